@@ -0,0 +1,60 @@
+"""
+bench_debuginfo.py
+
+Time building, writing and opening the debug info of a generated program,
+and looking up the source line and label of every address.
+Run from anywhere with: python3 bench_debuginfo.py [instructions]
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from programs import generate_program
+
+from assembler import Assembler, AssemblerOptions
+from debuginfo import build_debug_info, read_debug_info
+
+def main() -> None:
+    instructions = int(sys.argv[1]) if len(sys.argv) > 1 else 65536
+    logging.disable(logging.INFO) #time the debug info, not the parser log
+
+    session = Assembler(AssemblerOptions(scanner=True))
+    session.assemble_image(generate_program(instructions))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "program.dbg")
+        start = time.perf_counter()
+        info = build_debug_info(session.line_table, session.symbol_table, "program.asm")
+        info.write(path)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        info = read_debug_info(path)
+        opened = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for address in range(info.size):
+            info.line_of(address)
+        lines = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for address in range(info.size):
+            info.location(address)
+        labels = time.perf_counter() - start
+        print(f"{info.size:,} words, {info.entries:,} rows, {len(session.symbol_table):,} labels, "
+              f"{os.path.getsize(path):,} bytes")
+        info.close()
+
+    print(f"  build and write: {build * 1e3:8.2f} ms")
+    print(f"  open:            {opened * 1e6:8.1f} us")
+    print(f"  line_of:         {lines / instructions * 1e9:8.0f} ns/lookup")
+    print(f"  location:        {labels / instructions * 1e9:8.0f} ns/lookup")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+bench_disassembler.py
+
+Time the disassembly of a large image, built by repeating the example
+programs, decoding a word at a time and with NumPy.
+Run from anywhere with: python3 bench_disassembler.py [lines]
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+"""
+
+import logging
+import sys
+import time
+
+from programs import repeat_examples
+
+from assembler import Assembler, AssemblerOptions, _import_numpy
+from disassembler import decode_words, disassemble_image
+from writers import unpack_words
+
+def main() -> None:
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 65536
+    logging.disable(logging.INFO) #time the disassembler, not the parser log
+
+    image = Assembler(AssemblerOptions(compact=True)).assemble_image(repeat_examples(lines))
+    words = unpack_words(image)
+    print(f"{len(words):,} words")
+    for vectorise in (False, True):
+        if vectorise and _import_numpy() is None:
+            print("  NumPy is not installed")
+            break
+        name = "numpy" if vectorise else "python"
+        start = time.perf_counter()
+        decode_words(words, vectorise)
+        decoded = time.perf_counter() - start
+        start = time.perf_counter()
+        source = disassemble_image(image, vectorise=vectorise)
+        elapsed = time.perf_counter() - start
+        print(f"  {name:6} decode_words: {decoded:7.3f} s, disassemble_image: {elapsed:7.3f} s "
+              f"({len(words) / elapsed / 1e6:.2f} M words/s)")
+
+    start = time.perf_counter()
+    assert Assembler(AssemblerOptions(compact=True)).assemble_image("\n".join(source) + "\n") == image
+    print(f"  reassembled identically in {time.perf_counter() - start:.3f} s")
+
+if __name__ == "__main__":
+    main()
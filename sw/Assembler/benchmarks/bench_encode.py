@@ -0,0 +1,150 @@
+"""
+bench_encode.py
+
+Compare the encoders of the second pass: the original encoder, which built
+each instruction from binary strings, with the table-driven integer encoder,
+and with the NumPy column encoder when NumPy is installed. The outputs are
+checked to be identical before timing.
+Run from anywhere with: python3 bench_encode.py [lines]
+
+Author: Zachary Pearce
+Contributors: 
+License: GPL-3.0
+"""
+
+import logging
+import sys
+import time
+from typing import Callable
+
+from programs import repeat_examples
+
+from assembler import Assembler, AssemblerOptions, encode, _OPCODE, FUNCT
+from assembler import _field_columns, _import_numpy, encode_columns
+from parser import *
+
+def legacy_second_pass(ast: Program, symbols: dict[str, int]) -> list[str]:
+    """
+    The original string building second pass, kept as the baseline. The
+    only change is the IJMP operand, which read a misspelt attribute.
+    """
+    machine_code = []
+    for instruction in ast.instructions:
+        mnemonic = instruction.opcode_mnemonic
+        machine_code_line = ""
+        Rd = Rs = Rt = 0
+
+        if instruction.inst_format == Format.REGISTER_FORMAT:
+            Funct = FUNCT[mnemonic]
+
+            if mnemonic == "IJMP":
+                Rs = instruction.operands[0].register_num
+                Rt = instruction.operands[1].register_num
+            else:
+                registers = [0, 0, 0]
+                for x, operand in enumerate(instruction.operands):
+                    registers[x] = operand.register_num
+                Rd, Rs, Rt = registers
+
+            machine_code_line = ("000000"
+                                    + f"{Rd:04b}"
+                                    + f"{Rs:04b}"
+                                    + f"{Rt:04b}"
+                                    + Funct)
+        elif instruction.inst_format == Format.BRANCH_FORMAT:
+            opcode = _OPCODE[mnemonic]
+
+            address = 0
+            if len(instruction.operands) >= 1:
+                operand = instruction.operands[0]
+                if isinstance(operand, LabelOperand):
+                    address = symbols[operand.name]
+                else:
+                    address = operand.value
+
+            machine_code_line = (opcode
+                                    + "00"
+                                    + f"{address:016b}")
+        elif instruction.inst_format == Format.IMMEDIATE_FORMAT:
+            opcode = _OPCODE[mnemonic]
+            immediate = "0000000000"
+
+            registers = [0, 0]
+            imm_op: ASTNode = ASTNode()
+            for x, op in enumerate(instruction.operands):
+                if isinstance(op, RegisterOperand):
+                    registers[x] = op.register_num
+                else:
+                    imm_op = op
+
+            if (mnemonic == "STA"
+                or mnemonic == "PUSH"):
+                Rs = registers[0]
+            else:
+                Rd, Rs = registers
+
+            if isinstance(imm_op, ImmediateOperand):
+                decimal = imm_op.value
+                if decimal < 0:
+                    immediate = "00" + bin((1 << 8) + decimal)[2:]
+                else:
+                    immediate = f"{decimal:010b}"
+
+            machine_code_line = (opcode
+                                    + f"{Rd:04b}"
+                                    + f"{Rs:04b}"
+                                    + immediate)
+
+        machine_code.append(machine_code_line)
+
+    return machine_code
+
+def legacy_image(ast: Program, symbols: dict[str, int]) -> bytearray:
+    """Pack the baseline's machine code, for comparison with encode."""
+    return bytearray(b"".join(int(line, 2).to_bytes(3, "big") for line in legacy_second_pass(ast, symbols)))
+
+def best_time(function: Callable[[], object], repeats: int = 5) -> float:
+    """Return the best wall clock time of calling the function."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main() -> None:
+    line_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    logging.disable(logging.INFO) #time the encoding, not the parser log
+    asm = repeat_examples(line_count)
+
+    session = Assembler(AssemblerOptions(scanner=True))
+    ast = session.parse(session.tokenise(asm))
+    symbols = session.symbol_table
+    compact_session = Assembler(AssemblerOptions(compact=True))
+    compact_ast = compact_session.parse(compact_session.tokenise(asm))
+
+    expected = legacy_image(ast, symbols)
+    assert encode(ast, symbols, vectorise=False) == expected
+    assert encode(compact_ast, compact_session.symbol_table, vectorise=False) == expected
+
+    timings = [
+        ("string encoder", best_time(lambda: legacy_second_pass(ast, symbols))),
+        ("integer encoder", best_time(lambda: encode(ast, symbols, vectorise=False))),
+        ("integer, compact", best_time(lambda: encode(compact_ast, compact_session.symbol_table, vectorise=False)))
+    ]
+    if _import_numpy() is not None:
+        assert encode(ast, symbols, vectorise=True) == expected
+        columns = _field_columns(compact_ast, compact_session.symbol_table)
+        timings.append(("numpy, compact", best_time(
+            lambda: encode(compact_ast, compact_session.symbol_table, vectorise=True))))
+        timings.append(("numpy, columns only", best_time(lambda: encode_columns(*columns))))
+    else:
+        print("NumPy is not installed, skipping the column encoder")
+
+    baseline = timings[0][1]
+    print(f"{line_count} instructions, outputs identical")
+    for name, seconds in timings:
+        print(f"{name + ':':21} {seconds*1000:8.2f} ms  {line_count/seconds:12,.0f} instructions/s  {baseline/seconds:6.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+bench_lanes.py
+
+Measure the throughput of the lockstep lane simulator in lane instructions
+per second (lanes x instructions / s), against running each lane on the
+instruction at a time simulator. A converged program (pwm_led_breathe, every
+lane at the same PC) and a divergent program (branching on random initial
+registers) are run at several lane counts. A sample of lanes is checked
+against the simulator before the timings are printed.
+Run from anywhere with: python3 bench_lanes.py [steps]
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+"""
+
+import logging
+import sys
+import time
+
+from programs import EXAMPLES_DIR, DIVERGENT_PROGRAM
+
+from assembler import Assembler, _import_numpy
+from simulator import Simulator
+
+LANE_COUNTS = [1, 100, 1000, 10000]
+#lanes checked against the simulator
+SAMPLE_LANES = 8
+
+def main() -> None:
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    logging.disable(logging.INFO) #time the simulation, not the parser log
+    np = _import_numpy()
+    if np is None:
+        print("NumPy is not installed, the lane simulator needs it")
+        return
+    from lanes import LaneSimulator
+
+    programs = {
+        "converged (pwm_led_breathe)": (EXAMPLES_DIR / "pwm_led_breathe.asm").read_text(),
+        "divergent": DIVERGENT_PROGRAM
+    }
+    for name, source in programs.items():
+        image = Assembler().assemble_image(source)
+
+        scalar = Simulator.from_image(image)
+        start = time.perf_counter()
+        scalar.run(max_instructions=steps * 10)
+        scalar_rate = steps * 10 / (time.perf_counter() - start)
+        print(f"{name}: simulator {scalar_rate/1e6:.2f} M instructions/s")
+
+        for lane_count in LANE_COUNTS:
+            rng = np.random.default_rng(lane_count)
+            registers = rng.integers(0, 256, (lane_count, 16), dtype=np.uint8)
+            lane_simulator = LaneSimulator.from_image(image, lane_count)
+            lane_simulator.registers[:] = registers
+            start = time.perf_counter()
+            lane_simulator.run(max_instructions=steps)
+            seconds = time.perf_counter() - start
+
+            for lane in range(0, lane_count, max(1, lane_count // SAMPLE_LANES)):
+                simulator = Simulator.from_image(image)
+                simulator.registers[:] = registers[lane].tobytes()
+                simulator.run(max_instructions=steps)
+                assert lane_simulator.registers[lane].tobytes() == bytes(simulator.registers)
+                assert int(lane_simulator.cycles[lane]) == simulator.cycles
+
+            rate = int(lane_simulator.instructions.sum()) / seconds
+            distinct = len(set(lane_simulator.pc.tolist()))
+            print(f"  {lane_count:6} lanes: {rate/1e6:8.2f} M lane instructions/s  "
+                  f"{rate/scalar_rate:7.2f}x  ({distinct} distinct PCs at the end)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+bench_memory.py
+
+Report the peak memory of tokenising, parsing and assembling programs of
+1K, 16K and 64K instructions, with Token and Instruction objects, with the
+compact array based representation, and streaming a line at a time to the
+output. Run with: python3 bench_memory.py
+
+Author: Zachary Pearce
+Contributors: 
+License: GPL-3.0
+"""
+
+import logging
+import os
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from programs import repeat_examples
+
+from assembler import tokenise, tokenise_compact, second_pass
+from parser import Parser, symbol_table
+from streaming import assemble_stream
+
+SIZES = [1024, 16 * 1024, 64 * 1024]
+
+def objects(file_name: str) -> list[str]:
+    """Assemble with Token and Instruction objects."""
+    tokens = tokenise(file_name, scanner=True)
+    ast = Parser(tokens).parse_program()
+    return second_pass(ast)
+
+def compact(file_name: str) -> list[str]:
+    """Assemble with the compact token stream and instruction records."""
+    tokens = tokenise_compact(file_name)
+    ast = Parser(tokens).parse_compact()
+    return second_pass(ast)
+
+def streaming(file_name: str) -> None:
+    """Assemble a line at a time, writing the text output as it is produced."""
+    with open(file_name, "r") as f, open(os.devnull, "wb") as output:
+        assemble_stream(f, output)
+
+def peak_memory(assemble, file_name: str) -> int:
+    """Return the peak traced memory, in bytes, of assembling the file."""
+    symbol_table.clear()
+    tracemalloc.start()
+    assemble(file_name)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    symbol_table.clear()
+    return peak
+
+def main() -> None:
+    logging.disable(logging.INFO) #the log records would be traced too
+    print(f"{'instructions':>12} {'objects':>12} {'compact':>12} {'ratio':>7} {'streaming':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in SIZES:
+            file_name = str(Path(tmp) / f"bench_{size}.asm")
+            Path(file_name).write_text(repeat_examples(size))
+            object_peak = peak_memory(objects, file_name)
+            compact_peak = peak_memory(compact, file_name)
+            streaming_peak = peak_memory(streaming, file_name)
+            print(f"{size:>12} {object_peak/2**20:>10.2f}MB {compact_peak/2**20:>10.2f}MB "
+                  f"{object_peak/compact_peak:>6.1f}x {streaming_peak/2**20:>10.2f}MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+bench_parse.py
+
+Time Parser.parse_program and Parser.parse_compact on a generated program,
+the tokens are made once so only the operand validation and node building
+are timed.
+Run from anywhere with: python3 bench_parse.py [instructions] [repeats]
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+"""
+
+import logging
+import sys
+import time
+
+from programs import generate_program
+
+from assembler import Assembler, AssemblerOptions
+from parser import Parser
+
+def best_of(repeats: int, parse) -> float:
+    """The fastest of repeats runs of parse, in seconds."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        parse()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main() -> None:
+    instructions = int(sys.argv[1]) if len(sys.argv) > 1 else 65536
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    logging.disable(logging.INFO) #time the parser, not the per operand log
+
+    asm = generate_program(instructions)
+    session = Assembler(AssemblerOptions(scanner=True))
+    tokens = session.tokenise(asm)
+    program = best_of(repeats, lambda: Parser(tokens, session.symbol_table).parse_program())
+
+    compact = Assembler(AssemblerOptions(compact=True))
+    stream = compact.tokenise(asm)
+    records = best_of(repeats, lambda: Parser(stream, compact.symbol_table).parse_compact())
+
+    print(f"{instructions:,} instructions")
+    print(f"  parse_program: {program:7.3f} s {instructions / program / 1e3:8.0f} K instructions/s")
+    print(f"  parse_compact: {records:7.3f} s {instructions / records / 1e3:8.0f} K instructions/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+bench_simulator.py
+
+Measure the throughput of the simulators in simulated millions of
+instructions per second (MIPS): the instruction at a time simulator, and the
+basic-block translating simulator, with and without profiling, and the
+tracing simulator recording every instruction into its ring buffer. Each example
+program is run for the same number of instructions on every simulator, and
+the final states are checked to be identical before the timings are printed.
+Run from anywhere with: python3 bench_simulator.py [instructions]
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+"""
+
+import logging
+import sys
+import time
+
+from programs import EXAMPLES_DIR
+
+from assembler import Assembler
+from simulator import Simulator
+from translator import BlockSimulator
+from tracing import TracingSimulator
+
+#the examples that run for as long as wanted, fibonacci halts after 162 instructions
+PROGRAMS = ["pwm_led_breathe", "add5"]
+
+def final_state(simulator: Simulator) -> tuple:
+    """The state to compare between simulators."""
+    return (simulator.instructions, simulator.cycles, simulator.pc, simulator.sp, simulator.flags,
+            bytes(simulator.registers), bytes(simulator.ram), bytes(simulator.gpio))
+
+def main() -> None:
+    instructions = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    logging.disable(logging.INFO) #time the simulation, not the parser log
+
+    for program in PROGRAMS:
+        session = Assembler()
+        image = session.assemble_file_image(str(EXAMPLES_DIR / f"{program}.asm"))
+        timings: list[tuple[str, float]] = []
+        states: set[tuple] = set()
+        for name, simulator_class, profile in [("simulator", Simulator, False),
+                                               ("simulator, profiling", Simulator, True),
+                                               ("block simulator", BlockSimulator, False),
+                                               ("block simulator, profiling", BlockSimulator, True),
+                                               ("tracing simulator", TracingSimulator, False)]:
+            simulator = simulator_class.from_image(image, session.symbol_table, profile=profile, pins=0b0101)
+            start = time.perf_counter()
+            simulator.run(max_instructions=instructions)
+            timings.append((name, time.perf_counter() - start))
+            states.add(final_state(simulator))
+        assert len(states) == 1, f"{program}: the simulators disagree"
+
+        baseline = timings[0][1]
+        print(f"{program}: {instructions:,} instructions, final states identical")
+        for name, seconds in timings:
+            print(f"  {name + ':':28} {seconds:8.3f} s  {instructions/seconds/1e6:6.2f} MIPS  {baseline/seconds:6.2f}x")
+
+if __name__ == "__main__":
+    main()
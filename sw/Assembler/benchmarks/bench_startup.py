@@ -0,0 +1,90 @@
+"""
+bench_startup.py
+
+Measure the start up cost of the command line interface, which make may run
+hundreds of times per build. Lists the slowest imports of the assembler
+(from python -X importtime), then times assembling a tiny file from a fresh
+interpreter and compares the best run with TARGET_MS.
+Run from anywhere with: python3 bench_startup.py [runs]
+
+Author: Zachary Pearce
+Contributors: 
+License: GPL-3.0
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from programs import BENCH_DIR
+
+SRC_DIR = BENCH_DIR.parent / "src" / "POM8_Assembler"
+#the wall clock time to assemble a tiny file, including the interpreter start up
+TARGET_MS = 100
+TINY_PROGRAM = "start: LDI r0, 1\nADDI r0, r0, 1\nJMP start\n"
+
+def _environment() -> dict[str, str]:
+    """The environment to run in, allowing bytecode to be cached as it normally is."""
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+def slowest_imports(count: int = 12) -> list[tuple[int, int, str]]:
+    """
+    Import the CLI's modules with -X importtime.
+
+    Returns:
+        imports (list[tuple[int, int, str]]): The self and cumulative
+            microseconds and name of the imports with the most self time.
+    """
+    command = [sys.executable, "-X", "importtime", "-c", "import assembler, writers, logger_conf"]
+    for _ in range(2): #the first run caches the bytecode
+        result = subprocess.run(command, cwd=SRC_DIR, env=_environment(),
+                                capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        #import time: self [us] | cumulative | imported package
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        imports.append((int(fields[0]), int(fields[1]), fields[2].strip()))
+    return sorted(imports, reverse=True)[:count]
+
+def time_runs(command: list[str], runs: int) -> list[float]:
+    """Return the wall clock time of each run of the command, after a warm up run."""
+    env = _environment()
+    subprocess.run(command, env=env, capture_output=True, check=True)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, capture_output=True, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    print("slowest imports:    self  cumulative")
+    for self_us, cumulative_us, name in slowest_imports():
+        print(f"{name:16} {self_us/1000:8.2f} ms {cumulative_us/1000:8.2f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asm_file = Path(tmp) / "tiny.asm"
+        asm_file.write_text(TINY_PROGRAM)
+        interpreter = time_runs([sys.executable, "-c", "pass"], runs)
+        cli = time_runs([sys.executable, str(SRC_DIR / "__main__.py"), str(asm_file), "-q",
+                         "-o", str(Path(tmp) / "tiny_bin.txt")], runs)
+
+    best = min(cli) * 1000
+    print(f"\n{runs} runs of a {TINY_PROGRAM.count(chr(10))} line file")
+    print(f"python -c pass: {min(interpreter)*1000:8.2f} ms best  {statistics.median(interpreter)*1000:8.2f} ms median")
+    print(f"assembler CLI:  {best:8.2f} ms best  {statistics.median(cli)*1000:8.2f} ms median")
+    print(f"target:         {TARGET_MS:8.2f} ms  {'met' if best <= TARGET_MS else 'MISSED'}")
+    sys.exit(0 if best <= TARGET_MS else 1)
+
+if __name__ == "__main__":
+    main()
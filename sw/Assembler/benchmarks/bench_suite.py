@@ -0,0 +1,159 @@
+"""
+bench_suite.py
+
+Time each stage of assembling generated programs of 1K, 16K and 64K
+instructions, tokenise, Parser.parse_program, second_pass and write_file,
+and the single pass assembler doing the work of the first three, and
+record the peak memory each stage allocates with tracemalloc. The results
+can be saved as a JSON baseline, and compared with one, failing when a
+stage regresses past the threshold.
+Run from this directory with:
+    python3 bench_suite.py --save baselines/suite.json
+    python3 bench_suite.py --baseline baselines/suite.json [--threshold 0.25]
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+"""
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+
+from programs import generate_program
+
+from assembler import read_file, tokenise, second_pass, write_file
+from one_pass import assemble_words
+from parser import Parser, symbol_table
+
+SIZES = [1024, 16 * 1024, 64 * 1024]
+STAGES = ["tokenise", "parse_program", "second_pass", "write_file", "one_pass"]
+#smaller programs are assembled more often, at least this many instructions
+#per repeat, as their stages take well under a millisecond
+_TIMED_INSTRUCTIONS = 16 * 1024
+
+def run_stages(asm_file: str, bin_file: str, measure: Callable[[str, Callable[[], Any]], Any]) -> None:
+    """Assemble a file a stage at a time, each stage run through measure(name, stage)."""
+    symbol_table.clear()
+    tokens = measure("tokenise", lambda: tokenise(asm_file, scanner=True))
+    ast = measure("parse_program", lambda: Parser(tokens).parse_program())
+    machine_code = measure("second_pass", lambda: second_pass(ast))
+    measure("write_file", lambda: write_file(bin_file, machine_code))
+    symbol_table.clear()
+    measure("one_pass", lambda: assemble_words(read_file(asm_file), {}))
+
+def bench_size(size: int, repeat: int, directory: str) -> dict[str, dict[str, float]]:
+    """
+    Benchmark each stage for a generated program of size instructions.
+
+    Returns:
+        results (dict[str, dict[str, float]]): The fastest seconds of each
+            stage over the repeats, and the peak bytes it allocated.
+    """
+    asm_file = str(Path(directory) / f"suite_{size}.asm")
+    bin_file = str(Path(directory) / f"suite_{size}_bin.txt")
+    Path(asm_file).write_text(generate_program(size))
+    results = {stage: {"seconds": float("inf"), "peak_bytes": 0} for stage in STAGES}
+
+    def timed(name: str, stage: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        value = stage()
+        results[name]["seconds"] = min(results[name]["seconds"], time.perf_counter() - start)
+        return value
+
+    def traced(name: str, stage: Callable[[], Any]) -> Any:
+        #only what the stage allocates over what is live before it
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        value = stage()
+        results[name]["peak_bytes"] = tracemalloc.get_traced_memory()[1] - current
+        return value
+
+    for _ in range(repeat * max(1, _TIMED_INSTRUCTIONS // size)):
+        run_stages(asm_file, bin_file, timed)
+    #traced separately, tracemalloc slows every allocation
+    tracemalloc.start()
+    run_stages(asm_file, bin_file, traced)
+    tracemalloc.stop()
+    return results
+
+def compare(baseline: dict[str, Any], results: dict[str, Any], threshold: float,
+            memory_threshold: float, min_seconds: float = 0.001) -> list[str]:
+    """
+    Compare results with a baseline, a stage is not slower unless it also
+    takes min_seconds longer, so timer noise is not a regression.
+
+    Returns:
+        regressions (list[str]): A line for each stage slower, or allocating
+            more, than the baseline by more than its threshold.
+    """
+    regressions = []
+    for size, stages in results["sizes"].items():
+        for stage, result in stages.items():
+            base = baseline["sizes"].get(size, {}).get(stage)
+            if base is None:
+                continue
+            for key, limit in (("seconds", threshold), ("peak_bytes", memory_threshold)):
+                change = result[key] / base[key] - 1 if base[key] else 0.0
+                if key == "seconds" and result[key] - base[key] < min_seconds:
+                    continue
+                if change > limit:
+                    regressions.append(f"{stage} of {size} instructions: {key} {base[key]:.6g} -> "
+                                       f"{result[key]:.6g} ({change:+.1%}, threshold {limit:+.0%})")
+    return regressions
+
+def format_results(results: dict[str, Any], baseline: dict[str, Any] | None) -> str:
+    """Human readable table of the results, with the change from the baseline."""
+    lines = [f"{'instructions':>12} {'stage':<14} {'seconds':>9} {'change':>8} {'peak MB':>9} {'change':>8}"]
+    for size, stages in results["sizes"].items():
+        for stage, result in stages.items():
+            base = (baseline or {}).get("sizes", {}).get(size, {}).get(stage)
+            changes = [f"{result[key] / base[key] - 1:+.1%}" if base and base[key] else ""
+                       for key in ("seconds", "peak_bytes")]
+            lines.append(f"{size:>12} {stage:<14} {result['seconds']:>9.4f} {changes[0]:>8} "
+                         f"{result['peak_bytes'] / 2**20:>9.2f} {changes[1]:>8}")
+    return "\n".join(lines)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the assembler.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES,
+                        help="the instruction counts of the generated programs (default: 1K, 16K and 64K)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="time each stage at least this many times, keeping the fastest (default: 3)")
+    parser.add_argument("--save", metavar="JSON", help="save the results as a baseline")
+    parser.add_argument("--baseline", metavar="JSON", help="compare the results with a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="the slowdown of a stage that fails the comparison (default: 0.25, 25%%)")
+    parser.add_argument("--min-seconds", type=float, default=0.001,
+                        help="the least slowdown in seconds that fails the comparison (default: 0.001)")
+    parser.add_argument("--memory-threshold", type=float, default=0.10,
+                        help="the growth of the peak memory of a stage that fails the comparison (default: 0.10)")
+    args = parser.parse_args()
+    logging.disable(logging.INFO) #time the assembler, not the per token log
+
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    results: dict[str, Any] = {"python": platform.python_version(), "machine": platform.machine(), "sizes": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            results["sizes"][str(size)] = bench_size(size, args.repeat, tmp)
+    print(format_results(results, baseline))
+
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(results, indent=2) + "\n")
+    if baseline is not None:
+        regressions = compare(baseline, results, args.threshold, args.memory_threshold, args.min_seconds)
+        if regressions:
+            print(f"{len(regressions)} regressions against {args.baseline}:", *regressions, sep="\n  ")
+            sys.exit(1)
+        print(f"no regressions against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
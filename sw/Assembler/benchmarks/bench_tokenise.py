@@ -0,0 +1,65 @@
+"""
+bench_tokenise.py
+
+Compare the throughput of the line by line tokeniser with the single pass
+scanner, and the scanner with the source split across a process pool.
+Run from anywhere with: python3 bench_tokenise.py [lines] [workers]
+
+Author: Zachary Pearce
+Contributors: 
+License: GPL-3.0
+"""
+
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from programs import repeat_examples
+
+from assembler import tokenise
+from parser import symbol_table
+from parallel import tokenise_parallel
+
+def best_time(file_name: str, scanner: bool, repeats: int = 5) -> float:
+    """Return the best wall clock time of tokenising the file."""
+    best = float("inf")
+    for _ in range(repeats):
+        symbol_table.clear()
+        start = time.perf_counter()
+        tokenise(file_name, scanner=scanner)
+        best = min(best, time.perf_counter() - start)
+    symbol_table.clear()
+    return best
+
+def best_parallel_time(asm: str, workers: int, repeats: int = 5) -> float:
+    """Return the best wall clock time of tokenising the source with the scanner in parallel."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        tokenise_parallel(asm, {}, scanner=True, workers=workers)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main() -> None:
+    line_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    logging.disable(logging.INFO) #time the tokenisation, not the label log
+    asm = repeat_examples(line_count)
+    with tempfile.TemporaryDirectory() as tmp:
+        file_name = str(Path(tmp) / "bench.asm")
+        Path(file_name).write_text(asm)
+
+        legacy = best_time(file_name, scanner=False)
+        scanner = best_time(file_name, scanner=True)
+    parallel = best_parallel_time(asm, workers)
+
+    print(f"{line_count} lines")
+    print(f"line by line: {legacy*1000:8.2f} ms  {line_count/legacy:12,.0f} lines/s")
+    print(f"scanner:      {scanner*1000:8.2f} ms  {line_count/scanner:12,.0f} lines/s")
+    print(f"speedup:      {legacy/scanner:8.2f}x")
+    print(f"{workers} workers:    {parallel*1000:8.2f} ms  {line_count/parallel:12,.0f} lines/s")
+
+if __name__ == "__main__":
+    main()
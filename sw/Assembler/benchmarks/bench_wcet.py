@@ -0,0 +1,45 @@
+"""
+bench_wcet.py
+
+Time the control-flow graph and WCET analysis of a large program, built by
+repeating the annotated example programs, up to the 64K words the program
+counter can address.
+Run from anywhere with: python3 bench_wcet.py [lines]
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+"""
+
+import logging
+import sys
+import time
+
+from programs import repeat_examples
+
+from assembler import Assembler, AssemblerOptions
+from wcet import read_loop_bounds, build_cfg, analyse_wcet
+
+def main() -> None:
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 65536
+    logging.disable(logging.WARNING) #time the analysis, not the parser log or unreachable copies
+
+    asm = repeat_examples(lines)
+    session = Assembler(AssemblerOptions(compact=True))
+    ast = session.parse(session.tokenise(asm))
+
+    start = time.perf_counter()
+    cfg = build_cfg(ast, session.symbol_table)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    report = analyse_wcet(ast, session.symbol_table, read_loop_bounds(asm))
+    analysed = time.perf_counter() - start
+
+    bounded = sum(1 for wcet in report.subroutines if wcet.cycles is not None)
+    print(f"{len(ast):,} words: {len(cfg.blocks):,} basic blocks, {len(report.loops):,} loops, "
+          f"{bounded:,} of {len(report.subroutines):,} subroutines bounded")
+    print(f"  build_cfg:    {built:8.3f} s")
+    print(f"  analyse_wcet: {analysed:8.3f} s (including build_cfg)")
+
+if __name__ == "__main__":
+    main()
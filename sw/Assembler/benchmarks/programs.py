@@ -0,0 +1,170 @@
+"""
+programs.py
+
+Helpers shared by the benchmarks for building large POM8 programs, from
+copies of the examples or generated.
+
+Author: Zachary Pearce
+Contributors: 
+License: GPL-3.0
+"""
+
+import random
+import re
+import sys
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+EXAMPLES_DIR = BENCH_DIR.parent.parent / "Examples"
+
+#make the assembler modules importable, as pytest does with pythonpath
+sys.path.insert(0, str(BENCH_DIR.parent / "src" / "POM8_Assembler"))
+
+_LABEL_DEF_RE = re.compile(r"^\s*([a-z][a-z0-9]*):", re.IGNORECASE | re.MULTILINE)
+
+def repeat_examples(line_count: int) -> str:
+    """
+    Build a program of line_count instruction lines by repeating the example
+    programs, renaming the labels of each copy so they stay unique, and
+    padding the end with NOPs.
+
+    Parameters:
+        line_count (int): The number of instruction lines wanted.
+
+    Returns:
+        asm (str): The generated assembly code.
+    """
+    examples = [path.read_text() for path in sorted(EXAMPLES_DIR.glob("*.asm"))]
+    chunks: list[str] = []
+    lines = 0
+    copy = 0
+    while True:
+        for example, asm in enumerate(examples):
+            labels = _LABEL_DEF_RE.findall(asm)
+            renamed = re.sub(r"\b(" + "|".join(labels) + r")\b",
+                             lambda match: f"{match.group(1)}e{example}c{copy}", asm)
+            renamed_lines = [line for line in renamed.splitlines() if line.strip()]
+            if lines + len(renamed_lines) > line_count:
+                chunks.extend(["NOP"] * (line_count - lines))
+                return "\n".join(chunks) + "\n"
+            chunks.extend(renamed_lines)
+            lines += len(renamed_lines)
+        copy += 1
+
+#a program whose branches depend on the initial registers, so lanes started
+#from different states diverge, r1 is the loop count
+DIVERGENT_PROGRAM = """
+            LDI r0, 0b11110000
+            STA r0, 0x202
+            LDA r5, 0x200
+            ADDC r6, r5, r7
+loop:       SUBI r1, r1, 1
+            BRZ done
+            ADD r2, r2, r3
+            BRC carry
+            XOR r4, r4, r2
+            BRN neg
+            JMP loop
+carry:      PUSH r2
+            LSL r8, r2
+            LDO r9, r8, 3
+            POP r10
+            CALL sub
+            JMP loop
+neg:        SUBC r11, r4, r1
+            STA r11, 0x10
+            LSR r12, r11
+            BRV loop
+            NOT r13, r12, r0
+            JMP loop
+sub:        ORI r14, r14, 1
+            SETC
+            RET
+done:       STA r2, 0x201
+            JMP done
+"""
+
+#the mnemonics of each operand form, weighted as the examples use them
+_THREE_REGISTERS = ["ADD", "SUB", "AND", "OR", "NOT", "XOR", "ADDC", "SUBC", "INC"]
+_TWO_REGISTERS = ["LSL", "LSR", "MOV"]
+_FLAG_OPERATIONS = ["SETC", "CLRC", "SETV", "CLRV"]
+_IMMEDIATE_OPERATIONS = ["ADDI", "SUBI", "ANDI", "ORI", "XORI", "LDI", "LDO"]
+_BRANCHES = ["JMP", "BRZ", "BRN", "BRP", "BRC", "BRV"]
+#the share of each instruction format, register, immediate and branch
+_FORMAT_WEIGHTS = (0.35, 0.45, 0.20)
+
+def _register(rng: random.Random) -> str:
+    """Any of the 16 registers."""
+    return f"r{rng.randrange(16)}"
+
+def _immediate(rng: random.Random) -> str:
+    """An immediate in each way it can be written."""
+    kind = rng.randrange(4)
+    if kind == 0:
+        return str(rng.randrange(256))
+    if kind == 1:
+        return str(rng.randrange(-128, 0))
+    if kind == 2:
+        return f"0b{rng.randrange(256):08b}"
+    return f"0x{rng.randrange(0x400):03X}"
+
+def generate_program(instructions: int, seed: int = 0, label_every: int = 8) -> str:
+    """
+    Generate a valid synthetic program with a realistic mix of the three
+    instruction formats, every mnemonic and operand form, comments, and a
+    label on about one in label_every instructions. Branches go forwards and
+    backwards to any label, and CALLs to labels followed by a RET.
+
+    Parameters:
+        instructions (int): The number of instructions.
+        seed (int): The seed of the generator, the same seed gives the same program.
+        label_every (int): The mean number of instructions per label.
+
+    Returns:
+        asm (str): The generated assembly code.
+    """
+    rng = random.Random(seed)
+    labelled = sorted(rng.sample(range(instructions), max(1, instructions // label_every)))
+    labels = {address: f"lab{number}" for number, address in enumerate(labelled)}
+    names = list(labels.values())
+
+    lines: list[str] = []
+    for address in range(instructions):
+        fmt = rng.choices(range(3), _FORMAT_WEIGHTS)[0]
+        if fmt == 0:
+            kind = rng.randrange(10)
+            if kind < 6:
+                text = f"{rng.choice(_THREE_REGISTERS)} {_register(rng)}, {_register(rng)}, {_register(rng)}"
+            elif kind < 8:
+                text = f"{rng.choice(_TWO_REGISTERS)} {_register(rng)}, {_register(rng)}"
+            elif kind < 9:
+                text = rng.choice(_FLAG_OPERATIONS)
+            else:
+                text = f"IJMP {_register(rng)}, {_register(rng)}"
+        elif fmt == 1:
+            kind = rng.randrange(10)
+            if kind < 5:
+                mnemonic = rng.choice(_IMMEDIATE_OPERATIONS)
+                if rng.random() < 0.5:
+                    text = f"{mnemonic} {_register(rng)}, {_register(rng)}, {_immediate(rng)}"
+                else:
+                    text = f"{mnemonic} {_register(rng)}, {_immediate(rng)}"
+            elif kind < 7:
+                text = f"{rng.choice(['LDA', 'STA'])} {_register(rng)}, 0x{rng.randrange(0x200, 0x204):03X}"
+            else:
+                text = f"{rng.choice(['PUSH', 'POP'])} {_register(rng)}"
+        else:
+            kind = rng.randrange(10)
+            if kind < 6:
+                text = f"{rng.choice(_BRANCHES)} {rng.choice(names)}"
+            elif kind < 8:
+                text = f"CALL {rng.choice(names)}"
+            else:
+                text = rng.choice(["RET", "NOP", "HLT"])
+        if rng.random() < 0.2:
+            text += f"   ; synthetic instruction {address}"
+        label = f"{labels[address]}:" if address in labels else ""
+        lines.append(f"{label:<12}{text}")
+        if rng.random() < 0.02:
+            lines.append("")
+    return "\n".join(lines) + "\n"
@@ -1,7 +1,10 @@
 from assembler import *
 from parser import *
+from writers import *
 import sys
+import time
 import argparse
+import dataclasses
 
 import logging
 from logger_conf import *
@@ -12,30 +15,447 @@ def main() -> None:
     help_msg = "Convert a POM8 assembly file into machine code."
     parser = argparse.ArgumentParser(description=help_msg)
 
-    parser.add_argument("Input", type=str, help="the input assembly (.asm) file name")
+    parser.add_argument("Input", type=str, nargs="*",
+                        help="the input assembly (.asm) file name, several names or globs assemble a batch")
     parser.add_argument("-o", "--Output", help="optional output binary file name")
+    parser.add_argument("-f", "--format", choices=list(FORMATS), default="text",
+                        help="output format: text lines of 0/1 (default), raw binary, Intel HEX, "
+                             "Xilinx .coe or .mem, a VHDL rom_contents constant, or a Vivado Tcl script "
+                             "setting the ROM256X1 INIT values of an implemented design")
+    parser.add_argument("-m", "--manifest",
+                        help="assemble a batch of the files or globs listed in this file, one per line")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes for a batch (default: number of CPUs), or for a "
+                             "single large file, to tokenise it in chunks (default: 1)")
+    parser.add_argument("-d", "--output-dir",
+                        help="directory for batch outputs (default: next to each input), named <name>_bin.txt")
+    parser.add_argument("--cache-dir",
+                        help="cache assembled machine code in this directory, keyed on the source")
+    parser.add_argument("--cache-size", type=float, default=64,
+                        help="size limit of the cache in MiB, least recently used entries are evicted (default: 64)")
+    parser.add_argument("-s", "--scanner", action="store_true",
+                        help="tokenise with the single pass scanner")
+    parser.add_argument("-c", "--compact", action="store_true",
+                        help="use the compact array based tokens and instructions")
+    parser.add_argument("-O", "--optimise", action="store_true",
+                        help="rewrite the program with the peephole optimiser, printing the words and "
+                             "cycles saved by each rule")
+    parser.add_argument("--one-pass", action="store_true",
+                        help="encode each line as soon as it is read, patching forward branches when their "
+                             "label is defined, instead of parsing the whole program first")
+    parser.add_argument("--stream", action="store_true",
+                        help="assemble a line at a time, writing the output as it is produced")
+    parser.add_argument("--simulate", type=int, metavar="N",
+                        help="run the program on the cycle-accurate simulator for at most N instructions "
+                             "(stopping at HLT) and print its profile instead of the machine code")
+    parser.add_argument("--wcet", action="store_true",
+                        help="print the worst-case cycles of each subroutine, loop and label instead of the "
+                             "machine code, loops are bounded by '@bound N' in the comment of their labelled header")
+    parser.add_argument("--pins", type=lambda value: int(value, 0), default=0,
+                        help="the levels applied to the GPIO pins when simulating, e.g. 0b101")
+    parser.add_argument("--trace", type=int, metavar="N", nargs="?", const=4096,
+                        help="when simulating, keep a trace of the last N instructions (default: 4096) and "
+                             "print the end of it")
+    parser.add_argument("--watch", action="append", default=[], metavar="ADDRESS[:r|w|rw]",
+                        help="when simulating, snapshot the trace when a data memory or GPIO address is "
+                             "accessed, e.g. gpio_output:w or 0x20, may be given more than once")
+    parser.add_argument("--watch-stop", action="store_true",
+                        help="stop the simulation at the first watchpoint that triggers")
+    parser.add_argument("--trace-file", metavar="FILE",
+                        help="write the trace to a binary file when simulating, print it with tracing.py")
+    parser.add_argument("--debug-info", metavar="FILE",
+                        help="write the source file and line of each address, and the labels, to a compact "
+                             "debug info file, see debuginfo.py")
+    parser.add_argument("--listing", metavar="FILE",
+                        help="write a listing of the source with the address and word of each instruction")
+    parser.add_argument("--previous", metavar="IMAGE",
+                        help="report the words changed since the image the ROM was built from, e.g. "
+                             "rtl/pom8_instruction_memory.vhd or a previous output, and if the program "
+                             "fits the built ROM so the bitstream can be patched without a rebuild")
+    parser.add_argument("--object", action="store_true",
+                        help="assemble a single module into a relocatable object file (.o), labels it uses "
+                             "but does not define are resolved when linked")
+    parser.add_argument("--link", action="store_true",
+                        help="link the inputs in order into one image, assembly modules are assembled into "
+                             "object files (in -d/--output-dir or next to them) only when changed")
+    parser.add_argument("--disassemble", action="store_true",
+                        help="disassemble a single image written in any output format but Intel HEX, e.g. "
+                             "samples/add5_bin.txt, into assembly code with labels for the branch targets")
+    parser.add_argument("--serve", nargs="?", const="", metavar="SOCKET",
+                        help="run a long-lived server answering JSON line requests on a Unix domain socket "
+                             "(default: one per user in the runtime directory), or on stdin/stdout if '-', "
+                             "see client.py to forward to it")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="only log warnings and errors, skipping the per token progress log")
 
     #read input argumnets
     args = parser.parse_args()
+    configure_logging("WARNING" if args.quiet else "INFO")
+    options = AssemblerOptions(scanner=args.scanner, compact=args.compact,
+                               cache_dir=args.cache_dir, cache_size=int(args.cache_size * 2**20),
+                               optimise=args.optimise, one_pass=args.one_pass)
 
-    asm_file_name = args.Input
-    machine_code = []
+    if args.serve is not None:
+        if args.Input or args.manifest is not None:
+            parser.error("--serve takes its sources from requests")
+        sys.exit(run_server(args))
+    if args.disassemble:
+        if len(args.Input) != 1 or args.manifest is not None:
+            parser.error("--disassemble reads a single image")
+        sys.exit(run_disassembly(args))
+    if args.link or args.object:
+        if args.manifest is not None:
+            parser.error("-m/--manifest cannot be used with --link or --object")
+        if args.stream:
+            parser.error("--stream cannot be used with --link or --object")
+        if args.wcet:
+            parser.error("--wcet cannot be used with --link or --object")
+        if args.cache_dir:
+            parser.error("--cache-dir cannot be used with --link or --object, objects are rebuilt only when changed")
+        if args.debug_info or args.listing:
+            parser.error("--debug-info and --listing cannot be used with --link or --object")
+    if args.object:
+        if args.link:
+            parser.error("--object cannot be used with --link")
+        if len(args.Input) != 1:
+            parser.error("--object assembles a single module")
+        if args.simulate is not None or args.previous:
+            parser.error("--object writes an object file, link it to simulate or compare it")
+        sys.exit(run_object(args, options))
+
+    is_batch = (not args.link) and (args.manifest is not None or len(args.Input) > 1
+                or any(any(char in name for char in "*?[") for name in args.Input))
+    if is_batch:
+        if args.Output:
+            parser.error("-o/--Output cannot be used with a batch, use -d/--output-dir")
+        if args.stream:
+            parser.error("--stream assembles a single file")
+        if args.simulate is not None:
+            parser.error("--simulate runs a single file")
+        if args.previous:
+            parser.error("--previous compares a single file")
+        if args.wcet:
+            parser.error("--wcet analyses a single file")
+        if args.debug_info or args.listing:
+            parser.error("--debug-info and --listing describe a single file")
+        sys.exit(run_batch(args, options))
+    if not args.Input:
+        parser.error("an input file or a manifest is required")
+
+    asm_file_name = args.Input[0]
+    if args.jobs is not None and not args.link:
+        options = dataclasses.replace(options, jobs=args.jobs)
+    if args.stream:
+        if args.simulate is not None:
+            parser.error("--stream cannot be used with --simulate")
+        if args.cache_dir:
+            parser.error("--stream cannot be used with --cache-dir")
+        if args.previous:
+            parser.error("--stream cannot be used with --previous")
+        if args.optimise:
+            parser.error("--stream cannot be used with -O/--optimise")
+        if args.wcet:
+            parser.error("--stream cannot be used with --wcet")
+        if args.debug_info or args.listing:
+            parser.error("--stream cannot be used with --debug-info or --listing")
+        sys.exit(run_stream(args, options))
+    if args.wcet:
+        if args.simulate is not None:
+            parser.error("--wcet cannot be used with --simulate")
+        sys.exit(run_wcet(args, options))
+    if (args.debug_info or args.listing) and args.cache_dir:
+        parser.error("--debug-info and --listing cannot be used with --cache-dir, a cache hit does not read the source")
+
+    image = bytearray()
+    if args.link:
+        image, symbols = run_link(args, options)
+    else:
+        try:
+            session = Assembler(options)
+            image = session.assemble_file_image(asm_file_name)
+            symbols = session.symbol_table
+            if session.cache is not None:
+                logger.info(session.cache.stats)
+            if session.optimisation is not None:
+                print(session.optimisation, file=sys.stderr)
+            if args.debug_info or args.listing:
+                write_debug_info(args, image, session)
+        except Exception as ex:
+            logger.error(ex)
+            sys.exit()
+
+    if args.previous:
+        if not report_delta(args.previous, image):
+            sys.exit(1)
+
+    if args.simulate is not None:
+        sys.exit(run_simulation(args, image, symbols))
+    if args.trace is not None or args.watch or args.trace_file:
+        parser.error("--trace, --watch and --trace-file need --simulate")
+
+    if args.Output:
+        #if an output was provided
+        bin_file_name = args.Output
+        with open(bin_file_name, "wb") as f:
+            write_image(f, image, args.format)
+    else:
+        sys.stdout.flush()
+        write_image(sys.stdout.buffer, image, args.format)
+        sys.stdout.buffer.flush()
+
+def run_stream(args: argparse.Namespace, options: AssemblerOptions) -> int:
+    """
+    Assemble a single file a line at a time, writing the output as it is
+    produced. A failed assembly leaves a partial output.
+
+    Returns:
+        exit_code (int): 0 if the file assembled, otherwise 1.
+    """
+    session = Assembler(options)
+    try:
+        if args.Output:
+            with open(args.Output, "wb") as f:
+                session.assemble_stream(args.Input[0], f, args.format)
+        else:
+            sys.stdout.flush()
+            session.assemble_stream(args.Input[0], sys.stdout.buffer, args.format)
+            sys.stdout.buffer.flush()
+    except Exception as ex:
+        logger.error(ex)
+        return 1
+    return 0
+
+def run_object(args: argparse.Namespace, options: AssemblerOptions) -> int:
+    """
+    Assemble a single module into a relocatable object file, named after the
+    module with OBJECT_SUFFIX unless -o/--Output is given.
+
+    Returns:
+        exit_code (int): 0 if the module assembled, otherwise 1.
+    """
+    from linker import OBJECT_SUFFIX, assemble_object #only needed here
+    from pathlib import Path
+
+    session = Assembler(options)
+    source_path = Path(args.Input[0])
     try:
-        tokens = tokenise(asm_file_name)
-        parser = Parser(tokens)
-        ast = parser.parse_program()
-        machine_code = second_pass(ast)
+        module = assemble_object(session, read_file(str(source_path)), source_path.stem)
+        if session.optimisation is not None:
+            print(session.optimisation, file=sys.stderr)
+        module.write(args.Output or source_path.with_suffix(OBJECT_SUFFIX))
     except Exception as ex:
         logger.error(ex)
-        sys.exit()
+        return 1
+    return 0
+
+def run_link(args: argparse.Namespace, options: AssemblerOptions) -> tuple[bytearray, dict[str, int]]:
+    """
+    Link the inputs in order into an image. An assembly module is assembled
+    into an object file only if it changed since its object was built, an
+    object file is linked as it is. When optimising, no instructions are
+    removed from any module if one has an IJMP.
+
+    Returns:
+        link (tuple[bytearray, dict[str, int]]): The image and the address of
+            every label, exits if a module fails to assemble or link.
+    """
+    from linker import OBJECT_SUFFIX, ObjectModule, build_object, computes_jumps, link #only needed here
+    from pathlib import Path
+
+    modules: list[ObjectModule | None] = []
+    rebuilt = 0
+    try:
+        #the objects first, as whether any module has an IJMP decides how the rest are optimised
+        for name in args.Input:
+            path = Path(name)
+            modules.append(ObjectModule.read(path) if path.suffix == OBJECT_SUFFIX else None)
+        removals = not options.optimise or not any(
+            module.computed_jumps if module is not None else computes_jumps(read_file(name))
+            for name, module in zip(args.Input, modules))
+        for index, name in enumerate(args.Input):
+            if modules[index] is not None:
+                continue
+            path = Path(name)
+            object_file = None
+            if args.output_dir:
+                Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+                object_file = Path(args.output_dir) / (path.stem + OBJECT_SUFFIX)
+            modules[index], assembled = build_object(name, object_file, options, removals)
+            rebuilt += assembled
+        image, symbols = link(modules)
+    except Exception as ex:
+        logger.error(ex)
+        sys.exit(1)
+    logger.info("%d of %d modules assembled, the rest were up to date", rebuilt, len(modules))
+    return image, symbols
+
+def run_server(args: argparse.Namespace) -> int:
+    """
+    Run the assembler server until it is sent a shutdown request, or its
+    input ends when serving stdin/stdout.
+
+    Returns:
+        exit_code (int): 0 once the server stops, 1 if it could not listen.
+    """
+    from server import serve_stdio, serve_socket #only needed here
+
+    if args.serve == "-":
+        #the responses are the output, so the log goes to stderr
+        for handler in logging.getLogger().handlers:
+            if isinstance(handler, logging.StreamHandler):
+                handler.setStream(sys.stderr)
+        serve_stdio()
+        return 0
+    try:
+        serve_socket(args.serve or None)
+    except KeyboardInterrupt:
+        pass
+    except OSError as ex:
+        logger.error(ex)
+        return 1
+    return 0
 
+def run_disassembly(args: argparse.Namespace) -> int:
+    """
+    Disassemble a single image, words that are not instructions are written
+    as comments with a warning.
+
+    Returns:
+        exit_code (int): 0 if the image was read, otherwise 1.
+    """
+    from rom_delta import read_image_words #only needed here
+    from disassembler import disassemble
+
+    try:
+        lines = disassemble(read_image_words(args.Input[0]), strict=False)
+    except (OSError, ValueError) as ex:
+        logger.error(ex)
+        return 1
+    source = "".join(f"{line}\n" for line in lines)
     if args.Output:
-        #if an output was provided
-        bin_file_name = args.Output
-        write_file(bin_file_name, machine_code)
+        with open(args.Output, "w") as f:
+            f.write(source)
+    else:
+        sys.stdout.write(source)
+    return 0
+
+def report_delta(previous: str, image: bytearray) -> bool:
+    """
+    Print the differences between an image and the previous image the ROM
+    was built from, on stderr so they are not mixed with the machine code.
+
+    Returns:
+        ok (bool): If the previous image was read.
+    """
+    from rom_delta import read_image_words, compare_images #only needed here
+
+    try:
+        previous_words = read_image_words(previous)
+    except (OSError, ValueError) as ex:
+        logger.error("cannot read the previous image: %s", ex)
+        return False
+    print(compare_images(previous_words, unpack_words(image)), file=sys.stderr)
+    return True
+
+def run_wcet(args: argparse.Namespace, options: AssemblerOptions) -> int:
+    """
+    Analyse the worst-case execution time of a single file and print it,
+    after the peephole optimiser with -O.
+
+    Returns:
+        exit_code (int): 0 if the file was analysed, otherwise 1.
+    """
+    from wcet import read_loop_bounds, analyse_wcet #only needed here
+
+    session = Assembler(options)
+    try:
+        source = read_file(args.Input[0])
+        ast = session.parse(session.tokenise(source))
+        if options.optimise:
+            print(session.optimise(ast), file=sys.stderr)
+        report = analyse_wcet(ast, session.symbol_table, read_loop_bounds(source))
+    except Exception as ex:
+        logger.error(ex)
+        return 1
+    print(report)
+    return 0
+
+def write_debug_info(args: argparse.Namespace, image: bytearray, session: Assembler) -> None:
+    """Write the debug info and listing of a program assembled by a session."""
+    from debuginfo import build_debug_info, format_listing #only needed here
+
+    if args.debug_info:
+        build_debug_info(session.line_table, session.symbol_table, args.Input[0]).write(args.debug_info)
+    if args.listing:
+        with open(args.listing, "w") as f:
+            f.write(format_listing(image, session.line_table, read_file(args.Input[0])) + "\n")
+
+def run_simulation(args: argparse.Namespace, image: bytearray, symbols: dict[str, int]) -> int:
+    """
+    Run an assembled program on the simulator and print its profile. A build
+    cache hit has no symbol table, so the profile is not split by label.
+
+    Returns:
+        exit_code (int): 0 if the program ran, otherwise 1.
+    """
+    from simulator import format_profile #only needed here
+    from translator import BlockSimulator
+
+    tracing = args.trace is not None or args.watch or args.trace_file
+    if tracing:
+        from tracing import TracingSimulator, parse_watchpoint, format_trace, ACCESS_READ
+
+        try:
+            watchpoints = [parse_watchpoint(text, args.watch_stop) for text in args.watch]
+        except ValueError as ex:
+            logger.error(ex)
+            return 1
+        simulator = TracingSimulator.from_image(image, symbols, profile=True, pins=args.pins,
+                                                capacity=args.trace or 4096, watchpoints=watchpoints)
     else:
-        for line in machine_code:
-            print(line)
+        simulator = BlockSimulator.from_image(image, symbols, profile=True, pins=args.pins)
+    try:
+        simulator.run(max_instructions=args.simulate)
+    except ValueError as ex:
+        logger.error(ex)
+        return 1
+    print(format_profile(simulator))
+    if tracing:
+        for snapshot in simulator.snapshots:
+            print(f"\nwatchpoint {snapshot.address:#05x} {'read' if snapshot.access == ACCESS_READ else 'written'} "
+                  f"({snapshot.value:02X}) at cycle {snapshot.cycle} by {simulator.location(snapshot.pc)}")
+            print(format_trace(snapshot.records[-8:], symbols))
+        if simulator.watch_hits > len(simulator.snapshots):
+            print(f"\n{simulator.watch_hits} watchpoint hits, the first {len(simulator.snapshots)} are shown")
+        if args.trace is not None:
+            print(f"\nthe last of {simulator.trace.total} instructions:")
+            print(format_trace(simulator.trace.records(32), symbols))
+        if args.trace_file:
+            simulator.trace.write(args.trace_file)
+    print(f"registers: {' '.join(f'{value:02X}' for value in simulator.registers)}")
+    print(f"GPIO output pins: {simulator.output_pins:08b}")
+    return 0
+
+def run_batch(args: argparse.Namespace, options: AssemblerOptions) -> int:
+    """
+    Assemble a batch of files and print a summary, every file is attempted
+    even when some fail.
+
+    Returns:
+        exit_code (int): 0 if every file assembled, otherwise 1.
+    """
+    from batch import expand_inputs, assemble_batch, format_summary #loads pathlib and glob, only needed here
+
+    input_files = expand_inputs(args.Input, args.manifest)
+    if not input_files:
+        logger.error("no input files matched")
+        return 1
+
+    start = time.perf_counter()
+    results = assemble_batch(input_files, args.output_dir, options, args.jobs, args.format)
+    print(format_summary(results, time.perf_counter() - start))
+
+    return 0 if all(result.ok for result in results) else 1
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
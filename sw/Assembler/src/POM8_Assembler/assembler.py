@@ -9,20 +9,37 @@ Contributors:
 License: GPL-3.0
 
 Classes:
-    Line: A dataclass modelling the data related to each assembly line
-    Program: A dataclass modelling the data related to a program
+    AssemblerOptions: A dataclass of the options for an assembler session
+    Assembler: A reentrant assembler session with its own symbol table
 """
 
+from __init__ import __version__
 from pom8_token import *
 from parser import *
+from parser import _FORMATS, _MNEMONIC_FORMATS, _MNEMONIC_INDEX
+from writers import unpack_words
 import re
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, BinaryIO, Callable, Iterator, Sequence
 
 import logging
-from logger_conf import *
+
+if TYPE_CHECKING:
+    from cache import BuildCache
+    from optimiser import OptimisationReport
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["read_file", "write_file", "tokenise", "second_pass"]
+__all__ = [
+    "read_file", "write_file", "tokenise", "tokenise_compact", "second_pass",
+    "encode", "encode_columns", "WORD_BYTES",
+    "AssemblerOptions", "Assembler"
+]
+
+#the number of bytes an instruction is packed into
+WORD_BYTES = 3
 
 _OPCODE = {
     "NOP": "000001",
@@ -68,6 +85,97 @@ FUNCT = {
     "INC": "010000"
 }
 
+#the bit position of each field of an instruction word
+_OPCODE_SHIFT = 18
+_RD_SHIFT = 14
+_RS_SHIFT = 10
+_RT_SHIFT = 6
+
+#an encoder takes the register operands in order and the immediate or label
+#address, and returns the instruction word
+_Encoder = Callable[[int, int, int, int], int]
+
+def _register_encoder(funct: int) -> _Encoder:
+    """Encode Rd, Rs, Rt."""
+    def encode(r0: int, r1: int, r2: int, value: int) -> int:
+        return funct | (r0 << _RD_SHIFT) | (r1 << _RS_SHIFT) | (r2 << _RT_SHIFT)
+    return encode
+
+def _ijmp_encoder(funct: int) -> _Encoder:
+    """Encode Rs, Rt, IJMP is the only instruction that does not follow the Rd, Rs, Rt order."""
+    def encode(r0: int, r1: int, r2: int, value: int) -> int:
+        return funct | (r0 << _RS_SHIFT) | (r1 << _RT_SHIFT)
+    return encode
+
+def _branch_encoder(opcode: int) -> _Encoder:
+    """Encode a 16 bit address."""
+    def encode(r0: int, r1: int, r2: int, value: int) -> int:
+        return opcode | value
+    return encode
+
+def _immediate_encoder(opcode: int) -> _Encoder:
+    """Encode Rd, Rs, immediate, negative decimals are 8 bit two's complement."""
+    def encode(r0: int, r1: int, r2: int, value: int) -> int:
+        return opcode | (r0 << _RD_SHIFT) | (r1 << _RS_SHIFT) | (value & 0xFF if value < 0 else value)
+    return encode
+
+def _source_immediate_encoder(opcode: int) -> _Encoder:
+    """Encode Rs, immediate, STA and PUSH do not follow the Rd, Rs, Rt order."""
+    def encode(r0: int, r1: int, r2: int, value: int) -> int:
+        return opcode | (r0 << _RS_SHIFT) | (value & 0xFF if value < 0 else value)
+    return encode
+
+#the fields of each mnemonic, the opcode and funct as an integer with the
+#register format's opcode of 0, and the shift of each register operand,
+#built once from the tables above
+_FIELDS: dict[str, tuple[int, int, int, int]] = {
+    **{mnemonic: (int(funct, 2), _RD_SHIFT, _RS_SHIFT, _RT_SHIFT) for mnemonic, funct in FUNCT.items()},
+    **{mnemonic: (int(opcode, 2) << _OPCODE_SHIFT, _RD_SHIFT, _RS_SHIFT, 0) for mnemonic, opcode in _OPCODE.items()},
+    "IJMP": (int(FUNCT["IJMP"], 2), _RS_SHIFT, _RT_SHIFT, 0),
+    "STA": (int(_OPCODE["STA"], 2) << _OPCODE_SHIFT, _RS_SHIFT, 0, 0),
+    "PUSH": (int(_OPCODE["PUSH"], 2) << _OPCODE_SHIFT, _RS_SHIFT, 0, 0)
+}
+
+#the encoder of each mnemonic
+_ENCODERS: dict[str, _Encoder] = {}
+for _mnemonic, _fmt in _MNEMONIC_FORMATS.items():
+    _base = _FIELDS[_mnemonic][0]
+    if _mnemonic == "IJMP":
+        _ENCODERS[_mnemonic] = _ijmp_encoder(_base)
+    elif _mnemonic in ("STA", "PUSH"):
+        _ENCODERS[_mnemonic] = _source_immediate_encoder(_base)
+    elif _fmt == Format.REGISTER_FORMAT:
+        _ENCODERS[_mnemonic] = _register_encoder(_base)
+    elif _fmt == Format.BRANCH_FORMAT:
+        _ENCODERS[_mnemonic] = _branch_encoder(_base)
+    else:
+        _ENCODERS[_mnemonic] = _immediate_encoder(_base)
+
+#the encoders and fields by mnemonic index, as CompactProgram records store them
+_ENCODER_TABLE: tuple[_Encoder, ...] = tuple(_ENCODERS[mnemonic] for mnemonic in MNEMONICS)
+_FIELD_TABLE: tuple[tuple[int, ...], ...] = tuple(zip(*(_FIELDS[mnemonic] for mnemonic in MNEMONICS)))
+
+#the operand kinds of a CompactProgram record of three registers
+_THREE_REGISTERS = (CompactProgram.OPERAND_REGISTER
+                    | CompactProgram.OPERAND_REGISTER << 2
+                    | CompactProgram.OPERAND_REGISTER << 4)
+
+#the smallest program encode vectorises by default
+_VECTORISE_MIN_INSTRUCTIONS = 4096
+
+_numpy = None
+
+def _import_numpy():
+    """Import NumPy on first use, returns None if it is not installed."""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
 def read_file(file_name: str) -> str:
     """
     Helper function to read an assembly text file and return the contents.
@@ -98,117 +206,615 @@ def write_file(file_name: str, machine_code: list[str]) -> None:
         for line in machine_code:
             f.write(line + "\n")
 
-def tokenise(file_name: str) -> list[Token]:
+def tokenise(file_name: str, scanner: bool = False) -> list[Token]:
     """
     tokenise the lines of assembly and store them.
 
     Parameters:
-        program (Program): The assembly program.
+        file_name (str): The name of the assembly file.
+        scanner (bool): Use the single pass scanner instead of splitting
+            and classifying each line separately.
+    """
+    return _tokenise_source(read_file(file_name), symbol_table, scanner)
+
+def _tokenise_source(asm: str, symbols: dict[str, int], scanner: bool = False,
+                     log: logging.Logger = logger) -> list[Token]:
+    """
+    tokenise assembly code, adding its labels to the given symbol table.
+
+    Parameters:
+        asm (str): The assembly code.
+        symbols (dict[str, int]): The symbol table to add labels to.
+        scanner (bool): Use the single pass scanner.
+        log (logging.Logger): The logger to report labels to.
     """
+    if scanner:
+        return _scanner_tokenise(asm, symbols, log)
+
     tokens: list[Token] = []
-    asm = read_file(file_name)
     asm_lines = re.split("\n", asm)
     address = 0 #keep track of address separately to line number
     for line_index, line in enumerate(asm_lines):
-        if not line.strip() or line.strip().startswith(";"):
-            continue #skip empty lines or lines with only comments
-
-        # split line into items based on commas and/or whitespace
-        line_items = re.split(r"[,][ ]*|[ \t]+", line.strip())
-        for item in line_items:
-            token = Token(item, line_index+1)
-            if token.type == TokenType.COMMENT:
-                break #everything after a comment (;) is ignored
-            elif token.type == TokenType.LABEL:
-                label = token.text[:-1] #strip colon from label text
-                if label in symbol_table:
-                    raise SyntaxError(
-                        f"line {line_index+1}: '{label}' label already exists!"
-                    )
-                symbol_table[label] = address
-                logger.info(f"Line {line_index+1}: label ({label}) created for address {hex(address)}")
-            else:
-                tokens.append(token)
-            
-        address += 1
-        tokens.append(Token("\n", line_index+1))
+        line_tokens = _tokenise_line(line, line_index+1, address, symbols, log)
+        if line_tokens is not None:
+            tokens.extend(line_tokens)
+            address += 1
     
     return tokens
 
-def second_pass(ast: Program) -> list[str]:
+def _tokenise_line(line: str, line_num: int, address: int,
+                   symbols: dict[str, int], log: logging.Logger) -> list[Token] | None:
+    """
+    tokenise one line of assembly, adding its label to the symbol table.
+
+    Parameters:
+        line (str): The line of assembly code.
+        line_num (int): The line number, for error tracking.
+        address (int): The address of the line's instruction.
+        symbols (dict[str, int]): The symbol table to add labels to.
+        log (logging.Logger): The logger to report labels to.
+
+    Returns:
+        tokens (list[Token] | None): The tokens of the line, ending with a
+            newline, or None for an empty or comment only line.
+    """
+    if not line.strip() or line.strip().startswith(";"):
+        return None #skip empty lines or lines with only comments
+
+    tokens: list[Token] = []
+    # split line into items based on commas and/or whitespace
+    line_items = re.split(r"[,][ ]*|[ \t]+", line.strip())
+    for item in line_items:
+        token = Token(item, line_num)
+        if token.type == TokenType.COMMENT:
+            break #everything after a comment (;) is ignored
+        elif token.type == TokenType.LABEL:
+            _define_label(token.text[:-1], address, line_num, symbols, log)
+        else:
+            tokens.append(token)
+
+    tokens.append(Token("\n", line_num))
+    return tokens
+
+def _define_label(label: str, address: int, line_num: int,
+                  symbols: dict[str, int], log: logging.Logger) -> None:
+    """
+    Add a label to a symbol table.
+
+    Parameters:
+        label (str): The label, without its colon.
+        address (int): The address of the instruction the label marks.
+        line_num (int): The line number of the label, for error tracking.
+        symbols (dict[str, int]): The symbol table to add the label to.
+        log (logging.Logger): The logger to report the label to.
+    """
+    if label in symbols:
+        raise SyntaxError(
+            f"line {line_num}: '{label}' label already exists!"
+        )
+    symbols[label] = address
+    log.info("Line %d: label (%s) created for address %#x", line_num, label, address)
+
+def _scanner_tokenise(asm: str, symbols: dict[str, int], log: logging.Logger) -> list[Token]:
+    """
+    tokenise assembly with the scanner, giving the same tokens as tokenise.
+
+    Parameters:
+        asm (str): The assembly code.
+        symbols (dict[str, int]): The symbol table to add labels to.
+        log (logging.Logger): The logger to report labels to.
+    """
+    tokens: list[Token] = []
+    address = 0
+    for token_type, text, line_num in scan(asm):
+        if token_type is TokenType.LABEL:
+            _define_label(text[:-1], address, line_num, symbols, log) #strip colon from label text
+        else:
+            tokens.append(Token(text, line_num, token_type))
+            if token_type is TokenType.NEWLINE:
+                address += 1
+
+    return tokens
+
+def tokenise_compact(file_name: str) -> TokenStream:
+    """
+    tokenise assembly with the scanner into a compact TokenStream.
+
+    The tokens and symbol table are the same as tokenise, but the tokens are
+    stored as parallel arrays rather than Token objects.
+
+    Parameters:
+        file_name (str): The name of the assembly file.
+    """
+    return _tokenise_compact_source(read_file(file_name), symbol_table)
+
+def _tokenise_compact_source(asm: str, symbols: dict[str, int],
+                             log: logging.Logger = logger) -> TokenStream:
+    """
+    tokenise assembly code into a TokenStream, adding its labels to the
+    given symbol table.
+
+    Parameters:
+        asm (str): The assembly code.
+        symbols (dict[str, int]): The symbol table to add labels to.
+        log (logging.Logger): The logger to report labels to.
+    """
+    tokens = TokenStream(asm)
+    append = tokens.append
+    address = 0
+    for token_type, start, end, line_num in scan_spans(asm):
+        if token_type is TokenType.LABEL:
+            _define_label(asm[start:end-1], address, line_num, symbols, log) #strip colon from label text
+        else:
+            append(token_type, start, end, line_num)
+            if token_type is TokenType.NEWLINE:
+                address += 1
+
+    return tokens
+
+def second_pass(ast: Program | CompactProgram,
+                symbols: dict[str, int] | None = None) -> list[str]:
     """
     Assemble tokenised and syntax checked assembly code.
+
+    Parameters:
+        ast (Program | CompactProgram): The parsed program.
+        symbols (dict[str, int] | None): The symbol table to resolve labels
+            with, the module symbol table if not given.
+
+    Returns:
+        machine_code (list[str]): One line of 24 '0'/'1' characters per
+            instruction, see encode for the packed machine code.
+    """
+    return [f"{word:024b}" for word in _encode_words(ast, symbols)]
+
+def encode(ast: Program | CompactProgram,
+           symbols: dict[str, int] | None = None,
+           vectorise: bool | None = None) -> bytearray:
+    """
+    Assemble tokenised and syntax checked assembly code into an image.
+
+    Parameters:
+        ast (Program | CompactProgram): The parsed program.
+        symbols (dict[str, int] | None): The symbol table to resolve labels
+            with, the module symbol table if not given.
+        vectorise (bool | None): Encode the whole program at once with NumPy,
+            by default only for a CompactProgram of at least
+            _VECTORISE_MIN_INSTRUCTIONS instructions when NumPy is installed.
+
+    Returns:
+        image (bytearray): The machine code, each instruction packed into
+            WORD_BYTES big-endian bytes.
+    """
+    if symbols is None:
+        symbols = symbol_table
+    if vectorise is None:
+        vectorise = (isinstance(ast, CompactProgram)
+                     and len(ast) >= _VECTORISE_MIN_INSTRUCTIONS
+                     and _import_numpy() is not None)
+    if vectorise:
+        return encode_columns(*_field_columns(ast, symbols))
+    return _pack_words(array("I", _encode_words(ast, symbols)))
+
+def _encode_words(ast: Program | CompactProgram,
+                  symbols: dict[str, int] | None) -> Iterator[int]:
+    """Encode each instruction of a program as an integer."""
+    if symbols is None:
+        symbols = symbol_table
+    encoders = _ENCODER_TABLE
+    return (encoders[mnemonic](r0, r1, r2, value)
+            for mnemonic, r0, r1, r2, value in _instruction_fields(ast, symbols))
+
+def _pack_words(words: array) -> bytearray:
+    """Pack an array('I') of instruction words into WORD_BYTES big-endian bytes each."""
+    if sys.byteorder == "little":
+        words.byteswap()
+    data = words.tobytes()
+    size = words.itemsize
+    image = bytearray(WORD_BYTES * len(words))
+    for x in range(WORD_BYTES):
+        #drop the most significant byte of each big-endian word
+        image[x::WORD_BYTES] = data[size - WORD_BYTES + x::size]
+    return image
+
+def _instruction_fields(ast: Program | CompactProgram,
+                        symbols: dict[str, int]) -> Iterator[tuple[int, int, int, int, int]]:
     """
-    machine_code = []
+    Get the fields of each instruction of a program, ready to encode.
+
+    Yields:
+        fields (tuple[int, int, int, int, int]): The index of the mnemonic in
+            MNEMONICS, the register operands in order (0 when absent), and the
+            immediate or label address (0 when absent).
+    """
+    if isinstance(ast, CompactProgram):
+        yield from _compact_fields(ast, symbols)
+        return
+
     for instruction in ast.instructions:
-        mnemonic = instruction.opcode_mnemonic
-        machine_code_line = ""
-        Rd = Rs = Rt = 0
+        yield _object_fields(instruction, symbols)
 
-        if instruction.inst_format == Format.REGISTER_FORMAT:
-            Funct = FUNCT[mnemonic]
+def _object_fields(instruction: Instruction,
+                   symbols: dict[str, int]) -> tuple[int, int, int, int, int]:
+    """Get the fields of an Instruction node, see _instruction_fields."""
+    registers = [0, 0, 0]
+    count = 0
+    value = 0
+    for operand in instruction.operands:
+        if isinstance(operand, RegisterOperand):
+            registers[count] = operand.register_num
+            count += 1
+        elif isinstance(operand, LabelOperand):
+            value = symbols[operand.name]
+        else:
+            value = operand.value
+    return _MNEMONIC_INDEX[instruction.opcode_mnemonic], registers[0], registers[1], registers[2], value
 
-            if mnemonic == "IJMP":
-                #IJMP is the only instruction that does not follow the Rd, Rs, Rt order
-                Rs = instruction.operands[0].reigster_num
-                Rt = instruction.operands[1].register_num
-            else:
-                registers = [0, 0, 0]
-                for x, operand in enumerate(instruction.operands):
-                    registers[x] = operand.register_num
-                Rd, Rs, Rt = registers
-            
-            machine_code_line = ("000000"
-                                    + f"{Rd:04b}"
-                                    + f"{Rs:04b}"
-                                    + f"{Rt:04b}"
-                                    + Funct)
-        elif instruction.inst_format == Format.BRANCH_FORMAT:
-            opcode = _OPCODE[mnemonic]
-
-            #is it a label or a hex input
-            address = 0
-            if len(instruction.operands) >= 1:
-                operand = instruction.operands[0]
-                if isinstance(operand, LabelOperand):
-                    address = symbol_table[operand.name]
-                else:
-                    address = operand.value
-            
-            machine_code_line = (opcode
-                                    + "00"
-                                    + f"{address:016b}")
-        elif instruction.inst_format == Format.IMMEDIATE_FORMAT:
-            opcode = _OPCODE[mnemonic]
-            immediate = "0000000000"
-
-            registers = [0, 0]
-            imm_op: ASTNode = ASTNode()
-            for x, op in enumerate(instruction.operands):
-                if isinstance(op, RegisterOperand):
-                    registers[x] = op.register_num
-                else: #immediate operand
-                    imm_op = op
-
-            #STA and PUSH do not follow the Rd, Rs, Rt order
-            if (mnemonic == "STA"
-                or mnemonic == "PUSH"):
-                Rs = registers[0]
+def _compact_fields(ast: CompactProgram,
+                    symbols: dict[str, int]) -> Iterator[tuple[int, int, int, int, int]]:
+    """Get the fields of each record of a CompactProgram, see _instruction_fields."""
+    records = ast.records
+    labels = ast.labels
+    width = CompactProgram.RECORD_WIDTH
+    for start in range(0, len(records), width):
+        mnemonic, kinds, op0, op1, op2 = records[start:start + 5]
+        if kinds == _THREE_REGISTERS or kinds & 0b11 != CompactProgram.OPERAND_REGISTER:
+            #three registers, a lone immediate or label, or no operands
+            if kinds == CompactProgram.OPERAND_LABEL:
+                yield mnemonic, 0, 0, 0, symbols[labels[op0]]
+            elif kinds == CompactProgram.OPERAND_IMMEDIATE:
+                yield mnemonic, 0, 0, 0, op0
             else:
-                Rd, Rs = registers
-            
-            if isinstance(imm_op, ImmediateOperand):
-                decimal = imm_op.value
-                if decimal < 0:
-                    immediate = "00" + bin((1 << 8) + decimal)[2:]
-                else:
-                    immediate = f"{decimal:010b}"
-
-            machine_code_line = (opcode
-                                    + f"{Rd:04b}"
-                                    + f"{Rs:04b}"
-                                    + immediate)
-
-        machine_code.append(machine_code_line)
-    
-    return machine_code
\ No newline at end of file
+                yield mnemonic, op0, op1, op2, 0
+        elif kinds >> 2 & 0b11 == CompactProgram.OPERAND_REGISTER:
+            #two registers, then possibly an immediate
+            yield mnemonic, op0, op1, 0, op2
+        else:
+            #one register, then possibly an immediate
+            yield mnemonic, op0, 0, 0, op1
+
+def _field_columns(ast: Program | CompactProgram,
+                   symbols: dict[str, int]) -> tuple[Sequence[int], ...]:
+    """Get the fields of a program as columns, see _instruction_fields and encode_columns."""
+    np = _import_numpy()
+    if isinstance(ast, CompactProgram) and np is not None:
+        #slice the columns straight out of the records
+        records = np.frombuffer(ast.records, dtype=np.int32).reshape(-1, CompactProgram.RECORD_WIDTH)
+        addresses = np.array([symbols[label] for label in ast.labels] or [0], dtype=np.int32)
+        registers = [np.zeros(len(records), dtype=np.int32) for _ in range(3)]
+        values = np.zeros(len(records), dtype=np.int32)
+        for x in range(3):
+            kind = (records[:, 1] >> (2 * x)) & 0b11
+            operand = records[:, 2 + x]
+            #the registers come before any immediate or label
+            registers[x] = np.where(kind == CompactProgram.OPERAND_REGISTER, operand, 0)
+            values += np.where(kind == CompactProgram.OPERAND_IMMEDIATE, operand, 0)
+            is_label = kind == CompactProgram.OPERAND_LABEL
+            values += np.where(is_label, addresses[np.where(is_label, operand, 0)], 0)
+        return (records[:, 0], *registers, values)
+
+    columns = (array("B"), array("B"), array("B"), array("B"), array("i"))
+    appends = [column.append for column in columns]
+    for fields in _instruction_fields(ast, symbols):
+        for append, field in zip(appends, fields):
+            append(field)
+    return columns
+
+def encode_columns(mnemonics: Sequence[int], r0: Sequence[int], r1: Sequence[int],
+                   r2: Sequence[int], values: Sequence[int]) -> bytearray:
+    """
+    Encode whole columns of instruction fields at once with NumPy.
+
+    Parameters:
+        mnemonics (Sequence[int]): The index of each mnemonic in MNEMONICS.
+        r0, r1, r2 (Sequence[int]): The register operands of each instruction,
+            in the order written, 0 when absent.
+        values (Sequence[int]): The immediate or label address of each
+            instruction, 0 when absent.
+
+    Returns:
+        image (bytearray): The machine code, as from encode.
+    """
+    np = _import_numpy()
+    if np is None:
+        raise ImportError("NumPy is required to encode columns, install it or use encode")
+
+    mnemonics = np.asarray(mnemonics, dtype=np.intp)
+    base, shift0, shift1, shift2 = (np.asarray(column, dtype=np.uint32)[mnemonics]
+                                    for column in _FIELD_TABLE)
+    values = np.asarray(values, dtype=np.int32)
+    words = (base
+             | (np.asarray(r0, dtype=np.uint32) << shift0)
+             | (np.asarray(r1, dtype=np.uint32) << shift1)
+             | (np.asarray(r2, dtype=np.uint32) << shift2)
+             | np.where(values < 0, values & 0xFF, values).astype(np.uint32))
+    #drop the most significant byte of each big-endian word
+    return bytearray(words.astype(">u4").view(np.uint8).reshape(-1, 4)[:, 4 - WORD_BYTES:].tobytes())
+
+@dataclass(frozen=True)
+class AssemblerOptions:
+    """
+    The options of an assembler session.
+
+    Attributes:
+        scanner (bool): tokenise with the single pass scanner.
+        compact (bool): use the compact token stream and instruction records.
+        cache_dir (str | None): the build cache directory, no cache if None.
+        cache_size (int): the size limit of the build cache in bytes.
+        optimise (bool): rewrite the parsed program with the peephole
+            optimiser, the tokens are then parsed into a Program even when
+            compact.
+        one_pass (bool): encode each line as soon as it is scanned, patching
+            forward branches when their label is defined, see one_pass.py.
+            Ignored when optimising, which needs the parsed program.
+        jobs (int | None): the worker processes to tokenise a large source
+            with, see parallel.py, the number of CPUs if None. 1 tokenises
+            in this process.
+    """
+    scanner: bool = False
+    compact: bool = False
+    cache_dir: str | None = None
+    cache_size: int = 64 * 2**20
+    optimise: bool = False
+    one_pass: bool = False
+    jobs: int | None = 1
+
+def _encoding_fingerprint(optimise: bool = False) -> str:
+    """
+    Describe everything besides the source that determines the machine code,
+    the assembler version, the encoding tables and whether the program is
+    optimised, for cache keys.
+    """
+    formats = {fmt.name: mnemonics for fmt, mnemonics in _FORMATS.items()}
+    return f"{__version__}|{_OPCODE}|{FUNCT}|{formats}" + ("|optimised" if optimise else "")
+
+class Assembler:
+    """
+    A reentrant POM8 assembler session.
+
+    The session holds its own symbol table, options and logger rather than
+    using the module symbol table, so any number of sessions can assemble at
+    the same time, e.g. one per worker of a thread pool. The only state the
+    sessions share is immutable (compiled patterns and encoding tables). A
+    single session assembles one program at a time.
+
+    Properties:
+        symbol_table (dict[str, int]): The labels of the program being, or
+            last, assembled.
+        options (AssemblerOptions): The options of the session.
+        logger (logging.Logger): The logger the session reports to.
+        optimisation (OptimisationReport | None): The savings of the
+            peephole optimiser on the last program, None if it was not run.
+        line_table (array): The source line of each instruction of the last
+            program, an array('I') indexed by address.
+    """
+    def __init__(self, options: AssemblerOptions | None = None,
+                 log: logging.Logger | None = None) -> None:
+        """
+        Assembler class constructor.
+
+        Parameters:
+            options (AssemblerOptions | None): The session options.
+            log (logging.Logger | None): The logger to report to, the
+                assembler module logger if not given.
+        """
+        self._options = options if options is not None else AssemblerOptions()
+        self._logger = log if log is not None else logger
+        self._symbol_table: dict[str, int] = {}
+        self._optimisation: "OptimisationReport | None" = None
+        self._line_table = array("I")
+        self._cache: "BuildCache | None" = None
+        if self._options.cache_dir is not None:
+            from cache import BuildCache #only needed, and imported, with a cache
+            self._cache = BuildCache(self._options.cache_dir, self._options.cache_size)
+
+    @property
+    def symbol_table(self) -> dict[str, int]:
+        """The labels of the program being, or last, assembled."""
+        return self._symbol_table
+
+    @property
+    def options(self) -> AssemblerOptions:
+        """The options of the session."""
+        return self._options
+
+    @property
+    def logger(self) -> logging.Logger:
+        """The logger the session reports to."""
+        return self._logger
+
+    @property
+    def cache(self) -> "BuildCache | None":
+        """The build cache of the session, if the options give a cache_dir."""
+        return self._cache
+
+    @property
+    def optimisation(self) -> "OptimisationReport | None":
+        """The savings of the peephole optimiser on the last program, None if it was not run."""
+        return self._optimisation
+
+    @property
+    def line_table(self) -> array:
+        """
+        The source line of each instruction of the last program assembled by
+        assemble_image, an array('I') indexed by address. Empty after a
+        build cache hit, as the source is not read.
+        """
+        return self._line_table
+
+    def tokenise(self, source: str | bytes) -> list[Token] | TokenStream:
+        """
+        tokenise assembly code, starting a new symbol table.
+
+        Parameters:
+            source (str | bytes): The assembly code, bytes are decoded as UTF-8.
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = bytes(source).decode("utf-8")
+        self._symbol_table = {}
+        if self._options.jobs != 1:
+            from parallel import tokenise_parallel #imports this module
+
+            return tokenise_parallel(source, self._symbol_table, self._options.scanner, self._options.compact,
+                                     self._options.jobs, self._logger)
+        if self._options.compact:
+            return _tokenise_compact_source(source, self._symbol_table, self._logger)
+        return _tokenise_source(source, self._symbol_table, self._options.scanner, self._logger)
+
+    def parse(self, tokens: list[Token] | TokenStream) -> Program | CompactProgram:
+        """
+        Parse tokens from this session into an AST.
+
+        Parameters:
+            tokens (list[Token] | TokenStream): The tokens to parse.
+        """
+        parser = Parser(tokens, self._symbol_table, self._logger)
+        if self._options.compact and not self._options.optimise:
+            return parser.parse_compact()
+        return parser.parse_program()
+
+    def optimise(self, ast: Program, removals: bool = True) -> "OptimisationReport":
+        """
+        Rewrite a parsed program with the peephole optimiser, moving the
+        labels of this session's symbol table, see optimiser.optimise.
+
+        Parameters:
+            ast (Program): The parsed program, rewritten in place.
+            removals (bool): If instructions may be removed.
+        """
+        from optimiser import optimise #only needed, and imported, when optimising
+
+        self._optimisation = optimise(ast, self._symbol_table, self._logger, removals)
+        return self._optimisation
+
+    def second_pass(self, ast: Program | CompactProgram) -> list[str]:
+        """
+        Assemble a parsed program using this session's symbol table.
+
+        Parameters:
+            ast (Program | CompactProgram): The parsed program.
+        """
+        return second_pass(ast, self._symbol_table)
+
+    def encode(self, ast: Program | CompactProgram) -> bytearray:
+        """
+        Assemble a parsed program into a packed image using this session's
+        symbol table.
+
+        Parameters:
+            ast (Program | CompactProgram): The parsed program.
+        """
+        return encode(ast, self._symbol_table)
+
+    def assemble_image(self, source: str | bytes) -> bytearray:
+        """
+        Assemble assembly code into a packed image.
+
+        With a build cache, a hit returns the stored image without
+        tokenising, parsing or assembling, so the symbol table is left empty
+        and there is no optimisation report.
+
+        Parameters:
+            source (str | bytes): The assembly code, bytes are decoded as UTF-8.
+
+        Returns:
+            image (bytearray): The machine code, each instruction packed into
+                WORD_BYTES big-endian bytes.
+        """
+        self._optimisation = None
+        self._line_table = array("I")
+        if self._cache is None:
+            return self._assemble_image(source)
+
+        if isinstance(source, str):
+            source = source.encode("utf-8")
+        key = self._cache.key(bytes(source), _encoding_fingerprint(self._options.optimise))
+        image = self._cache.get(key)
+        if image is not None:
+            self._symbol_table = {}
+            self._logger.info("cache hit %s", key[:16])
+            return image
+
+        image = self._assemble_image(source)
+        self._cache.put(key, image)
+        return image
+
+    def _assemble_image(self, source: str | bytes) -> bytearray:
+        """Tokenise, parse, optionally optimise, and encode assembly code."""
+        if self._options.one_pass and not self._options.optimise:
+            return self.assemble_one_pass(source)
+        ast = self.parse(self.tokenise(source))
+        if self._options.optimise:
+            self.optimise(ast)
+        if isinstance(ast, CompactProgram):
+            self._line_table = array("I", ast.records[CompactProgram.RECORD_WIDTH - 1::CompactProgram.RECORD_WIDTH])
+        else:
+            self._line_table = array("I", [instruction.line_num for instruction in ast.instructions])
+        return self.encode(ast)
+
+    def assemble_one_pass(self, source: str | bytes) -> bytearray:
+        """
+        Assemble assembly code into a packed image in a single pass, starting
+        a new symbol table, see one_pass.assemble_one_pass.
+
+        Parameters:
+            source (str | bytes): The assembly code, bytes are decoded as UTF-8.
+        """
+        from one_pass import assemble_one_pass #imports this module
+
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = bytes(source).decode("utf-8")
+        self._symbol_table = {}
+        self._line_table = array("I")
+        return assemble_one_pass(source, self._symbol_table, self._logger, self._line_table)
+
+    def assemble(self, source: str | bytes) -> list[str]:
+        """
+        Assemble assembly code into machine code, see assemble_image.
+
+        Parameters:
+            source (str | bytes): The assembly code, bytes are decoded as UTF-8.
+
+        Returns:
+            machine_code (list[str]): The machine code, one line per instruction.
+        """
+        return [f"{word:024b}" for word in unpack_words(self.assemble_image(source))]
+
+    def assemble_stream(self, file_name: str, output: BinaryIO, fmt: str = "text") -> None:
+        """
+        Assemble an assembly file a line at a time, writing the machine code
+        to the output as it is produced, see streaming.stream_words. The
+        build cache is not used.
+
+        Parameters:
+            file_name (str): The name of the assembly file.
+            output (BinaryIO): The binary file to write the machine code to.
+            fmt (str): The output format, a key of writers.WORD_FORMATS.
+        """
+        from streaming import assemble_stream #imports this module
+
+        self._symbol_table = {}
+        with open(file_name, "r") as f:
+            assemble_stream(f, output, fmt, self._symbol_table, self._logger)
+
+    def assemble_file_image(self, file_name: str) -> bytearray:
+        """
+        Assemble an assembly file into a packed image.
+
+        Parameters:
+            file_name (str): The name of the assembly file.
+        """
+        if self._cache is not None:
+            #key on the bytes of the file, as they are
+            with open(file_name, "rb") as f:
+                return self.assemble_image(f.read())
+        return self.assemble_image(read_file(file_name))
+
+    def assemble_file(self, file_name: str) -> list[str]:
+        """
+        Assemble an assembly file into machine code.
+
+        Parameters:
+            file_name (str): The name of the assembly file.
+        """
+        return [f"{word:024b}" for word in unpack_words(self.assemble_file_image(file_name))]
@@ -0,0 +1,219 @@
+"""
+batch.py
+
+This module assembles many POM8 assembly files at once, spreading them
+across a process pool, and reports the time taken and any error for each.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Classes:
+    BatchResult: A dataclass of the outcome of assembling one file.
+
+Functions:
+    expand_inputs: Expand file names, globs and a manifest into input files.
+    output_path: Get the output file name for an input file.
+    assemble_one: Assemble a single file, capturing any error.
+    assemble_batch: Assemble many files across a process pool.
+    format_summary: Format a per-file summary of a batch.
+"""
+
+from assembler import *
+from writers import *
+import glob
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "BatchResult",
+    "expand_inputs", "output_path",
+    "assemble_one", "assemble_batch", "format_summary"
+]
+
+@dataclass(frozen=True)
+class BatchResult:
+    """
+    The outcome of assembling one file in a batch.
+
+    Attributes:
+        input_file (str): The assembly file.
+        output_file (str): The machine code file.
+        seconds (float): The time taken to assemble and write the file.
+        error (str | None): The error message, if the file failed.
+        cache_hit (bool | None): Was the machine code found in the build
+            cache, None without a cache.
+    """
+    input_file: str
+    output_file: str
+    seconds: float
+    error: str | None = None
+    cache_hit: bool | None = None
+
+    @property
+    def ok(self) -> bool:
+        """Did the file assemble without error."""
+        return self.error is None
+
+def _is_glob(pattern: str) -> bool:
+    """Does the pattern contain glob wildcards."""
+    return any(char in pattern for char in "*?[")
+
+def expand_inputs(patterns: list[str], manifest: str | None = None) -> list[str]:
+    """
+    Expand file names and glob patterns into a list of input files.
+
+    Parameters:
+        patterns (list[str]): File names or glob patterns ("**" is recursive).
+        manifest (str | None): A manifest file listing one file name or glob
+            per line, relative to the manifest. Blank lines and lines starting
+            with '#' are ignored.
+
+    Returns:
+        input_files (list[str]): The input files in the order given, without
+            duplicates. A file name that does not exist is kept, so it is
+            reported as an error rather than silently skipped.
+    """
+    patterns = list(patterns)
+    if manifest is not None:
+        manifest_dir = Path(manifest).parent
+        with open(manifest, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                patterns.append(str(manifest_dir / line))
+
+    input_files: list[str] = []
+    for pattern in patterns:
+        if _is_glob(pattern):
+            input_files.extend(sorted(glob.glob(pattern, recursive=True)))
+        else:
+            input_files.append(pattern)
+
+    return list(dict.fromkeys(input_files))
+
+def output_path(input_file: str, output_dir: str | None = None, fmt: str = "text") -> str:
+    """
+    Get the output file name for an input file, text outputs are named like
+    the samples.
+
+    Parameters:
+        input_file (str): The assembly file, e.g. "src/add5.asm".
+        output_dir (str | None): The directory to write to, the directory of
+            the input file if not given.
+        fmt (str): The output format, a key of writers.FORMATS.
+
+    Returns:
+        output_file (str): The machine code file, e.g. "src/add5_bin.txt".
+    """
+    path = Path(input_file)
+    directory = Path(output_dir) if output_dir is not None else path.parent
+    return str(directory / f"{path.stem}{FORMAT_SUFFIXES[fmt]}")
+
+def assemble_one(input_file: str, output_file: str,
+                 options: AssemblerOptions | None = None, fmt: str = "text") -> BatchResult:
+    """
+    Assemble a single file and write its machine code, capturing any error
+    so a failing file does not stop the rest of the batch.
+
+    Parameters:
+        input_file (str): The assembly file.
+        output_file (str): The machine code file.
+        options (AssemblerOptions | None): The assembler options.
+        fmt (str): The output format, a key of writers.FORMATS.
+    """
+    start = time.perf_counter()
+    session = Assembler(options)
+    try:
+        image = session.assemble_file_image(input_file)
+        with open(output_file, "wb") as f:
+            write_image(f, image, fmt)
+    except Exception as ex:
+        return BatchResult(input_file, output_file, time.perf_counter() - start,
+                           f"{type(ex).__name__}: {ex}")
+    cache_hit = session.cache.stats.hits > 0 if session.cache is not None else None
+    return BatchResult(input_file, output_file, time.perf_counter() - start, cache_hit=cache_hit)
+
+def assemble_batch(input_files: list[str], output_dir: str | None = None,
+                   options: AssemblerOptions | None = None,
+                   workers: int | None = None, fmt: str = "text") -> list[BatchResult]:
+    """
+    Assemble many files in parallel across a process pool. Inputs whose
+    outputs would be the same file, e.g. a/add5.asm and b/add5.asm with an
+    output_dir, are errors after the first, rather than overwriting it.
+
+    Parameters:
+        input_files (list[str]): The assembly files.
+        output_dir (str | None): The directory to write to, see output_path.
+        options (AssemblerOptions | None): The assembler options.
+        workers (int | None): The number of worker processes, the number of
+            CPUs if not given. With one worker the files are assembled in
+            this process.
+        fmt (str): The output format, a key of writers.FORMATS.
+
+    Returns:
+        results (list[BatchResult]): The result of each file, in input order.
+    """
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    jobs = [(input_file, output_path(input_file, output_dir, fmt)) for input_file in input_files]
+
+    #the first input to claim each output, keyed on the output as the file system sees it
+    writers: dict[str, str] = {}
+    collisions: dict[int, BatchResult] = {}
+    for x, (input_file, output_file) in enumerate(jobs):
+        first = writers.setdefault(os.path.normcase(os.path.abspath(output_file)), input_file)
+        if first != input_file:
+            collisions[x] = BatchResult(input_file, output_file, 0.0,
+                                        error=f"{output_file} is also the output of {first}")
+    jobs = [job for x, job in enumerate(jobs) if x not in collisions]
+
+    if workers == 1 or len(jobs) <= 1:
+        results = [assemble_one(input_file, output_file, options, fmt) for input_file, output_file in jobs]
+    else:
+        from concurrent.futures import ProcessPoolExecutor #loads multiprocessing, only needed here
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(assemble_one, input_file, output_file, options, fmt)
+                       for input_file, output_file in jobs]
+            results = [future.result() for future in futures]
+
+    #put the collisions back in input order
+    for x in sorted(collisions):
+        results.insert(x, collisions[x])
+    return results
+
+def format_summary(results: list[BatchResult], wall_seconds: float | None = None) -> str:
+    """
+    Format a summary of a batch, one line per file then the totals.
+
+    Parameters:
+        results (list[BatchResult]): The results of the batch.
+        wall_seconds (float | None): The wall clock time of the whole batch.
+    """
+    lines: list[str] = []
+    for result in results:
+        status = "ok" if result.ok else f"FAILED {result.error}"
+        if result.cache_hit:
+            status += " (cached)"
+        lines.append(f"{result.seconds*1000:9.2f} ms  {result.input_file} -> {result.output_file}  {status}")
+
+    failed = sum(1 for result in results if not result.ok)
+    total = sum(result.seconds for result in results)
+    summary = f"{len(results)} files, {len(results) - failed} assembled, {failed} failed, {total:.3f} s assembling"
+    if wall_seconds is not None:
+        summary += f", {wall_seconds:.3f} s wall clock"
+    if any(result.cache_hit is not None for result in results):
+        hits = sum(1 for result in results if result.cache_hit)
+        misses = sum(1 for result in results if result.cache_hit is False)
+        summary += f", cache: {hits} hits, {misses} misses"
+    lines.append(summary)
+
+    return "\n".join(lines)
@@ -0,0 +1,206 @@
+"""
+cache.py
+
+This module provides a content-addressed on-disk cache of assembled machine
+code, so unchanged sources do not need to be assembled again.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Classes:
+    CacheStats: A dataclass of the cache statistics of a session.
+    BuildCache: A size-bounded, least recently used, on-disk cache.
+"""
+
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["CacheStats", "BuildCache"]
+
+#the suffix of cache entries, anything else in the cache directory is ignored
+_ENTRY_SUFFIX = ".bin"
+#the size of an encoded instruction in an image
+_WORD_BYTES = 3
+
+@dataclass
+class CacheStats:
+    """
+    The statistics of a build cache since it was opened.
+
+    Attributes:
+        hits (int): Lookups that found an entry.
+        misses (int): Lookups that did not find an entry.
+        stores (int): Entries written.
+        evictions (int): Entries removed to stay within the size limit.
+    """
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of lookups that were hits."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __str__(self) -> str:
+        """Human readable summary of the statistics."""
+        return (f"cache: {self.hits} hits, {self.misses} misses ({self.hit_rate:.0%}), "
+                f"{self.stores} stored, {self.evictions} evicted")
+
+class BuildCache:
+    """
+    A content-addressed on-disk cache of machine code.
+
+    Entries are keyed on a hash of everything that determines the machine
+    code, and hold the image, the instructions packed as 3 byte big-endian
+    words. Each entry is written atomically, so several processes can share
+    a cache. A hit refreshes the entry's modification time, and when the
+    cache grows past its size limit the least recently used entries are
+    removed.
+
+    Properties:
+        cache_dir (Path): The directory the entries are stored in.
+        max_bytes (int): The size limit of the cache.
+        stats (CacheStats): The statistics since the cache was opened.
+    """
+    def __init__(self, cache_dir: str | os.PathLike, max_bytes: int = 64 * 2**20) -> None:
+        """
+        BuildCache class constructor.
+
+        Parameters:
+            cache_dir (str | os.PathLike): The cache directory, created if needed.
+            max_bytes (int): The size limit of the cache.
+        """
+        self._cache_dir = Path(cache_dir)
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._stats = CacheStats()
+
+    @property
+    def cache_dir(self) -> Path:
+        """The directory the entries are stored in."""
+        return self._cache_dir
+
+    @property
+    def max_bytes(self) -> int:
+        """The size limit of the cache."""
+        return self._max_bytes
+
+    @property
+    def stats(self) -> CacheStats:
+        """The statistics since the cache was opened."""
+        return self._stats
+
+    @staticmethod
+    def key(source: bytes, *parts: str) -> str:
+        """
+        Get the cache key of a source.
+
+        Parameters:
+            source (bytes): The assembly source.
+            parts (str): Everything else the machine code depends on, e.g.
+                the assembler version and encoding tables.
+
+        Returns:
+            key (str): The hex digest of the hash.
+        """
+        import hashlib
+
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        digest.update(source)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        """The file name of an entry."""
+        return self._cache_dir / f"{key}{_ENTRY_SUFFIX}"
+
+    def get(self, key: str) -> bytearray | None:
+        """
+        Look up an image in the cache.
+
+        Parameters:
+            key (str): The cache key.
+
+        Returns:
+            image (bytearray | None): The packed machine code, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path) #mark as recently used
+        except OSError:
+            #missing, or evicted by another process since
+            self._stats.misses += 1
+            return None
+        if len(data) % _WORD_BYTES:
+            #a damaged entry is a miss, and is replaced by the next store
+            self._stats.misses += 1
+            return None
+
+        self._stats.hits += 1
+        return bytearray(data)
+
+    def put(self, key: str, image: bytes | bytearray | memoryview) -> None:
+        """
+        Store an image in the cache, then evict entries over the limit.
+
+        Parameters:
+            key (str): The cache key.
+            image (bytes | bytearray | memoryview): The packed machine code.
+        """
+        import tempfile
+
+        fd, tmp_name = tempfile.mkstemp(dir=self._cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(image)
+            os.replace(tmp_name, self._path(key))
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        self._stats.stores += 1
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until within the size limit."""
+        entries: list[tuple[float, int, str]] = []
+        total = 0
+        with os.scandir(self._cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(_ENTRY_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        if total <= self._max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self._max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue #already removed by another process
+            total -= size
+            self._stats.evictions += 1
+            logger.debug("evicted cache entry %s", path)
+
+    def __repr__(self) -> str:
+        """String representation of the BuildCache object."""
+        return f"BuildCache(cache_dir='{self._cache_dir}', max_bytes={self._max_bytes})"
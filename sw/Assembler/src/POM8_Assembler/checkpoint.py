@@ -0,0 +1,142 @@
+"""
+checkpoint.py
+
+This module provides an on-disk cache of simulator snapshots, so a program
+that takes a long time to initialise, e.g. pwm_led_breathe, is simulated up
+to the interesting part once and then restored from the snapshot. Entries
+are keyed on the digest of the program's image, the cycle count it was run
+to, the levels applied to the GPIO pins and the snapshot version, so a
+change to any of them simulates again.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Classes:
+    CheckpointCache: An on-disk cache of simulator snapshots.
+"""
+
+from simulator import *
+import os
+from pathlib import Path
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["CheckpointCache"]
+
+#the suffix of cache entries
+_ENTRY_SUFFIX = ".snapshot"
+
+class CheckpointCache:
+    """
+    An on-disk cache of simulator snapshots, see Simulator.snapshot. Each
+    entry is written atomically, so tests running in parallel can share a
+    cache.
+
+    Properties:
+        cache_dir (Path): The directory the snapshots are stored in.
+        hits (int): The fast forwards restored from a snapshot.
+        misses (int): The fast forwards that had to simulate.
+    """
+    def __init__(self, cache_dir: str | os.PathLike) -> None:
+        """
+        CheckpointCache class constructor.
+
+        Parameters:
+            cache_dir (str | os.PathLike): The cache directory, created if needed.
+        """
+        self._cache_dir = Path(cache_dir)
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def cache_dir(self) -> Path:
+        """The directory the snapshots are stored in."""
+        return self._cache_dir
+
+    @property
+    def hits(self) -> int:
+        """The fast forwards restored from a snapshot."""
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """The fast forwards that had to simulate."""
+        return self._misses
+
+    @staticmethod
+    def key(digest: bytes, cycles: int, pins: int = 0) -> str:
+        """
+        Get the cache key of a checkpoint.
+
+        Parameters:
+            digest (bytes): The digest of the program, see image_digest.
+            cycles (int): The cycles since reset the program is run to.
+            pins (int): The levels applied to the GPIO pins.
+        """
+        return f"{digest.hex()}-{cycles}-{pins:02x}-v{SNAPSHOT_VERSION}"
+
+    def _path(self, key: str) -> Path:
+        """The file name of an entry."""
+        return self._cache_dir / f"{key}{_ENTRY_SUFFIX}"
+
+    def get(self, key: str) -> bytes | None:
+        """The snapshot of a key, None if there is none."""
+        try:
+            return self._path(key).read_bytes()
+        except OSError:
+            return None
+
+    def put(self, key: str, snapshot: bytes) -> None:
+        """Store the snapshot of a key."""
+        import tempfile
+
+        fd, tmp_name = tempfile.mkstemp(dir=self._cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(snapshot)
+            os.replace(tmp_name, self._path(key))
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+    def fast_forward(self, simulator: Simulator, cycles: int) -> bool:
+        """
+        Bring a simulator to the state its program reaches from reset after
+        cycles clock cycles, as Simulator.run(max_cycles=cycles) leaves it,
+        restoring a cached snapshot if there is one. The profile is reset.
+        A run that stops short of cycles without halting, e.g. at a
+        TracingSimulator stop watchpoint, is left where it stopped and not
+        cached, as it is not the state the key describes.
+
+        Parameters:
+            simulator (Simulator): The simulator, any of its subclasses.
+            cycles (int): The cycles since reset to run to.
+
+        Returns:
+            hit (bool): Was the state restored from a snapshot.
+        """
+        key = self.key(simulator.program_digest(), cycles, simulator.pins)
+        simulator.reset() #the pins are inputs, and are kept
+        snapshot = self.get(key)
+        if snapshot is not None:
+            try:
+                simulator.restore(snapshot)
+            except ValueError as ex:
+                #a damaged entry is a miss, and is replaced below
+                logger.warning("checkpoint %s: %s", key, ex)
+                simulator.reset()
+            else:
+                self._hits += 1
+                return True
+
+        self._misses += 1
+        simulator.run(max_cycles=cycles)
+        if simulator.cycles < cycles and not simulator.halted:
+            logger.warning("checkpoint %s: the run stopped at cycle %d, it is not cached", key, simulator.cycles)
+            return False
+        self.put(key, simulator.snapshot())
+        return False
@@ -0,0 +1,165 @@
+"""
+client.py
+
+This module is a small client of the assembler server (see server.py). It
+forwards a single file to a running server, so only this module is imported
+and the assembler's start up is paid once by the server rather than by every
+call. When no server is running, or the arguments need more than the server
+offers, it runs the command line interface itself, so it can replace it.
+Run with: python3 client.py YourProgram.asm [-o output.txt] [--socket PATH]
+
+It imports nothing from the assembler, only the standard library.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Functions:
+    default_socket: The path of the server's socket.
+    send_request: Send a request to a server and return its response.
+    main: Forward the command line to a server, or run it locally.
+"""
+
+import json
+import os
+import socket
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any
+
+__all__ = ["SOCKET_ENV", "default_socket", "send_request", "main"]
+
+#the environment variable naming the server's socket
+SOCKET_ENV = "POM8_ASSEMBLER_SOCKET"
+
+#the options the server accepts, by command line flag
+_FLAGS = {"-s": "scanner", "--scanner": "scanner", "-c": "compact", "--compact": "compact",
+          "-O": "optimise", "--optimise": "optimise", "--one-pass": "one_pass"}
+
+def default_socket() -> str:
+    """The path of the server's socket, from SOCKET_ENV, else one per user in the runtime directory."""
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    user = os.getuid() if hasattr(os, "getuid") else os.environ.get("USERNAME", "user")
+    return os.path.join(directory, f"pom8_assembler-{user}.sock")
+
+def send_request(request: dict[str, Any], path: str | None = None, timeout: float | None = 30.0) -> dict[str, Any]:
+    """
+    Send a request to a server as a JSON line and read its response line.
+
+    Parameters:
+        request (dict[str, Any]): The request, see server.py.
+        path (str | None): The socket of the server, default_socket if not given.
+        timeout (float | None): Seconds to wait for the response.
+
+    Returns:
+        response (dict[str, Any]): The response of the server.
+
+    Raises:
+        OSError: No server is listening on the socket.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(path or default_socket())
+        connection.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with connection.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("the server closed the connection without a response")
+    return json.loads(line)
+
+def _parse(argv: list[str]) -> dict[str, Any] | None:
+    """
+    Read the command line of a single file assembly, None if it uses anything
+    the server does not offer, e.g. a batch, --simulate or --cache-dir.
+    """
+    request: dict[str, Any] = {"options": {}, "format": "text"}
+    output = None
+    inputs = []
+    arguments = iter(argv)
+    for argument in arguments:
+        if argument in _FLAGS:
+            request["options"][_FLAGS[argument]] = True
+        elif argument in ("-q", "--quiet"):
+            continue
+        elif argument in ("-o", "--Output", "-f", "--format", "--socket"):
+            value = next(arguments, None)
+            if value is None:
+                return None
+            if argument == "--socket":
+                request["socket"] = value
+            elif argument in ("-f", "--format"):
+                request["format"] = value
+            else:
+                output = value
+        elif argument.startswith("-"):
+            return None
+        else:
+            inputs.append(argument)
+    if len(inputs) != 1 or any(char in inputs[0] for char in "*?["):
+        return None
+    request["file"] = str(Path(inputs[0]).resolve())
+    request["output_file"] = output
+    return request
+
+def _run_locally(argv: list[str]) -> None:
+    """Run the command line interface in this process, without the client's flags."""
+    import runpy
+
+    while "--socket" in argv:
+        index = argv.index("--socket")
+        del argv[index:index + 2]
+    sys.argv = [sys.argv[0], *argv]
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    runpy.run_path(str(Path(__file__).resolve().with_name("__main__.py")), run_name="__main__")
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Forward a single file assembly to a running server and write its output,
+    falling back to the command line interface.
+
+    Returns:
+        exit_code (int): 0 if the file assembled, otherwise 1.
+    """
+    argv = list(sys.argv[1:] if argv is None else argv)
+    request = _parse(argv)
+    if request is None:
+        _run_locally(argv)
+        return 0
+
+    path = request.pop("socket", None)
+    output_file = request.pop("output_file")
+    try:
+        response = send_request(request, path)
+    except (OSError, ValueError):
+        _run_locally(argv) #no server is running
+        return 0
+
+    for diagnostic in response.get("diagnostics", []):
+        print(f"[{diagnostic['level']}] {diagnostic['message']}", file=sys.stderr)
+    if response.get("optimisation"):
+        print(response["optimisation"], file=sys.stderr)
+    if not response.get("ok"):
+        return 1
+
+    output = response["output"]
+    data = output.encode("utf-8") if response["encoding"] == "utf-8" else _base64_decode(output)
+    if output_file:
+        with open(output_file, "wb") as f:
+            f.write(data)
+    else:
+        sys.stdout.flush()
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+    return 0
+
+def _base64_decode(text: str) -> bytes:
+    """Decode the output of a binary format."""
+    import base64
+
+    return base64.b64decode(text)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,337 @@
+"""
+debuginfo.py
+
+This module writes and reads the debug information of an assembled program,
+mapping each address back to the file and line it was assembled from, and
+the labels to their addresses. The file is a header followed by packed
+little-endian arrays, each 4-byte aligned:
+
+    addresses u32[entries]  the first address of each row, sorted
+    lines     u32[entries]  the source line of the first address of the row
+    files     u16[entries]  the index of the source file of the row
+    labels    u32[labels]   the label addresses, sorted
+    label names u32[labels + 1], file names u32[files + 1]
+                            the offsets of each name in the name blob
+    names     the UTF-8 file names then label names
+
+Opening a file maps it into memory and casts the arrays in place, nothing is
+copied or parsed, so a debugger or trace viewer pays the same to open the
+debug info of a 64K word image as a 10 word one. Lookups bisect the sorted
+arrays.
+
+It also writes a listing, the source side by side with the address and word
+each line was assembled into.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Classes:
+    DebugInfo: The address to source line and label tables of a program.
+
+Functions:
+    build_debug_info: Make the debug info of an assembled program.
+    read_debug_info: Open a debug info file.
+    format_listing: Format the listing of an assembled program.
+"""
+
+from writers import unpack_words
+from array import array
+from bisect import bisect_right
+from typing import Sequence
+import mmap
+import os
+import struct
+import sys
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["DEBUG_INFO_VERSION", "DebugInfo", "build_debug_info", "read_debug_info", "format_listing"]
+
+DEBUG_INFO_VERSION = 1
+
+#magic, version, program words, entries, labels, files, name blob bytes
+_HEADER = struct.Struct("<4sHxxIIIII")
+_MAGIC = b"P8DI"
+
+def _aligned(size: int) -> int:
+    """Round a section size up to the next 4 bytes."""
+    return (size + 3) & ~3
+
+def _sections(entries: int, labels: int, files: int) -> list[tuple[int, str, int]]:
+    """The offset, typecode and length of each array section of a file."""
+    sections = []
+    offset = _HEADER.size
+    for typecode, length in (("I", entries), ("I", entries), ("H", entries), ("I", labels),
+                             ("I", labels + 1), ("I", files + 1)):
+        sections.append((offset, typecode, length))
+        offset += _aligned(length * array(typecode).itemsize)
+    sections.append((offset, "B", 0)) #the name blob, its length is in the header
+    return sections
+
+class DebugInfo:
+    """
+    The address to source line and label tables of an assembled program.
+    Each row of the line table covers the addresses from its own to the
+    next row's, assembled from consecutive lines of one file, so only a
+    blank line, comment or label on a line of its own starts a new row.
+
+    Properties:
+        files (list[str]): The names of the source files.
+        labels (dict[str, int]): The address of each label.
+        entries (int): The rows of the line table.
+        size (int): The words in the program.
+    """
+    def __init__(self, addresses: Sequence[int], lines: Sequence[int], files: Sequence[int],
+                 file_names: Sequence[str], label_addresses: Sequence[int], label_names: Sequence[str],
+                 size: int, buffer: "mmap.mmap | None" = None) -> None:
+        """
+        DebugInfo class constructor, see build_debug_info and read_debug_info.
+
+        Parameters:
+            addresses (Sequence[int]): The first address of each row, sorted.
+            lines (Sequence[int]): The source line of the first address of each row.
+            files (Sequence[int]): The index in file_names of each row.
+            file_names (Sequence[str]): The names of the source files.
+            label_addresses (Sequence[int]): The label addresses, sorted.
+            label_names (Sequence[str]): The name of each label.
+            size (int): The words in the program, the address after its end.
+            buffer (mmap.mmap | None): The mapping the arrays are cast from.
+        """
+        self._addresses = addresses
+        self._lines = lines
+        self._files = files
+        self._file_names = list(file_names)
+        self._label_addresses = label_addresses
+        self._label_names = label_names
+        self._size = size
+        self._labels: dict[str, int] | None = None
+        self._buffer = buffer
+
+    @property
+    def files(self) -> list[str]:
+        """The names of the source files."""
+        return self._file_names
+
+    @property
+    def labels(self) -> dict[str, int]:
+        """The address of each label."""
+        if self._labels is None:
+            self._labels = dict(zip(self._label_names, self._label_addresses))
+        return self._labels
+
+    @property
+    def entries(self) -> int:
+        """The rows of the line table."""
+        return len(self._addresses)
+
+    @property
+    def size(self) -> int:
+        """The words in the program."""
+        return self._size
+
+    def line_of(self, address: int) -> tuple[str, int] | None:
+        """
+        Get the source of an address.
+
+        Parameters:
+            address (int): An address of the program.
+
+        Returns:
+            source (tuple[str, int] | None): The file name and line number,
+                None if the address is not in the program.
+        """
+        row = bisect_right(self._addresses, address) - 1
+        if row < 0 or address >= self._size:
+            return None
+        return self._file_names[self._files[row]], self._lines[row] + address - self._addresses[row]
+
+    def address_of(self, label: str) -> int | None:
+        """The address of a label, None if there is no such label."""
+        return self.labels.get(label)
+
+    def location(self, address: int) -> str:
+        """
+        Describe an address by the label at or before it, e.g. "loop+2", or
+        the address itself if there is no label before it.
+        """
+        index = bisect_right(self._label_addresses, address) - 1
+        if index < 0:
+            return f"{address:#06x}"
+        offset = address - self._label_addresses[index]
+        #the last of several labels on one address
+        return self._label_names[index] + (f"+{offset}" if offset else "")
+
+    def to_bytes(self) -> bytes:
+        """Serialise the tables as a debug info file."""
+        names = [name.encode("utf-8") for name in (*self._file_names, *self._label_names)]
+        offsets = array("I", [0])
+        for name in names:
+            offsets.append(offsets[-1] + len(name))
+        file_offsets = offsets[:len(self._file_names) + 1]
+        base = file_offsets[-1]
+        label_offsets = array("I", [offset - base for offset in offsets[len(self._file_names):]])
+        blob = b"".join(names)
+
+        arrays = [array("I", self._addresses), array("I", self._lines), array("H", self._files),
+                  array("I", self._label_addresses), label_offsets, file_offsets]
+        parts = [_HEADER.pack(_MAGIC, DEBUG_INFO_VERSION, self._size, len(arrays[0]), len(arrays[3]),
+                              len(self._file_names), len(blob))]
+        for values in arrays:
+            if sys.byteorder != "little":
+                values.byteswap()
+            data = values.tobytes()
+            parts.append(data + bytes(_aligned(len(data)) - len(data)))
+        parts.append(blob)
+        return b"".join(parts)
+
+    def write(self, path: str | os.PathLike) -> None:
+        """Write the tables to a debug info file."""
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def from_buffer(cls, buffer: bytes | bytearray | memoryview | mmap.mmap) -> "DebugInfo":
+        """
+        Read debug info from a buffer, casting the arrays in place on a
+        little-endian host.
+
+        Parameters:
+            buffer (bytes | bytearray | memoryview | mmap.mmap): The contents of a debug info file.
+
+        Raises:
+            ValueError: The buffer is not a POM8 debug info file of this version.
+        """
+        view = memoryview(buffer)
+        if len(view) < _HEADER.size:
+            raise ValueError("not a POM8 debug info file, it is too short")
+        magic, version, size, entries, labels, files, blob_size = _HEADER.unpack_from(view)
+        if magic != _MAGIC:
+            raise ValueError("not a POM8 debug info file")
+        if version != DEBUG_INFO_VERSION:
+            raise ValueError(f"debug info version {version}, expected {DEBUG_INFO_VERSION}")
+        sections = _sections(entries, labels, files)
+        blob_start = sections[-1][0]
+        if len(view) < blob_start + blob_size:
+            raise ValueError("the debug info file is truncated")
+
+        arrays = []
+        for offset, typecode, length in sections[:-1]:
+            section = view[offset:offset + length * array(typecode).itemsize]
+            if sys.byteorder == "little":
+                arrays.append(section.cast(typecode))
+            else:
+                values = array(typecode, section.tobytes())
+                values.byteswap()
+                arrays.append(values)
+        addresses, lines, file_indices, label_addresses, label_offsets, file_offsets = arrays
+        blob = view[blob_start:blob_start + blob_size]
+        file_names = [bytes(blob[file_offsets[x]:file_offsets[x + 1]]).decode("utf-8") for x in range(files)]
+        base = file_offsets[files]
+        label_names = _NameTable(blob[base:], label_offsets)
+        return cls(addresses, lines, file_indices, file_names, label_addresses, label_names, size,
+                   buffer if isinstance(buffer, mmap.mmap) else None)
+
+    def close(self) -> None:
+        """Release the mapping of a file opened by read_debug_info."""
+        if self._buffer is not None:
+            for values in (self._addresses, self._lines, self._files, self._label_addresses):
+                if isinstance(values, memoryview):
+                    values.release()
+            self._label_names.release()
+            self._buffer.close()
+            self._buffer = None
+
+    def __enter__(self) -> "DebugInfo":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+class _NameTable(Sequence):
+    """The label names of a file, each decoded when it is looked up."""
+    def __init__(self, blob: memoryview, offsets: Sequence[int]) -> None:
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("label index out of range")
+        return bytes(self._blob[self._offsets[index]:self._offsets[index + 1]]).decode("utf-8")
+
+    def release(self) -> None:
+        """Release the views of the mapping."""
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._blob.release()
+
+def build_debug_info(lines: Sequence[int], symbols: dict[str, int], file_name: str) -> DebugInfo:
+    """
+    Make the debug info of an assembled program, with a row for each run of
+    instructions assembled from consecutive lines.
+
+    Parameters:
+        lines (Sequence[int]): The source line of each instruction, see Assembler.line_table.
+        symbols (dict[str, int]): The symbol table of the program.
+        file_name (str): The name of the source file.
+    """
+    addresses = array("I")
+    rows = array("I")
+    previous = None
+    for address, line in enumerate(lines):
+        if previous is None or line != previous + 1:
+            addresses.append(address)
+            rows.append(line)
+        previous = line
+    labels = sorted(symbols.items(), key=lambda item: (item[1], item[0]))
+    return DebugInfo(addresses, rows, array("H", bytes(2 * len(addresses))), [file_name],
+                     array("I", [address for _, address in labels]), [label for label, _ in labels],
+                     len(lines))
+
+def read_debug_info(path: str | os.PathLike) -> DebugInfo:
+    """
+    Open a debug info file, mapping it into memory.
+
+    Parameters:
+        path (str | os.PathLike): The debug info file, see DebugInfo.write.
+
+    Raises:
+        ValueError: The file is not a POM8 debug info file of this version.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            raise ValueError("not a POM8 debug info file, it is too short")
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return DebugInfo.from_buffer(buffer)
+    except ValueError:
+        buffer.close()
+        raise
+
+def format_listing(image: bytes | bytearray, lines: Sequence[int], source: str) -> str:
+    """
+    Format the listing of an assembled program: each source line with the
+    address and word of the instruction assembled from it.
+
+    Parameters:
+        image (bytes | bytearray): The machine code.
+        lines (Sequence[int]): The source line of each instruction, see Assembler.line_table.
+        source (str): The assembly code.
+    """
+    words = unpack_words(image)
+    placed = {line: address for address, line in enumerate(lines)}
+    listing = [f"{'addr':>6} {'word':>6} {'line':>5}  source"]
+    for line_num, text in enumerate(source.splitlines(), start=1):
+        address = placed.get(line_num)
+        if address is None:
+            listing.append(f"{'':>13} {line_num:>5}  {text}".rstrip())
+        else:
+            listing.append(f"{address:#06x} {words[address]:06X} {line_num:>5}  {text}".rstrip())
+    return "\n".join(listing)
@@ -0,0 +1,291 @@
+"""
+disassembler.py
+
+This module turns POM8 machine code back into assembly code, inverting the
+opcode and funct tables and the field layout of the assembler. Each word is
+decoded through lookup tables indexed by its 6 bit opcode and funct, a whole
+image at once with NumPy when it is installed. Branch targets inside the
+image are given synthesised labels, sub<address> for CALL targets and
+loc<address> for the rest, unless a symbol table names them.
+
+Every word the assembler can produce has a single canonical spelling, so
+assembling the disassembly gives the image back exactly, and disassembling
+that gives the same text. A word the assembler cannot produce is an error,
+or when not strict, is written as a NOP with the word in its comment, so
+every later instruction keeps its address when assembled again.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Functions:
+    decode_words: Decode the fields of instruction words.
+    disassemble: Disassemble instruction words into lines of assembly code.
+    disassemble_image: Disassemble a packed image into lines of assembly code.
+"""
+
+from assembler import FUNCT, WORD_BYTES
+from assembler import _FIELDS, _OPCODE, _OPCODE_SHIFT, _RD_SHIFT, _RS_SHIFT, _RT_SHIFT, _import_numpy
+from parser import Format, MNEMONICS
+from parser import _MNEMONIC_FORMATS, _MNEMONIC_INDEX, _expected_operand_types
+from writers import unpack_words
+from typing import Callable, Sequence
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["decode_words", "disassemble", "disassemble_image"]
+
+#the width of the label column, as the examples are written
+_LABEL_WIDTH = 12
+#the most a hexadecimal operand may be, so farther branch targets need a label
+_MAX_HEXADECIMAL = 0x3FF
+#the fields of an instruction word
+_FIELD_MASK = 0x3F
+_REGISTER_MASK = 0xF
+_IMMEDIATE_MASK = 0x3FF
+_ADDRESS_MASK = 0xFFFF
+#written in place of a word that cannot be disassembled, keeping the addresses after it
+_PLACEHOLDER = "NOP"
+#the immediates of these mnemonics are data addresses, so are written in hexadecimal
+_ADDRESS_IMMEDIATES = ("LDA", "LDO", "STA")
+_CALL = _MNEMONIC_INDEX["CALL"]
+
+#a decoder takes the Rd, Rs, Rt and immediate fields and the branch target,
+#and returns the instruction as written
+_Decoder = Callable[[int, int, int, int, str], str]
+
+def _immediate(value: int, hexadecimal: bool) -> str:
+    """Write an immediate so it reads back as the same field, decimal if it fits 8 bits."""
+    return f"0x{value:03X}" if hexadecimal or value > 0xFF else str(value)
+
+def _no_operand_decoder(mnemonic: str) -> _Decoder:
+    """Decode an instruction without operands."""
+    def decode(rd: int, rs: int, rt: int, immediate: int, target: str) -> str:
+        return mnemonic
+    return decode
+
+def _register_decoder(mnemonic: str) -> _Decoder:
+    """Decode Rd, Rs, Rt."""
+    def decode(rd: int, rs: int, rt: int, immediate: int, target: str) -> str:
+        return f"{mnemonic} r{rd}, r{rs}, r{rt}"
+    return decode
+
+def _two_register_decoder(mnemonic: str) -> _Decoder:
+    """Decode Rd, Rs."""
+    def decode(rd: int, rs: int, rt: int, immediate: int, target: str) -> str:
+        return f"{mnemonic} r{rd}, r{rs}"
+    return decode
+
+def _destination_decoder(mnemonic: str) -> _Decoder:
+    """Decode Rd alone."""
+    def decode(rd: int, rs: int, rt: int, immediate: int, target: str) -> str:
+        return f"{mnemonic} r{rd}"
+    return decode
+
+def _ijmp_decoder(mnemonic: str) -> _Decoder:
+    """Decode Rs, Rt, IJMP is the only instruction that does not follow the Rd, Rs, Rt order."""
+    def decode(rd: int, rs: int, rt: int, immediate: int, target: str) -> str:
+        return f"{mnemonic} r{rs}, r{rt}"
+    return decode
+
+def _branch_decoder(mnemonic: str) -> _Decoder:
+    """Decode a branch target."""
+    def decode(rd: int, rs: int, rt: int, immediate: int, target: str) -> str:
+        return f"{mnemonic} {target}"
+    return decode
+
+def _immediate_decoder(mnemonic: str) -> _Decoder:
+    """Decode Rd, Rs, immediate, leaving out Rs when it is r0 as the examples do."""
+    hexadecimal = mnemonic in _ADDRESS_IMMEDIATES
+    def decode(rd: int, rs: int, rt: int, immediate: int, target: str) -> str:
+        if rs:
+            return f"{mnemonic} r{rd}, r{rs}, {_immediate(immediate, hexadecimal)}"
+        return f"{mnemonic} r{rd}, {_immediate(immediate, hexadecimal)}"
+    return decode
+
+def _source_immediate_decoder(mnemonic: str) -> _Decoder:
+    """Decode Rs, immediate, STA does not follow the Rd, Rs, Rt order."""
+    hexadecimal = mnemonic in _ADDRESS_IMMEDIATES
+    def decode(rd: int, rs: int, rt: int, immediate: int, target: str) -> str:
+        return f"{mnemonic} r{rs}, {_immediate(immediate, hexadecimal)}"
+    return decode
+
+def _source_decoder(mnemonic: str) -> _Decoder:
+    """Decode Rs alone, PUSH does not follow the Rd, Rs, Rt order."""
+    def decode(rd: int, rs: int, rt: int, immediate: int, target: str) -> str:
+        return f"{mnemonic} r{rs}"
+    return decode
+
+_RD = _REGISTER_MASK << _RD_SHIFT
+_RS = _REGISTER_MASK << _RS_SHIFT
+_RT = _REGISTER_MASK << _RT_SHIFT
+
+#the decoder of each mnemonic, and the bits of the operands it writes, a word
+#with any other bit differing from the mnemonic's opcode and funct cannot be
+#written as assembly code
+_DECODERS: dict[str, tuple[_Decoder, int]] = {}
+for _mnemonic, _fmt in _MNEMONIC_FORMATS.items():
+    if not _expected_operand_types(_mnemonic, _fmt, None):
+        _DECODERS[_mnemonic] = (_no_operand_decoder(_mnemonic), 0)
+    elif _mnemonic == "IJMP":
+        _DECODERS[_mnemonic] = (_ijmp_decoder(_mnemonic), _RS | _RT)
+    elif _mnemonic in ("LSL", "LSR", "MOV"):
+        _DECODERS[_mnemonic] = (_two_register_decoder(_mnemonic), _RD | _RS)
+    elif _fmt == Format.REGISTER_FORMAT:
+        _DECODERS[_mnemonic] = (_register_decoder(_mnemonic), _RD | _RS | _RT)
+    elif _fmt == Format.BRANCH_FORMAT:
+        _DECODERS[_mnemonic] = (_branch_decoder(_mnemonic), _ADDRESS_MASK)
+    elif _mnemonic == "STA":
+        _DECODERS[_mnemonic] = (_source_immediate_decoder(_mnemonic), _RS | _IMMEDIATE_MASK)
+    elif _mnemonic == "PUSH":
+        _DECODERS[_mnemonic] = (_source_decoder(_mnemonic), _RS)
+    elif _mnemonic == "POP":
+        _DECODERS[_mnemonic] = (_destination_decoder(_mnemonic), _RD)
+    else:
+        _DECODERS[_mnemonic] = (_immediate_decoder(_mnemonic), _RD | _RS | _IMMEDIATE_MASK)
+
+#the lookup tables, the index in MNEMONICS of each 6 bit opcode and of each
+#6 bit funct of the register format (opcode 0), -1 if none
+_OPCODE_TABLE: list[int] = [-1] * (_FIELD_MASK + 1)
+_FUNCT_TABLE: list[int] = [-1] * (_FIELD_MASK + 1)
+for _mnemonic, _bits in _OPCODE.items():
+    _OPCODE_TABLE[int(_bits, 2)] = _MNEMONIC_INDEX[_mnemonic]
+for _mnemonic, _bits in FUNCT.items():
+    _FUNCT_TABLE[int(_bits, 2)] = _MNEMONIC_INDEX[_mnemonic]
+#the decoder, the opcode and funct bits, and the operand bits, by mnemonic index
+_DECODER_TABLE: tuple[_Decoder, ...] = tuple(_DECODERS[mnemonic][0] for mnemonic in MNEMONICS)
+_BASE_TABLE: tuple[int, ...] = tuple(_FIELDS[mnemonic][0] for mnemonic in MNEMONICS)
+_OPERAND_TABLE: tuple[int, ...] = tuple(_DECODERS[mnemonic][1] for mnemonic in MNEMONICS)
+_IS_BRANCH: tuple[bool, ...] = tuple(_DECODERS[mnemonic][1] == _ADDRESS_MASK for mnemonic in MNEMONICS)
+
+def decode_words(words: Sequence[int], vectorise: bool | None = None) -> tuple[list[int], ...]:
+    """
+    Decode the fields of instruction words through the opcode and funct
+    lookup tables.
+
+    Parameters:
+        words (Sequence[int]): The instruction words.
+        vectorise (bool | None): Decode all the words at once with NumPy, by
+            default when NumPy is installed.
+
+    Returns:
+        columns (tuple[list[int], ...]): The index in MNEMONICS of each word
+            (-1 if it cannot be written as assembly code), then its Rd, Rs,
+            Rt, immediate and branch address fields.
+    """
+    np = _import_numpy()
+    if vectorise is None:
+        vectorise = np is not None
+    if vectorise:
+        if np is None:
+            raise ImportError("NumPy is required to decode words at once, install it or set vectorise=False")
+        return tuple(column.tolist() for column in _decode_columns(np, np.asarray(words, dtype=np.uint32)))
+
+    columns: tuple[list[int], ...] = ([], [], [], [], [], [])
+    appends = [column.append for column in columns]
+    for word in words:
+        opcode = word >> _OPCODE_SHIFT
+        if opcode > _FIELD_MASK:
+            index = -1
+        else:
+            index = _OPCODE_TABLE[opcode] if opcode else _FUNCT_TABLE[word & _FIELD_MASK]
+            if index >= 0 and word & ~_OPERAND_TABLE[index] != _BASE_TABLE[index]:
+                index = -1
+        fields = (index, (word >> _RD_SHIFT) & _REGISTER_MASK, (word >> _RS_SHIFT) & _REGISTER_MASK,
+                  (word >> _RT_SHIFT) & _REGISTER_MASK, word & _IMMEDIATE_MASK, word & _ADDRESS_MASK)
+        for append, field in zip(appends, fields):
+            append(field)
+    return columns
+
+def _decode_columns(np, words):
+    """Decode a uint32 array of words with shifts and masks, see decode_words."""
+    opcode_table = np.array(_OPCODE_TABLE, dtype=np.intp)
+    funct_table = np.array(_FUNCT_TABLE, dtype=np.intp)
+    opcodes = words >> _OPCODE_SHIFT
+    index = np.where(opcodes == 0, funct_table[words & _FIELD_MASK], opcode_table[opcodes & _FIELD_MASK])
+    #the bits besides the operands must be the opcode and funct of the mnemonic
+    bases = np.array(_BASE_TABLE, dtype=np.uint32)[index]
+    operands = np.array(_OPERAND_TABLE, dtype=np.uint32)[index]
+    index[(index < 0) | ((words & ~operands) != bases)] = -1
+    return (index, (words >> _RD_SHIFT) & _REGISTER_MASK, (words >> _RS_SHIFT) & _REGISTER_MASK,
+            (words >> _RT_SHIFT) & _REGISTER_MASK, words & _IMMEDIATE_MASK, words & _ADDRESS_MASK)
+
+def _label_names(indices: list[int], addresses: list[int], size: int,
+                 symbols: dict[str, int] | None) -> dict[int, str]:
+    """Name the address of each symbol, and each branch target inside the image."""
+    names: dict[int, str] = {}
+    for name, address in (symbols or {}).items():
+        if 0 <= address < size:
+            names.setdefault(address, name)
+    for index, address in zip(indices, addresses):
+        if index >= 0 and _IS_BRANCH[index] and address < size and address not in names:
+            names[address] = f"{'sub' if index == _CALL else 'loc'}{address:04X}"
+    return names
+
+def disassemble(words: Sequence[int], symbols: dict[str, int] | None = None,
+                strict: bool = True, vectorise: bool | None = None) -> list[str]:
+    """
+    Disassemble instruction words into assembly code, one line per word with
+    the label of its address, if any, in the label column.
+
+    Parameters:
+        words (Sequence[int]): The instruction words from address 0.
+        symbols (dict[str, int] | None): The names of addresses, branch
+            targets without a name are given a synthesised label.
+        strict (bool): Raise on a word that cannot be written as assembly
+            code, otherwise write a NOP in its place with the word in a
+            comment, so the other words keep their addresses when assembled
+            again.
+        vectorise (bool | None): Decode with NumPy, see decode_words.
+
+    Returns:
+        lines (list[str]): The assembly code.
+    """
+    indices, rds, rss, rts, immediates, addresses = decode_words(words, vectorise)
+    size = len(indices)
+    names = _label_names(indices, addresses, size, symbols)
+    label_columns = {address: f"{name}:".ljust(_LABEL_WIDTH - 1) + " " for address, name in names.items()}
+
+    lines: list[str] = []
+    append = lines.append
+    decoders = _DECODER_TABLE
+    is_branch = _IS_BRANCH
+    blank = " " * _LABEL_WIDTH
+    for address, (index, rd, rs, rt, immediate, target) in enumerate(
+            zip(indices, rds, rss, rts, immediates, addresses)):
+        column = label_columns.get(address, blank)
+        target_text = ""
+        reason = "it is not a POM8 instruction"
+        if index >= 0 and is_branch[index]:
+            target_text = names.get(target)
+            if target_text is None:
+                if target > _MAX_HEXADECIMAL:
+                    index = -1
+                    reason = "its target is outside the image and too far for a hexadecimal operand"
+                else:
+                    target_text = f"0x{target:03X}"
+        if index < 0:
+            word = int(words[address])
+            if strict:
+                raise ValueError(f"address {address:#06x}: {word:#08x} cannot be disassembled, {reason}")
+            logger.warning("address %#06x: %#08x cannot be disassembled, %s", address, word, reason)
+            append(f"{column}{_PLACEHOLDER:<24}; {word:06X} cannot be disassembled, {reason}")
+            continue
+        append(column + decoders[index](rd, rs, rt, immediate, target_text))
+    return lines
+
+def disassemble_image(image: bytes | bytearray | memoryview, symbols: dict[str, int] | None = None,
+                      strict: bool = True, vectorise: bool | None = None) -> list[str]:
+    """
+    Disassemble a packed image of WORD_BYTES big-endian bytes per word into
+    assembly code, see disassemble.
+    """
+    np = _import_numpy()
+    if (vectorise is None or vectorise) and np is not None and len(image) % WORD_BYTES == 0:
+        #gather the bytes of every word at once
+        data = np.frombuffer(bytes(image), dtype=np.uint8).reshape(-1, WORD_BYTES).astype(np.uint32)
+        words = (data[:, 0] << 16) | (data[:, 1] << 8) | data[:, 2]
+        return disassemble(words, symbols, strict, vectorise)
+    return disassemble(unpack_words(image), symbols, strict, vectorise)
@@ -0,0 +1,419 @@
+"""
+lanes.py
+
+This module simulates many instances (lanes) of the POM8 at once, each
+running the same program from its own initial registers, data memory and
+GPIO inputs, e.g. for fuzzing or parameter sweeps. The state of every lane
+is held in NumPy arrays and each instruction is executed across the lanes
+at its PC in one go, lanes at other PCs being masked out. Each lane gives
+the same results, cycle for cycle, as simulator.Simulator. NumPy is needed,
+see the numpy extra.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Classes:
+    LaneSimulator: A lockstep simulator of many POM8 instances.
+"""
+
+from assembler import _import_numpy
+from simulator import *
+from simulator import (
+    _FLAG_TABLE, _ALU_OPERATIONS, _BRANCH_FLAGS, _SET_FLAGS, _CLEAR_FLAGS,
+    _BOOT_CYCLES, _PCH_INC_CYCLES, _decode_word, _instruction_cycles
+)
+from writers import unpack_words
+from typing import Any, Callable, Sequence
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["LaneSimulator"]
+
+_IMMEDIATE_ALU = frozenset(("ADDI", "SUBI", "ANDI", "ORI", "XORI"))
+_DATA_ADDRESS_MASK = 0x3FF
+
+#the lanes an instruction is executed on, a slice of all of them or an index array
+_Lanes = Any
+
+class LaneSimulator:
+    """
+    A cycle-accurate simulator of many POM8 instances running the same
+    program in lockstep.
+
+    Each step executes one instruction on every running lane. The lanes are
+    grouped by PC, so when every lane is at the same PC an instruction is a
+    few whole-array operations, and when the PCs diverge each group is run
+    in turn with the other lanes masked out. The arrays of the state can be
+    written to set up each lane before a run.
+
+    Properties:
+        lanes (int): The number of lanes.
+        registers (ndarray): The registers of each lane, lanes x 16 uint8.
+        flags (ndarray): The status flags of each lane, see the FLAG_* constants.
+        pc (ndarray): The program counter of each lane.
+        sp (ndarray): The stack pointer of each lane.
+        ram (ndarray): The data memory of each lane, lanes x RAM_SIZE uint8.
+        gpio (ndarray): The GPIO registers of each lane, lanes x 4 uint8.
+        pins (ndarray): The levels applied to the GPIO pins of each lane.
+        output_pins (ndarray): The levels driven onto the GPIO pins of each lane.
+        cycles (ndarray): The clock cycles of each lane since reset.
+        instructions (ndarray): The instructions each lane has executed.
+        halted (ndarray): Has each lane executed a HLT instruction.
+    """
+    def __init__(self, words: Sequence[int], lanes: int, pins: int = 0) -> None:
+        """
+        LaneSimulator class constructor.
+
+        Parameters:
+            words (Sequence[int]): The instruction words, from address 0, see
+                Simulator.
+            lanes (int): The number of instances to simulate.
+            pins (int): The levels applied to the GPIO pins of every lane,
+                the pins array can be written to give each lane its own.
+        """
+        np = _import_numpy()
+        if np is None:
+            raise ImportError("NumPy is required to simulate lanes, install it or use Simulator")
+        if len(words) > 1 << 16:
+            raise ValueError(f"program of {len(words)} words does not fit the 16 bit address space")
+        self._np = np
+        self._words = list(words)
+        self._mask = ROM_SIZE - 1 if len(self._words) <= ROM_SIZE else (1 << 16) - 1
+        self._lanes = lanes
+        self._rows = np.arange(lanes)
+        self._flag_table = np.frombuffer(_FLAG_TABLE, dtype=np.uint8)
+        #register major, so each register of every lane is contiguous
+        self._registers = np.zeros((16, lanes), dtype=np.uint8)
+        self._flags = np.zeros(lanes, dtype=np.uint8)
+        self._pc = np.zeros(lanes, dtype=np.int32)
+        self._sp = np.zeros(lanes, dtype=np.int32)
+        self._ram = np.zeros((lanes, RAM_SIZE), dtype=np.uint8)
+        self._gpio = np.zeros((lanes, 4), dtype=np.uint8)
+        self._pins = np.full(lanes, pins, dtype=np.uint8)
+        self._cycles = np.full(lanes, _BOOT_CYCLES, dtype=np.int64)
+        self._instructions = np.zeros(lanes, dtype=np.int64)
+        self._halted = np.zeros(lanes, dtype=bool)
+        self._table = [self._decode(self._words[address] if address < len(self._words) else 0)
+                       for address in range(self._mask + 1)]
+        #the cycles of each address, including PCH_INC, for diverged lanes
+        self._cycle_table = np.array(
+            [entry[-1] + (_PCH_INC_CYCLES if address & 0xFF == 0xFF else 0)
+             for address, entry in enumerate(self._table)], dtype=np.int64)
+
+    @classmethod
+    def from_image(cls, image: bytes | bytearray | memoryview, lanes: int, **kwargs) -> "LaneSimulator":
+        """Create a lane simulator of a packed image, see assembler.encode."""
+        return cls(unpack_words(image), lanes, **kwargs)
+
+    def reset(self) -> None:
+        """Reset every lane, the pins are kept."""
+        for array in (self._registers, self._flags, self._pc, self._sp, self._ram,
+                      self._gpio, self._instructions, self._halted):
+            array.fill(0)
+        self._cycles.fill(_BOOT_CYCLES)
+
+    @property
+    def lanes(self) -> int:
+        """The number of lanes."""
+        return self._lanes
+
+    @property
+    def registers(self) -> Any:
+        """The registers of each lane, a lanes x 16 view."""
+        return self._registers.T
+
+    @property
+    def flags(self) -> Any:
+        """The status flags of each lane."""
+        return self._flags
+
+    @property
+    def pc(self) -> Any:
+        """The program counter of each lane."""
+        return self._pc
+
+    @property
+    def sp(self) -> Any:
+        """The stack pointer of each lane."""
+        return self._sp
+
+    @property
+    def ram(self) -> Any:
+        """The data memory of each lane."""
+        return self._ram
+
+    @property
+    def gpio(self) -> Any:
+        """The GPIO registers of each lane: input, output, DDR and spare."""
+        return self._gpio
+
+    @property
+    def pins(self) -> Any:
+        """The levels applied to the GPIO pins of each lane."""
+        return self._pins
+
+    @property
+    def output_pins(self) -> Any:
+        """The levels driven onto the GPIO pins of each lane."""
+        return self._gpio[:, 1] & self._gpio[:, 2]
+
+    @property
+    def cycles(self) -> Any:
+        """The clock cycles of each lane since reset, including BOOT."""
+        return self._cycles
+
+    @property
+    def instructions(self) -> Any:
+        """The instructions each lane has executed since reset."""
+        return self._instructions
+
+    @property
+    def halted(self) -> Any:
+        """Has each lane executed a HLT instruction."""
+        return self._halted
+
+    def _decode(self, word: int) -> tuple[Callable[..., None], str | None, int, int, int, int, int]:
+        """Decode an instruction word into its executor, fields and cycles."""
+        mnemonic, rd, rs, rt = _decode_word(word)
+        if mnemonic is None:
+            execute = self._illegal
+        elif mnemonic in _ALU_OPERATIONS:
+            execute = self._alu
+        elif mnemonic in _BRANCH_FLAGS:
+            execute = self._branch
+        elif mnemonic in _SET_FLAGS or mnemonic in _CLEAR_FLAGS:
+            execute = self._flag
+        else:
+            execute = getattr(self, f"_{mnemonic.lower()}")
+        return execute, mnemonic, rd, rs, rt, word, _instruction_cycles(mnemonic)
+
+    def _load(self, lanes: _Lanes, address: Any) -> Any:
+        """
+        Read the data memory map of some lanes.
+
+        Parameters:
+            lanes (_Lanes): The lanes to read.
+            address (int | ndarray): The address, or the address of each lane.
+        """
+        if isinstance(address, int):
+            if address < GPIO_BASE:
+                return self._ram[lanes, address]
+            register = address & 0b11
+            if register == 0:
+                #the input register samples the pins that are not outputs
+                return self._pins[lanes] & ~self._gpio[lanes, 2]
+            return self._gpio[lanes, register]
+
+        np = self._np
+        rows = self._rows[lanes]
+        values = self._ram[rows, np.minimum(address, GPIO_BASE - 1)]
+        in_gpio = address >= GPIO_BASE
+        if in_gpio.any():
+            gpio_rows = rows[in_gpio]
+            register = address[in_gpio] & 0b11
+            values[in_gpio] = np.where(register == 0,
+                                       self._pins[gpio_rows] & ~self._gpio[gpio_rows, 2],
+                                       self._gpio[gpio_rows, register])
+        return values
+
+    def _store(self, lanes: _Lanes, address: Any, values: Any) -> None:
+        """
+        Write the data memory map of some lanes, the GPIO input register is read only.
+
+        Parameters:
+            lanes (_Lanes): The lanes to write.
+            address (int | ndarray): The address, or the address of each lane.
+            values (int | ndarray): The byte, or the byte of each lane.
+        """
+        if isinstance(address, int):
+            if address < GPIO_BASE:
+                self._ram[lanes, address] = values
+            elif address & 0b11:
+                self._gpio[lanes, address & 0b11] = values
+            return
+
+        np = self._np
+        rows = self._rows[lanes]
+        values = np.broadcast_to(np.asarray(values, dtype=np.uint8), rows.shape)
+        in_ram = address < GPIO_BASE
+        self._ram[rows[in_ram], address[in_ram]] = values[in_ram]
+        in_gpio = ~in_ram & (address & 0b11 != 0)
+        if in_gpio.any():
+            self._gpio[rows[in_gpio], address[in_gpio] & 0b11] = values[in_gpio]
+
+    def _alu(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+             rd: int, rs: int, rt: int, word: int) -> None:
+        """Execute an ALU instruction, register or immediate."""
+        np = self._np
+        a = self._registers[rs, lanes].astype(np.int32)
+        if mnemonic in _IMMEDIATE_ALU:
+            b = word & 0xFF
+        elif mnemonic == "INC":
+            b = 1
+        else:
+            b = self._registers[rt, lanes].astype(np.int32)
+        carry = (self._flags[lanes] >> 1) & 1 if mnemonic in ("ADDC", "SUBC") else 0
+        result = _ALU_OPERATIONS[mnemonic](a, b, carry)
+        self._flags[lanes] = self._flag_table[(result & 0x1FF) | (a & 0x80) << 2 | (b & 0x80) << 3]
+        self._registers[rd, lanes] = result & 0xFF
+
+    def _mov(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+             rd: int, rs: int, rt: int, word: int) -> None:
+        self._registers[rd, lanes] = self._registers[rs, lanes]
+
+    def _flag(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+              rd: int, rs: int, rt: int, word: int) -> None:
+        if mnemonic in _SET_FLAGS:
+            self._flags[lanes] |= _SET_FLAGS[mnemonic]
+        else:
+            self._flags[lanes] &= ~_CLEAR_FLAGS[mnemonic] & 0xFF
+
+    def _ijmp(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+              rd: int, rs: int, rt: int, word: int) -> None:
+        self._pc[lanes] = self._registers[rs, lanes].astype(self._np.int32) << 8 | self._registers[rt, lanes]
+
+    def _jmp(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+             rd: int, rs: int, rt: int, word: int) -> None:
+        self._pc[lanes] = word & 0xFFFF
+
+    def _branch(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+                rd: int, rs: int, rt: int, word: int) -> None:
+        self._pc[lanes] = self._np.where(self._flags[lanes] & _BRANCH_FLAGS[mnemonic], word & 0xFFFF, next_pc)
+
+    def _call(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+              rd: int, rs: int, rt: int, word: int) -> None:
+        #push the return address, low byte first
+        sp = self._sp[lanes]
+        self._store(lanes, sp, next_pc & 0xFF)
+        self._store(lanes, (sp + 1) & _DATA_ADDRESS_MASK, next_pc >> 8)
+        self._sp[lanes] = (sp + 2) & _DATA_ADDRESS_MASK
+        self._pc[lanes] = word & 0xFFFF
+
+    def _ret(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+             rd: int, rs: int, rt: int, word: int) -> None:
+        sp = (self._sp[lanes] - 2) & _DATA_ADDRESS_MASK
+        self._sp[lanes] = sp
+        high = self._load(lanes, (sp + 1) & _DATA_ADDRESS_MASK).astype(self._np.int32)
+        self._pc[lanes] = high << 8 | self._load(lanes, sp)
+
+    def _nop(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+             rd: int, rs: int, rt: int, word: int) -> None:
+        pass
+
+    def _hlt(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+             rd: int, rs: int, rt: int, word: int) -> None:
+        self._halted[lanes] = True
+
+    def _ldi(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+             rd: int, rs: int, rt: int, word: int) -> None:
+        self._registers[rd, lanes] = word & 0xFF
+
+    def _lda(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+             rd: int, rs: int, rt: int, word: int) -> None:
+        self._registers[rd, lanes] = self._load(lanes, word & 0x3FF)
+
+    def _sta(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+             rd: int, rs: int, rt: int, word: int) -> None:
+        self._store(lanes, word & 0x3FF, self._registers[rs, lanes])
+
+    def _ldo(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+             rd: int, rs: int, rt: int, word: int) -> None:
+        #the address is calculated by the ALU, which sets the flags
+        a = self._registers[rs, lanes].astype(self._np.int32)
+        imm8 = word & 0xFF
+        result = a + imm8
+        self._flags[lanes] = self._flag_table[result | (a & 0x80) << 2 | (imm8 & 0x80) << 3]
+        self._registers[rd, lanes] = self._ram[self._rows[lanes], result & 0xFF]
+
+    def _push(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+              rd: int, rs: int, rt: int, word: int) -> None:
+        sp = self._sp[lanes]
+        self._store(lanes, sp, self._registers[rs, lanes])
+        self._sp[lanes] = (sp + 1) & _DATA_ADDRESS_MASK
+
+    def _pop(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+             rd: int, rs: int, rt: int, word: int) -> None:
+        sp = (self._sp[lanes] - 1) & _DATA_ADDRESS_MASK
+        self._sp[lanes] = sp
+        self._registers[rd, lanes] = self._load(lanes, sp)
+
+    def _illegal(self, lanes: _Lanes, pc: int, next_pc: int, mnemonic: str,
+                 rd: int, rs: int, rt: int, word: int) -> None:
+        self._pc[lanes] = pc
+        raise ValueError(f"address {pc & self._mask:#06x}: illegal instruction {word:06x}")
+
+    def _execute(self, lanes: _Lanes, pc: int) -> None:
+        """Execute the instruction at a PC on the lanes at that PC."""
+        execute, mnemonic, rd, rs, rt, word, cycles = self._table[pc & self._mask]
+        if pc & 0xFF == 0xFF:
+            cycles += _PCH_INC_CYCLES
+        self._cycles[lanes] += cycles
+        self._instructions[lanes] += 1
+        next_pc = (pc + 1) & 0xFFFF
+        self._pc[lanes] = next_pc
+        execute(lanes, pc, next_pc, mnemonic, rd, rs, rt, word)
+
+    def step(self, max_cycles: int | None = None) -> bool:
+        """
+        Execute one instruction on every running lane. An illegal
+        instruction raises once its lanes are reached, lanes at other PCs
+        may already have executed the step.
+
+        Parameters:
+            max_cycles (int | None): Lanes whose cycles since reset have
+                reached this do not run.
+
+        Returns:
+            running (bool): False once no lane could run.
+        """
+        np = self._np
+        running = ~self._halted
+        if max_cycles is not None:
+            running &= self._cycles < max_cycles
+        pcs = self._pc[running]
+        if pcs.size == 0:
+            return False
+
+        first = int(pcs[0])
+        if (pcs == first).all():
+            #converged, one instruction for every running lane
+            self._execute(slice(None) if pcs.size == self._lanes else np.flatnonzero(running), first)
+            return True
+
+        #diverged, the counters of every lane at once, then each PC in turn
+        #with the other lanes masked out
+        rows = np.flatnonzero(running)
+        self._cycles[rows] += self._cycle_table[pcs & self._mask]
+        self._instructions[rows] += 1
+        self._pc[rows] = (pcs + 1) & 0xFFFF
+        order = np.argsort(pcs, kind="stable")
+        sorted_pcs = pcs[order]
+        starts = np.flatnonzero(sorted_pcs[1:] != sorted_pcs[:-1]) + 1
+        bounds = [0, *starts.tolist(), sorted_pcs.size]
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            pc = int(sorted_pcs[start])
+            execute, mnemonic, rd, rs, rt, word, _ = self._table[pc & self._mask]
+            execute(rows[order[start:end]], pc, (pc + 1) & 0xFFFF, mnemonic, rd, rs, rt, word)
+        return True
+
+    def run(self, max_instructions: int | None = None, max_cycles: int | None = None) -> int:
+        """
+        Run every lane until it halts, or a limit is reached.
+
+        Parameters:
+            max_instructions (int | None): The most instructions each lane executes.
+            max_cycles (int | None): Each lane stops once its cycles since
+                reset reach this, the instruction that crosses it is
+                completed, as Simulator.run.
+
+        Returns:
+            steps (int): The number of steps run, the most instructions any
+                lane executed.
+        """
+        steps = 0
+        while steps != max_instructions and self.step(max_cycles):
+            steps += 1
+        return steps
@@ -0,0 +1,332 @@
+"""
+linker.py
+
+This module assembles POM8 assembly modules into relocatable object files,
+and links objects into an image. An object holds the encoded words of a
+module, assembled from address 0, with its labels, the labels it uses but
+does not define, and a relocation for each branch target that must move
+with the module or be resolved by the linker. A changed module is then the
+only one assembled again, see build_object.
+
+All labels are global, as though the modules were concatenated in the order
+they are linked, so a label defined by two modules is an error. Numeric
+branch targets are absolute addresses and are not relocated.
+
+Each module is optimised on its own. The target of an IJMP is computed, so
+when any linked module has an IJMP no module may have instructions removed,
+or the addresses it computes would land on the wrong instruction. An object
+records both, and link refuses a mix of the two.
+
+The object file format, all integers little-endian:
+    header: the magic b"POM8OBJ", the format version (1 byte), the flags
+        (1 byte, COMPUTED_JUMPS and REMOVED), the first 8 bytes of the SHA-256 of the assembler version and encoding tables,
+        then the word, symbol, external and relocation counts (uint32 each).
+    words: 3 big-endian bytes each, as in an image.
+    symbols: the offset (uint32), then the UTF-8 name, prefixed with its
+        length (uint8).
+    externals: the UTF-8 name of each label used but not defined, prefixed
+        with its length (uint8).
+    relocations: the offset of the word (uint32), then the index of the
+        external it targets, or LOCAL to add the address of the module.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Classes:
+    ObjectModule: A dataclass of a relocatable object.
+
+Functions:
+    assemble_object: Assemble a module into a relocatable object.
+    build_object: Assemble a module file, unless its object file is up to date.
+    computes_jumps: Check if a module has an IJMP.
+    link: Link objects into an image.
+"""
+
+from assembler import *
+from assembler import _encoding_fingerprint, _encode_words, _pack_words
+from parser import *
+from writers import unpack_words
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+import hashlib
+import os
+import re
+import struct
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["OBJECT_SUFFIX", "LOCAL", "ObjectModule", "assemble_object", "build_object", "computes_jumps", "link"]
+
+#the suffix of object files
+OBJECT_SUFFIX = ".o"
+#the relocation target of a label defined by the module itself
+LOCAL = 0xFFFFFFFF
+
+_MAGIC = b"POM8OBJ"
+_VERSION = 2
+_HEADER = struct.Struct("<7sBB8s4I")
+#the header flags, the module has an IJMP, the optimiser removed instructions
+_COMPUTED_JUMPS = 0x01
+_REMOVED = 0x02
+#an IJMP before any comment on its line
+_IJMP = re.compile(r"^[^;\n]*\bIJMP\b", re.IGNORECASE | re.MULTILINE)
+_OFFSET = struct.Struct("<I")
+_RELOCATION = struct.Struct("<II")
+#the branch target field of a branch format word
+_TARGET_MASK = 0xFFFF
+#the most words the 16 bit program counter addresses
+_MAX_WORDS = 0x10000
+
+def _fingerprint(optimise: bool = False, removals: bool = True) -> bytes:
+    """The hash of the assembler version, encoding tables and optimisation, so stale objects are assembled again."""
+    text = _encoding_fingerprint(optimise) + ("" if removals or not optimise else "|in place")
+    return hashlib.sha256(text.encode("utf-8")).digest()[:8]
+
+@dataclass
+class ObjectModule:
+    """
+    A relocatable object, a module assembled from address 0.
+
+    Attributes:
+        name (str): The name of the module, for error messages.
+        words (array): The instruction words ('I'), the branch targets of
+            relocations to externals are 0.
+        symbols (dict[str, int]): The offset of each label the module defines.
+        externals (list[str]): The labels the module uses but does not define.
+        relocations (list[tuple[int, int]]): The offset of each word whose
+            branch target is a label, and the index of the external it
+            targets, or LOCAL for a label of the module.
+        fingerprint (bytes): The fingerprint of the assembler that built it.
+        computed_jumps (bool): If the module has an IJMP.
+        removed (bool): If the optimiser removed instructions, moving the
+            instructions after them.
+    """
+    name: str
+    words: array = field(default_factory=lambda: array("I"))
+    symbols: dict[str, int] = field(default_factory=dict)
+    externals: list[str] = field(default_factory=list)
+    relocations: list[tuple[int, int]] = field(default_factory=list)
+    fingerprint: bytes = field(default_factory=_fingerprint)
+    computed_jumps: bool = False
+    removed: bool = False
+
+    def __len__(self) -> int:
+        """The number of words in the module."""
+        return len(self.words)
+
+    def to_bytes(self) -> bytes:
+        """Serialise the object in the object file format."""
+        flags = (_COMPUTED_JUMPS if self.computed_jumps else 0) | (_REMOVED if self.removed else 0)
+        parts = [_HEADER.pack(_MAGIC, _VERSION, flags, self.fingerprint, len(self.words), len(self.symbols),
+                              len(self.externals), len(self.relocations)),
+                 bytes(_pack_words(array("I", self.words)))]
+        for name, offset in self.symbols.items():
+            encoded = name.encode("utf-8")
+            parts += [_OFFSET.pack(offset), bytes([len(encoded)]), encoded]
+        for name in self.externals:
+            encoded = name.encode("utf-8")
+            parts += [bytes([len(encoded)]), encoded]
+        parts += [_RELOCATION.pack(offset, target) for offset, target in self.relocations]
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, name: str = "") -> "ObjectModule":
+        """
+        Read an object from the object file format.
+
+        Parameters:
+            data (bytes): The object file.
+            name (str): The name of the module.
+        """
+        try:
+            magic, version, flags, fingerprint, word_count, symbol_count, external_count, relocation_count = \
+                _HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError(f"{name}: not a POM8 object file") from None
+        if magic != _MAGIC:
+            raise ValueError(f"{name}: not a POM8 object file")
+        if version != _VERSION:
+            raise ValueError(f"{name}: object file version {version} is not supported, expected {_VERSION}")
+
+        position = _HEADER.size
+        end = position + WORD_BYTES * word_count
+        module = cls(name, array("I", unpack_words(data[position:end])), fingerprint=fingerprint,
+                     computed_jumps=bool(flags & _COMPUTED_JUMPS), removed=bool(flags & _REMOVED))
+        position = end
+        try:
+            for _ in range(symbol_count):
+                (offset,) = _OFFSET.unpack_from(data, position)
+                length = data[position + _OFFSET.size]
+                position += _OFFSET.size + 1
+                module.symbols[data[position:position + length].decode("utf-8")] = offset
+                position += length
+            for _ in range(external_count):
+                length = data[position]
+                module.externals.append(data[position + 1:position + 1 + length].decode("utf-8"))
+                position += 1 + length
+            for _ in range(relocation_count):
+                module.relocations.append(_RELOCATION.unpack_from(data, position))
+                position += _RELOCATION.size
+        except (struct.error, IndexError):
+            raise ValueError(f"{name}: truncated object file") from None
+        return module
+
+    @classmethod
+    def read(cls, file_name: str | os.PathLike) -> "ObjectModule":
+        """Read an object file, named after the file."""
+        return cls.from_bytes(Path(file_name).read_bytes(), Path(file_name).stem)
+
+    def write(self, file_name: str | os.PathLike) -> None:
+        """Write the object file, atomically so a failed build leaves no partial object."""
+        path = Path(file_name)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(self.to_bytes())
+        os.replace(tmp_path, path)
+
+def assemble_object(session: Assembler, source: str | bytes, name: str = "", removals: bool = True) -> ObjectModule:
+    """
+    Assemble a module into a relocatable object, labels it does not define
+    are left to the linker.
+
+    Parameters:
+        session (Assembler): The session to assemble with, its symbol table
+            holds the labels of the module afterwards.
+        source (str | bytes): The assembly code of the module.
+        name (str): The name of the module.
+        removals (bool): If the optimiser may remove instructions, False
+            when a module it is linked with has an IJMP.
+
+    Returns:
+        module (ObjectModule): The relocatable object.
+    """
+    tokens = session.tokenise(source)
+    symbols = session.symbol_table
+    ast = Parser(tokens, symbols, session.logger, forward_refs=True).parse_program()
+    computed_jumps = any(instruction.opcode_mnemonic == "IJMP" for instruction in ast.instructions)
+    removed = False
+    if session.options.optimise:
+        removed = session.optimise(ast, removals).words > 0
+
+    module = ObjectModule(name, symbols=dict(symbols), fingerprint=_fingerprint(session.options.optimise, removals),
+                          computed_jumps=computed_jumps, removed=removed)
+    external_index: dict[str, int] = {}
+    for offset, instruction in enumerate(ast.instructions):
+        for operand in instruction.operands:
+            if not isinstance(operand, LabelOperand):
+                continue
+            if operand.name in symbols:
+                module.relocations.append((offset, LOCAL))
+            else:
+                index = external_index.setdefault(operand.name, len(module.externals))
+                if index == len(module.externals):
+                    module.externals.append(operand.name)
+                module.relocations.append((offset, index))
+    #the externals are encoded as 0, to be patched when linked
+    module.words = array("I", _encode_words(ast, {**dict.fromkeys(module.externals, 0), **symbols}))
+    if len(module.words) > _MAX_WORDS:
+        raise ValueError(f"{name}: {len(module.words)} words do not fit the {_MAX_WORDS} word address space")
+    return module
+
+def build_object(source_file: str, object_file: str | None = None, options: AssemblerOptions | None = None,
+                 removals: bool = True) -> tuple[ObjectModule, bool]:
+    """
+    Assemble a module file into an object file, unless the object file is
+    newer than the source and was built by this assembler with the same
+    optimisation, as make would.
+
+    Parameters:
+        source_file (str): The assembly file of the module.
+        object_file (str | None): The object file, by default the source
+            file with OBJECT_SUFFIX.
+        options (AssemblerOptions | None): The options to assemble with.
+        removals (bool): If the optimiser may remove instructions, see assemble_object.
+
+    Returns:
+        build (tuple[ObjectModule, bool]): The object, and whether it was assembled.
+    """
+    options = options if options is not None else AssemblerOptions()
+    source_path = Path(source_file)
+    object_path = Path(object_file) if object_file is not None else source_path.with_suffix(OBJECT_SUFFIX)
+    try:
+        if object_path.stat().st_mtime_ns > source_path.stat().st_mtime_ns:
+            module = ObjectModule.read(object_path)
+            if module.fingerprint == _fingerprint(options.optimise, removals):
+                logger.info("%s is up to date", object_path)
+                module.name = source_path.stem
+                return module, False
+    except (OSError, ValueError):
+        pass #missing or damaged, assemble it again
+
+    module = assemble_object(Assembler(options), read_file(str(source_path)), source_path.stem, removals)
+    module.write(object_path)
+    logger.info("assembled %s into %s", source_path, object_path)
+    return module, True
+
+def computes_jumps(source: str) -> bool:
+    """
+    Check if a module has an IJMP without assembling it, so the modules
+    linked with it can be optimised without removals, see assemble_object.
+    An IJMP in a label name is also found, which only costs the removals.
+
+    Parameters:
+        source (str): The assembly code of the module.
+    """
+    return _IJMP.search(source) is not None
+
+def link(modules: list[ObjectModule]) -> tuple[bytearray, dict[str, int]]:
+    """
+    Link objects into an image, placing them one after another in order
+    from address 0, and resolving the branch targets of their relocations.
+
+    Parameters:
+        modules (list[ObjectModule]): The objects, the first holds the entry.
+
+    Returns:
+        link (tuple[bytearray, dict[str, int]]): The image, and the address
+            of every label.
+
+    Raises:
+        SyntaxError: A label is undefined, or defined by two modules.
+        ValueError: The image is too large, or a module had instructions
+            removed and a module has an IJMP.
+    """
+    jumps = next((module.name for module in modules if module.computed_jumps), None)
+    if jumps is not None:
+        for module in modules:
+            if module.removed:
+                raise ValueError(f"{module.name}: the optimiser removed instructions, but {jumps} has an IJMP "
+                                 "whose computed targets would move, assemble it again without -O")
+    symbols: dict[str, int] = {}
+    owners: dict[str, str] = {}
+    bases: list[int] = []
+    base = 0
+    for module in modules:
+        bases.append(base)
+        for label, offset in module.symbols.items():
+            if label in symbols:
+                raise SyntaxError(f"{module.name}: '{label}' label already exists! (defined by {owners[label]})")
+            symbols[label] = base + offset
+            owners[label] = module.name
+        base += len(module)
+    if base > _MAX_WORDS:
+        raise ValueError(f"the linked image of {base} words does not fit the {_MAX_WORDS} word address space")
+
+    words = array("I")
+    for module, base in zip(modules, bases):
+        start = len(words)
+        words.extend(module.words)
+        addresses: list[int] = []
+        for name in module.externals:
+            if name not in symbols:
+                raise SyntaxError(f"{module.name}: undefined label '{name}'")
+            addresses.append(symbols[name])
+        for offset, target in module.relocations:
+            word = words[start + offset]
+            address = base + (word & _TARGET_MASK) if target == LOCAL else addresses[target]
+            words[start + offset] = (word & ~_TARGET_MASK) | (address & _TARGET_MASK)
+    logger.info("linked %d modules into %d words", len(modules), len(words))
+    return _pack_words(words), symbols
@@ -1,6 +1,22 @@
-import logging.config
+"""
+logger_conf.py
+
+This module holds the logging configuration of the command line interface.
+Importing it has no side effects, the CLI calls configure_logging, so the
+assembler can be imported as a library without installing any handlers.
+
+Author: Zachary Pearce
+Contributors: 
+License: GPL-3.0
+
+Functions:
+    configure_logging: Apply the logging configuration.
+"""
+
 from typing import Any
 
+__all__ = ["LOGGING_CONFIG", "configure_logging"]
+
 LOGGING_CONFIG: dict[str, Any] = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -26,14 +42,30 @@ LOGGING_CONFIG: dict[str, Any] = {
         "__main__": {
             "handlers": ["default"],
             "level": "DEBUG",
-            "propagate": True
+            "propagate": False
         },
         "pom8_parser": {
             "handlers": ["default"],
             "level": "DEBUG",
-            "propagate": True
+            "propagate": False
         }
     }
 }
 
-logging.config.dictConfig(LOGGING_CONFIG)
\ No newline at end of file
+def configure_logging(level: str = "INFO") -> None:
+    """
+    Apply LOGGING_CONFIG, logging.config is only imported when called.
+
+    Parameters:
+        level (str): The level of the root logger, e.g. "WARNING" to only
+            report problems. The other loggers log nothing less severe.
+    """
+    import logging.config
+
+    threshold = logging.getLevelName(level)
+    config = {**LOGGING_CONFIG, "loggers": {}}
+    for name, logger in LOGGING_CONFIG["loggers"].items():
+        if name == "" or logging.getLevelName(logger["level"]) < threshold:
+            logger = {**logger, "level": level}
+        config["loggers"][name] = logger
+    logging.config.dictConfig(config)
@@ -0,0 +1,177 @@
+"""
+one_pass.py
+
+This module assembles POM8 assembly in a single pass. The usual flow scans
+the whole source for its labels, parses every line into an AST and then
+walks the AST again to encode it. Here each line is scanned, checked and
+encoded as soon as its newline is reached, so the work on a line is done
+once. A branch to a label that is not defined yet is encoded with an
+address of 0 and noted in a fixup list keyed by the label, then patched in
+the output when the label is defined. Labels still in the fixup list at the
+end of the source are never defined, and are reported as errors.
+
+The machine code and symbol table are the same as the multi pass assembler,
+and so are the errors, but they are raised in line order: the multi pass
+assembler raises a duplicate label, or an item it cannot tokenise, before
+any error on an earlier line.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Functions:
+    assemble_words: Assemble a source in a single pass into instruction words.
+    assemble_one_pass: Assemble a source in a single pass into an image.
+"""
+
+from assembler import *
+from assembler import _define_label, _pack_words, _ENCODER_TABLE
+from parser import *
+from parser import _SIGNATURES, _IMMEDIATE_TYPES, _MNEMONIC_INDEX, _valid_register, _valid_immediate
+from pom8_token import *
+from array import array
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["assemble_words", "assemble_one_pass"]
+
+#a branch waiting on a label, the index of its word, its fields and its line
+_Fixup = tuple[int, int, int, int, int, int]
+
+def _check_mnemonic(token_type: TokenType, text: str, line_num: int) -> None:
+    """Raise the error the parser raises for an item where a mnemonic is expected."""
+    if token_type is not TokenType.MNEMONIC:
+        raise SyntaxError(
+            f"line {line_num}: Expected mnemonic, got {token_type}"
+        )
+    if text.upper() in _SIGNATURES:
+        #the parser would go on to a second instruction on the line
+        raise SyntaxError(
+            f"line {line_num}: Expected the end of the line, got '{text}'"
+        )
+    raise SyntaxError(
+        f"line {line_num}: Unknown opcode '{text.upper()}'"
+    )
+
+def assemble_words(source: str, symbols: dict[str, int],
+                   log: logging.Logger = logger, lines: array | None = None) -> array:
+    """
+    Assemble assembly code in a single pass, encoding each line as soon as
+    it is scanned and patching forward branches when their label is defined.
+
+    Parameters:
+        source (str): The assembly code.
+        symbols (dict[str, int]): The symbol table to add labels to.
+        log (logging.Logger): The logger to report labels and errors to.
+        lines (array | None): An array to append the line of each word to.
+
+    Returns:
+        words (array): The instruction words, an array('I').
+
+    Raises:
+        SyntaxError: An invalid line, or a label that is never defined.
+        ValueError: An item that could not be tokenised.
+    """
+    words = array("I")
+    fixups: dict[str, list[_Fixup]] = {}
+    encoders = _ENCODER_TABLE
+    register_type = TokenType.REGISTER
+    mnemonic_type = TokenType.MNEMONIC
+    #the items of the line being scanned, its labels are defined as they are read
+    items: list[tuple[TokenType, int, int]] = []
+    for token_type, start, end, line_num in scan_spans(source):
+        if token_type is TokenType.LABEL:
+            label = source[start:end-1] #strip colon from label text
+            address = len(words)
+            _define_label(label, address, line_num, symbols, log)
+            for index, mnemonic, r0, r1, r2, _ in fixups.pop(label, ()):
+                words[index] = encoders[mnemonic](r0, r1, r2, address)
+            continue
+        if token_type is not TokenType.NEWLINE:
+            items.append((token_type, start, end))
+            continue
+
+        #the line is complete, check and encode its instruction
+        items.append((token_type, start, end))
+        item_type, start, end = items[0]
+        text = source[start:end]
+        signature = _SIGNATURES.get(text.upper()) if item_type is mnemonic_type else None
+        if signature is None:
+            _check_mnemonic(item_type, text, line_num)
+        expected_types = signature.operands
+        names = signature.names
+        if signature.short_operands is not None and len(items) > 2 and items[2][0] in _IMMEDIATE_TYPES:
+            expected_types = signature.short_operands
+            names = signature.short_names
+
+        fields = [_MNEMONIC_INDEX[text.upper()], 0, 0, 0, 0]
+        registers = 1
+        label = None
+        for x, (allowed, expected) in enumerate(zip(expected_types, names)):
+            item_type, start, end = items[x + 1]
+            text = source[start:end]
+            if item_type not in allowed:
+                raise SyntaxError(
+                    f"line {line_num}: Expected operand of type {expected}, got {item_type.name}"
+                )
+
+            if item_type is register_type:
+                value = int(text[1:], 10)
+                valid = _valid_register(value)
+                fields[registers] = value
+                registers += 1
+            elif item_type is mnemonic_type:
+                valid = True #a forward reference until the end of the source
+                label = text
+            else:
+                value = int(text, 0)
+                valid = _valid_immediate(item_type, value)
+                fields[4] = value
+            if not valid:
+                raise SyntaxError(
+                    f"line {line_num}: Invalid value {text} for operand of type {item_type.name}"
+                )
+        #the parser skips the newline after the operands, anything after that starts the next instruction
+        if len(expected_types) + 2 < len(items):
+            item_type, start, end = items[len(expected_types) + 2]
+            _check_mnemonic(item_type, source[start:end], line_num)
+
+        if label is not None:
+            address = symbols.get(label)
+            if address is None:
+                fixups.setdefault(label, []).append((len(words), *fields[:4], line_num))
+                address = 0
+            fields[4] = address
+        words.append(encoders[fields[0]](*fields[1:]))
+        if lines is not None:
+            lines.append(line_num)
+        items.clear()
+
+    if fixups:
+        undefined = sorted((fixup[-1], label) for label, waiting in fixups.items() for fixup in waiting)
+        for line_num, label in undefined:
+            log.error("line %d: label '%s' is never defined", line_num, label)
+        line_num, label = undefined[0]
+        raise SyntaxError(
+            f"line {line_num}: Invalid value {label} for operand of type {TokenType.MNEMONIC.name}"
+        )
+    return words
+
+def assemble_one_pass(source: str, symbols: dict[str, int],
+                      log: logging.Logger = logger, lines: array | None = None) -> bytearray:
+    """
+    Assemble assembly code in a single pass into an image, see assemble_words.
+
+    Parameters:
+        source (str): The assembly code.
+        symbols (dict[str, int]): The symbol table to add labels to.
+        log (logging.Logger): The logger to report labels and errors to.
+        lines (array | None): An array to append the line of each word to.
+
+    Returns:
+        image (bytearray): The machine code, each instruction packed into
+            WORD_BYTES big-endian bytes.
+    """
+    return _pack_words(assemble_words(source, symbols, log, lines))
@@ -0,0 +1,347 @@
+"""
+optimiser.py
+
+This module provides a peephole optimiser, which rewrites a parsed Program
+before it is assembled to save instruction words and clock cycles. Every
+rewrite leaves the registers, data memory and (live) status flags of the
+program as they would have been, and the symbol table is moved to the new
+addresses of the labels.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Classes:
+    RuleReport: A dataclass of the savings of one rule.
+    OptimisationReport: The savings of every rule over a program.
+
+Functions:
+    optimise: Rewrite a Program in place with the peephole rules.
+"""
+
+from pom8_token import *
+from parser import *
+from simulator import _instruction_cycles
+from dataclasses import dataclass, field
+from typing import Callable
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["RULES", "RuleReport", "OptimisationReport", "optimise"]
+
+#the branch format instructions that take a target
+_TARGETED = frozenset(("JMP", "CALL", "BRZ", "BRN", "BRP", "BRC", "BRV"))
+#the immediate ALU operations that fold into the constant of an LDI
+_IMMEDIATE_FOLDS: dict[str, Callable[[int, int], int]] = {
+    "ADDI": lambda a, b: a + b,
+    "SUBI": lambda a, b: a - b,
+    "ANDI": lambda a, b: a & b,
+    "ORI": lambda a, b: a | b,
+    "XORI": lambda a, b: a ^ b
+}
+#the instructions that set every status flag, and those that read them (the
+#flag instructions only change one flag, so they count as reading the rest)
+_FLAG_WRITERS = frozenset(("ADD", "SUB", "AND", "OR", "NOT", "XOR", "LSL", "LSR", "ADDC", "SUBC",
+                           "INC", "LDO", *_IMMEDIATE_FOLDS))
+_FLAG_READERS = frozenset(("BRZ", "BRN", "BRP", "BRC", "BRV", "ADDC", "SUBC", "SETC", "CLRC", "SETV", "CLRV"))
+#the instructions that leave straight-line code, the flags are assumed live after them
+_TRANSFERS = frozenset(("JMP", "CALL", "RET", "IJMP", "BRZ", "BRN", "BRP", "BRC", "BRV"))
+#the furthest the flags are followed before they are assumed live
+_FLAG_SCAN_LIMIT = 64
+#the most passes of the rules, each pass can enable more rewrites
+_MAX_PASSES = 8
+
+#the rules, in the order they are applied, and what each rewrites
+RULES: dict[str, str] = {
+    "jump_thread": "branch to a JMP: branch to its target instead",
+    "tail_call": "CALL then RET: JMP to the subroutine, which returns for both",
+    "jump_next": "JMP to the next instruction: removed",
+    "self_move": "MOV rX, rX: removed",
+    "dead_load": "LDI rX overwritten by the next instruction: removed",
+    "fold_load": "LDI rX then an immediate ALU operation on rX: one LDI, when the flags are not read",
+    "fold_add": "ADDI/SUBI chain on rX: one ADDI (or nothing), when the flags are not read"
+}
+
+@dataclass
+class RuleReport:
+    """
+    The savings of a peephole rule.
+
+    Attributes:
+        rule (str): The name of the rule, a key of RULES.
+        rewrites (int): The number of places the rule rewrote.
+        words (int): The instruction words removed.
+        cycles (int): The clock cycles saved when each rewritten place runs once.
+    """
+    rule: str
+    rewrites: int = 0
+    words: int = 0
+    cycles: int = 0
+
+@dataclass
+class OptimisationReport:
+    """
+    The savings of the peephole rules over a program.
+
+    Attributes:
+        rules (dict[str, RuleReport]): The report of each rule, by name.
+        passes (int): The number of passes of the rules.
+        removals (bool): If instructions could be removed, not when the
+            program, or a module it is linked with, has an IJMP, as its
+            targets are computed addresses.
+    """
+    rules: dict[str, RuleReport] = field(default_factory=lambda: {rule: RuleReport(rule) for rule in RULES})
+    passes: int = 0
+    removals: bool = True
+
+    @property
+    def words(self) -> int:
+        """The instruction words removed by every rule."""
+        return sum(report.words for report in self.rules.values())
+
+    @property
+    def cycles(self) -> int:
+        """The clock cycles saved by every rule, when each rewritten place runs once."""
+        return sum(report.cycles for report in self.rules.values())
+
+    def __str__(self) -> str:
+        """Human readable table of the savings of each rule."""
+        lines = [f"{'rule':12} {'rewrites':>8} {'words':>6} {'cycles':>7}"]
+        lines += [f"{report.rule:12} {report.rewrites:8} {report.words:6} {report.cycles:7}"
+                  for report in self.rules.values()]
+        lines.append(f"{'total':12} {sum(report.rewrites for report in self.rules.values()):8} "
+                     f"{self.words:6} {self.cycles:7}")
+        if not self.removals:
+            lines.append("an IJMP computes jump targets, no instructions were removed")
+        return "\n".join(lines)
+
+def _registers(instruction: Instruction) -> list[int]:
+    """The register operands of an instruction, padded with r0 as they are encoded."""
+    registers = [operand.register_num for operand in instruction.operands if isinstance(operand, RegisterOperand)]
+    return registers + [0] * (3 - len(registers))
+
+def _immediate(instruction: Instruction) -> int:
+    """The 8 bit immediate operand of an immediate format instruction."""
+    return instruction.operands[-1].value & 0xFF
+
+def _immediate_instruction(mnemonic: str, destination: RegisterOperand, source: RegisterOperand | None,
+                           value: int, line_num: int = 0) -> Instruction:
+    """Build an immediate format instruction, the value written as hexadecimal."""
+    text = f"{value & 0xFF:#04x}"
+    immediate = ImmediateOperand(Token(text, destination.token.line_num), text)
+    operands: list[ASTNode] = [destination, immediate] if source is None else [destination, source, immediate]
+    return Instruction(mnemonic, operands, Format.IMMEDIATE_FORMAT, line_num)
+
+class _Optimiser:
+    """A pass over the instructions of a program, removed instructions are None."""
+    def __init__(self, program: Program, symbols: dict[str, int], report: OptimisationReport) -> None:
+        self.instructions: list[Instruction | None] = list(program.instructions)
+        self.symbols = symbols
+        self.report = report
+        self.changed = False
+        #the addresses control can reach other than from the previous instruction
+        self.targets = set(symbols.values())
+        for instruction in self.instructions:
+            if instruction.opcode_mnemonic in _TARGETED and isinstance(instruction.operands[0], ImmediateOperand):
+                self.targets.add(instruction.operands[0].value)
+
+    def target(self, instruction: Instruction) -> int:
+        """The address a branch format instruction targets, -1 for a label of another module."""
+        operand = instruction.operands[0]
+        return self.symbols.get(operand.name, -1) if isinstance(operand, LabelOperand) else operand.value
+
+    def next_index(self, index: int) -> int:
+        """The index of the next instruction that has not been removed, len if there is none."""
+        index += 1
+        while index < len(self.instructions) and self.instructions[index] is None:
+            index += 1
+        return index
+
+    def get(self, index: int) -> Instruction | None:
+        """The instruction at an index, None if it is removed or past the end."""
+        return self.instructions[index] if 0 <= index < len(self.instructions) else None
+
+    def flags_dead(self, index: int) -> bool:
+        """Are the flags written before the instruction at index never read."""
+        for _ in range(_FLAG_SCAN_LIMIT):
+            instruction = self.get(index)
+            if instruction is None:
+                return False #past the end, or a run of removed instructions
+            mnemonic = instruction.opcode_mnemonic
+            if mnemonic in _FLAG_READERS or mnemonic in _TRANSFERS:
+                return False
+            if mnemonic in _FLAG_WRITERS or mnemonic == "HLT":
+                return True
+            index = self.next_index(index)
+        return False
+
+    def record(self, rule: str, words: int, cycles: int) -> None:
+        """Record a rewrite by a rule."""
+        report = self.report.rules[rule]
+        report.rewrites += 1
+        report.words += words
+        report.cycles += cycles
+        self.changed = True
+
+    def remove(self, index: int) -> None:
+        """Remove an instruction, labels of it move to the next instruction."""
+        self.instructions[index] = None
+
+    def run(self) -> None:
+        """Apply every rule once over the program."""
+        removals = self.report.removals
+        for index, instruction in enumerate(self.instructions):
+            if instruction is None:
+                continue
+            mnemonic = instruction.opcode_mnemonic
+            following_index = self.next_index(index)
+            following = self.get(following_index)
+
+            if mnemonic in _TARGETED:
+                self.thread(index, instruction)
+                instruction = self.instructions[index]
+            if mnemonic == "CALL" and following is not None and following.opcode_mnemonic == "RET":
+                self.instructions[index] = Instruction("JMP", instruction.operands, Format.BRANCH_FORMAT,
+                                                         instruction.line_num)
+                words = 0
+                if removals and following_index not in self.targets:
+                    self.remove(following_index)
+                    words = 1
+                self.record("tail_call", words, _instruction_cycles("CALL") + _instruction_cycles("RET")
+                            - _instruction_cycles("JMP"))
+            elif not removals:
+                continue
+            elif mnemonic == "JMP" and index < self.target(instruction) <= following_index:
+                self.remove(index)
+                self.record("jump_next", 1, _instruction_cycles("JMP"))
+            elif mnemonic == "MOV" and _registers(instruction)[0] == _registers(instruction)[1]:
+                self.remove(index)
+                self.record("self_move", 1, _instruction_cycles("MOV"))
+            elif mnemonic == "LDI" and following is not None:
+                self.fold_load(index, instruction, following_index, following)
+            elif mnemonic in ("ADDI", "SUBI") and following is not None:
+                self.fold_add(index, instruction, following_index, following)
+
+    def thread(self, index: int, instruction: Instruction) -> None:
+        """Branch straight to the end of a chain of JMPs."""
+        operand = instruction.operands[0]
+        seen = {index}
+        address = self.target(instruction)
+        while address not in seen:
+            target = self.get(address)
+            if target is None or target.opcode_mnemonic != "JMP":
+                break
+            seen.add(address)
+            operand = target.operands[0]
+            address = self.target(target)
+        if operand is not instruction.operands[0] and address != self.target(instruction):
+            self.instructions[index] = Instruction(instruction.opcode_mnemonic, [operand], instruction.inst_format,
+                                                   instruction.line_num)
+            if isinstance(operand, ImmediateOperand):
+                self.targets.add(operand.value)
+            #every JMP of the chain is skipped
+            self.record("jump_thread", 0, (len(seen) - 1) * _instruction_cycles("JMP"))
+
+    def fold_load(self, index: int, instruction: Instruction, following_index: int, following: Instruction) -> None:
+        """Remove an LDI that is overwritten, or fold an immediate operation into it."""
+        register = _registers(instruction)[0]
+        following_mnemonic = following.opcode_mnemonic
+        rd, rs, _ = _registers(following)
+        if (following_mnemonic in ("LDI", "LDA", "POP") and rd == register
+                or following_mnemonic == "MOV" and rd == register and rs != register):
+            self.remove(index)
+            self.record("dead_load", 1, _instruction_cycles("LDI"))
+        elif (following_mnemonic in _IMMEDIATE_FOLDS and rd == register and rs == register
+              and following_index not in self.targets and self.flags_dead(self.next_index(following_index))):
+            value = _IMMEDIATE_FOLDS[following_mnemonic](_immediate(instruction), _immediate(following))
+            self.instructions[index] = _immediate_instruction("LDI", instruction.operands[0], None, value,
+                                                              instruction.line_num)
+            self.remove(following_index)
+            self.record("fold_load", 1, _instruction_cycles(following_mnemonic))
+
+    def fold_add(self, index: int, instruction: Instruction, following_index: int, following: Instruction) -> None:
+        """Fold a chain of two ADDI/SUBI of a register into one, or none when they cancel."""
+        rd, rs, _ = _registers(instruction)
+        following_rd, following_rs, _ = _registers(following)
+        if (following.opcode_mnemonic not in ("ADDI", "SUBI") or not rd == rs == following_rd == following_rs
+                or following_index in self.targets or not self.flags_dead(self.next_index(following_index))):
+            return
+        value = 0
+        for step in (instruction, following):
+            value += _immediate(step) if step.opcode_mnemonic == "ADDI" else -_immediate(step)
+        self.remove(following_index)
+        if value & 0xFF:
+            source = instruction.operands[1] if isinstance(instruction.operands[1], RegisterOperand) else None
+            self.instructions[index] = _immediate_instruction("ADDI", instruction.operands[0], source, value,
+                                                              instruction.line_num)
+            self.record("fold_add", 1, _instruction_cycles("ADDI"))
+        else:
+            self.remove(index)
+            self.record("fold_add", 2, 2 * _instruction_cycles("ADDI"))
+
+    def finish(self, program: Program) -> None:
+        """Write the instructions back to the program, moving the labels and numeric targets."""
+        addresses: list[int] = [] #the new address of each old address
+        address = 0
+        for instruction in self.instructions:
+            addresses.append(address)
+            if instruction is not None:
+                address += 1
+        removed = len(self.instructions) - address
+
+        def move(old: int) -> int:
+            return addresses[old] if old < len(addresses) else old - removed
+
+        for label, old in self.symbols.items():
+            self.symbols[label] = move(old)
+        kept: list[Instruction] = []
+        for instruction in self.instructions:
+            if instruction is None:
+                continue
+            operands = instruction.operands
+            if (removed and instruction.opcode_mnemonic in _TARGETED and isinstance(operands[0], ImmediateOperand)
+                    and move(operands[0].value) != operands[0].value):
+                text = f"{move(operands[0].value):#x}"
+                operand = ImmediateOperand(Token(text, operands[0].token.line_num), text)
+                instruction = Instruction(instruction.opcode_mnemonic, [operand], instruction.inst_format,
+                                          instruction.line_num)
+            kept.append(instruction)
+        program.instructions[:] = kept
+
+def optimise(program: Program, symbols: dict[str, int], log: logging.Logger = logger,
+             removals: bool = True) -> OptimisationReport:
+    """
+    Rewrite a parsed program in place with the peephole rules of RULES,
+    applied until none of them rewrites anything. Labels that marked a
+    removed instruction mark the instruction after it.
+
+    The rules assume subroutines return with RET, that the stack is not
+    read below the stack pointer, and that numeric branch targets are
+    addresses of this program. Instructions are only rewritten in place,
+    not removed, when the program has an IJMP, as its targets are computed.
+
+    Parameters:
+        program (Program): The parsed program, its instructions are replaced.
+        symbols (dict[str, int]): The symbol table of the program, updated
+            with the new address of each label.
+        log (logging.Logger): The logger to report the savings to.
+        removals (bool): If instructions may be removed, False for a module
+            linked with one that has an IJMP.
+
+    Returns:
+        report (OptimisationReport): The savings of each rule.
+    """
+    report = OptimisationReport()
+    report.removals = removals and not any(instruction.opcode_mnemonic == "IJMP" for instruction in program.instructions)
+    for _ in range(_MAX_PASSES):
+        optimiser = _Optimiser(program, symbols, report)
+        optimiser.run()
+        optimiser.finish(program)
+        report.passes += 1
+        if not optimiser.changed:
+            break
+    log.info("peephole optimiser: %d words and %d cycles saved in %d passes",
+             report.words, report.cycles, report.passes)
+    return report
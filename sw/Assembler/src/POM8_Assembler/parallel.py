@@ -0,0 +1,208 @@
+"""
+parallel.py
+
+This module tokenises a single large source across a process pool. The
+source is split into chunks at line boundaries and each chunk is tokenised
+by a worker, which numbers its lines from the chunk's first line and its
+labels from the chunk's first instruction. The chunks are then merged in
+order: each label is defined at its address in the chunk plus the
+instructions of the chunks before it, so a label defined twice, in one
+chunk or across two, raises the same "label already exists" error as
+tokenising sequentially.
+
+The tokens and symbol table are the same as tokenise, tokenise with the
+scanner, or tokenise_compact, and so is the first error. A worker that
+fails returns its error with the tokens and labels before it, so the merge
+defines the labels of the lines before the error before raising it.
+
+Workers return plain arrays and strings rather than Token objects, which
+are much cheaper to send between processes, and the tokens are rebuilt
+with their known types.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Functions:
+    split_source: Split a source into chunks at line boundaries.
+    tokenise_parallel: Tokenise a source in chunks across a process pool.
+"""
+
+from assembler import *
+from assembler import _define_label, _tokenise_line, _tokenise_compact_source, _tokenise_source
+from pom8_token import *
+from pom8_token import _TOKEN_TYPES
+from array import array
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["MIN_CHUNK_LINES", "split_source", "tokenise_parallel"]
+
+#sources with fewer lines per worker are tokenised in this process, a pool costs more to start
+MIN_CHUNK_LINES = 4096
+
+#the tokens of a chunk: types, lines, and texts, or spans into the chunk when compact
+_ChunkTokens = tuple[array, array, list[str] | tuple[array, array]]
+
+class _ChunkLabels:
+    """
+    Stands in for the symbol table of a chunk, collecting its labels in
+    order rather than defining them, duplicates are found by the merge.
+    """
+    def __init__(self) -> None:
+        self.names: list[str] = []
+        self.lines = array("I")
+        self.addresses = array("I")
+        self.line_num = 0
+
+    def __contains__(self, label: str) -> bool:
+        return False
+
+    def __setitem__(self, label: str, address: int) -> None:
+        self.names.append(label)
+        self.lines.append(self.line_num)
+        self.addresses.append(address)
+
+#workers report no labels, they are logged as the chunks are merged
+_SILENT = logging.Logger(__name__ + ".chunk", logging.CRITICAL)
+
+def split_source(asm: str, chunks: int) -> list[tuple[int, int, int]]:
+    """
+    Split a source into chunks at line boundaries, each about the same size.
+
+    Parameters:
+        asm (str): The assembly code.
+        chunks (int): The number of chunks wanted.
+
+    Returns:
+        chunks (list[tuple[int, int, int]]): The start and end offset of
+            each chunk in the source and the number of its first line.
+    """
+    spans = []
+    start = 0
+    first_line = 1
+    for x in range(1, chunks):
+        end = asm.find("\n", max(start, len(asm) * x // chunks))
+        if end < 0:
+            break
+        end += 1 #a chunk ends after its last newline
+        spans.append((start, end, first_line))
+        first_line += asm.count("\n", start, end)
+        start = end
+    if start < len(asm) or not spans:
+        spans.append((start, len(asm), first_line))
+    return spans
+
+def _tokenise_chunk(chunk: str, first_line: int, scanner: bool,
+                    compact: bool) -> tuple[_ChunkTokens, _ChunkLabels, Exception | None]:
+    """
+    Tokenise a chunk of a source in a worker. The labels are returned
+    rather than defined, so duplicates are found when the chunks are merged.
+
+    Parameters:
+        chunk (str): The lines of the chunk.
+        first_line (int): The line number of the first line of the chunk.
+        scanner (bool): Tokenise with the single pass scanner.
+        compact (bool): Give the spans of the tokens in the chunk instead of their text.
+
+    Returns:
+        tokens (_ChunkTokens): The types, lines and texts or spans of the tokens.
+        labels (_ChunkLabels): The labels, with their lines and addresses in the chunk.
+        error (Exception | None): The error that stopped the chunk, the tokens
+            and labels are those before it.
+    """
+    types = array("B")
+    lines = array("I")
+    texts: list[str] = []
+    starts = array("I")
+    ends = array("I")
+    labels = _ChunkLabels()
+    newline = TokenType.NEWLINE
+    address = 0
+    try:
+        if scanner or compact:
+            for token_type, start, end, line_num in scan_spans(chunk, first_line):
+                if token_type is TokenType.LABEL:
+                    labels.line_num = line_num
+                    labels[chunk[start:end-1]] = address #strip colon from label text
+                    continue
+                types.append(token_type.value)
+                lines.append(line_num)
+                if compact:
+                    starts.append(start)
+                    ends.append(end)
+                else:
+                    texts.append("\n" if token_type is newline else chunk[start:end])
+                if token_type is newline:
+                    address += 1
+        else:
+            for line_num, line in enumerate(chunk.split("\n"), start=first_line):
+                labels.line_num = line_num
+                line_tokens = _tokenise_line(line, line_num, address, labels, _SILENT)
+                if line_tokens is not None:
+                    for token in line_tokens:
+                        types.append(token.type.value)
+                        lines.append(token.line_num)
+                        texts.append(token.text)
+                    address += 1
+        error = None
+    except Exception as ex:
+        error = ex
+    return (types, lines, (starts, ends) if compact else texts), labels, error
+
+def tokenise_parallel(asm: str, symbols: dict[str, int], scanner: bool = False, compact: bool = False,
+                      workers: int | None = None, log: logging.Logger = logger) -> list[Token] | TokenStream:
+    """
+    Tokenise assembly code in chunks across a process pool, adding its
+    labels to the given symbol table. The tokens, symbol table and errors
+    are the same as tokenising in this process.
+
+    Parameters:
+        asm (str): The assembly code.
+        symbols (dict[str, int]): The symbol table to add labels to.
+        scanner (bool): Use the single pass scanner.
+        compact (bool): Give a compact TokenStream, see tokenise_compact.
+        workers (int | None): The number of worker processes, the number of
+            CPUs if not given. A source with fewer than MIN_CHUNK_LINES lines
+            per worker is tokenised in this process.
+        log (logging.Logger): The logger to report labels to.
+
+    Raises:
+        SyntaxError: A label is defined more than once.
+        ValueError: An item could not be tokenised.
+    """
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    workers = min(workers, asm.count("\n") // MIN_CHUNK_LINES)
+    if workers <= 1:
+        if compact:
+            return _tokenise_compact_source(asm, symbols, log)
+        return _tokenise_source(asm, symbols, scanner, log)
+
+    from concurrent.futures import ProcessPoolExecutor #loads multiprocessing, only needed here
+
+    spans = split_source(asm, workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_tokenise_chunk, asm[start:end], first_line, scanner, compact)
+                   for start, end, first_line in spans]
+        results = [future.result() for future in futures]
+
+    tokens: list[Token] | TokenStream = TokenStream(asm) if compact else []
+    base = 0
+    for (start, _, _), ((types, lines, texts), labels, error) in zip(spans, results):
+        for label, line_num, address in zip(labels.names, labels.lines, labels.addresses):
+            _define_label(label, base + address, line_num, symbols, log)
+        if error is not None:
+            raise error
+        if compact:
+            starts, ends = texts
+            tokens.extend(types, lines, array("I", [offset + start for offset in starts]),
+                          array("I", [offset + start for offset in ends]))
+        else:
+            token_types = _TOKEN_TYPES
+            tokens.extend([Token(text, line_num, token_types[value])
+                           for text, line_num, value in zip(texts, lines, types)])
+        base += types.count(TokenType.NEWLINE.value)
+    return tokens
@@ -10,21 +10,22 @@ License: GPL-3.0
 """
 
 from pom8_token import *
-from dataclasses import dataclass
+from array import array
+from dataclasses import dataclass, field
 from typing import Callable, Dict
 from enum import Enum
 
 import logging
-from logger_conf import *
 
 logger = logging.getLogger(__name__)
 
 __all__ = [
-    "Format",
+    "Format", "MNEMONICS",
     "symbol_table",
     "ASTNode",
     "RegisterOperand", "ImmediateOperand", "LabelOperand",
     "Program", "Instruction",
+    "CompactProgram",
     "Parser"
 ]
 
@@ -53,11 +54,37 @@ _FORMATS = {
                               "LDI", "LDA", "LDO", "STA", "PUSH", "POP"]
 }
 
+#the format of each mnemonic, and the index of each mnemonic in MNEMONICS
+_MNEMONIC_FORMATS: Dict[str, Format] = {
+    mnemonic: fmt for fmt, mnemonics in _FORMATS.items() for mnemonic in mnemonics
+}
+MNEMONICS: tuple[str, ...] = tuple(_MNEMONIC_FORMATS)
+_MNEMONIC_INDEX: Dict[str, int] = {mnemonic: index for index, mnemonic in enumerate(MNEMONICS)}
+
 symbol_table: Dict[str, int] = dict()
 
+def _valid_register(register_num: int) -> bool:
+    """Is the register number within range (0-15)."""
+    return register_num <= 15
+
+def _valid_immediate(token_type: TokenType, value: int) -> bool:
+    """Is the immediate value valid for the type of token it was written as."""
+    match token_type:
+        case TokenType.HEXADECIMAL:
+            return value <= 0x3FF
+        case TokenType.DECIMAL:
+            if value < 0:
+                return value >= -128
+            else:
+                return value <= 255
+        case TokenType.BINARY:
+            return value <= 255
+        case _:
+            return False
+
 class ASTNode:
     """Base class for all AST nodes."""
-    pass
+    __slots__ = ()
 
     def validate(self) -> bool:
         """Validate the AST node."""
@@ -72,6 +99,8 @@ class RegisterOperand(ASTNode):
         token (Token): The token representing the register.
         register_num (int): The integer value of the register number.
     """
+    __slots__ = ("_token", "_register_num")
+
     def __init__(self, token: Token, value: str) -> None:
         self._token = token
         self._register_num = int(value[1:], 10)
@@ -83,7 +112,7 @@ class RegisterOperand(ASTNode):
         Returns:
             valid (bool): is the register number within range (0-15).
         """
-        return self._register_num <= 15
+        return _valid_register(self._register_num)
     
     @property
     def token(self) -> Token:
@@ -107,6 +136,8 @@ class ImmediateOperand(ASTNode):
         token (Token): The token representing the immediate value.
         value (int): The integer value of the immediate operand.
     """
+    __slots__ = ("_token", "_value")
+
     def __init__(self, token: Token, value: str) -> None:
         self._token = token
         self._value = int(value, 0)
@@ -118,18 +149,7 @@ class ImmediateOperand(ASTNode):
         Returns:
             valid (bool): is the immediate value valid for its type.
         """
-        match self.token.type:
-            case TokenType.HEXADECIMAL:
-                return self.value <= 0x3FF
-            case TokenType.DECIMAL:
-                if self.value < 0:
-                    return self.value >= -128
-                else:
-                    return self.value <= 255
-            case TokenType.BINARY:
-                return self.value <= 255
-            case _:
-                return False
+        return _valid_immediate(self.token.type, self.value)
 
     @property
     def token(self) -> Token:
@@ -153,9 +173,12 @@ class LabelOperand(ASTNode):
         token (Token): The token representing the label.
         name (str): The name of the label.
     """
-    def __init__(self, token: Token, name: str) -> None:
+    __slots__ = ("_token", "_name", "_symbols")
+
+    def __init__(self, token: Token, name: str, symbols: Dict[str, int] | None = None) -> None:
         self._token = token
         self._name = name
+        self._symbols = symbol_table if symbols is None else symbols
     
     def validate(self) -> bool:
         """
@@ -164,7 +187,7 @@ class LabelOperand(ASTNode):
         Returns:
             valid (bool): true if the label exists in the symbol table.
         """
-        return self._name in symbol_table
+        return self._name in self._symbols
     
     @property
     def token(self) -> Token:
@@ -190,18 +213,143 @@ OPERANDS: Dict[TokenType, OperandFactory] = {
     TokenType.MNEMONIC: LabelOperand
 }
 
-@dataclass
+@dataclass(slots=True)
 class Instruction(ASTNode):
-    """Instruction node with mnemonic and operands."""
+    """Instruction node with mnemonic and operands, and the line of the mnemonic."""
     opcode_mnemonic: str
     operands: list[ASTNode]
     inst_format: Format
+    line_num: int = 0
 
-@dataclass
+@dataclass(slots=True)
 class Program(ASTNode):
     """The root program node containing all instructions."""
     instructions: list[Instruction]
 
+    def __len__(self) -> int:
+        """The number of instructions."""
+        return len(self.instructions)
+
+@dataclass(slots=True)
+class CompactProgram(ASTNode):
+    """
+    The root program node, with each instruction stored as a fixed-width
+    integer record instead of Instruction and operand objects.
+
+    Every record is RECORD_WIDTH consecutive integers in records:
+        mnemonic: the index of the mnemonic in MNEMONICS.
+        kinds: the OPERAND_* kind of each operand, two bits per operand,
+            the first operand in the lowest bits.
+        operand 0-2: a register number, an immediate value, or the index of
+            a label name in labels, 0 if there is no operand.
+        line: the line number of the mnemonic.
+    """
+    RECORD_WIDTH = 6
+    OPERAND_NONE = 0
+    OPERAND_REGISTER = 1
+    OPERAND_IMMEDIATE = 2
+    OPERAND_LABEL = 3
+
+    records: array = field(default_factory=lambda: array("i"))
+    labels: list[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        """The number of instructions in the program."""
+        return len(self.records) // self.RECORD_WIDTH
+
+    def record(self, index: int) -> tuple[int, ...]:
+        """Get the record of the instruction at the given index."""
+        start = index * self.RECORD_WIDTH
+        return tuple(self.records[start:start + self.RECORD_WIDTH])
+
+def _expected_operand_types(mnemonic: str, inst_format: Format,
+                            second_operand_type: TokenType | None) -> list[str]:
+    """
+    Get the token types expected for the operands of an instruction.
+
+    Parameters:
+        mnemonic (str): The upper case mnemonic of the instruction.
+        inst_format (Format): The format of the instruction.
+        second_operand_type (TokenType | None): The type of the token after
+            the first operand, immediate instructions can take one register.
+
+    Returns:
+        expected_types (list[str]): The accepted TokenType names of each
+            operand, '/' separated, empty if there are no operands.
+    """
+    expected_types: list[str] = []
+    if mnemonic in ["NOP", "HLT", "RET", "SETC", "CLRC", "SETV", "CLRV"]:
+        return expected_types #no operands
+    elif inst_format == Format.BRANCH_FORMAT:
+        expected_types = [ f"{TokenType.MNEMONIC.name}/"+
+                          f"{TokenType.HEXADECIMAL.name}" ]
+    elif inst_format == Format.IMMEDIATE_FORMAT:
+        if mnemonic in ["PUSH", "POP"]:
+            expected_types = [ f"{TokenType.REGISTER.name}" ]
+        elif (second_operand_type in [TokenType.DECIMAL,
+                                      TokenType.HEXADECIMAL,
+                                      TokenType.BINARY]):
+            expected_types = [ f"{TokenType.REGISTER.name}",
+                              f"{TokenType.DECIMAL.name}/"+
+                              f"{TokenType.HEXADECIMAL.name}/"+
+                              f"{TokenType.BINARY.name}" ]
+        else:
+            expected_types = [ f"{TokenType.REGISTER.name}",
+                              f"{TokenType.REGISTER.name}",
+                              f"{TokenType.DECIMAL.name}/"+
+                              f"{TokenType.HEXADECIMAL.name}/"+
+                              f"{TokenType.BINARY.name}" ]
+    elif inst_format == Format.REGISTER_FORMAT:
+        if mnemonic in ["LSL", "LSR", "MOV", "IJMP"]:
+            expected_types = [ f"{TokenType.REGISTER.name}",
+                              f"{TokenType.REGISTER.name}" ]
+        else:
+            expected_types = [ f"{TokenType.REGISTER.name}",
+                              f"{TokenType.REGISTER.name}",
+                              f"{TokenType.REGISTER.name}" ]
+    return expected_types
+
+@dataclass(frozen=True, slots=True)
+class _Signature:
+    """
+    The operands a mnemonic accepts, built once from _expected_operand_types.
+
+    Attributes:
+        inst_format (Format): The format of the instruction.
+        operands (tuple[tuple[TokenType, ...], ...]): The token types each
+            operand may be.
+        short_operands (tuple[tuple[TokenType, ...], ...] | None): The form
+            taken when the second token is an immediate, e.g. LDI r0, 1.
+        names (tuple[str, ...]): The '/' separated names of the token types
+            of each operand, for error messages.
+        short_names (tuple[str, ...] | None): The names of the short form.
+    """
+    inst_format: Format
+    operands: tuple[tuple[TokenType, ...], ...]
+    short_operands: tuple[tuple[TokenType, ...], ...] | None
+    names: tuple[str, ...]
+    short_names: tuple[str, ...] | None
+
+#the token types that select the short form of an immediate instruction, tuples
+#rather than sets as members are compared by identity, without hashing the enum
+_IMMEDIATE_TYPES = (TokenType.DECIMAL, TokenType.HEXADECIMAL, TokenType.BINARY)
+
+def _build_signature(mnemonic: str, inst_format: Format) -> _Signature:
+    """Build the signature of a mnemonic from its expected operand types."""
+    def types_of(names: list[str]) -> tuple[tuple[TokenType, ...], ...]:
+        return tuple(tuple(TokenType[name] for name in expected.split("/")) for expected in names)
+
+    names = _expected_operand_types(mnemonic, inst_format, None)
+    short_names = _expected_operand_types(mnemonic, inst_format, TokenType.DECIMAL)
+    if short_names == names:
+        return _Signature(inst_format, types_of(names), None, tuple(names), None)
+    return _Signature(inst_format, types_of(names), types_of(short_names), tuple(names), tuple(short_names))
+
+#the signature of each mnemonic
+_SIGNATURES: Dict[str, _Signature] = {
+    mnemonic: _build_signature(mnemonic, fmt) for mnemonic, fmt in _MNEMONIC_FORMATS.items()
+}
+
 class Parser:
     """
     Recursive descent parser for POM8 assembly language.
@@ -209,9 +357,27 @@ class Parser:
     Properties:
         current_token (Token): The current token being parsed.
     """
-    def __init__(self, tokens: list[Token]) -> None:
+    def __init__(self, tokens: list[Token] | TokenStream,
+                 symbols: Dict[str, int] | None = None,
+                 log: logging.Logger | None = None,
+                 forward_refs: bool = False) -> None:
+        """
+        Parser class constructor.
+
+        Parameters:
+            tokens (list[Token] | TokenStream): The tokens to parse.
+            symbols (Dict[str, int] | None): The symbol table labels are
+                checked against, the module symbol table if not given.
+            log (logging.Logger | None): The logger to report progress to.
+            forward_refs (bool): Accept labels that are not in the symbol
+                table yet, the caller checks they are defined later.
+        """
         self._tokens = tokens
         self._pos = 0
+        self._symbols = symbol_table if symbols is None else symbols
+        self._forward_refs = forward_refs
+        self._log = logger if log is None else log
+        self._log_info = self._log.isEnabledFor(logging.INFO)
     
     @property
     def current_token(self) -> Token | None:
@@ -233,58 +399,43 @@ class Parser:
         self._pos += 1
         return token
     
-    def _parse_operands(self, mnemonic: str, inst_format: Format) -> list[ASTNode]:
-        """Parse operands based on instruction format."""
+    def _parse_operands(self, signature: _Signature) -> list[ASTNode]:
+        """Parse operands based on the signature of the instruction."""
         operands: list[ASTNode] = []
-        expected_types : list[str] = []
-        if mnemonic in ["NOP", "HLT", "RET", "SETC", "CLRC", "SETV", "CLRV"]:
-            token = self._advance() #consume newline
-            return operands #no operands
-        elif inst_format == Format.BRANCH_FORMAT:
-            expected_types = [ f"{TokenType.MNEMONIC.name}/"+
-                              f"{TokenType.HEXADECIMAL.name}" ]
-        elif inst_format == Format.IMMEDIATE_FORMAT:
-            if mnemonic in ["PUSH", "POP"]:
-                expected_types = [ f"{TokenType.REGISTER.name}" ]
-            elif (self._peek_ahead(1).type in [TokenType.DECIMAL,
-                                            TokenType.HEXADECIMAL,
-                                            TokenType.BINARY]):
-                expected_types = [ f"{TokenType.REGISTER.name}",
-                                  f"{TokenType.DECIMAL.name}/"+
-                                  f"{TokenType.HEXADECIMAL.name}/"+
-                                  f"{TokenType.BINARY.name}" ]
-            else:
-                expected_types = [ f"{TokenType.REGISTER.name}",
-                                  f"{TokenType.REGISTER.name}",
-                                  f"{TokenType.DECIMAL.name}/"+
-                                  f"{TokenType.HEXADECIMAL.name}/"+
-                                  f"{TokenType.BINARY.name}" ]
-        elif inst_format == Format.REGISTER_FORMAT:
-            if mnemonic in ["LSL", "LSR", "MOV", "IJMP"]:
-                expected_types = [ f"{TokenType.REGISTER.name}",
-                                  f"{TokenType.REGISTER.name}" ]
-            else:
-                expected_types = [ f"{TokenType.REGISTER.name}",
-                                  f"{TokenType.REGISTER.name}",
-                                  f"{TokenType.REGISTER.name}" ]
-        
-        token = self.current_token
-        for expected in expected_types:
-            token = self._advance()
-            if token.type.name not in expected:
+        tokens = self._tokens
+        pos = self._pos
+        expected_types = signature.operands
+        names = signature.names
+        if (signature.short_operands is not None and pos + 1 < len(tokens)
+                and tokens[pos + 1].type in _IMMEDIATE_TYPES):
+            expected_types = signature.short_operands
+            names = signature.short_names
+
+        for allowed, expected in zip(expected_types, names):
+            if pos >= len(tokens):
+                raise SyntaxError(f"Expected operand of type {expected}, got the end of the program")
+            token = tokens[pos]
+            pos += 1
+            token_type = token.type
+            if token_type not in allowed:
                 raise SyntaxError(
-                    f"line {token.line_num}: Expected operand of type {expected}, got {token.type.name}"
+                    f"line {token.line_num}: Expected operand of type {expected}, got {token_type.name}"
                 )
-            
-            operand_class = OPERANDS[token.type]
-            new_operand = operand_class(token, token.text)
-            if new_operand.validate() is False:
+
+            if token_type is TokenType.MNEMONIC:
+                new_operand = LabelOperand(token, token.text, self._symbols)
+                valid = self._forward_refs or new_operand.validate()
+            else:
+                new_operand = OPERANDS[token_type](token, token.text)
+                valid = new_operand.validate()
+            if not valid:
                 raise SyntaxError(
-                    f"line {token.line_num}: Invalid value {token.text} for operand of type {token.type.name}"
+                    f"line {token.line_num}: Invalid value {token.text} for operand of type {token_type.name}"
                 )
-            logger.info(f"Line {self.current_token.line_num}: Created {new_operand.__repr__()}")
+            if self._log_info:
+                self._log.info("Line %d: Created %r", token.line_num, new_operand)
             operands.append(new_operand)
-        token = self._advance() #consume newline
+        self._pos = pos + 1 #consume newline
 
         return operands
 
@@ -296,29 +447,105 @@ class Parser:
                 f"line {token.line_num}: Expected mnemonic, got {token.type}"
             )
         mnemonic = token.text.upper()
-        inst_format = None
-        for fmt, mnemonics in _FORMATS.items():
-            if mnemonic in mnemonics:
-                inst_format = fmt
-                break
-        if inst_format is None:
+        signature = _SIGNATURES.get(mnemonic)
+        if signature is None:
             raise SyntaxError(
                 f"line {token.line_num}: Unknown opcode '{mnemonic}'"
             )
 
-        operands = self._parse_operands(mnemonic, inst_format)
+        operands = self._parse_operands(signature)
 
         return Instruction(
             opcode_mnemonic=mnemonic,
             operands=operands,
-            inst_format=inst_format
+            inst_format=signature.inst_format,
+            line_num=token.line_num
         )
     
     def parse_program(self) -> Program:
         """Parse the entire program and return the AST."""
         instructions: list[Instruction] = []
+        self._log_info = self._log.isEnabledFor(logging.INFO)
         while self.current_token is not None:
             instruction = self._parse_intruction()
             instructions.append(instruction)
-            logger.info(f"Parsed {instruction.inst_format.name} instruction.\n")
-        return Program(instructions)
\ No newline at end of file
+            if self._log_info:
+                self._log.info("Parsed %s instruction.\n", instruction.inst_format.name)
+        return Program(instructions)
+
+    def parse_compact(self) -> CompactProgram:
+        """
+        Parse the entire program into a CompactProgram.
+
+        The tokens must be a TokenStream, they are read straight from its
+        arrays and every instruction is stored as an integer record, so no
+        Token, operand or Instruction objects are created. Syntax errors are
+        the same as parse_program.
+        """
+        stream = self._tokens
+        if not isinstance(stream, TokenStream):
+            raise TypeError("parse_compact requires a TokenStream")
+
+        program = CompactProgram()
+        records = program.records
+        label_index: Dict[str, int] = {}
+        types = stream.types
+        lines = stream.lines
+        token_count = len(types)
+        mnemonic_type = TokenType.MNEMONIC.value
+        while self._pos < token_count:
+            pos = self._pos
+            token_type = stream.type(pos)
+            if token_type is not TokenType.MNEMONIC:
+                raise SyntaxError(
+                    f"line {lines[pos]}: Expected mnemonic, got {token_type}"
+                )
+            mnemonic = stream.text(pos).upper()
+            signature = _SIGNATURES.get(mnemonic)
+            if signature is None:
+                raise SyntaxError(
+                    f"line {lines[pos]}: Unknown opcode '{mnemonic}'"
+                )
+
+            expected_types = signature.operands
+            names = signature.names
+            if (signature.short_operands is not None and pos + 2 < token_count
+                    and stream.type(pos + 2) in _IMMEDIATE_TYPES):
+                expected_types = signature.short_operands
+                names = signature.short_names
+            record = [_MNEMONIC_INDEX[mnemonic], 0, 0, 0, 0, lines[pos]]
+            for x, (allowed, expected) in enumerate(zip(expected_types, names)):
+                pos += 1
+                if pos >= token_count:
+                    raise SyntaxError(f"Expected operand of type {expected}, got the end of the program")
+                token_type = stream.type(pos)
+                text = stream.text(pos)
+                if token_type not in allowed:
+                    raise SyntaxError(
+                        f"line {lines[pos]}: Expected operand of type {expected}, got {token_type.name}"
+                    )
+
+                if token_type is TokenType.REGISTER:
+                    kind = CompactProgram.OPERAND_REGISTER
+                    value = int(text[1:], 10)
+                    valid = _valid_register(value)
+                elif types[pos] == mnemonic_type:
+                    kind = CompactProgram.OPERAND_LABEL
+                    valid = text in self._symbols
+                    value = label_index.setdefault(text, len(program.labels))
+                    if value == len(program.labels):
+                        program.labels.append(text)
+                else:
+                    kind = CompactProgram.OPERAND_IMMEDIATE
+                    value = int(text, 0)
+                    valid = _valid_immediate(token_type, value)
+                if not valid:
+                    raise SyntaxError(
+                        f"line {lines[pos]}: Invalid value {text} for operand of type {token_type.name}"
+                    )
+                record[1] |= kind << (2 * x)
+                record[2 + x] = value
+
+            records.extend(record)
+            self._pos = pos + 2 #skip the last operand (or mnemonic) and the newline
+        return program
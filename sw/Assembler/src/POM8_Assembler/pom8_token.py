@@ -11,12 +11,19 @@ License: GPL-3.0
 Classes:
     TokenType: An enumeration of possible token types.
     Token: A class representing a token.
+    TokenStream: A compact token stream stored as parallel arrays.
+
+Functions:
+    scan: Scan a whole source buffer into (type, text, line) tuples.
+    scan_spans: Scan a whole source buffer into (type, start, end, line) tuples.
 """
 
 import re
+from array import array
 from enum import Enum
+from typing import Iterator
 
-__all__ = ["TokenType", "Token"]
+__all__ = ["TokenType", "Token", "TokenStream", "scan", "scan_spans"]
 
 class TokenType(Enum):
     """
@@ -49,6 +56,123 @@ _BIANRY_RE = re.compile(r"^0b[0-1]+$", re.IGNORECASE)
 _LABEL_RE = re.compile(r"^[a-z][a-z0-9]*:$", re.IGNORECASE)
 _MNEMONIC_RE = re.compile(r"^[a-z][a-z0-9]+$", re.IGNORECASE)
 
+#Master pattern for the scanner, one alternation with a named group per type.
+# The alternatives are tried in the same order as _classify_token, and each
+# one must end on an item boundary so it can only match a whole item
+_ITEM_END = r"(?![^,\s])"
+_SCANNER_RE = re.compile(
+    r"(?P<NEWLINE>\n)"
+    r"|(?P<SEPARATOR>,[ ]*|[^\S\n]+)"
+    r"|(?P<COMMENT>;[^\n]*)"
+    rf"|(?P<REGISTER>r\d+){_ITEM_END}"
+    rf"|(?P<HEXADECIMAL>0x[0-9A-F]+){_ITEM_END}"
+    rf"|(?P<DECIMAL>[-]?\d+){_ITEM_END}"
+    rf"|(?P<BINARY>0b[0-1]+){_ITEM_END}"
+    rf"|(?P<LABEL>[a-z][a-z0-9]*:){_ITEM_END}"
+    rf"|(?P<MNEMONIC>[a-z][a-z0-9]+){_ITEM_END}"
+    r"|(?P<UNKNOWN>[^,\s]+)",
+    re.IGNORECASE
+)
+
+#the groups are not nested, so match.lastindex identifies the alternative
+_NEWLINE_GROUP = _SCANNER_RE.groupindex["NEWLINE"]
+_SEPARATOR_GROUP = _SCANNER_RE.groupindex["SEPARATOR"]
+_COMMENT_GROUP = _SCANNER_RE.groupindex["COMMENT"]
+_SCANNER_TYPES: dict[int, TokenType] = {
+    _SCANNER_RE.groupindex[token_type.name]: token_type for token_type in TokenType
+    if token_type not in (TokenType.NEWLINE, TokenType.COMMENT)
+}
+
+def _unrecognised(text: str, line_num: int) -> ValueError:
+    """Build the error raised for text that does not form a valid token."""
+    return ValueError(f"Line {line_num}: '{text}' could not be tokenised, not recognised!")
+
+def scan(source: str) -> Iterator[tuple[TokenType, str, int]]:
+    """
+    Scan a whole source buffer in a single pass.
+
+    See scan_spans, this yields the text of each item instead of its span.
+
+    Parameters:
+        source (str): The assembly code to scan.
+
+    Yields:
+        item (tuple[TokenType, str, int]): The type, text and line number
+            of each item.
+
+    Raises:
+        ValueError: If an item could not be tokenised.
+    """
+    for token_type, start, end, line_num in scan_spans(source):
+        if token_type is TokenType.NEWLINE:
+            yield token_type, "\n", line_num
+        else:
+            yield token_type, source[start:end], line_num
+
+def scan_spans(source: str, first_line: int = 1) -> Iterator[tuple[TokenType, int, int, int]]:
+    """
+    Scan a whole source buffer in a single pass.
+
+    Every item is matched and classified by one compiled alternation, so no
+    item is classified twice. Lines that are empty or only hold a comment
+    produce nothing, every other line is terminated by a NEWLINE item.
+    Comments are dropped. Items are split on commas and whitespace exactly
+    as tokenise splits them, so the same items are rejected with the same
+    errors, including the empty item between two adjacent separators.
+
+    Parameters:
+        source (str): The assembly code to scan.
+        first_line (int): The line number of the first line, when the source
+            is part of a larger one.
+
+    Yields:
+        item (tuple[TokenType, int, int, int]): The type, start offset, end
+            offset and line number of each item.
+
+    Raises:
+        ValueError: If an item could not be tokenised.
+    """
+    line_num = first_line
+    has_items = False #has the current line produced an item yet
+    after_item = False #was the last match an item (not a separator)
+    after_comma = False #was the last match a comma separator
+    for match in _SCANNER_RE.finditer(source):
+        index = match.lastindex
+        token_type = _SCANNER_TYPES.get(index)
+        if token_type is not None:
+            has_items = after_item = True
+            after_comma = False
+            yield token_type, match.start(), match.end(), line_num
+        elif index == _SEPARATOR_GROUP:
+            if match.group()[0] == ",":
+                #a comma must follow an item, otherwise there is an empty item
+                if not after_item:
+                    raise _unrecognised("", line_num)
+                after_comma = True
+            elif after_comma:
+                #whitespace the comma did not consume splits off an empty item
+                raise _unrecognised("", line_num)
+            after_item = False
+        elif index == _NEWLINE_GROUP:
+            if after_comma:
+                raise _unrecognised("", line_num)
+            if has_items:
+                yield TokenType.NEWLINE, match.start(), match.end(), line_num
+            line_num += 1
+            has_items = after_item = after_comma = False
+        elif index == _COMMENT_GROUP:
+            #the comment runs to the end of the line
+            after_item = True
+            after_comma = False
+        else:
+            raise _unrecognised(match.group(), line_num)
+
+    #the last line may not end with a newline
+    if after_comma:
+        raise _unrecognised("", line_num)
+    if has_items:
+        yield TokenType.NEWLINE, len(source), len(source), line_num
+
 class Token():
     """
     A class representing a token of POM8 assembly code.
@@ -58,18 +182,21 @@ class Token():
         line_num (int): The line number of the token, for error tracking.
         type (TokenType): The tokens type as a TokenType member.
     """
+    __slots__ = ("_text", "_line_num", "_type")
 
-    def __init__(self, text: str, line_num: int):
+    def __init__(self, text: str, line_num: int, token_type: TokenType | None = None):
         """
         Token class constructor.
         
         Parameters:
             text (str): The portion of code associated with the token.
             line_num (int): The line number of the token, for error tracking.
+            token_type (TokenType | None): The type, if it is already known
+                (e.g. from scan), otherwise the text is classified.
         """
         self._text: str = text
         self._line_num: int = line_num
-        self._type: TokenType = self._classify_token()
+        self._type: TokenType = token_type if token_type is not None else self._classify_token()
 
     def _classify_token(self) -> TokenType:
         """
@@ -105,7 +232,7 @@ class Token():
         elif _MNEMONIC_RE.fullmatch(self._text):
             return TokenType.MNEMONIC
         else:
-            raise ValueError(f"Line {self._line_num}: '{self._text}' could not be tokenised, not recognised!")
+            raise _unrecognised(self._text, self._line_num)
 
     @property
     def text(self) -> str:
@@ -124,4 +251,116 @@ class Token():
     
     def __repr__(self) -> str:
         """String representation of the Token object."""
-        return f"Token(text='{self._text}', type={self._type}, line_num={self._line_num})"
\ No newline at end of file
+        return f"Token(text='{self._text}', type={self._type}, line_num={self._line_num})"
+
+#TokenType members indexed by their value, for decoding TokenStream.types
+_TOKEN_TYPES: tuple[TokenType | None, ...] = (None, *TokenType)
+
+class TokenStream():
+    """
+    A compact stream of POM8 assembly tokens.
+
+    Instead of a Token object per token, the type, line number and span in the
+    source buffer of every token are stored in parallel typed arrays. Indexing
+    the stream builds a Token view on demand, so it can be used wherever a
+    list of tokens is expected.
+
+    Properties:
+        source (str): The source buffer the tokens were scanned from.
+        types (array): The TokenType value of each token.
+        lines (array): The line number of each token.
+        starts (array): The offset of the start of each token in the source.
+        ends (array): The offset of the end of each token in the source.
+    """
+    __slots__ = ("_source", "_types", "_lines", "_starts", "_ends")
+
+    def __init__(self, source: str):
+        """
+        TokenStream class constructor.
+
+        Parameters:
+            source (str): The source buffer the tokens will be scanned from.
+        """
+        self._source: str = source
+        self._types: array = array("B")
+        self._lines: array = array("I")
+        self._starts: array = array("I")
+        self._ends: array = array("I")
+
+    def append(self, token_type: TokenType, start: int, end: int, line_num: int) -> None:
+        """
+        Append a token to the stream.
+
+        Parameters:
+            token_type (TokenType): The type of the token.
+            start (int): The offset of the start of the token in the source.
+            end (int): The offset of the end of the token in the source.
+            line_num (int): The line number of the token.
+        """
+        self._types.append(token_type.value)
+        self._lines.append(line_num)
+        self._starts.append(start)
+        self._ends.append(end)
+
+    def extend(self, types: array, lines: array, starts: array, ends: array) -> None:
+        """
+        Append many tokens to the stream, e.g. those of a part of the source
+        scanned separately.
+
+        Parameters:
+            types (array): The TokenType value of each token.
+            lines (array): The line number of each token.
+            starts (array): The offset of the start of each token in the source.
+            ends (array): The offset of the end of each token in the source.
+        """
+        self._types.extend(types)
+        self._lines.extend(lines)
+        self._starts.extend(starts)
+        self._ends.extend(ends)
+
+    def text(self, index: int) -> str:
+        """Get the text of the token at the given index."""
+        if self._types[index] == TokenType.NEWLINE.value:
+            return "\n"
+        return self._source[self._starts[index]:self._ends[index]]
+
+    def type(self, index: int) -> TokenType:
+        """Get the type of the token at the given index."""
+        return _TOKEN_TYPES[self._types[index]]
+
+    @property
+    def source(self) -> str:
+        """The source buffer the tokens were scanned from."""
+        return self._source
+
+    @property
+    def types(self) -> array:
+        """The TokenType value of each token."""
+        return self._types
+
+    @property
+    def lines(self) -> array:
+        """The line number of each token."""
+        return self._lines
+
+    @property
+    def starts(self) -> array:
+        """The offset of the start of each token in the source."""
+        return self._starts
+
+    @property
+    def ends(self) -> array:
+        """The offset of the end of each token in the source."""
+        return self._ends
+
+    def __len__(self) -> int:
+        """The number of tokens in the stream."""
+        return len(self._types)
+
+    def __getitem__(self, index: int) -> Token:
+        """Build a Token view of the token at the given index."""
+        return Token(self.text(index), self._lines[index], self.type(index))
+
+    def __repr__(self) -> str:
+        """String representation of the TokenStream object."""
+        return f"TokenStream(tokens={len(self._types)})"
@@ -0,0 +1,155 @@
+"""
+rom_delta.py
+
+This module compares a program with the image the hardware was last built
+from, listing the instruction words and ROM256X1 primitives that changed and
+whether the program fits the depth of the built ROM. A program that fits only
+changes the INIT values of the primitives, so the built design can be patched
+(see writers.write_rom_tcl) instead of synthesised and implemented again.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Classes:
+    WordChange: A dataclass of an instruction word that changed.
+    RomDelta: A dataclass of the differences between two images.
+
+Functions:
+    read_image_words: Read the words of an image written in any output format.
+    compare_images: Compare a program with the previous image.
+"""
+
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Sequence
+
+from writers import ROM_PRIMITIVE_DEPTH, unpack_words
+
+__all__ = ["WordChange", "RomDelta", "read_image_words", "compare_images"]
+
+#the width of an instruction word, one ROM256X1 primitive per bit
+_WORD_BITS = 24
+#an element of a rom_contents aggregate, as written by writers.write_vhdl_rom
+_VHDL_ELEMENT = re.compile(r'^\s*(\d+)\s*=>\s*"([01]+)"', re.MULTILINE)
+
+@dataclass(frozen=True)
+class WordChange:
+    """
+    An instruction word that differs from the previous image.
+
+    Attributes:
+        address (int): The address of the word.
+        old (int): The word in the previous image, 0 past its end.
+        new (int): The word in the program, 0 past its end.
+    """
+    address: int
+    old: int
+    new: int
+
+@dataclass(frozen=True)
+class RomDelta:
+    """
+    The differences between a program and the previous image.
+
+    Attributes:
+        changes (list[WordChange]): The words that changed, by address.
+        columns (list[int]): The bits of the words that changed, the ROM256X1 primitives whose INIT value changed.
+        words (int): The number of words in the program.
+        depth (int): The number of words the built ROM holds.
+    """
+    changes: list[WordChange]
+    columns: list[int]
+    words: int
+    depth: int
+
+    @property
+    def fits(self) -> bool:
+        """If the program fits the built ROM, so only the INIT values need to change."""
+        return self.words <= self.depth
+
+    def __str__(self) -> str:
+        """Human readable report of the changed words and what needs to be rebuilt."""
+        if not self.changes:
+            return "ROM delta: identical to the previous image, nothing to rebuild"
+        lines = [f"ROM delta: {len(self.changes)} words changed, "
+                 f"{len(self.columns)} of {_WORD_BITS} ROM256X1 INIT values changed"]
+        lines += [f"  {change.address:#06x}: {change.old:06X} -> {change.new:06X}" for change in self.changes]
+        if self.fits:
+            lines.append(f"the {self.words} words fit the {self.depth} word ROM, "
+                         "patch the INIT values of the built design (-f tcl), no rebuild needed")
+        else:
+            lines.append(f"the {self.words} words do not fit the {self.depth} word ROM, "
+                         "a deeper ROM must be synthesised and implemented")
+        return "\n".join(lines)
+
+def read_image_words(file_name: str) -> list[int]:
+    """
+    Read the instruction words of an image written in any output format but
+    Intel HEX, chosen by the file name suffix. A VHDL file is read for its
+    rom_contents aggregate, so rtl/pom8_instruction_memory.vhd can be read.
+
+    Parameters:
+        file_name (str): The image, e.g. a previous output or the RTL.
+
+    Returns:
+        words (list[int]): The instruction words from address 0.
+    """
+    path = Path(file_name)
+    suffix = path.suffix.lower()
+    if suffix == ".bin":
+        return unpack_words(path.read_bytes())
+
+    text = path.read_text()
+    if suffix in (".vhd", ".vhdl"):
+        elements = {int(address): int(bits, 2) for address, bits in _VHDL_ELEMENT.findall(text)}
+        words = [0] * (max(elements) + 1 if elements else 0)
+        for address, word in elements.items():
+            words[address] = word
+        return words
+    if suffix == ".mem":
+        words = []
+        address = 0
+        for token in text.split():
+            if token.startswith("@"):
+                address = int(token[1:], 16)
+                continue
+            words.extend([0] * (address + 1 - len(words)))
+            words[address] = int(token, 16)
+            address += 1
+        return words
+    if suffix == ".coe":
+        vector = text.split("memory_initialization_vector=", 1)[-1]
+        return [int(entry, 16) for entry in re.split(r"[\s,;]+", vector) if entry]
+    if suffix == ".hex":
+        raise ValueError("Intel HEX images cannot be compared, use the bin, text, mem, coe or vhdl format")
+    return [int(line, 2) for line in text.split()]
+
+def compare_images(previous: Sequence[int], current: Sequence[int], depth: int | None = None) -> RomDelta:
+    """
+    Compare a program with the previous image the ROM was built from.
+
+    Parameters:
+        previous (Sequence[int]): The words of the previous image.
+        current (Sequence[int]): The words of the program.
+        depth (int | None): The number of words the built ROM holds, by default
+            the whole ROM256X1 primitives needed to hold the previous image.
+
+    Returns:
+        delta (RomDelta): The differences between the images.
+    """
+    if depth is None:
+        depth = max(1, -(-len(previous) // ROM_PRIMITIVE_DEPTH)) * ROM_PRIMITIVE_DEPTH
+
+    changes: list[WordChange] = []
+    changed_bits = 0
+    for address in range(max(len(previous), len(current))):
+        #past the end of an image the ROM holds the others => 0 of rom_contents
+        old = previous[address] if address < len(previous) else 0
+        new = current[address] if address < len(current) else 0
+        if old != new:
+            changes.append(WordChange(address, old, new))
+            changed_bits |= old ^ new
+    columns = [column for column in range(_WORD_BITS) if changed_bits >> column & 1]
+    return RomDelta(changes, columns, len(current), depth)
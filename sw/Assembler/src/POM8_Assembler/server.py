@@ -0,0 +1,282 @@
+"""
+server.py
+
+This module provides a long-lived assembler server, so tools that assemble
+many times a second, e.g. an IDE checking the program as it is edited, pay
+for the interpreter start up and the imports once. The server keeps its
+state warm between requests: the compiled patterns and encoding tables, and
+the responses to the most recent sources, so an unchanged source is answered
+without assembling it again.
+
+The server speaks JSON lines, one request object per line and one response
+line for each, over a Unix domain socket or stdin/stdout.
+
+A request:
+    {"id": 1, "source": "...", "options": {"compact": true}, "format": "text"}
+    "file" may be given instead of "source", the path of a file the server
+    reads. The options are the true or false flags of AssemblerOptions, and
+    the format is a key of writers.FORMATS. "command" may be "ping" or
+    "shutdown" instead of the default "assemble".
+
+A response:
+    {"id": 1, "ok": true, "output": "...", "encoding": "utf-8", "symbols": {...},
+     "optimisation": null, "diagnostics": [{"level": "WARNING", "message": "..."}]}
+    The output of a binary format is base64 encoded. A failed request has ok
+    false and its error in the diagnostics.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Classes:
+    AssemblerServer: The warm state of a server, answering requests.
+
+Functions:
+    serve_stdio: Answer JSON line requests from a stream.
+    serve_socket: Answer JSON line requests on a Unix domain socket.
+"""
+
+from __init__ import __version__
+from assembler import *
+from assembler import _encoding_fingerprint
+from writers import FORMATS, write_image
+from client import default_socket, send_request
+from collections import OrderedDict
+from typing import Any, TextIO
+import base64
+import hashlib
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["AssemblerServer", "serve_stdio", "serve_socket"]
+
+#the number of responses kept for unchanged sources
+_RESPONSE_CACHE_SIZE = 128
+#the formats written as text, the rest are base64 encoded
+_TEXT_FORMATS = ("text", "hex", "coe", "mem", "vhdl", "tcl")
+#the AssemblerOptions a request may set
+_REQUEST_OPTIONS = ("scanner", "compact", "optimise", "one_pass")
+
+class _DiagnosticHandler(logging.Handler):
+    """Collect the warnings and errors of a request."""
+    def __init__(self) -> None:
+        super().__init__(logging.WARNING)
+        self.diagnostics: list[dict[str, str]] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.diagnostics.append({"level": record.levelname, "message": record.getMessage()})
+
+class AssemblerServer:
+    """
+    The warm state of an assembler server. A session is made for each
+    request, so requests may be answered from several threads at once.
+
+    Properties:
+        requests (int): The number of requests answered.
+        hits (int): The number of requests answered from the response cache.
+    """
+    def __init__(self, cache_size: int = _RESPONSE_CACHE_SIZE) -> None:
+        """
+        AssemblerServer class constructor.
+
+        Parameters:
+            cache_size (int): The number of responses kept for unchanged sources.
+        """
+        self._cache: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._hits = 0
+        self.stopping = threading.Event()
+
+    @property
+    def requests(self) -> int:
+        """The number of requests answered."""
+        return self._requests
+
+    @property
+    def hits(self) -> int:
+        """The number of requests answered from the response cache."""
+        return self._hits
+
+    def handle(self, request: dict[str, Any]) -> dict[str, Any]:
+        """
+        Answer a request, errors are reported in the response.
+
+        Parameters:
+            request (dict[str, Any]): The request.
+
+        Returns:
+            response (dict[str, Any]): The response, with the id of the request.
+        """
+        with self._lock:
+            self._requests += 1
+        command = request.get("command", "assemble")
+        if command == "ping":
+            response = {"ok": True, "version": __version__, "requests": self._requests, "hits": self._hits}
+        elif command == "shutdown":
+            self.stopping.set()
+            response = {"ok": True}
+        elif command == "assemble":
+            response = self._assemble(request)
+        else:
+            response = _failure(f"unknown command '{command}'")
+        return {"id": request.get("id"), **response}
+
+    def _assemble(self, request: dict[str, Any]) -> dict[str, Any]:
+        """Assemble the source of a request, or answer from the response cache."""
+        try:
+            fmt = request.get("format", "text")
+            if fmt not in FORMATS:
+                raise ValueError(f"unknown format '{fmt}', expected one of {', '.join(FORMATS)}")
+            unknown = set(request.get("options", {})) - set(_REQUEST_OPTIONS)
+            if unknown:
+                raise ValueError(f"unknown options {', '.join(sorted(unknown))}")
+            flags = request.get("options", {})
+            for name, value in flags.items():
+                if not isinstance(value, bool):
+                    raise TypeError(f"option '{name}' must be true or false")
+            options = AssemblerOptions(**flags)
+            if "source" in request:
+                source = request["source"]
+                if not isinstance(source, str):
+                    raise TypeError("the source must be a string")
+            elif "file" in request:
+                if not isinstance(request["file"], str):
+                    raise TypeError("the file must be a string")
+                source = read_file(request["file"])
+            else:
+                raise ValueError("the request has no source or file")
+        except (AttributeError, OSError, TypeError, ValueError) as ex:
+            return _failure(str(ex))
+
+        #the encoding, not the parse, decides the output, so the scanner, compact and one_pass options are not keyed
+        key = hashlib.sha256(f"{_encoding_fingerprint(options.optimise)}|{fmt}|".encode("utf-8")
+                             + source.encode("utf-8")).hexdigest()
+        with self._lock:
+            response = self._cache.get(key)
+            if response is not None:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return response
+
+        handler = _DiagnosticHandler()
+        log = logging.Logger(__name__ + ".request", logging.WARNING)
+        log.addHandler(handler)
+        session = Assembler(options, log)
+        try:
+            image = session.assemble_image(source)
+        except Exception as ex:
+            log.error(ex)
+            return {"ok": False, "diagnostics": handler.diagnostics}
+
+        output = io.BytesIO()
+        write_image(output, image, fmt)
+        text = fmt in _TEXT_FORMATS
+        response = {
+            "ok": True,
+            "output": output.getvalue().decode("utf-8") if text else base64.b64encode(output.getvalue()).decode("ascii"),
+            "encoding": "utf-8" if text else "base64",
+            "symbols": session.symbol_table,
+            "optimisation": str(session.optimisation) if session.optimisation is not None else None,
+            "diagnostics": handler.diagnostics,
+        }
+        with self._lock:
+            self._cache[key] = response
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return response
+
+    def handle_line(self, line: str | bytes) -> str:
+        """Answer a request line with a response line."""
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request must be a JSON object")
+        except ValueError as ex:
+            return json.dumps({"id": None, **_failure(f"invalid request: {ex}")}) + "\n"
+        return json.dumps(self.handle(request)) + "\n"
+
+def _failure(message: str) -> dict[str, Any]:
+    """The response to a request that could not be answered."""
+    return {"ok": False, "diagnostics": [{"level": "ERROR", "message": message}]}
+
+def serve_stdio(input: TextIO = sys.stdin, output: TextIO = sys.stdout,
+                server: AssemblerServer | None = None) -> None:
+    """
+    Answer JSON line requests from a stream until it ends or a shutdown request.
+
+    Parameters:
+        input (TextIO): The requests, one per line.
+        output (TextIO): The responses, one per line, flushed after each.
+        server (AssemblerServer | None): The warm state, a new server if not given.
+    """
+    server = server if server is not None else AssemblerServer()
+    for line in input:
+        if not line.strip():
+            continue
+        output.write(server.handle_line(line))
+        output.flush()
+        if server.stopping.is_set():
+            break
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Answer the requests of a connection, one per line, until it closes."""
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.wfile.write(self.server.assembler.handle_line(line).encode("utf-8"))
+            self.wfile.flush()
+            if self.server.assembler.stopping.is_set():
+                #shutdown waits for serve_forever, so from another thread
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                break
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def serve_socket(path: str | None = None, server: AssemblerServer | None = None,
+                 ready: threading.Event | None = None) -> None:
+    """
+    Answer JSON line requests on a Unix domain socket until a shutdown
+    request, each connection on its own thread. A socket left by a server
+    that is no longer running is replaced.
+
+    Parameters:
+        path (str | None): The socket, client.default_socket if not given.
+        server (AssemblerServer | None): The warm state, a new server if not given.
+        ready (threading.Event | None): Set once the socket is listening.
+    """
+    path = path or default_socket()
+    if os.path.exists(path):
+        try:
+            send_request({"command": "ping"}, path, timeout=1.0)
+        except (OSError, ValueError):
+            os.unlink(path) #stale
+        else:
+            raise OSError(f"a server is already listening on {path}")
+
+    with _UnixServer(path, _RequestHandler) as unix_server:
+        unix_server.assembler = server if server is not None else AssemblerServer()
+        os.chmod(path, 0o600)
+        logger.info("listening on %s", path)
+        if ready is not None:
+            ready.set()
+        start = time.perf_counter()
+        try:
+            unix_server.serve_forever()
+        finally:
+            os.unlink(path)
+            logger.info("answered %d requests (%d from the cache) in %.1f s",
+                        unix_server.assembler.requests, unix_server.assembler.hits,
+                        time.perf_counter() - start)
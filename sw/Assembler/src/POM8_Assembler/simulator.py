@@ -0,0 +1,740 @@
+"""
+simulator.py
+
+This module provides a cycle-accurate instruction set simulator of the POM8,
+so the performance of firmware can be measured without a Vivado simulation.
+Cycles are charged by the states the control unit (rtl/pom8_cu.vhd) passes
+through for each instruction, and hit counts and cycles can be profiled per
+instruction and aggregated by the labels of the symbol table.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Classes:
+    LabelProfile: A dataclass of the profile of the code under one label.
+    Simulator: A cycle-accurate POM8 simulator with a pre-decoded program.
+
+Functions:
+    image_digest: The hash of a program, as snapshots and checkpoints key on it.
+    format_profile: Format the profile of a simulation, by label and by
+        instruction.
+"""
+
+from assembler import _OPCODE, FUNCT, _pack_words
+from writers import unpack_words
+from bisect import bisect_right
+from array import array
+from dataclasses import dataclass
+from typing import Callable, Sequence
+import hashlib
+import struct
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "FLAG_Z", "FLAG_N", "FLAG_P", "FLAG_C", "FLAG_V",
+    "RAM_SIZE", "GPIO_BASE", "ROM_SIZE",
+    "SNAPSHOT_VERSION",
+    "LabelProfile", "Simulator", "image_digest", "format_profile"
+]
+
+#the status flags, in the order of the status register (rtl/pom8_status_register.vhd)
+FLAG_Z = 0b10000
+FLAG_N = 0b01000
+FLAG_P = 0b00100
+FLAG_C = 0b00010
+FLAG_V = 0b00001
+
+#the memory map (rtl/packages/pom8_memory_map_conf.vhd), RAM from 0 and the
+#GPIO registers from 512, selected by the low two address bits
+RAM_SIZE = 512
+GPIO_BASE = 512
+_DATA_ADDRESS_MASK = 0x3FF
+#the GPIO registers (rtl/pom8_gpio_controller.vhd)
+_GPIO_INPUT = 0
+_GPIO_OUTPUT = 1
+_GPIO_DDR = 2
+#the instruction memory is 256 words, addressed by PCL alone
+ROM_SIZE = 256
+
+#the states of the control unit, each is one clock cycle
+_BOOT_CYCLES = 1 #BOOT, after reset
+_FETCH_CYCLES = 2 #PCL_INC, DECODE
+_PCH_INC_CYCLES = 1 #PCH_INC, when PCL carries
+_EXECUTE_CYCLES = 1 #REGISTER_EXE, BRANCH_EXE or IMMEDIATE_EXE
+_WRITEBACK_CYCLES = 1 #MEM_WRITEBACK, for POP, LDA and LDO
+_CALL_CYCLES = 2 #PCH_SAVE, PC_LOAD16
+_RET_CYCLES = 3 #PCH_LOAD8, PCL_FETCH8, PCL_LOAD8
+#no limit on a run
+_UNLIMITED = 1 << 63
+
+#a snapshot of the machine state, the header then the registers, RAM and GPIO registers
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_MAGIC = b"P8SS"
+#magic, version, halted, PC, SP, status flags, pins, cycles, instructions, image digest
+_SNAPSHOT_HEADER = struct.Struct("<4sBBHHBBQQ8s")
+_SNAPSHOT_SIZE = _SNAPSHOT_HEADER.size + 16 + RAM_SIZE + 4
+
+#the opcode and funct of each mnemonic as integers
+_OPCODES = {mnemonic: int(bits, 2) for mnemonic, bits in _OPCODE.items()}
+_FUNCTS = {mnemonic: int(bits, 2) for mnemonic, bits in FUNCT.items()}
+_MNEMONIC_OF_OPCODE = {opcode: mnemonic for mnemonic, opcode in _OPCODES.items()}
+_MNEMONIC_OF_FUNCT = {funct: mnemonic for mnemonic, funct in _FUNCTS.items()}
+
+def _build_flag_table() -> bytes:
+    """
+    Build the flags of every ALU result, indexed by the 9 bit result, then
+    bit 7 of the source and target inputs (bits 9 and 10), as in rtl/pom8_alu.vhd.
+    """
+    table = bytearray(1 << 11)
+    for index in range(len(table)):
+        result = index & 0x1FF
+        r7 = (result >> 7) & 1
+        a7 = (index >> 9) & 1
+        b7 = (index >> 10) & 1
+        flags = 0
+        if result & 0xFF == 0:
+            flags |= FLAG_Z
+        flags |= FLAG_N if r7 else FLAG_P
+        if result & 0x100:
+            flags |= FLAG_C
+        if (not a7 and not b7 and r7) or (a7 and b7 and not r7):
+            flags |= FLAG_V
+        table[index] = flags
+    return bytes(table)
+
+_FLAG_TABLE = _build_flag_table()
+
+def _alu_flags(a: int, b: int, result: int) -> int:
+    """The flags of an ALU result, result is the 9 bit result."""
+    return _FLAG_TABLE[(result & 0x1FF) | (a & 0x80) << 2 | (b & 0x80) << 3]
+
+#the ALU operation of each ALU mnemonic, taking Rs, Rt and C, returning the 9 bit result
+_ALU_OPERATIONS: dict[str, Callable[[int, int, int], int]] = {
+    "ADD": lambda a, b, c: a + b,
+    "SUB": lambda a, b, c: (a - b) & 0x1FF,
+    "AND": lambda a, b, c: a & b,
+    "OR": lambda a, b, c: a | b,
+    "XOR": lambda a, b, c: a ^ b,
+    "NOT": lambda a, b, c: ~a & 0xFF,
+    "LSL": lambda a, b, c: a << 1,
+    "LSR": lambda a, b, c: a >> 1,
+    "ADDC": lambda a, b, c: a + b + c,
+    "SUBC": lambda a, b, c: (a - b - c) & 0x1FF,
+    "INC": lambda a, b, c: a + b,
+    "ADDI": lambda a, b, c: a + b,
+    "SUBI": lambda a, b, c: (a - b) & 0x1FF,
+    "ANDI": lambda a, b, c: a & b,
+    "ORI": lambda a, b, c: a | b,
+    "XORI": lambda a, b, c: a ^ b
+}
+
+#the status flag each conditional branch tests
+_BRANCH_FLAGS = {"BRZ": FLAG_Z, "BRN": FLAG_N, "BRP": FLAG_P, "BRC": FLAG_C, "BRV": FLAG_V}
+#the masks of the flag instructions, ORed in to set or ANDed in to clear
+_SET_FLAGS = {"SETC": FLAG_C, "SETV": FLAG_V}
+_CLEAR_FLAGS = {"CLRC": FLAG_C, "CLRV": FLAG_V}
+
+def _decode_word(word: int) -> tuple[str | None, int, int, int]:
+    """
+    Decode the mnemonic and register fields of an instruction word.
+
+    Returns:
+        fields (tuple[str | None, int, int, int]): The mnemonic, None if the
+            word is not an instruction, then the Rd, Rs and Rt fields.
+    """
+    opcode = word >> 18
+    mnemonic = _MNEMONIC_OF_FUNCT.get(word & 0x3F) if opcode == 0 else _MNEMONIC_OF_OPCODE.get(opcode)
+    return mnemonic, (word >> 14) & 0xF, (word >> 10) & 0xF, (word >> 6) & 0xF
+
+def _instruction_cycles(mnemonic: str | None) -> int:
+    """The cycles an instruction takes from PCL_INC, not counting PCH_INC."""
+    cycles = _FETCH_CYCLES + _EXECUTE_CYCLES
+    if mnemonic in ("POP", "LDA", "LDO"):
+        cycles += _WRITEBACK_CYCLES
+    elif mnemonic == "CALL":
+        cycles += _CALL_CYCLES
+    elif mnemonic == "RET":
+        cycles += _RET_CYCLES
+    return cycles
+
+#an executor takes the address of the next instruction and returns the new
+#PC, or -1 when the processor halts
+_Executor = Callable[[int], int]
+
+@dataclass(frozen=True)
+class LabelProfile:
+    """
+    The profile of the instructions from a label up to the next label.
+
+    Attributes:
+        label (str): The label, "(start)" for any code before the first label.
+        address (int): The address of the label.
+        instructions (int): The number of instructions executed.
+        cycles (int): The number of clock cycles taken.
+    """
+    label: str
+    address: int
+    instructions: int
+    cycles: int
+
+class Simulator:
+    """
+    A cycle-accurate POM8 instruction set simulator.
+
+    Every word of the instruction memory is decoded once, into an executor
+    and its cycle count, so running only looks up the table. The cycles of
+    an instruction are the control unit states it passes through: PCL_INC,
+    DECODE and one execute state; PCH_INC when the program counter's low
+    byte carries; MEM_WRITEBACK for POP, LDA and LDO; PCH_SAVE and PC_LOAD16
+    for CALL; and PCH_LOAD8, PCL_FETCH8 and PCL_LOAD8 for RET. Reset costs
+    the BOOT state.
+
+    The PCH_INC state follows the intent of the control unit, entered when
+    the increment of PCL carries. Note the RTL samples flag_bus there with
+    ALU_STAT low, so it reads the carry flag of the status register instead.
+
+    Properties:
+        registers (bytearray): The 16 general purpose registers.
+        flags (int): The status flags, see the FLAG_* constants.
+        pc (int): The 16 bit program counter.
+        sp (int): The 10 bit stack pointer, the stack grows up from 0.
+        ram (bytearray): The data memory.
+        gpio (bytearray): The GPIO registers: input, output, DDR and spare.
+        pins (int): The levels applied to the 8 GPIO pins.
+        output_pins (int): The levels driven onto the GPIO pins.
+        cycles (int): The clock cycles since reset, including BOOT.
+        instructions (int): The instructions executed since reset.
+        halted (bool): Has a HLT instruction been executed.
+        hits (array | None): The times each address was executed, when
+            profiling.
+        address_cycles (array | None): The cycles taken by each address, when
+            profiling.
+    """
+    __slots__ = (
+        "_words", "_symbols", "_mask", "_table", "_profile",
+        "_registers", "_flags", "_pc", "_sp", "_ram", "_gpio", "pins",
+        "_cycles", "_instructions", "_halted", "_hits", "_address_cycles"
+    )
+
+    def __init__(self, words: Sequence[int], symbols: dict[str, int] | None = None,
+                 profile: bool = False, pins: int = 0) -> None:
+        """
+        Simulator class constructor.
+
+        Parameters:
+            words (Sequence[int]): The instruction words, from address 0. A
+                program of up to ROM_SIZE words is addressed by PCL alone,
+                as the hardware does, a longer one by the whole PC.
+            symbols (dict[str, int] | None): The symbol table, to profile by label.
+            profile (bool): Count the hits and cycles of each address.
+            pins (int): The levels applied to the GPIO pins.
+        """
+        if len(words) > 1 << 16:
+            raise ValueError(f"program of {len(words)} words does not fit the 16 bit address space")
+        self._words = list(words)
+        self._symbols = dict(symbols) if symbols is not None else {}
+        self._mask = ROM_SIZE - 1 if len(self._words) <= ROM_SIZE else (1 << 16) - 1
+        self._profile = profile
+        self.pins = pins
+        #the executors hold the memories, so reset clears them in place
+        self._registers = bytearray(16)
+        self._ram = bytearray(RAM_SIZE)
+        self._gpio = bytearray(4)
+        self.reset()
+        #unused addresses read as 0, ADD r0, r0, r0
+        self._table: list[tuple[_Executor, int]] = [
+            self._decode(self._words[address] if address < len(self._words) else 0, address)
+            for address in range(self._mask + 1)
+        ]
+
+    @classmethod
+    def from_image(cls, image: bytes | bytearray | memoryview,
+                   symbols: dict[str, int] | None = None, **kwargs) -> "Simulator":
+        """Create a simulator of a packed image, see assembler.encode."""
+        return cls(unpack_words(image), symbols, **kwargs)
+
+    @classmethod
+    def from_machine_code(cls, machine_code: Sequence[str],
+                          symbols: dict[str, int] | None = None, **kwargs) -> "Simulator":
+        """Create a simulator of the lines of '0'/'1' characters from second_pass."""
+        return cls([int(line, 2) for line in machine_code], symbols, **kwargs)
+
+    def reset(self) -> None:
+        """Reset the processor, as the ARST input does, and clear the profile."""
+        self._registers[:] = bytes(len(self._registers))
+        self._ram[:] = bytes(len(self._ram))
+        self._gpio[:] = bytes(len(self._gpio))
+        self._flags = 0
+        self._pc = 0
+        self._sp = 0
+        self._cycles = _BOOT_CYCLES
+        self._instructions = 0
+        self._halted = False
+        size = self._mask + 1
+        self._hits = array("Q", bytes(8 * size)) if self._profile else None
+        self._address_cycles = array("Q", bytes(8 * size)) if self._profile else None
+
+    @property
+    def registers(self) -> bytearray:
+        """The 16 general purpose registers."""
+        return self._registers
+
+    @property
+    def flags(self) -> int:
+        """The status flags, see the FLAG_* constants."""
+        return self._flags
+
+    @property
+    def pc(self) -> int:
+        """The 16 bit program counter, the address of the next instruction."""
+        return self._pc
+
+    @property
+    def sp(self) -> int:
+        """The 10 bit stack pointer."""
+        return self._sp
+
+    @property
+    def ram(self) -> bytearray:
+        """The data memory."""
+        return self._ram
+
+    @property
+    def gpio(self) -> bytearray:
+        """The GPIO registers: input, output, DDR and spare."""
+        return self._gpio
+
+    @property
+    def output_pins(self) -> int:
+        """The levels driven onto the GPIO pins, the output register where the DDR is set."""
+        return self._gpio[_GPIO_OUTPUT] & self._gpio[_GPIO_DDR]
+
+    @property
+    def cycles(self) -> int:
+        """The clock cycles since reset, including BOOT."""
+        return self._cycles
+
+    @property
+    def instructions(self) -> int:
+        """The instructions executed since reset."""
+        return self._instructions
+
+    @property
+    def halted(self) -> bool:
+        """Has a HLT instruction been executed."""
+        return self._halted
+
+    @property
+    def hits(self) -> array | None:
+        """The times each address was executed, when profiling."""
+        return self._hits
+
+    @property
+    def address_cycles(self) -> array | None:
+        """The cycles taken by each address, when profiling."""
+        return self._address_cycles
+
+    def snapshot(self) -> bytes:
+        """
+        Save the machine state as a compact versioned blob: the PC, registers,
+        status flags, stack pointer, RAM, GPIO registers and pins, and the
+        cycle and instruction counts, see restore. The profile is not saved.
+
+        Returns:
+            snapshot (bytes): The state, and the digest of the program it ran.
+        """
+        header = _SNAPSHOT_HEADER.pack(
+            _SNAPSHOT_MAGIC, SNAPSHOT_VERSION, self._halted, self._pc, self._sp, self._flags,
+            self.pins & 0xFF, self._cycles, self._instructions, self.program_digest()[:8]
+        )
+        return header + bytes(self._registers) + bytes(self._ram) + bytes(self._gpio)
+
+    def restore(self, snapshot: bytes | bytearray | memoryview, check_program: bool = True) -> None:
+        """
+        Restore the machine state saved by snapshot, e.g. to skip a long
+        initialisation. The profile is left as it is.
+
+        Parameters:
+            snapshot (bytes | bytearray | memoryview): The saved state.
+            check_program (bool): Refuse a snapshot of a different program.
+
+        Raises:
+            ValueError: The blob is not a snapshot of this version, or of
+                this program.
+        """
+        if len(snapshot) != _SNAPSHOT_SIZE:
+            raise ValueError(f"a snapshot is {_SNAPSHOT_SIZE} bytes, not {len(snapshot)}")
+        magic, version, halted, pc, sp, flags, pins, cycles, instructions, digest = \
+            _SNAPSHOT_HEADER.unpack_from(snapshot)
+        if magic != _SNAPSHOT_MAGIC:
+            raise ValueError("not a POM8 simulator snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot version {version}, expected {SNAPSHOT_VERSION}")
+        if check_program and digest != self.program_digest()[:8]:
+            raise ValueError("the snapshot is of a different program")
+
+        #the executors hold the memories, so they are restored in place
+        offset = _SNAPSHOT_HEADER.size
+        self._registers[:] = snapshot[offset:offset + 16]
+        self._ram[:] = snapshot[offset + 16:offset + 16 + RAM_SIZE]
+        self._gpio[:] = snapshot[offset + 16 + RAM_SIZE:]
+        self._halted = bool(halted)
+        self._pc = pc
+        self._sp = sp
+        self._flags = flags
+        self.pins = pins
+        self._cycles = cycles
+        self._instructions = instructions
+
+    def program_digest(self) -> bytes:
+        """The SHA-256 of the program, see image_digest."""
+        return image_digest(self._words)
+
+    def load(self, address: int) -> int:
+        """
+        Read the data memory map.
+
+        Parameters:
+            address (int): The 10 bit data address.
+        """
+        if address < GPIO_BASE:
+            return self._ram[address]
+        register = address & 0b11
+        if register == _GPIO_INPUT:
+            #the input register samples the pins that are not outputs
+            return self.pins & ~self._gpio[_GPIO_DDR] & 0xFF
+        return self._gpio[register]
+
+    def store(self, address: int, value: int) -> None:
+        """
+        Write the data memory map, the GPIO input register is read only.
+
+        Parameters:
+            address (int): The 10 bit data address.
+            value (int): The byte to write.
+        """
+        if address < GPIO_BASE:
+            self._ram[address] = value
+        elif address & 0b11 != _GPIO_INPUT:
+            self._gpio[address & 0b11] = value
+
+    def write_instruction(self, address: int, word: int) -> None:
+        """
+        Write a word of the instruction memory, e.g. to patch a program
+        between runs, and decode it again.
+
+        Parameters:
+            address (int): The instruction memory address.
+            word (int): The instruction word.
+        """
+        if not 0 <= address <= self._mask:
+            raise ValueError(f"address {address:#x} is outside the instruction memory")
+        if address >= len(self._words):
+            self._words.extend([0] * (address + 1 - len(self._words)))
+        self._words[address] = word
+        self._table[address] = self._decode(word, address)
+
+    def _decode(self, word: int, address: int) -> tuple[_Executor, int]:
+        """
+        Decode an instruction word into an executor and the cycles it takes,
+        not counting PCH_INC.
+        """
+        mnemonic, rd, rs, rt = _decode_word(word)
+        regs = self._registers
+        ram = self._ram
+        cycles = _instruction_cycles(mnemonic)
+
+        if mnemonic is None:
+            return self._illegal(word, address), cycles
+        if word >> 18 == 0:
+            return self._decode_register(mnemonic, rd, rs, rt, regs), cycles
+
+        if mnemonic == "CALL":
+            target = word & 0xFFFF
+            def execute(next_pc: int) -> int:
+                #push the return address, low byte first
+                sp = self._sp
+                self.store(sp, next_pc & 0xFF)
+                self.store((sp + 1) & _DATA_ADDRESS_MASK, next_pc >> 8)
+                self._sp = (sp + 2) & _DATA_ADDRESS_MASK
+                return target
+            return execute, cycles
+        if mnemonic == "RET":
+            def execute(next_pc: int) -> int:
+                sp = (self._sp - 2) & _DATA_ADDRESS_MASK
+                self._sp = sp
+                return self.load((sp + 1) & _DATA_ADDRESS_MASK) << 8 | self.load(sp)
+            return execute, cycles
+        if mnemonic == "JMP":
+            target = word & 0xFFFF
+            return (lambda next_pc: target), cycles
+        if mnemonic in _BRANCH_FLAGS:
+            target = word & 0xFFFF
+            flag = _BRANCH_FLAGS[mnemonic]
+            def execute(next_pc: int) -> int:
+                return target if self._flags & flag else next_pc
+            return execute, cycles
+        if mnemonic == "NOP":
+            return (lambda next_pc: next_pc), cycles
+        if mnemonic == "HLT":
+            def execute(next_pc: int) -> int:
+                self._halted = True
+                return -1
+            return execute, cycles
+
+        #immediate format
+        imm8 = word & 0xFF
+        imm10 = word & 0x3FF
+        if mnemonic in _ALU_OPERATIONS:
+            operation = _ALU_OPERATIONS[mnemonic]
+            def execute(next_pc: int) -> int:
+                a = regs[rs]
+                result = operation(a, imm8, 0)
+                regs[rd] = result & 0xFF
+                self._flags = _FLAG_TABLE[(result & 0x1FF) | (a & 0x80) << 2 | (imm8 & 0x80) << 3]
+                return next_pc
+            return execute, cycles
+        if mnemonic == "LDI":
+            def execute(next_pc: int) -> int:
+                regs[rd] = imm8
+                return next_pc
+            return execute, cycles
+        if mnemonic == "LDA":
+            if imm10 < GPIO_BASE:
+                def execute(next_pc: int) -> int:
+                    regs[rd] = ram[imm10]
+                    return next_pc
+            else:
+                def execute(next_pc: int) -> int:
+                    regs[rd] = self.load(imm10)
+                    return next_pc
+            return execute, cycles
+        if mnemonic == "LDO":
+            def execute(next_pc: int) -> int:
+                #the address is calculated by the ALU, which sets the flags
+                a = regs[rs]
+                result = a + imm8
+                self._flags = _FLAG_TABLE[(result & 0x1FF) | (a & 0x80) << 2 | (imm8 & 0x80) << 3]
+                regs[rd] = ram[result & 0xFF]
+                return next_pc
+            return execute, cycles
+        if mnemonic == "STA":
+            if imm10 < GPIO_BASE:
+                def execute(next_pc: int) -> int:
+                    ram[imm10] = regs[rs]
+                    return next_pc
+            else:
+                def execute(next_pc: int) -> int:
+                    self.store(imm10, regs[rs])
+                    return next_pc
+            return execute, cycles
+        if mnemonic == "PUSH":
+            def execute(next_pc: int) -> int:
+                self.store(self._sp, regs[rs])
+                self._sp = (self._sp + 1) & _DATA_ADDRESS_MASK
+                return next_pc
+            return execute, cycles
+        #POP
+        def execute(next_pc: int) -> int:
+            self._sp = (self._sp - 1) & _DATA_ADDRESS_MASK
+            regs[rd] = self.load(self._sp)
+            return next_pc
+        return execute, cycles
+
+    def _decode_register(self, mnemonic: str, rd: int, rs: int, rt: int,
+                         regs: bytearray) -> _Executor:
+        """Decode a register format instruction into an executor."""
+        if mnemonic in _SET_FLAGS:
+            mask = _SET_FLAGS[mnemonic]
+            def execute(next_pc: int) -> int:
+                self._flags |= mask
+                return next_pc
+        elif mnemonic in _CLEAR_FLAGS:
+            mask = ~_CLEAR_FLAGS[mnemonic]
+            def execute(next_pc: int) -> int:
+                self._flags &= mask
+                return next_pc
+        elif mnemonic == "MOV":
+            def execute(next_pc: int) -> int:
+                regs[rd] = regs[rs]
+                return next_pc
+        elif mnemonic == "IJMP":
+            def execute(next_pc: int) -> int:
+                return regs[rs] << 8 | regs[rt]
+        elif mnemonic == "INC":
+            def execute(next_pc: int) -> int:
+                a = regs[rs]
+                result = a + 1
+                regs[rd] = result & 0xFF
+                self._flags = _FLAG_TABLE[result | (a & 0x80) << 2]
+                return next_pc
+        elif mnemonic in ("ADDC", "SUBC"):
+            operation = _ALU_OPERATIONS[mnemonic]
+            def execute(next_pc: int) -> int:
+                a = regs[rs]
+                b = regs[rt]
+                result = operation(a, b, (self._flags >> 1) & 1)
+                regs[rd] = result & 0xFF
+                self._flags = _FLAG_TABLE[(result & 0x1FF) | (a & 0x80) << 2 | (b & 0x80) << 3]
+                return next_pc
+        else:
+            #the other ALU operations, the target register is an ALU input
+            #(and so affects V) even for NOT, LSL and LSR
+            operation = _ALU_OPERATIONS[mnemonic]
+            def execute(next_pc: int) -> int:
+                a = regs[rs]
+                b = regs[rt]
+                result = operation(a, b, 0)
+                regs[rd] = result & 0xFF
+                self._flags = _FLAG_TABLE[(result & 0x1FF) | (a & 0x80) << 2 | (b & 0x80) << 3]
+                return next_pc
+        return execute
+
+    def _illegal(self, word: int, address: int) -> _Executor:
+        """An executor that raises for a word that is not a POM8 instruction."""
+        def execute(next_pc: int) -> int:
+            raise ValueError(f"address {address:#06x}: illegal instruction {word:06x}")
+        return execute
+
+    def step(self) -> bool:
+        """
+        Execute one instruction.
+
+        Returns:
+            running (bool): False once the processor has halted.
+        """
+        return self.run(max_instructions=1) == 1 and not self._halted
+
+    def run(self, max_instructions: int | None = None, max_cycles: int | None = None) -> int:
+        """
+        Run until a HLT instruction, or a limit is reached.
+
+        Parameters:
+            max_instructions (int | None): The most instructions to execute.
+            max_cycles (int | None): Stop once the cycles since reset reach
+                this, the instruction that crosses it is completed.
+
+        Returns:
+            executed (int): The number of instructions executed.
+        """
+        if self._halted:
+            return 0
+        instruction_limit = max_instructions if max_instructions is not None else _UNLIMITED
+        cycle_limit = max_cycles if max_cycles is not None else _UNLIMITED
+        table = self._table
+        mask = self._mask
+        hits = self._hits
+        address_cycles = self._address_cycles
+        pc = self._pc
+        cycles = self._cycles
+        executed = 0
+        try:
+            while executed < instruction_limit and cycles < cycle_limit:
+                address = pc & mask
+                execute, cost = table[address]
+                if pc & 0xFF == 0xFF:
+                    cost += _PCH_INC_CYCLES
+                cycles += cost
+                executed += 1
+                if hits is not None:
+                    hits[address] += 1
+                    address_cycles[address] += cost
+                next_pc = (pc + 1) & 0xFFFF
+                pc = execute(next_pc)
+                if pc < 0:
+                    #halted, with the program counter past the HLT
+                    pc = next_pc
+                    break
+        finally:
+            #an illegal instruction leaves the PC at it
+            self._pc = pc
+            self._cycles = cycles
+            self._instructions += executed
+        return executed
+
+    def profile_by_label(self) -> list[LabelProfile]:
+        """
+        Aggregate the profile by label, each label covering the addresses
+        from it up to the next label.
+
+        Returns:
+            profile (list[LabelProfile]): The labels that executed, most
+                cycles first.
+        """
+        if self._hits is None:
+            raise ValueError("the simulator was not created with profile=True")
+        labels = sorted((address, label) for label, address in self._symbols.items())
+        starts = [address for address, _ in labels]
+        totals: dict[int, list[int]] = {}
+        for address, hits in enumerate(self._hits):
+            if not hits:
+                continue
+            index = bisect_right(starts, address) - 1
+            total = totals.setdefault(index, [0, 0])
+            total[0] += hits
+            total[1] += self._address_cycles[address]
+
+        profile = [
+            LabelProfile(labels[index][1] if index >= 0 else "(start)",
+                         labels[index][0] if index >= 0 else 0, hits, cycles)
+            for index, (hits, cycles) in totals.items()
+        ]
+        return sorted(profile, key=lambda entry: (-entry.cycles, entry.address))
+
+    def location(self, address: int) -> str:
+        """Describe an address by the label at or before it, e.g. "loop+2"."""
+        best: tuple[int, str] | None = None
+        for label, label_address in self._symbols.items():
+            if label_address <= address and (best is None or label_address > best[0]):
+                best = (label_address, label)
+        if best is None:
+            return f"{address:#06x}"
+        return best[1] if best[0] == address else f"{best[1]}+{address - best[0]}"
+
+def image_digest(image: bytes | bytearray | memoryview | Sequence[int]) -> bytes:
+    """
+    The SHA-256 of a program, the digest of its packed image.
+
+    Parameters:
+        image (bytes | bytearray | memoryview | Sequence[int]): The packed
+            image, see assembler.encode, or its instruction words.
+    """
+    if not isinstance(image, (bytes, bytearray, memoryview)):
+        image = _pack_words(array("I", image))
+    return hashlib.sha256(image).digest()
+
+def format_profile(simulator: Simulator, top: int | None = None) -> str:
+    """
+    Format the profile of a simulation, the totals, then each label, then
+    each instruction that executed, most cycles first.
+
+    Parameters:
+        simulator (Simulator): A simulator created with profile=True.
+        top (int | None): Only list this many labels and instructions.
+    """
+    total = simulator.cycles
+    lines = [f"{simulator.instructions} instructions, {total} cycles "
+             f"({total / max(simulator.instructions, 1):.2f} cycles per instruction)"
+             + (", halted" if simulator.halted else "")]
+
+    lines.append("")
+    lines.append(f"{'label':<16} {'address':>7} {'instructions':>14} {'cycles':>14} {'%':>6}")
+    for entry in simulator.profile_by_label()[:top]:
+        lines.append(f"{entry.label:<16} {entry.address:>#7x} {entry.instructions:>14} "
+                     f"{entry.cycles:>14} {100 * entry.cycles / total:>6.2f}")
+
+    hits = simulator.hits
+    cycles = simulator.address_cycles
+    executed = sorted((address for address in range(len(hits)) if hits[address]),
+                      key=lambda address: (-cycles[address], address))
+    lines.append("")
+    lines.append(f"{'address':>7} {'location':<16} {'hits':>14} {'cycles':>14} {'%':>6}")
+    for address in executed[:top]:
+        lines.append(f"{address:>#7x} {simulator.location(address):<16} {hits[address]:>14} "
+                     f"{cycles[address]:>14} {100 * cycles[address] / total:>6.2f}")
+
+    return "\n".join(lines)
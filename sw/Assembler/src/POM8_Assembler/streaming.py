@@ -0,0 +1,137 @@
+"""
+streaming.py
+
+This module assembles POM8 assembly as a stream: the source is read a line at
+a time, and each instruction is tokenised, parsed and encoded as soon as its
+line is read, so the output can be written while the input is still being
+read. Only the instructions waiting on a label that is not defined yet are
+held back, so besides the symbol table, memory is bounded by the longest
+forward reference rather than the size of the program.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Functions:
+    stream_instructions: Tokenise and parse a source a line at a time.
+    stream_words: Encode a source a line at a time, in address order.
+    assemble_stream: Assemble a source file into an output file as a stream.
+"""
+
+from assembler import *
+from assembler import _tokenise_line, _object_fields, _ENCODER_TABLE
+from parser import *
+from writers import write_words
+from collections import deque
+from typing import BinaryIO, Iterable, Iterator
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["stream_instructions", "stream_words", "assemble_stream"]
+
+def stream_instructions(lines: Iterable[str], symbols: dict[str, int],
+                        log: logging.Logger = logger) -> Iterator[Instruction]:
+    """
+    Tokenise and parse assembly a line at a time.
+
+    Labels are added to the symbol table as their line is read. A label
+    operand is accepted before its label is defined, see stream_words.
+
+    Parameters:
+        lines (Iterable[str]): The lines of assembly code, e.g. a text file.
+        symbols (dict[str, int]): The symbol table to add labels to.
+        log (logging.Logger): The logger to report progress to.
+
+    Yields:
+        instruction (Instruction): Each instruction, in address order.
+    """
+    address = 0
+    for line_index, line in enumerate(lines):
+        tokens = _tokenise_line(line, line_index+1, address, symbols, log)
+        if tokens is None:
+            continue
+        yield from Parser(tokens, symbols, log, forward_refs=True).parse_program().instructions
+        address += 1
+
+def _forward_label(instruction: Instruction, symbols: dict[str, int]) -> LabelOperand | None:
+    """Get the label operand of an instruction if its label is not defined yet."""
+    for operand in instruction.operands:
+        if isinstance(operand, LabelOperand) and operand.name not in symbols:
+            return operand
+    return None
+
+def _encode(instruction: Instruction, symbols: dict[str, int]) -> int:
+    """Encode an Instruction node whose labels are all defined."""
+    mnemonic, r0, r1, r2, value = _object_fields(instruction, symbols)
+    return _ENCODER_TABLE[mnemonic](r0, r1, r2, value)
+
+def stream_words(lines: Iterable[str], symbols: dict[str, int],
+                 log: logging.Logger = logger) -> Iterator[int]:
+    """
+    Assemble assembly a line at a time, yielding each instruction word as
+    soon as it and every instruction before it can be encoded.
+
+    An instruction that refers to a label not defined yet is held back,
+    along with the (already encoded) instructions after it, until the label
+    is defined. Errors are raised as their line is reached, except for a
+    label that is never defined, which is raised at the end of the source.
+
+    Parameters:
+        lines (Iterable[str]): The lines of assembly code, e.g. a text file.
+        symbols (dict[str, int]): The symbol table to add labels to.
+        log (logging.Logger): The logger to report progress to.
+
+    Yields:
+        word (int): Each instruction word, in address order.
+    """
+    #held back instructions, an int once encoded, or an Instruction waiting on a label
+    pending: deque[int | Instruction] = deque()
+    for instruction in stream_instructions(lines, symbols, log):
+        #the line defined its label (if any) when it was tokenised
+        while pending and (isinstance(pending[0], int) or _forward_label(pending[0], symbols) is None):
+            head = pending.popleft()
+            yield head if isinstance(head, int) else _encode(head, symbols)
+
+        if _forward_label(instruction, symbols) is not None:
+            pending.append(instruction)
+        elif pending:
+            pending.append(_encode(instruction, symbols))
+        else:
+            yield _encode(instruction, symbols)
+
+    while pending:
+        head = pending.popleft()
+        if isinstance(head, int):
+            yield head
+            continue
+        operand = _forward_label(head, symbols)
+        if operand is not None:
+            raise SyntaxError(
+                f"line {operand.token.line_num}: Invalid value {operand.name} for operand of type {operand.token.type.name}"
+            )
+        yield _encode(head, symbols)
+
+def assemble_stream(source: Iterable[str], output: BinaryIO, fmt: str = "text",
+                    symbols: dict[str, int] | None = None,
+                    log: logging.Logger = logger) -> dict[str, int]:
+    """
+    Assemble a source into an output as a stream, writing the machine code
+    as it is produced.
+
+    Parameters:
+        source (Iterable[str]): The lines of assembly code, e.g. a text file.
+        output (BinaryIO): The binary file to write the machine code to.
+        fmt (str): The output format, a key of writers.WORD_FORMATS.
+        symbols (dict[str, int] | None): The symbol table to add labels to,
+            a new one if not given.
+        log (logging.Logger): The logger to report progress to.
+
+    Returns:
+        symbols (dict[str, int]): The symbol table of the source.
+    """
+    if symbols is None:
+        symbols = {}
+    write_words(output, stream_words(source, symbols, log), fmt)
+    return symbols
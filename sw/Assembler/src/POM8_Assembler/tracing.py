@@ -0,0 +1,657 @@
+"""
+tracing.py
+
+This module records what the POM8 did in its last few thousand instructions,
+e.g. to find out why a GPIO pin changed at the wrong time. A TracingSimulator
+runs like simulator.Simulator, and writes the cycle, PC, instruction word,
+register written and data memory access of every instruction into a ring
+buffer of preallocated arrays, so nothing is allocated per instruction and
+the oldest entries are overwritten. Watchpoints on data memory and GPIO
+addresses (rtl/packages/pom8_memory_map_conf.vhd) take a snapshot of the
+processor and the trace when the address is read or written.
+
+A trace can be written to a compact binary file and read back by the
+decoder, which can also be run on its own.
+Run with: python3 tracing.py trace.bin [--last N]
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Classes:
+    TraceRecord: A dataclass of one traced instruction.
+    TraceBuffer: A ring buffer of traced instructions, as arrays.
+    Watchpoint: A dataclass of a watched data memory or GPIO address.
+    TraceSnapshot: A dataclass of the processor when a watchpoint triggered.
+    TracingSimulator: A Simulator that traces every instruction.
+
+Functions:
+    parse_watchpoint: Read a watchpoint from text, e.g. "gpio_output:w".
+    read_trace: Read a trace written by TraceBuffer.write.
+    format_trace: Format traced instructions, one per line.
+"""
+
+from simulator import *
+from simulator import _PCH_INC_CYCLES, _UNLIMITED, _DATA_ADDRESS_MASK, _decode_word
+from array import array
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, BinaryIO, Iterator, Sequence
+import struct
+import sys
+
+if TYPE_CHECKING:
+    from debuginfo import DebugInfo
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "ACCESS_NONE", "ACCESS_READ", "ACCESS_WRITE", "WATCH_ADDRESSES",
+    "TraceRecord", "TraceBuffer", "Watchpoint", "TraceSnapshot", "TracingSimulator",
+    "parse_watchpoint", "read_trace", "format_trace"
+]
+
+#the data memory access of a traced instruction
+ACCESS_NONE = 0
+ACCESS_READ = 1
+ACCESS_WRITE = 2
+_ACCESS_NAMES = {ACCESS_READ: "read", ACCESS_WRITE: "write"}
+
+#the named addresses of the memory map, the GPIO registers (rtl/pom8_gpio_controller.vhd)
+#and the partitions of RAM
+WATCH_ADDRESSES = {
+    "gpio_input": GPIO_BASE,
+    "gpio_output": GPIO_BASE + 1,
+    "gpio_ddr": GPIO_BASE + 2,
+    "stack": 0,
+    "program_start": 511
+}
+
+#stored in the register and address columns when an instruction has none
+_NO_REGISTER = 0xFF
+_NO_ADDRESS = 0xFFFF
+
+#the trace file, a header then each column in order, little-endian
+_MAGIC = b"P8TR"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHHIQ") #magic, version, columns, records, total recorded
+_COLUMNS = (("cycles", "Q"), ("pcs", "H"), ("words", "I"), ("registers", "B"),
+            ("register_values", "B"), ("accesses", "B"), ("addresses", "H"), ("values", "B"))
+
+#how an instruction reaches data memory, the address is worked out before
+#the instruction executes and the value after
+_MODE_NONE = 0
+_MODE_LOAD = 1 #LDA, a fixed address
+_MODE_STORE = 2 #STA, a fixed address
+_MODE_LOAD_OFFSET = 3 #LDO, Rs plus an offset
+_MODE_PUSH = 4
+_MODE_POP = 5
+_MODE_CALL = 6 #two bytes pushed, low byte first
+_MODE_RET = 7 #two bytes popped
+_MODE_ACCESS = (ACCESS_NONE, ACCESS_READ, ACCESS_WRITE, ACCESS_READ,
+                ACCESS_WRITE, ACCESS_READ, ACCESS_WRITE, ACCESS_READ)
+#the instructions that write Rd
+_REGISTER_WRITERS = frozenset(("ADD", "SUB", "AND", "OR", "NOT", "XOR", "LSL", "LSR", "ADDC", "SUBC",
+                               "MOV", "INC", "ADDI", "SUBI", "ANDI", "ORI", "XORI",
+                               "LDI", "LDA", "LDO", "POP"))
+
+#how a word is traced: the word, the register it writes, how it reaches
+#memory, its fixed address or offset, and the register it stores or offsets from
+_Access = tuple[int, int, int, int, int]
+
+def _describe(word: int) -> _Access:
+    """Work out how an instruction word is traced."""
+    mnemonic, rd, rs, _ = _decode_word(word)
+    register = rd if mnemonic in _REGISTER_WRITERS else _NO_REGISTER
+    if mnemonic == "LDA":
+        return word, register, _MODE_LOAD, word & 0x3FF, 0
+    if mnemonic == "STA":
+        return word, register, _MODE_STORE, word & 0x3FF, rs
+    if mnemonic == "LDO":
+        return word, register, _MODE_LOAD_OFFSET, word & 0xFF, rs
+    if mnemonic == "PUSH":
+        return word, register, _MODE_PUSH, 0, rs
+    if mnemonic == "POP":
+        return word, register, _MODE_POP, 0, 0
+    if mnemonic == "CALL":
+        return word, register, _MODE_CALL, 0, 0
+    if mnemonic == "RET":
+        return word, register, _MODE_RET, 0, 0
+    return word, register, _MODE_NONE, 0, 0
+
+def _watch_key(address: int) -> int:
+    """The address a watchpoint is keyed on, the GPIO registers repeat every 4 addresses."""
+    return address if address < GPIO_BASE else GPIO_BASE | (address & 0b11)
+
+@dataclass(frozen=True)
+class TraceRecord:
+    """
+    One traced instruction.
+
+    Attributes:
+        cycle (int): The clock cycles since reset when the instruction completed.
+        pc (int): The address of the instruction.
+        word (int): The instruction word.
+        register (int | None): The register written, if any.
+        register_value (int): The value written to the register.
+        access (int): ACCESS_NONE, ACCESS_READ or ACCESS_WRITE.
+        address (int | None): The data memory address, if any, the first
+            byte of a CALL or RET.
+        value (int): The value read or written.
+    """
+    cycle: int
+    pc: int
+    word: int
+    register: int | None
+    register_value: int
+    access: int
+    address: int | None
+    value: int
+
+class TraceBuffer:
+    """
+    A ring buffer of traced instructions, each field in its own array, all
+    allocated up front. Once full, each instruction overwrites the oldest.
+
+    Properties:
+        capacity (int): The most instructions held.
+        total (int): The instructions recorded since the buffer was cleared,
+            including those overwritten.
+    """
+    __slots__ = ("_capacity", "_next", "_total", *(name for name, _ in _COLUMNS))
+
+    def __init__(self, capacity: int = 4096) -> None:
+        """
+        TraceBuffer class constructor.
+
+        Parameters:
+            capacity (int): The most instructions held.
+        """
+        if capacity < 1:
+            raise ValueError(f"a trace must hold at least one instruction, not {capacity}")
+        self._capacity = capacity
+        self._next = 0
+        self._total = 0
+        for name, typecode in _COLUMNS:
+            setattr(self, name, array(typecode, bytes(array(typecode).itemsize * capacity)))
+
+    @property
+    def capacity(self) -> int:
+        """The most instructions held."""
+        return self._capacity
+
+    @property
+    def total(self) -> int:
+        """The instructions recorded since the buffer was cleared, including those overwritten."""
+        return self._total
+
+    def __len__(self) -> int:
+        return min(self._total, self._capacity)
+
+    def clear(self) -> None:
+        """Forget every instruction, the arrays are kept."""
+        self._next = 0
+        self._total = 0
+
+    def columns(self) -> dict[str, array]:
+        """
+        Copy the columns in order, oldest first.
+
+        Returns:
+            columns (dict[str, array]): Each column, by the name of its field.
+        """
+        length = len(self)
+        start = (self._next - length) % self._capacity
+        columns = {}
+        for name, _ in _COLUMNS:
+            column = getattr(self, name)
+            columns[name] = column[start:start + length] if start + length <= self._capacity \
+                else column[start:] + column[:self._next]
+        return columns
+
+    def records(self, last: int | None = None) -> list[TraceRecord]:
+        """
+        The traced instructions, oldest first.
+
+        Parameters:
+            last (int | None): Only the most recent instructions, all if None.
+        """
+        length = len(self) if last is None else min(last, len(self))
+        records = []
+        for x in range(self._next - length, self._next):
+            index = x % self._capacity
+            register = self.registers[index]
+            address = self.addresses[index]
+            records.append(TraceRecord(
+                self.cycles[index], self.pcs[index], self.words[index],
+                None if register == _NO_REGISTER else register, self.register_values[index],
+                self.accesses[index], None if address == _NO_ADDRESS else address, self.values[index]
+            ))
+        return records
+
+    def __iter__(self) -> Iterator[TraceRecord]:
+        return iter(self.records())
+
+    def to_bytes(self) -> bytes:
+        """The trace as a binary file, see read_trace."""
+        columns = self.columns()
+        data = bytearray(_HEADER.pack(_MAGIC, _VERSION, len(_COLUMNS), len(self), self._total))
+        for name, _ in _COLUMNS:
+            column = columns[name]
+            if sys.byteorder != "little":
+                column.byteswap()
+            data += column.tobytes()
+        return bytes(data)
+
+    def write(self, file: str | BinaryIO) -> None:
+        """
+        Write the trace to a binary file, oldest first.
+
+        Parameters:
+            file (str | BinaryIO): The file name, or a binary file.
+        """
+        if isinstance(file, str):
+            with open(file, "wb") as f:
+                f.write(self.to_bytes())
+        else:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def from_bytes(cls, data: bytes | bytearray | memoryview) -> "TraceBuffer":
+        """Read a trace from the bytes of a binary file, see read_trace."""
+        data = memoryview(data)
+        if len(data) < _HEADER.size:
+            raise ValueError("not a POM8 trace, too short")
+        magic, version, column_count, length, total = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("not a POM8 trace")
+        if version != _VERSION or column_count != len(_COLUMNS):
+            raise ValueError(f"unsupported POM8 trace version {version}")
+
+        trace = cls(max(length, 1))
+        offset = _HEADER.size
+        for name, typecode in _COLUMNS:
+            column = array(typecode)
+            size = column.itemsize * length
+            if offset + size > len(data):
+                raise ValueError("the POM8 trace is truncated")
+            column.frombytes(data[offset:offset + size])
+            if sys.byteorder != "little":
+                column.byteswap()
+            getattr(trace, name)[:length] = column
+            offset += size
+        trace._next = length % trace._capacity
+        trace._total = total
+        return trace
+
+@dataclass(frozen=True)
+class Watchpoint:
+    """
+    A watched data memory or GPIO address.
+
+    Attributes:
+        address (int): The 10 bit data address, a GPIO register matches any
+            of the addresses it repeats at.
+        access (str): "r", "w" or "rw", the accesses that trigger it.
+        stop (bool): Stop the run after the instruction that triggered it.
+    """
+    address: int
+    access: str = "rw"
+    stop: bool = False
+
+    def __post_init__(self) -> None:
+        if not 0 <= self.address <= _DATA_ADDRESS_MASK:
+            raise ValueError(f"watchpoint address {self.address:#x} is outside the data memory map")
+        if self.access not in ("r", "w", "rw"):
+            raise ValueError(f"watchpoint access must be 'r', 'w' or 'rw', not '{self.access}'")
+
+def parse_watchpoint(text: str, stop: bool = False) -> Watchpoint:
+    """
+    Read a watchpoint from text, an address or a name of WATCH_ADDRESSES,
+    optionally followed by ":r", ":w" or ":rw", e.g. "gpio_output:w" or "0x20".
+
+    Parameters:
+        text (str): The watchpoint.
+        stop (bool): Stop the run when it triggers.
+    """
+    address, _, access = text.partition(":")
+    if address.lower() in WATCH_ADDRESSES:
+        number = WATCH_ADDRESSES[address.lower()]
+    else:
+        try:
+            number = int(address, 0)
+        except ValueError:
+            raise ValueError(f"watchpoint '{text}' is not an address or one of {', '.join(WATCH_ADDRESSES)}") from None
+    return Watchpoint(number, access or "rw", stop)
+
+@dataclass(frozen=True)
+class TraceSnapshot:
+    """
+    The processor when a watchpoint triggered.
+
+    Attributes:
+        watchpoint (Watchpoint): The watchpoint.
+        address (int): The address accessed.
+        access (int): ACCESS_READ or ACCESS_WRITE.
+        value (int): The value read or written.
+        cycle (int): The clock cycles since reset.
+        pc (int): The address of the instruction that accessed it.
+        registers (bytes): The 16 general purpose registers.
+        flags (int): The status flags.
+        sp (int): The stack pointer.
+        gpio (bytes): The GPIO registers.
+        records (tuple[TraceRecord, ...]): The trace up to and including
+            the instruction.
+    """
+    watchpoint: Watchpoint
+    address: int
+    access: int
+    value: int
+    cycle: int
+    pc: int
+    registers: bytes
+    flags: int
+    sp: int
+    gpio: bytes
+    records: tuple[TraceRecord, ...]
+
+class TracingSimulator(Simulator):
+    """
+    A cycle-accurate POM8 simulator that traces every instruction into a
+    TraceBuffer, see Simulator. Watchpoints take a snapshot of the processor
+    and the trace when their address is accessed.
+
+    Properties:
+        trace (TraceBuffer): The trace of the most recent instructions.
+        watchpoints (tuple[Watchpoint, ...]): The watched addresses.
+        snapshots (list[TraceSnapshot]): The snapshots taken, oldest first.
+        watch_hits (int): The times a watchpoint triggered, including those
+            past max_snapshots.
+    """
+    __slots__ = ("_trace", "_watchpoints", "_watched", "_snapshots", "_max_snapshots",
+                 "_snapshot_records", "_watch_hits", "_accesses")
+
+    def __init__(self, words: Sequence[int], symbols: dict[str, int] | None = None,
+                 profile: bool = False, pins: int = 0, capacity: int = 4096,
+                 watchpoints: Sequence[Watchpoint] = (), max_snapshots: int = 16,
+                 snapshot_records: int | None = None) -> None:
+        """
+        TracingSimulator class constructor, see Simulator.
+
+        Parameters:
+            capacity (int): The most instructions the trace holds.
+            watchpoints (Sequence[Watchpoint]): The addresses to watch.
+            max_snapshots (int): The most snapshots kept, later triggers are
+                only counted.
+            snapshot_records (int | None): The most recent instructions of
+                the trace kept in each snapshot, the whole trace if None.
+        """
+        self._trace = TraceBuffer(capacity)
+        self._watchpoints = tuple(watchpoints)
+        self._watched: dict[int, list[Watchpoint]] = {}
+        for watchpoint in self._watchpoints:
+            self._watched.setdefault(_watch_key(watchpoint.address), []).append(watchpoint)
+        self._snapshots: list[TraceSnapshot] = []
+        self._max_snapshots = max_snapshots
+        self._snapshot_records = snapshot_records
+        self._watch_hits = 0
+        super().__init__(words, symbols, profile, pins)
+        #how the instruction at each address is traced, decoded once like the executors
+        self._accesses: list[_Access] = [
+            _describe(self._words[address] if address < len(self._words) else 0)
+            for address in range(self._mask + 1)
+        ]
+
+    @property
+    def trace(self) -> TraceBuffer:
+        """The trace of the most recent instructions."""
+        return self._trace
+
+    @property
+    def watchpoints(self) -> tuple[Watchpoint, ...]:
+        """The watched addresses."""
+        return self._watchpoints
+
+    @property
+    def snapshots(self) -> list[TraceSnapshot]:
+        """The snapshots taken, oldest first."""
+        return self._snapshots
+
+    @property
+    def watch_hits(self) -> int:
+        """The times a watchpoint triggered, including those past max_snapshots."""
+        return self._watch_hits
+
+    def reset(self) -> None:
+        """Reset the processor, and clear the profile, trace and snapshots."""
+        super().reset()
+        self._trace.clear()
+        self._snapshots.clear()
+        self._watch_hits = 0
+
+    def write_instruction(self, address: int, word: int) -> None:
+        """Write a word of the instruction memory, see Simulator.write_instruction."""
+        super().write_instruction(address, word)
+        self._accesses[address] = _describe(word)
+
+    def _watch(self, address: int, access: int, value: int, pc: int, cycles: int) -> bool:
+        """
+        Check the watchpoints of an access, taking a snapshot for each that
+        triggers.
+
+        Returns:
+            stop (bool): Should the run stop.
+        """
+        stop = False
+        kind = "r" if access == ACCESS_READ else "w"
+        for watchpoint in self._watched.get(_watch_key(address), ()):
+            if kind not in watchpoint.access:
+                continue
+            self._watch_hits += 1
+            stop = stop or watchpoint.stop
+            if len(self._snapshots) >= self._max_snapshots:
+                continue
+            self._snapshots.append(TraceSnapshot(
+                watchpoint, address, access, value, cycles, pc, bytes(self._registers),
+                self._flags, self._sp, bytes(self._gpio), tuple(self._trace.records(self._snapshot_records))
+            ))
+            logger.info("cycle %d: %s %s %#x (%#04x) at %s", cycles, _ACCESS_NAMES[access],
+                        "to" if access == ACCESS_WRITE else "from", address, value, self.location(pc))
+        return stop
+
+    def run(self, max_instructions: int | None = None, max_cycles: int | None = None) -> int:
+        """
+        Run until a HLT instruction, a limit is reached, or a watchpoint that
+        stops triggers, tracing each instruction, see Simulator.run.
+
+        Returns:
+            executed (int): The number of instructions executed.
+        """
+        if self._halted:
+            return 0
+        instruction_limit = max_instructions if max_instructions is not None else _UNLIMITED
+        cycle_limit = max_cycles if max_cycles is not None else _UNLIMITED
+        table = self._table
+        mask = self._mask
+        hits = self._hits
+        address_cycles = self._address_cycles
+        regs = self._registers
+        accesses = self._accesses
+        watched = self._watched
+        trace = self._trace
+        capacity = trace._capacity
+        cycle_column, pc_column, word_column = trace.cycles, trace.pcs, trace.words
+        register_column, register_value_column = trace.registers, trace.register_values
+        access_column, address_column, value_column = trace.accesses, trace.addresses, trace.values
+        index = trace._next
+        total = trace._total
+        pc = self._pc
+        cycles = self._cycles
+        executed = 0
+        try:
+            while executed < instruction_limit and cycles < cycle_limit:
+                address = pc & mask
+                execute, cost = table[address]
+                if pc & 0xFF == 0xFF:
+                    cost += _PCH_INC_CYCLES
+                word, register, mode, fixed, source = accesses[address]
+
+                #the memory address, before the instruction moves the stack pointer
+                if mode == _MODE_NONE:
+                    memory = _NO_ADDRESS
+                elif mode <= _MODE_STORE:
+                    memory = fixed
+                elif mode == _MODE_LOAD_OFFSET:
+                    memory = (regs[source] + fixed) & 0xFF
+                elif mode == _MODE_PUSH or mode == _MODE_CALL:
+                    memory = self._sp
+                elif mode == _MODE_POP:
+                    memory = (self._sp - 1) & _DATA_ADDRESS_MASK
+                else:
+                    memory = (self._sp - 2) & _DATA_ADDRESS_MASK
+
+                cycles += cost
+                executed += 1
+                if hits is not None:
+                    hits[address] += 1
+                    address_cycles[address] += cost
+                next_pc = (pc + 1) & 0xFFFF
+                new_pc = execute(next_pc)
+
+                if mode == _MODE_NONE:
+                    value = 0
+                elif mode == _MODE_STORE or mode == _MODE_PUSH:
+                    value = regs[source]
+                elif mode == _MODE_CALL:
+                    value = next_pc & 0xFF
+                elif mode == _MODE_RET:
+                    value = new_pc & 0xFF
+                else:
+                    value = regs[register]
+                cycle_column[index] = cycles
+                pc_column[index] = address
+                word_column[index] = word
+                register_column[index] = register
+                register_value_column[index] = regs[register] if register != _NO_REGISTER else 0
+                access_column[index] = _MODE_ACCESS[mode]
+                address_column[index] = memory
+                value_column[index] = value
+                index += 1
+                if index == capacity:
+                    index = 0
+
+                if watched and memory != _NO_ADDRESS:
+                    trace._next = index
+                    trace._total = total + executed
+                    access_kind = _MODE_ACCESS[mode]
+                    stop = self._watch(memory, access_kind, value, address, cycles)
+                    if mode >= _MODE_CALL:
+                        #the high byte of the return address
+                        high = (memory + 1) & _DATA_ADDRESS_MASK
+                        stop = self._watch(high, access_kind, (next_pc if mode == _MODE_CALL else new_pc) >> 8,
+                                           address, cycles) or stop
+                    if stop:
+                        pc = next_pc if new_pc < 0 else new_pc
+                        break
+
+                if new_pc < 0:
+                    #halted, with the program counter past the HLT
+                    pc = next_pc
+                    break
+                pc = new_pc
+        finally:
+            #an illegal instruction leaves the PC at it
+            self._pc = pc
+            self._cycles = cycles
+            self._instructions += executed
+            trace._next = index
+            trace._total = total + executed
+        return executed
+
+def read_trace(file: str | BinaryIO) -> TraceBuffer:
+    """
+    Read a trace written by TraceBuffer.write.
+
+    Parameters:
+        file (str | BinaryIO): The file name, or a binary file.
+
+    Returns:
+        trace (TraceBuffer): The trace, exactly as long as the one written.
+
+    Raises:
+        ValueError: The file is not a POM8 trace.
+    """
+    if isinstance(file, str):
+        with open(file, "rb") as f:
+            return TraceBuffer.from_bytes(f.read())
+    return TraceBuffer.from_bytes(file.read())
+
+def format_trace(records: Sequence[TraceRecord], symbols: dict[str, int] | None = None,
+                 debug_info: "DebugInfo | None" = None) -> str:
+    """
+    Format traced instructions, one per line: the cycle, address, word and
+    its assembly code, then the register and memory they changed or read,
+    and the source line of the instruction with debug info.
+
+    Parameters:
+        records (Sequence[TraceRecord]): The instructions, e.g. TraceBuffer.records().
+        symbols (dict[str, int] | None): The names of branch targets, the
+            labels of the debug info if not given.
+        debug_info (DebugInfo | None): The debug info of the program, see debuginfo.py.
+    """
+    from disassembler import decode_words, _DECODER_TABLE, _IS_BRANCH #only needed here
+
+    if symbols is None and debug_info is not None:
+        symbols = debug_info.labels
+    names = {address: label for label, address in (symbols or {}).items()}
+    indices, rds, rss, rts, immediates, targets = decode_words([record.word for record in records])
+    lines = [f"{'cycle':>12} {'pc':>6} {'word':>6}  {'instruction':<24} {'register':<9} {'memory':<16} "
+             f"{'source' if debug_info is not None else ''}".rstrip()]
+    for record, index, rd, rs, rt, immediate, target in zip(records, indices, rds, rss, rts, immediates, targets):
+        if index < 0:
+            text = "(not an instruction)"
+        else:
+            target_text = names.get(target, f"0x{target:04X}") if _IS_BRANCH[index] else ""
+            text = _DECODER_TABLE[index](rd, rs, rt, immediate, target_text)
+        register = f"r{record.register}={record.register_value:02X}" if record.register is not None else ""
+        memory = ""
+        if record.address is not None:
+            arrow = "->" if record.access == ACCESS_READ else "<-"
+            memory = f"[{record.address:#05x}] {arrow} {record.value:02X}"
+        source = ""
+        if debug_info is not None:
+            location = debug_info.line_of(record.pc)
+            source = f"{location[0]}:{location[1]}" if location is not None else "?"
+        lines.append(f"{record.cycle:>12} {record.pc:#06x} {record.word:06X}  {text:<24} {register:<9} "
+                     f"{memory:<16} {source}".rstrip())
+    return "\n".join(lines)
+
+def main(argv: list[str] | None = None) -> int:
+    """Decode a trace file and print it."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print a POM8 simulator trace.")
+    parser.add_argument("trace", help="a trace written by --trace-file or TraceBuffer.write")
+    parser.add_argument("--last", type=int, help="only the most recent N instructions")
+    parser.add_argument("--debug-info", metavar="FILE",
+                        help="the debug info of the program, written by --debug-info, to name the source "
+                             "line and branch targets of each instruction")
+    args = parser.parse_args(argv)
+    debug_info = None
+    try:
+        trace = read_trace(args.trace)
+        if args.debug_info:
+            from debuginfo import read_debug_info #only needed here
+            debug_info = read_debug_info(args.debug_info)
+    except (OSError, ValueError) as ex:
+        print(ex, file=sys.stderr)
+        return 1
+    print(f"{len(trace)} of {trace.total} instructions")
+    print(format_trace(trace.records(args.last), debug_info=debug_info))
+    if debug_info is not None:
+        debug_info.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
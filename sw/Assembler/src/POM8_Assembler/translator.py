@@ -0,0 +1,407 @@
+"""
+translator.py
+
+This module provides a faster POM8 simulator, which translates the program
+into basic blocks, each compiled once into Python code that runs its
+instructions as straight-line code. Blocks end at the branch format
+instructions that change the flow of the program (JMP, the conditional
+branches, CALL, RET, IJMP and HLT), and are cached by the PC they start at.
+The simulation is cycle-accurate and gives the same results as the
+instruction at a time simulator.Simulator.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Classes:
+    BlockSimulator: A cycle-accurate POM8 simulator that runs basic blocks.
+"""
+
+from simulator import *
+from simulator import (
+    _FLAG_TABLE, _BRANCH_FLAGS, _SET_FLAGS, _CLEAR_FLAGS, _PCH_INC_CYCLES, _UNLIMITED,
+    _decode_word, _instruction_cycles
+)
+from typing import Callable, Sequence
+import re
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["BlockSimulator"]
+
+#the instructions that end a basic block
+_TERMINATORS = frozenset(("JMP", "BRZ", "BRN", "BRP", "BRC", "BRV", "CALL", "RET", "IJMP", "HLT"))
+#the longest block, so a long run of straight-line code is still split
+_MAX_BLOCK_INSTRUCTIONS = 64
+#set in the PC a block returns when it executed a HLT
+_HALTED = 0x10000
+
+#the 9 bit result of each ALU operation of Rs (a) and the target input (b)
+_ALU_EXPRESSIONS = {
+    "ADD": "{a} + {b}",
+    "SUB": "({a} - {b}) & 511",
+    "AND": "{a} & {b}",
+    "OR": "{a} | {b}",
+    "XOR": "{a} ^ {b}",
+    "NOT": "~{a} & 255",
+    "LSL": "{a} << 1",
+    "LSR": "{a} >> 1",
+    "ADDC": "{a} + {b} + (flags >> 1 & 1)",
+    "SUBC": "({a} - {b} - (flags >> 1 & 1)) & 511",
+    "ADDI": "{a} + {b}",
+    "SUBI": "({a} - {b}) & 511",
+    "ANDI": "{a} & {b}",
+    "ORI": "{a} | {b}",
+    "XORI": "{a} ^ {b}"
+}
+_IMMEDIATE_ALU = frozenset(("ADDI", "SUBI", "ANDI", "ORI", "XORI"))
+#the instructions that set every flag, and those that read them
+_FLAG_WRITERS = frozenset(_ALU_EXPRESSIONS) | {"INC", "LDO"}
+_FLAG_READERS = frozenset(_BRANCH_FLAGS) | set(_SET_FLAGS) | set(_CLEAR_FLAGS) | {"ADDC", "SUBC"}
+_STACK_USERS = frozenset(("PUSH", "POP", "CALL", "RET"))
+
+#a compiled block returns the next PC, a loop is called with the most
+#iterations to run and also returns the iterations it ran
+_BlockFunction = Callable[..., int | tuple[int, int]]
+#a compiled block, the cycles and instructions of one pass, and whether it loops
+_Block = tuple[_BlockFunction, int, int, bool]
+
+def _flag_liveness(mnemonics: list[str]) -> tuple[list[bool], bool]:
+    """
+    Find which flag writes of a block are read, by a later instruction of
+    the block or after the block. Unread flags are not calculated.
+
+    Returns:
+        liveness (tuple[list[bool], bool]): Whether the flags written by each
+            instruction are read, and whether the flags from before the
+            block are read.
+    """
+    live = [False] * len(mnemonics)
+    read = True #the flags are live at the end of the block
+    for index in range(len(mnemonics) - 1, -1, -1):
+        mnemonic = mnemonics[index]
+        if mnemonic in _FLAG_WRITERS:
+            live[index] = read
+            read = False
+        if mnemonic in _FLAG_READERS:
+            read = True
+    return live, read
+
+#the registers a block uses are held in locals, r0 to r15
+_REGISTER_RE = re.compile(r"\br(1[0-5]|[0-9])\b")
+_REGISTER_WRITE_RE = re.compile(r"^\s*(?:else: )?r(1[0-5]|[0-9]) = ", re.MULTILINE)
+
+def _alu_lines(mnemonic: str, rd: int, rs: int, rt: int, imm8: int, flags_live: bool) -> list[str]:
+    """Generate an ALU instruction, an immediate ALU instruction uses imm8 as the target input."""
+    immediate = mnemonic in _IMMEDIATE_ALU
+    expression = _ALU_EXPRESSIONS[mnemonic].format(a=f"r{rs}", b=imm8 if immediate else f"r{rt}")
+    if not flags_live:
+        return [f"r{rd} = ({expression}) & 255"]
+    #the flags use the inputs, so they are calculated before Rd is written
+    index = f"x | (r{rs} & 128) << 2"
+    if not immediate:
+        index += f" | (r{rt} & 128) << 3"
+    elif imm8 & 0x80:
+        index += f" | {(imm8 & 0x80) << 3}"
+    return [f"x = {expression}", f"flags = T[{index}]", f"r{rd} = x & 255"]
+
+def _instruction_lines(mnemonic: str, word: int, rd: int, rs: int, rt: int,
+                       flags_live: bool) -> list[str]:
+    """Generate the Python lines of an instruction that does not end a block."""
+    imm8 = word & 0xFF
+    imm10 = word & 0x3FF
+    if mnemonic in _ALU_EXPRESSIONS:
+        return _alu_lines(mnemonic, rd, rs, rt, imm8, flags_live)
+    if mnemonic == "INC":
+        if not flags_live:
+            return [f"r{rd} = (r{rs} + 1) & 255"]
+        return [f"x = r{rs} + 1", f"flags = T[x | (r{rs} & 128) << 2]", f"r{rd} = x & 255"]
+    if mnemonic == "MOV":
+        return [f"r{rd} = r{rs}"]
+    if mnemonic in _SET_FLAGS:
+        return [f"flags |= {_SET_FLAGS[mnemonic]}"]
+    if mnemonic in _CLEAR_FLAGS:
+        return [f"flags &= {~_CLEAR_FLAGS[mnemonic]}"]
+    if mnemonic == "LDI":
+        return [f"r{rd} = {imm8}"]
+    if mnemonic == "LDA":
+        return [f"r{rd} = ram[{imm10}]" if imm10 < GPIO_BASE else f"r{rd} = load({imm10})"]
+    if mnemonic == "STA":
+        return [f"ram[{imm10}] = r{rs}" if imm10 < GPIO_BASE else f"store({imm10}, r{rs})"]
+    if mnemonic == "LDO":
+        #the address is calculated by the ALU, which sets the flags
+        lines = [f"x = r{rs} + {imm8}"]
+        if flags_live:
+            lines.append(f"flags = T[x | (r{rs} & 128) << 2 | {(imm8 & 0x80) << 3}]")
+        return lines + [f"r{rd} = ram[x & 255]"]
+    if mnemonic == "PUSH":
+        return [f"if sp < {GPIO_BASE}: ram[sp] = r{rs}", f"else: store(sp, r{rs})",
+                "sp = (sp + 1) & 1023"]
+    if mnemonic == "POP":
+        return ["sp = (sp - 1) & 1023", f"r{rd} = ram[sp] if sp < {GPIO_BASE} else load(sp)"]
+    #NOP
+    return []
+
+def _terminator_lines(mnemonic: str, word: int, rs: int, rt: int, next_pc: int) -> tuple[list[str], str]:
+    """
+    Generate the Python lines of an instruction that ends a block.
+
+    Returns:
+        code (tuple[list[str], str]): The lines before the state is written
+            back, and the expression of the next PC.
+    """
+    target = word & 0xFFFF
+    if mnemonic in _BRANCH_FLAGS:
+        return [], f"{target} if flags & {_BRANCH_FLAGS[mnemonic]} else {next_pc}"
+    if mnemonic == "CALL":
+        #push the return address, low byte first
+        return [f"if sp < {GPIO_BASE - 1}:",
+                f"    ram[sp] = {next_pc & 0xFF}",
+                f"    ram[sp + 1] = {next_pc >> 8}",
+                "else:",
+                f"    store(sp, {next_pc & 0xFF})",
+                f"    store((sp + 1) & 1023, {next_pc >> 8})",
+                "sp = (sp + 2) & 1023"], str(target)
+    if mnemonic == "RET":
+        return ["sp = (sp - 2) & 1023",
+                f"if sp < {GPIO_BASE - 1}: pc = ram[sp + 1] << 8 | ram[sp]",
+                "else: pc = load((sp + 1) & 1023) << 8 | load(sp)"], "pc"
+    if mnemonic == "IJMP":
+        return [], f"r{rs} << 8 | r{rt}"
+    #HLT
+    return [], str(next_pc | _HALTED)
+
+class BlockSimulator(Simulator):
+    """
+    A cycle-accurate POM8 simulator that translates the program into basic
+    blocks, compiled once each into straight-line Python code.
+
+    A block runs from its start PC up to and including the first branch
+    format instruction that changes the flow of the program, so the cycles
+    it takes are known when it is translated. A JMP has a single successor,
+    so the block carries on from its target, and a block that can branch
+    back to its own start runs as a loop within one call. Within a block
+    the registers are held in locals and the flags are only calculated when
+    they are read. Blocks are cached by start PC, and the blocks holding an
+    address are dropped when it is written with write_instruction. A run is
+    limited exactly as Simulator.run, running the instructions at the end
+    of a limit one at a time.
+
+    Properties:
+        translations (int): The number of blocks translated.
+        cached_blocks (int): The number of blocks in the cache.
+    """
+    __slots__ = ("_blocks", "_block_costs", "_block_counts", "_translations")
+
+    def __init__(self, words: Sequence[int], symbols: dict[str, int] | None = None,
+                 profile: bool = False, pins: int = 0) -> None:
+        """
+        BlockSimulator class constructor, see Simulator.
+
+        Parameters:
+            words (Sequence[int]): The instruction words, from address 0.
+            symbols (dict[str, int] | None): The symbol table, to profile by label.
+            profile (bool): Count the hits and cycles of each address.
+            pins (int): The levels applied to the GPIO pins.
+        """
+        self._blocks: dict[int, _Block] = {}
+        #the instruction memory address and cycles of each instruction of each block
+        self._block_costs: dict[int, tuple[tuple[int, int], ...]] = {}
+        self._block_counts: dict[int, int] = {}
+        self._translations = 0
+        super().__init__(words, symbols, profile, pins)
+
+    @property
+    def translations(self) -> int:
+        """The number of blocks translated."""
+        return self._translations
+
+    @property
+    def cached_blocks(self) -> int:
+        """The number of blocks in the cache."""
+        return len(self._blocks)
+
+    def write_instruction(self, address: int, word: int) -> None:
+        """
+        Write a word of the instruction memory, dropping the blocks that hold it.
+
+        Parameters:
+            address (int): The instruction memory address.
+            word (int): The instruction word.
+        """
+        super().write_instruction(address, word)
+        stale = [start for start, costs in self._block_costs.items()
+                 if any(block_address == address for block_address, _ in costs)]
+        for start in stale:
+            del self._blocks[start]
+            del self._block_costs[start]
+        if stale:
+            logger.debug("address %#x written, dropped %d blocks", address, len(stale))
+
+    def invalidate(self) -> None:
+        """Drop every translated block."""
+        self._blocks.clear()
+        self._block_costs.clear()
+
+    def _translate(self, pc: int) -> _Block | None:
+        """
+        Translate the block starting at a PC, and cache it.
+
+        Returns:
+            block (_Block | None): The compiled block, the cycles it takes,
+                its number of instructions and whether it loops, or None if
+                the instruction at the PC is illegal.
+        """
+        instructions: list[tuple[str, int, int, int, int]] = []
+        costs: list[tuple[int, int]] = []
+        block_pc = pc
+        while len(instructions) < _MAX_BLOCK_INSTRUCTIONS:
+            address = block_pc & self._mask
+            word = self._words[address] if address < len(self._words) else 0
+            mnemonic, rd, rs, rt = _decode_word(word)
+            if mnemonic is None:
+                #left to the instruction at a time simulator, which reports it
+                break
+            cycles = _instruction_cycles(mnemonic)
+            if block_pc & 0xFF == 0xFF:
+                cycles += _PCH_INC_CYCLES
+            instructions.append((mnemonic, word, rd, rs, rt))
+            costs.append((address, cycles))
+            if mnemonic == "JMP":
+                #a jump has one successor, so the block carries on from its target
+                block_pc = word & 0xFFFF
+                continue
+            block_pc = (block_pc + 1) & 0xFFFF
+            if mnemonic in _TERMINATORS:
+                break
+        if not instructions:
+            return None
+
+        mnemonics = [mnemonic for mnemonic, *_ in instructions]
+        live, reads_flags = _flag_liveness(mnemonics)
+        body: list[str] = []
+        next_pc = str(block_pc)
+        #a block whose last branch can return to its start runs as a loop
+        loops = False
+        for index, (mnemonic, word, rd, rs, rt) in enumerate(instructions):
+            if mnemonic == "JMP":
+                continue
+            if mnemonic in _TERMINATORS:
+                lines, next_pc = _terminator_lines(mnemonic, word, rs, rt, block_pc)
+                loops = (mnemonic in _BRANCH_FLAGS and pc in (word & 0xFFFF, block_pc)
+                         or mnemonic == "CALL" and word & 0xFFFF == pc)
+            else:
+                lines = _instruction_lines(mnemonic, word, rd, rs, rt, live[index])
+            body.extend(lines)
+        if mnemonics[-1] == "JMP":
+            next_pc = str(block_pc)
+            loops = block_pc == pc
+
+        #only the state the block uses is read and written back
+        writes_flags = bool((_FLAG_WRITERS | set(_SET_FLAGS) | set(_CLEAR_FLAGS)).intersection(mnemonics))
+        uses_stack = bool(_STACK_USERS.intersection(mnemonics))
+        code = "\n".join(body) + "\n" + next_pc
+        used = sorted({int(register) for register in _REGISTER_RE.findall(code)})
+        written = sorted({int(register) for register in _REGISTER_WRITE_RE.findall(code)})
+        prologue = ([f"r{register} = regs[{register}]" for register in used]
+                    + (["flags = sim._flags"] if reads_flags else []) + (["sp = sim._sp"] if uses_stack else []))
+        epilogue = ([f"regs[{register}] = r{register}" for register in written]
+                    + (["sim._flags = flags"] if writes_flags else []) + (["sim._sp = sp"] if uses_stack else []))
+
+        if loops:
+            #run up to budget iterations, returning the next PC and the iterations run
+            lines = (["def block(budget):"]
+                     + [f"    {line}" for line in prologue]
+                     + ["    n = 0", "    while True:", "        n += 1"]
+                     + [f"        {line}" for line in body]
+                     + [f"        pc = {next_pc}", f"        if pc != {pc} or n == budget: break"]
+                     + [f"    {line}" for line in epilogue]
+                     + ["    return pc, n"])
+        else:
+            lines = (["def block():"]
+                     + [f"    {line}" for line in prologue + body + epilogue]
+                     + [f"    return {next_pc}"])
+        source = "\n".join(["def _make(regs, ram, load, store, T, sim):"]
+                           + [f"    {line}" for line in lines]
+                           + ["    return block"])
+        namespace: dict[str, object] = {}
+        exec(compile(source, f"<POM8 block {pc:#06x}>", "exec"), namespace)
+        function = namespace["_make"](self._registers, self._ram, self.load, self.store, _FLAG_TABLE, self)
+
+        block = (function, sum(cycles for _, cycles in costs), len(instructions), loops)
+        self._blocks[pc] = block
+        self._block_costs[pc] = tuple(costs)
+        self._translations += 1
+        return block
+
+    def run(self, max_instructions: int | None = None, max_cycles: int | None = None) -> int:
+        """
+        Run until a HLT instruction, or a limit is reached, see Simulator.run.
+
+        Parameters:
+            max_instructions (int | None): The most instructions to execute.
+            max_cycles (int | None): Stop once the cycles since reset reach
+                this, the instruction that crosses it is completed.
+
+        Returns:
+            executed (int): The number of instructions executed.
+        """
+        if self._halted:
+            return 0
+        instruction_limit = max_instructions if max_instructions is not None else _UNLIMITED
+        cycle_limit = max_cycles if max_cycles is not None else _UNLIMITED
+        blocks = self._blocks
+        counts = self._block_counts if self._profile else None
+        pc = self._pc
+        cycles = self._cycles
+        executed = 0
+        try:
+            while True:
+                block = blocks.get(pc)
+                if block is None:
+                    block = self._translate(pc)
+                    if block is None:
+                        break
+                function, block_cycles, length, loops = block
+                #a block that could cross a limit is run an instruction at a time
+                if executed + length > instruction_limit or cycles + block_cycles >= cycle_limit:
+                    break
+                start = pc
+                if loops:
+                    budget = min((instruction_limit - executed) // length,
+                                 (cycle_limit - cycles - 1) // block_cycles)
+                    pc, iterations = function(budget)
+                else:
+                    pc = function()
+                    iterations = 1
+                cycles += block_cycles * iterations
+                executed += length * iterations
+                if counts is not None:
+                    counts[start] = counts.get(start, 0) + iterations
+                if pc & _HALTED:
+                    pc &= 0xFFFF
+                    self._halted = True
+                    break
+        finally:
+            self._pc = pc
+            self._cycles = cycles
+            self._instructions += executed
+            if counts:
+                self._flush_profile()
+
+        if not self._halted:
+            remaining = max_instructions - executed if max_instructions is not None else None
+            executed += super().run(remaining, max_cycles)
+        return executed
+
+    def _flush_profile(self) -> None:
+        """Add the counts of the blocks executed to the hits and cycles of each address."""
+        hits = self._hits
+        address_cycles = self._address_cycles
+        for start, count in self._block_counts.items():
+            for address, cycles in self._block_costs[start]:
+                hits[address] += count
+                address_cycles[address] += count * cycles
+        self._block_counts.clear()
@@ -0,0 +1,555 @@
+"""
+wcet.py
+
+This module builds the control-flow graph of a parsed POM8 program and
+bounds the worst-case execution time (WCET) in clock cycles of each
+subroutine and from each label, so the timing of GPIO code can be checked
+against its deadlines without counting cycles by hand. The cycles of each
+basic block are the control unit states of its instructions, as charged by
+simulator.Simulator, and the iterations of each loop are bounded by an
+annotation in the comment of the labelled line of its header:
+
+    loopa:  SUBI r1, r1, 1  ; @bound 255
+
+A bound is the most times the header runs each time the loop is entered.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Classes:
+    BasicBlock: A dataclass of a basic block of the control-flow graph.
+    ControlFlowGraph: The basic blocks and subroutines of a program.
+    Wcet: A dataclass of the WCET from an address.
+    LoopWcet: A dataclass of the WCET of a loop.
+    WcetReport: The WCET of every subroutine, loop and label of a program.
+
+Functions:
+    read_loop_bounds: Read the @bound annotations of assembly code.
+    build_cfg: Build the control-flow graph of a parsed program.
+    analyse_wcet: Bound the WCET of a parsed program.
+"""
+
+from assembler import _instruction_fields
+from parser import *
+from simulator import _instruction_cycles, _PCH_INC_CYCLES
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Callable
+import re
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "BasicBlock", "ControlFlowGraph", "Wcet", "LoopWcet", "WcetReport",
+    "read_loop_bounds", "build_cfg", "analyse_wcet"
+]
+
+#the instructions that end a basic block, and those that take a target
+_TERMINATORS = frozenset(("JMP", "BRZ", "BRN", "BRP", "BRC", "BRV", "CALL", "RET", "IJMP", "HLT"))
+_CONDITIONAL = frozenset(("BRZ", "BRN", "BRP", "BRC", "BRV"))
+_TARGETED = _CONDITIONAL | {"JMP", "CALL"}
+#how a block leaves the subroutine: by returning, halting, or to somewhere unknown
+_EXIT_RETURN = "RET"
+_EXIT_HALT = "HLT"
+_EXIT_UNKNOWN = "IJMP"
+_EXIT_OUTSIDE = "outside"
+#a loop bound annotation, in the comment of the labelled line of the loop header
+_BOUND_RE = re.compile(r";.*@bound\s+(\d+)", re.IGNORECASE)
+_LABEL_RE = re.compile(r"^\s*([a-z][a-z0-9]*):", re.IGNORECASE)
+
+def read_loop_bounds(source: str) -> dict[str, int]:
+    """
+    Read the loop bounds annotated in assembly code, '@bound N' in the
+    comment of the labelled line of a loop header.
+
+    Parameters:
+        source (str): The assembly code.
+
+    Returns:
+        bounds (dict[str, int]): The bound of the loop headed by each label.
+    """
+    bounds: dict[str, int] = {}
+    for line_num, line in enumerate(source.split("\n"), 1):
+        match = _BOUND_RE.search(line)
+        if match is None:
+            continue
+        label = _LABEL_RE.match(line)
+        if label is None:
+            raise SyntaxError(f"line {line_num}: a @bound annotation must be on the labelled line of a loop header")
+        bounds[label.group(1)] = int(match.group(1))
+    return bounds
+
+@dataclass(frozen=True, slots=True)
+class BasicBlock:
+    """
+    A basic block, straight-line code entered only at its first instruction.
+
+    Attributes:
+        start (int): The address of the first instruction.
+        end (int): The address after the last instruction.
+        cycles (int): The cycles of its instructions, including PCH_INC,
+            not including the subroutine its last instruction calls.
+        successors (tuple[int, ...]): The start of each block control can
+            pass to, for a CALL the block it returns to.
+        call (int | None): The subroutine its last instruction calls.
+        exit (str): How the block leaves the subroutine, "RET" or "HLT",
+            "IJMP" to an unknown address, "outside" past the end of the
+            program, or "" if it does not.
+    """
+    start: int
+    end: int
+    cycles: int
+    successors: tuple[int, ...]
+    call: int | None
+    exit: str
+
+class ControlFlowGraph:
+    """
+    The control-flow graph of a program. Blocks start at the first
+    instruction, every label and branch target, and after every branch
+    format instruction that changes the flow of the program.
+
+    Properties:
+        blocks (dict[int, BasicBlock]): The basic blocks, by start address.
+        subroutines (list[int]): The entry of each subroutine, the program
+            entry (0) first then each CALL target.
+        symbols (dict[str, int]): The labels of the program.
+        size (int): The number of instructions in the program.
+    """
+    def __init__(self, blocks: dict[int, BasicBlock], subroutines: list[int], symbols: dict[str, int],
+                 size: int) -> None:
+        """
+        ControlFlowGraph class constructor.
+
+        Parameters:
+            blocks (dict[int, BasicBlock]): The basic blocks, by start address.
+            subroutines (list[int]): The entry of each subroutine.
+            symbols (dict[str, int]): The labels of the program.
+            size (int): The number of instructions in the program.
+        """
+        self._blocks = blocks
+        self._size = size
+        self._starts = sorted(blocks)
+        self._subroutines = subroutines
+        self._symbols = symbols
+        self._names: dict[int, str] = {}
+        for label, address in symbols.items():
+            self._names.setdefault(address, label)
+
+    @property
+    def blocks(self) -> dict[int, BasicBlock]:
+        """The basic blocks, by start address."""
+        return self._blocks
+
+    @property
+    def subroutines(self) -> list[int]:
+        """The entry of each subroutine, the program entry first."""
+        return self._subroutines
+
+    @property
+    def symbols(self) -> dict[str, int]:
+        """The labels of the program."""
+        return self._symbols
+
+    @property
+    def size(self) -> int:
+        """The number of instructions in the program."""
+        return self._size
+
+    def block_at(self, address: int) -> BasicBlock:
+        """
+        Find the basic block holding an address.
+
+        Parameters:
+            address (int): The address of an instruction of the program.
+        """
+        index = bisect_right(self._starts, address) - 1
+        if index < 0 or address >= self._blocks[self._starts[index]].end:
+            raise ValueError(f"address {address:#06x} is not in the program")
+        return self._blocks[self._starts[index]]
+
+    def name(self, address: int) -> str:
+        """The first label of an address, "(start)" for an unlabelled entry, or the address in hexadecimal."""
+        return self._names.get(address, "(start)" if address == 0 else f"{address:#06x}")
+
+def build_cfg(ast: Program | CompactProgram, symbols: dict[str, int]) -> ControlFlowGraph:
+    """
+    Build the control-flow graph of a parsed program.
+
+    Parameters:
+        ast (Program | CompactProgram): The parsed program.
+        symbols (dict[str, int]): The symbol table of the program.
+
+    Returns:
+        cfg (ControlFlowGraph): The basic blocks and subroutines of the program.
+    """
+    mnemonics: list[str] = []
+    targets: list[int] = []
+    for mnemonic, _, _, _, value in _instruction_fields(ast, symbols):
+        mnemonics.append(MNEMONICS[mnemonic])
+        targets.append(value)
+    size = len(mnemonics)
+
+    leaders = {0, *symbols.values()}
+    subroutines = [0] if size else []
+    for address, mnemonic in enumerate(mnemonics):
+        if mnemonic in _TERMINATORS:
+            leaders.add(address + 1)
+        if mnemonic in _TARGETED:
+            leaders.add(targets[address])
+            if mnemonic == "CALL":
+                subroutines.append(targets[address])
+    starts = sorted(leader for leader in leaders if 0 <= leader < size)
+    subroutines = [entry for entry in dict.fromkeys(subroutines) if entry < size]
+
+    cycles_of = {mnemonic: _instruction_cycles(mnemonic) for mnemonic in MNEMONICS}
+    blocks: dict[int, BasicBlock] = {}
+    for index, start in enumerate(starts):
+        end = starts[index + 1] if index + 1 < len(starts) else size
+        cycles = sum(map(cycles_of.__getitem__, mnemonics[start:end]))
+        #PCH_INC is entered when the fetch of the last address of a page carries into PCH
+        cycles += _PCH_INC_CYCLES * sum(1 for address in range(start | 0xFF, end, 0x100))
+        last = mnemonics[end - 1]
+        target = targets[end - 1]
+        successors: list[int] = []
+        call = None
+        exit = ""
+        if last == "JMP":
+            successors.append(target)
+        elif last in _CONDITIONAL:
+            successors += [target, end]
+        elif last == "CALL":
+            call = target
+            successors.append(end)
+        elif last in (_EXIT_RETURN, _EXIT_HALT, _EXIT_UNKNOWN):
+            exit = last
+        else:
+            successors.append(end)
+        if any(successor >= size for successor in successors) or call is not None and call >= size:
+            exit = _EXIT_OUTSIDE
+            successors = [successor for successor in successors if successor < size]
+        blocks[start] = BasicBlock(start, end, cycles, tuple(dict.fromkeys(successors)), call, exit)
+    return ControlFlowGraph(blocks, subroutines, symbols, size)
+
+@dataclass(frozen=True)
+class Wcet:
+    """
+    The worst-case cycles from an address until its subroutine returns or
+    the program halts.
+
+    Attributes:
+        name (str): The label of the address.
+        address (int): The address.
+        cycles (int | None): The WCET, None if it is unbounded.
+        reason (str): Why the WCET is unbounded, "" if it is bounded.
+    """
+    name: str
+    address: int
+    cycles: int | None
+    reason: str = ""
+
+@dataclass(frozen=True)
+class LoopWcet:
+    """
+    The WCET of a loop, each time it is entered.
+
+    Attributes:
+        name (str): The label of the loop header.
+        address (int): The address of the loop header.
+        bound (int | None): The most times the header runs, None if not annotated.
+        iteration (int | None): The worst-case cycles of one iteration,
+            including any loops nested in it.
+        cycles (int | None): The WCET of the loop, None if it is unbounded.
+    """
+    name: str
+    address: int
+    bound: int | None
+    iteration: int | None
+    cycles: int | None
+
+def _format_cycles(cycles: int | None, reason: str) -> str:
+    """Format a WCET, or why it is unbounded."""
+    return f"{cycles:,}" if cycles is not None else f"unbounded: {reason}"
+
+class WcetReport:
+    """
+    The WCET of every subroutine, loop and label of a program.
+
+    Properties:
+        cfg (ControlFlowGraph): The control-flow graph analysed.
+        subroutines (list[Wcet]): The WCET of each subroutine, from its entry
+            until it returns (or, for the program entry, halts).
+        loops (list[LoopWcet]): The WCET of each loop, by address.
+        labels (list[Wcet]): The WCET from each label until its subroutine
+            returns. From inside a loop, the rest of the outermost loop
+            around it is bounded as a whole loop.
+    """
+    def __init__(self, cfg: ControlFlowGraph, subroutines: list[Wcet], loops: list[LoopWcet],
+                 labels: list[Wcet]) -> None:
+        self._cfg = cfg
+        self._subroutines = subroutines
+        self._loops = loops
+        self._labels = labels
+
+    @property
+    def cfg(self) -> ControlFlowGraph:
+        """The control-flow graph analysed."""
+        return self._cfg
+
+    @property
+    def subroutines(self) -> list[Wcet]:
+        """The WCET of each subroutine."""
+        return self._subroutines
+
+    @property
+    def loops(self) -> list[LoopWcet]:
+        """The WCET of each loop."""
+        return self._loops
+
+    @property
+    def labels(self) -> list[Wcet]:
+        """The WCET from each label."""
+        return self._labels
+
+    def subroutine(self, name: str) -> Wcet:
+        """Get the WCET of the subroutine with the given label."""
+        for wcet in self._subroutines:
+            if wcet.name == name:
+                return wcet
+        raise KeyError(name)
+
+    def __str__(self) -> str:
+        """Human readable tables of the WCET of each subroutine, loop and label."""
+        lines = [f"{len(self._cfg.blocks)} basic blocks, {len(self._subroutines)} subroutines", "",
+                 f"{'subroutine':16} {'address':>7}  WCET cycles"]
+        lines += [f"{wcet.name:16} {wcet.address:#07x}  {_format_cycles(wcet.cycles, wcet.reason)}"
+                  for wcet in self._subroutines]
+        if self._loops:
+            lines += ["", f"{'loop':16} {'address':>7} {'bound':>6} {'iteration':>10}  WCET cycles"]
+            lines += [f"{loop.name:16} {loop.address:#07x} {'-' if loop.bound is None else loop.bound:>6} "
+                      f"{'-' if loop.iteration is None else loop.iteration:>10}  "
+                      f"{'unbounded' if loop.cycles is None else f'{loop.cycles:,}'}"
+                      for loop in self._loops]
+        lines += ["", f"{'label':16} {'address':>7}  WCET cycles to return or halt"]
+        lines += [f"{wcet.name:16} {wcet.address:#07x}  {_format_cycles(wcet.cycles, wcet.reason)}"
+                  for wcet in self._labels]
+        return "\n".join(lines)
+
+def _add(a: int | None, b: int | None) -> int | None:
+    """Add cycle counts, None (unbounded) if either is."""
+    return None if a is None or b is None else a + b
+
+def _longest_paths(start: int, edges: Callable[[int], list[int]],
+                   cost: Callable[[int], int | None]) -> tuple[dict[int, int | None], bool]:
+    """
+    Find the longest path from each node reachable from start, the cost of
+    the node plus the longest path of its successors.
+
+    Returns:
+        paths (tuple[dict[int, int | None], bool]): The longest path from
+            each node, None if unbounded, and whether a cycle was found.
+    """
+    longest: dict[int, int | None] = {}
+    on_stack = {start}
+    stack = [(start, iter(edges(start)))]
+    cyclic = False
+    while stack:
+        node, successors = stack[-1]
+        for successor in successors:
+            if successor in on_stack:
+                cyclic = True
+            elif successor not in longest:
+                on_stack.add(successor)
+                stack.append((successor, iter(edges(successor))))
+                break
+        else:
+            stack.pop()
+            on_stack.discard(node)
+            tail: int | None = 0
+            for successor in edges(node):
+                path = longest.get(successor)
+                if path is None or successor in on_stack:
+                    tail = None
+                    break
+                tail = max(tail, path)
+            longest[node] = _add(cost(node), tail)
+    return longest, cyclic
+
+class _Subroutine:
+    """The loops and longest paths of one subroutine of a control-flow graph."""
+    def __init__(self, cfg: ControlFlowGraph, entry: int, bounds: dict[int, int],
+                 callee: Callable[[int], Wcet]) -> None:
+        self.cfg = cfg
+        self.entry = entry
+        self.reason = ""
+        self.loops: list[LoopWcet] = []
+        blocks = cfg.blocks
+
+        #the blocks of the subroutine, and its back edges, by a depth first search
+        state = {entry: 1}
+        back_edges: dict[int, list[int]] = {}
+        stack = [(entry, iter(blocks[entry].successors))]
+        while stack:
+            node, successors = stack[-1]
+            for successor in successors:
+                if successor not in state:
+                    state[successor] = 1
+                    stack.append((successor, iter(blocks[successor].successors)))
+                    break
+                if state[successor] == 1:
+                    back_edges.setdefault(successor, []).append(node)
+            else:
+                state[node] = 2
+                stack.pop()
+        self.nodes = set(state)
+        predecessors: dict[int, list[int]] = {node: [] for node in self.nodes}
+        for node in self.nodes:
+            for successor in blocks[node].successors:
+                predecessors[successor].append(node)
+
+        #the cost, exits and successors of each node, loops are collapsed into their header
+        self.owner: dict[int, int] = {}
+        self.cost: dict[int, int | None] = {}
+        self.successors: dict[int, tuple[int, ...]] = {}
+        for node in self.nodes:
+            block = blocks[node]
+            cycles: int | None = block.cycles
+            if block.exit in (_EXIT_UNKNOWN, _EXIT_OUTSIDE):
+                self.unbounded(f"{cfg.name(node)} jumps to an unknown address" if block.exit == _EXIT_UNKNOWN
+                               else f"{cfg.name(node)} leaves the program")
+                cycles = None
+            elif block.call is not None:
+                called = callee(block.call)
+                if called.cycles is None:
+                    self.unbounded(called.reason)
+                cycles = _add(cycles, called.cycles)
+            self.cost[node] = cycles
+            self.successors[node] = block.successors
+
+        #each natural loop, innermost first
+        loops: list[tuple[int, set[int]]] = []
+        for header, sources in back_edges.items():
+            body = {header}
+            work = list(sources)
+            while work:
+                node = work.pop()
+                if node not in body:
+                    body.add(node)
+                    work += predecessors[node]
+            if any(predecessor not in body for node in body - {header} for predecessor in predecessors[node]):
+                self.unbounded(f"the loop at {cfg.name(header)} is entered other than at its header")
+                self.cost[header] = None
+                continue
+            loops.append((header, body))
+        loops.sort(key=lambda loop: len(loop[1]))
+        for header, body in loops:
+            self.collapse(header, body, bounds.get(header))
+        self.loops.sort(key=lambda loop: loop.address)
+
+        self.paths, cyclic = _longest_paths(entry, self.edges, self.cost.__getitem__)
+        if cyclic:
+            self.unbounded(f"{cfg.name(entry)} has a loop that is not entered at its header")
+
+    def unbounded(self, reason: str) -> None:
+        """Record the first reason the subroutine is unbounded."""
+        if not self.reason:
+            self.reason = reason
+
+    def find(self, node: int) -> int:
+        """The header of the outermost collapsed loop holding a node, or the node."""
+        while node in self.owner:
+            node = self.owner[node]
+        return node
+
+    def edges(self, node: int) -> list[int]:
+        """The successors of a node of the collapsed graph."""
+        return list(dict.fromkeys(self.find(successor) for successor in self.successors[node]))
+
+    def collapse(self, header: int, body: set[int], bound: int | None) -> None:
+        """Bound a loop, whose inner loops are collapsed, and collapse it into its header."""
+        level = {self.find(node) for node in body}
+
+        def iteration_edges(node: int) -> list[int]:
+            #an iteration ends on a branch back to the header, or leaving the loop
+            return [successor for successor in self.edges(node) if successor != header and successor in level]
+
+        paths, cyclic = _longest_paths(header, iteration_edges, self.cost.__getitem__)
+        iteration = None if cyclic else paths[header]
+        if bound is None:
+            self.unbounded(f"the loop at {self.cfg.name(header)} has no @bound")
+        cycles = None if bound is None or iteration is None else bound * iteration
+        self.loops.append(LoopWcet(self.cfg.name(header), header, bound, iteration, cycles))
+
+        exits = tuple(successor for node in level for successor in self.successors[node]
+                      if self.find(successor) not in level)
+        for node in level - {header}:
+            self.owner[node] = header
+        self.cost[header] = cycles
+        self.successors[header] = exits
+
+    def wcet(self, address: int) -> Wcet:
+        """The WCET from an address of the subroutine."""
+        cycles = self.paths.get(self.find(self.cfg.block_at(address).start))
+        return Wcet(self.cfg.name(address), address, cycles, self.reason if cycles is None else "")
+
+def analyse_wcet(ast: Program | CompactProgram, symbols: dict[str, int],
+                 bounds: dict[str, int] | None = None) -> WcetReport:
+    """
+    Bound the worst-case execution time of a parsed program, see
+    read_loop_bounds for the loop bounds. A WCET is unbounded when a loop has
+    no bound, a loop is entered other than at its header, an IJMP jumps to an
+    unknown address, control leaves the program, or a subroutine is called
+    recursively.
+
+    Parameters:
+        ast (Program | CompactProgram): The parsed program.
+        symbols (dict[str, int]): The symbol table of the program.
+        bounds (dict[str, int] | None): The bound of the loop headed by each label.
+
+    Returns:
+        report (WcetReport): The WCET of every subroutine, loop and label.
+    """
+    cfg = build_cfg(ast, symbols)
+    address_bounds: dict[int, int] = {}
+    for label, bound in (bounds or {}).items():
+        if label not in symbols:
+            raise ValueError(f"the loop bound of '{label}' is not on a label of the program")
+        address_bounds[symbols[label]] = bound
+
+    analysed: dict[int, _Subroutine] = {}
+    analysing: list[int] = []
+
+    def callee(entry: int) -> Wcet:
+        if entry in analysing:
+            return Wcet(cfg.name(entry), entry, None, f"{cfg.name(entry)} is called recursively")
+        if entry not in analysed:
+            analysing.append(entry)
+            analysed[entry] = _Subroutine(cfg, entry, address_bounds, callee)
+            analysing.pop()
+        return analysed[entry].wcet(entry)
+
+    subroutines = [callee(entry) for entry in cfg.subroutines]
+    loops = sorted((loop for subroutine in analysed.values() for loop in subroutine.loops),
+                   key=lambda loop: loop.address)
+
+    #a block shared by subroutines is reported in the first of them
+    owners: dict[int, _Subroutine] = {}
+    for entry in reversed(cfg.subroutines):
+        owners.update(dict.fromkeys(analysed[entry].nodes, analysed[entry]))
+
+    headers = {loop.address for loop in loops}
+    for address in address_bounds:
+        if address not in headers and address < cfg.size and cfg.block_at(address).start in owners:
+            logger.warning("the @bound of '%s' is not on the header of a loop", cfg.name(address))
+    labels: list[Wcet] = []
+    for label, address in sorted(symbols.items(), key=lambda item: item[1]):
+        if address >= cfg.size:
+            continue #a label after the last instruction
+        subroutine = owners.get(cfg.block_at(address).start)
+        if subroutine is not None: #not unreachable code
+            wcet = subroutine.wcet(address)
+            labels.append(Wcet(label, address, wcet.cycles, wcet.reason))
+    return WcetReport(cfg, subroutines, loops, labels)
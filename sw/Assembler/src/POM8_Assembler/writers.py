@@ -0,0 +1,267 @@
+"""
+writers.py
+
+This module writes packed POM8 machine code images (see assembler.encode) in
+the formats used to load them: raw binary, Intel HEX, Xilinx .coe and .mem
+memory initialisation files, a rom_contents aggregate to paste into
+rtl/pom8_instruction_memory.vhd, a Vivado Tcl script that sets the INIT value
+of each ROM256X1 primitive of an implemented design, and the original text
+format of one line of '0'/'1' characters per instruction.
+
+Author: Zachary Pearce
+Contributors:
+License: GPL-3.0
+
+Functions:
+    unpack_words: Unpack an image into integer instruction words.
+    rom_column_inits: The INIT value of each ROM256X1 primitive holding words.
+    write_text, write_binary, write_intel_hex, write_coe, write_mem,
+    write_vhdl_rom, write_rom_tcl: Write an image in a format.
+    write_image: Write an image in a format selected by name.
+    write_text_words, write_binary_words, write_intel_hex_words,
+    write_coe_words, write_mem_words, write_vhdl_rom_words,
+    write_rom_tcl_words: Write words in a format as they are produced.
+    write_words: Write words in a format selected by name.
+"""
+
+from itertools import islice
+from typing import BinaryIO, Callable, Iterable, Iterator, Sequence
+
+__all__ = [
+    "FORMATS", "WORD_FORMATS", "FORMAT_SUFFIXES", "ROM_PRIMITIVE_DEPTH",
+    "unpack_words", "rom_column_inits",
+    "write_text", "write_binary", "write_intel_hex", "write_coe", "write_mem",
+    "write_vhdl_rom", "write_rom_tcl", "write_image",
+    "write_text_words", "write_binary_words", "write_intel_hex_words", "write_coe_words",
+    "write_mem_words", "write_vhdl_rom_words", "write_rom_tcl_words", "write_words"
+]
+
+#the number of bytes each instruction is packed into, and its width in bits
+_WORD_BYTES = 3
+_WORD_BITS = _WORD_BYTES * 8
+#the number of data bytes in each Intel HEX record
+_IHEX_RECORD_BYTES = 16
+#the number of words written at a time when writing words as they are produced
+_CHUNK_WORDS = 1024
+#the words held by each ROM256X1 primitive of rtl/pom8_instruction_memory.vhd, one bit of each word
+ROM_PRIMITIVE_DEPTH = 256
+#the instruction memory instance in rtl/pom8_top.vhd, and the primitives generated in it
+_ROM_INSTANCE = "PM_inst"
+_ROM_PRIMITIVE = "g256cpy_generate[0].ibits_generate[{column}].ROM256X1_inst"
+
+def unpack_words(image: bytes | bytearray | memoryview) -> list[int]:
+    """
+    Unpack an image of 3 byte big-endian words into integers.
+
+    Parameters:
+        image (bytes | bytearray | memoryview): The packed machine code.
+
+    Returns:
+        words (list[int]): The instruction words.
+    """
+    data = bytes(image)
+    if len(data) % _WORD_BYTES:
+        raise ValueError(f"image of {len(data)} bytes is not a whole number of {_WORD_BYTES} byte words")
+    return [int.from_bytes(data[x:x + _WORD_BYTES], "big") for x in range(0, len(data), _WORD_BYTES)]
+
+def write_text(f: BinaryIO, image: bytes | bytearray | memoryview) -> None:
+    """Write one line of 24 '0'/'1' characters per instruction, as in samples/."""
+    write_text_words(f, unpack_words(image))
+
+def write_binary(f: BinaryIO, image: bytes | bytearray | memoryview) -> None:
+    """Write the packed words as they are, 3 big-endian bytes per instruction."""
+    f.write(image)
+
+def write_intel_hex(f: BinaryIO, image: bytes | bytearray | memoryview) -> None:
+    """
+    Write the packed words as Intel HEX, byte addressed from 0, with an
+    extended linear address record before each 64KiB segment.
+    """
+    write_intel_hex_words(f, unpack_words(image))
+
+def write_coe(f: BinaryIO, image: bytes | bytearray | memoryview) -> None:
+    """Write a Xilinx .coe memory initialisation file, one hex word per entry."""
+    write_coe_words(f, unpack_words(image))
+
+def write_mem(f: BinaryIO, image: bytes | bytearray | memoryview) -> None:
+    """Write a Xilinx .mem file (as read by updatemem), one hex word per line from address 0."""
+    write_mem_words(f, unpack_words(image))
+
+def write_vhdl_rom(f: BinaryIO, image: bytes | bytearray | memoryview) -> None:
+    """Write the rom_contents constant of rtl/pom8_instruction_memory.vhd, ready to paste."""
+    write_vhdl_rom_words(f, unpack_words(image))
+
+def write_rom_tcl(f: BinaryIO, image: bytes | bytearray | memoryview) -> None:
+    """
+    Write a Vivado Tcl script that sets the INIT value of each ROM256X1
+    primitive of the instruction memory, to patch the program of an
+    implemented design without synthesising or implementing it again.
+    """
+    write_rom_tcl_words(f, unpack_words(image))
+
+def rom_column_inits(words: Sequence[int]) -> list[int]:
+    """
+    Find the INIT value of each ROM256X1 primitive of the instruction memory,
+    as GetRomCol in rtl/pom8_instruction_memory.vhd builds them: bit n of the
+    INIT value of column c is bit c of the word at address n.
+
+    Parameters:
+        words (Sequence[int]): The instruction words, at most ROM_PRIMITIVE_DEPTH.
+
+    Returns:
+        inits (list[int]): The 256 bit INIT value of each column, least significant bit first.
+    """
+    if len(words) > ROM_PRIMITIVE_DEPTH:
+        raise ValueError(f"{len(words)} words do not fit the {ROM_PRIMITIVE_DEPTH} word ROM256X1 primitives")
+    inits = [0] * _WORD_BITS
+    for address, word in enumerate(words):
+        column = 0
+        while word:
+            if word & 1:
+                inits[column] |= 1 << address
+            word >>= 1
+            column += 1
+    return inits
+
+def _chunks(words: Iterable[int]) -> Iterator[list[int]]:
+    """Group words into lists of up to _CHUNK_WORDS, so they are written a chunk at a time."""
+    it = iter(words)
+    while chunk := list(islice(it, _CHUNK_WORDS)):
+        yield chunk
+
+def write_text_words(f: BinaryIO, words: Iterable[int]) -> None:
+    """Write words as they are produced, see write_text."""
+    for chunk in _chunks(words):
+        f.write("".join(f"{word:0{_WORD_BITS}b}\n" for word in chunk).encode("ascii"))
+
+def write_binary_words(f: BinaryIO, words: Iterable[int]) -> None:
+    """Write words as they are produced, see write_binary."""
+    for chunk in _chunks(words):
+        f.write(b"".join(word.to_bytes(_WORD_BYTES, "big") for word in chunk))
+
+def _ihex_record(record_type: int, address: int, data: bytes) -> str:
+    """Build an Intel HEX record, including its checksum."""
+    record = bytes([len(data), (address >> 8) & 0xFF, address & 0xFF, record_type]) + data
+    checksum = (-sum(record)) & 0xFF
+    return f":{record.hex().upper()}{checksum:02X}\n"
+
+def write_intel_hex_words(f: BinaryIO, words: Iterable[int]) -> None:
+    """Write words as they are produced, see write_intel_hex."""
+    pending = bytearray() #bytes not yet written, less than a record once a chunk is written
+    address = 0
+    segment = 0
+
+    def records(final: bool) -> str:
+        nonlocal address, segment
+        lines: list[str] = []
+        while len(pending) >= _IHEX_RECORD_BYTES or (final and pending):
+            data = bytes(pending[:_IHEX_RECORD_BYTES])
+            del pending[:_IHEX_RECORD_BYTES]
+            if address >> 16 != segment:
+                segment = address >> 16
+                lines.append(_ihex_record(0x04, 0, segment.to_bytes(2, "big")))
+            lines.append(_ihex_record(0x00, address & 0xFFFF, data))
+            address += len(data)
+        return "".join(lines)
+
+    for chunk in _chunks(words):
+        for word in chunk:
+            pending += word.to_bytes(_WORD_BYTES, "big")
+        f.write(records(final=False).encode("ascii"))
+    f.write((records(final=True) + _ihex_record(0x01, 0, b"")).encode("ascii"))
+
+def write_coe_words(f: BinaryIO, words: Iterable[int]) -> None:
+    """Write words as they are produced, see write_coe."""
+    f.write(b"memory_initialization_radix=16;\nmemory_initialization_vector=\n")
+    separator = ""
+    for chunk in _chunks(words):
+        f.write((separator + ",\n".join(f"{word:06X}" for word in chunk)).encode("ascii"))
+        separator = ",\n"
+    if not separator:
+        f.write(b"000000") #the vector cannot be empty
+    f.write(b";\n")
+
+def write_mem_words(f: BinaryIO, words: Iterable[int]) -> None:
+    """Write words as they are produced, see write_mem."""
+    f.write(b"@0000\n")
+    for chunk in _chunks(words):
+        f.write("".join(f"{word:06X}\n" for word in chunk).encode("ascii"))
+
+def write_vhdl_rom_words(f: BinaryIO, words: Iterable[int]) -> None:
+    """Write words as they are produced, see write_vhdl_rom."""
+    f.write(b"constant rom_contents: rom_type := (\n")
+    address = 0
+    for chunk in _chunks(words):
+        f.write("".join(f'    {address + x} => "{word:0{_WORD_BITS}b}",\n'
+                        for x, word in enumerate(chunk)).encode("ascii"))
+        address += len(chunk)
+    f.write(f'    others => "{0:0{_WORD_BITS}b}"\n);\n'.encode("ascii"))
+
+def write_rom_tcl_words(f: BinaryIO, words: Iterable[int]) -> None:
+    """Write words as they are produced, see write_rom_tcl."""
+    inits = rom_column_inits([word for chunk in _chunks(words) for word in chunk])
+    f.write(b"#set the program of the POM8 instruction memory in an implemented design, e.g.\n"
+            b"#open_checkpoint pom8_routed.dcp; source <this script>; write_bitstream pom8.bit\n")
+    f.write("".join(f"set_property INIT 256'h{init:064X} "
+                    f"[get_cells {{{_ROM_INSTANCE}/{_ROM_PRIMITIVE.format(column=column)}}}]\n"
+                    for column, init in enumerate(inits)).encode("ascii"))
+
+#the writer of each output format, by name
+FORMATS: dict[str, Callable[[BinaryIO, bytes | bytearray | memoryview], None]] = {
+    "text": write_text,
+    "bin": write_binary,
+    "hex": write_intel_hex,
+    "coe": write_coe,
+    "mem": write_mem,
+    "vhdl": write_vhdl_rom,
+    "tcl": write_rom_tcl
+}
+
+#the writer of each output format that takes words as they are produced
+WORD_FORMATS: dict[str, Callable[[BinaryIO, Iterable[int]], None]] = {
+    "text": write_text_words,
+    "bin": write_binary_words,
+    "hex": write_intel_hex_words,
+    "coe": write_coe_words,
+    "mem": write_mem_words,
+    "vhdl": write_vhdl_rom_words,
+    "tcl": write_rom_tcl_words
+}
+
+#the suffix of the output file of each format, appended to the input name
+FORMAT_SUFFIXES: dict[str, str] = {
+    "text": "_bin.txt",
+    "bin": ".bin",
+    "hex": ".hex",
+    "coe": ".coe",
+    "mem": ".mem",
+    "vhdl": "_rom.vhd",
+    "tcl": "_rom.tcl"
+}
+
+def write_image(f: BinaryIO, image: bytes | bytearray | memoryview, fmt: str = "text") -> None:
+    """
+    Write an image in the named format.
+
+    Parameters:
+        f (BinaryIO): The binary file to write to.
+        image (bytes | bytearray | memoryview): The packed machine code.
+        fmt (str): The format, a key of FORMATS.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown output format '{fmt}', expected one of {', '.join(FORMATS)}")
+    FORMATS[fmt](f, image)
+
+def write_words(f: BinaryIO, words: Iterable[int], fmt: str = "text") -> None:
+    """
+    Write instruction words in the named format as they are produced, so the
+    whole image is never held in memory.
+
+    Parameters:
+        f (BinaryIO): The binary file to write to.
+        words (Iterable[int]): The instruction words, e.g. a generator.
+        fmt (str): The format, a key of WORD_FORMATS.
+    """
+    if fmt not in WORD_FORMATS:
+        raise ValueError(f"unknown output format '{fmt}', expected one of {', '.join(WORD_FORMATS)}")
+    WORD_FORMATS[fmt](f, words)
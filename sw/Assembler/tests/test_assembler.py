@@ -1,6 +1,9 @@
 from assembler import *
 from parser import *
 import pytest
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterator
 
 def test_assembler_and_compare_good_binaries(monkeypatch: pytest.MonkeyPatch) -> None:
@@ -32,4 +35,126 @@ def test_assembler_and_compare_good_binaries(monkeypatch: pytest.MonkeyPatch) ->
             assert machine_code[index] == inst
 
         # clear symbol table
-        symbol_table.clear()
\ No newline at end of file
+        symbol_table.clear()
+
+def test_compact_matches_good_binaries() -> None:
+    """Test the compact token stream and instruction records assemble the same as the object based path"""
+    file_names = ["add5", "fibonacci", "pwm_led_breathe"]
+    symbol_table.clear()
+    for file_name in file_names:
+        tokens = tokenise(f"../Examples/{file_name}.asm")
+        machine_code = second_pass(Parser(tokens).parse_program())
+        symbol_table.clear()
+
+        compact_tokens = tokenise_compact(f"../Examples/{file_name}.asm")
+        assert len(compact_tokens) == len(tokens)
+        for index, token in enumerate(tokens):
+            assert (compact_tokens.text(index) == token.text and
+                    compact_tokens.type(index) == token.type and
+                    compact_tokens.lines[index] == token.line_num)
+
+        compact_program = Parser(compact_tokens).parse_compact()
+        assert len(compact_program) == len(machine_code)
+        assert second_pass(compact_program) == machine_code
+        symbol_table.clear()
+
+def test_concurrent_sessions() -> None:
+    """Test many assembler sessions running at once on a thread pool, without touching the module symbol table"""
+    symbol_table.clear()
+    sources: dict[str, bytes] = {}
+    expected: dict[str, list[str]] = {}
+    for file_name in ["add5", "fibonacci", "pwm_led_breathe"]:
+        with open(f"../Examples/{file_name}.asm", "rb") as f:
+            sources[file_name] = f.read()
+        expected[file_name] = Assembler().assemble(sources[file_name])
+    with open("./samples/add5_bin.txt") as f:
+        assert expected["add5"] == f.read().split()
+
+    options = [AssemblerOptions(), AssemblerOptions(scanner=True), AssemblerOptions(compact=True)]
+    jobs = [(name, option) for name in sources for option in options] * 20
+    def assemble(job: tuple[str, AssemblerOptions]) -> list[str]:
+        name, option = job
+        return Assembler(option).assemble(sources[name])
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(assemble, jobs))
+
+    for (name, _), machine_code in zip(jobs, results):
+        assert machine_code == expected[name]
+    assert not symbol_table
+
+_EVERY_MNEMONIC = """start: ADD r1, r2, r3
+SUB r4, r5, r6
+AND r7, r8, r9
+OR r10, r11, r12
+NOT r13, r14, r15
+XOR r0, r1, r2
+LSL r3, r4
+LSR r5, r6
+ADDC r7, r8, r9
+SUBC r10, r11, r12
+SETC
+CLRC
+SETV
+CLRV
+MOV r13, r14
+IJMP r15, r1
+INC r2, r3, r4
+NOP
+CALL start
+RET
+JMP 0x3FF
+BRZ start
+BRN start
+BRP start
+BRC start
+BRV start
+HLT
+ADDI r1, r2, -1
+SUBI r3, r4, 255
+ANDI r5, r6, 0b1010
+ORI r7, 0x3FF
+XORI r8, -128
+LDI r9, 0xFF
+LDA r10, 0x200
+LDO r11, r12, 7
+STA r13, 0x201
+PUSH r14
+POP r15
+"""
+
+def test_encoders_match_expected_words() -> None:
+    """Test every mnemonic encodes to the expected word, with objects, records and columns"""
+    expected = [
+        0x0048C0, 0x011581, 0x01E242, 0x02AF03, 0x037BC4, 0x000485, 0x00D006, 0x015807, 0x01E248,
+        0x02AF09, 0x00000A, 0x00000B, 0x00000C, 0x00000D, 0x03780E, 0x003C4F, 0x008D10,
+        0x040000, 0x080000, 0x0C0000, 0x1003FF, 0x140000, 0x180000, 0x1C0000, 0x200000, 0x240000,
+        0x280000, 0x2C48FF, 0x30D0FF, 0x35580A, 0x39C3FF, 0x3E0080, 0x4240FF, 0x468200,
+        0x4AF007, 0x4C3601, 0x503800, 0x57C000
+    ]
+    for options in (AssemblerOptions(), AssemblerOptions(compact=True)):
+        session = Assembler(options)
+        ast = session.parse(session.tokenise(_EVERY_MNEMONIC))
+        assert session.second_pass(ast) == [f"{word:024b}" for word in expected]
+        assert encode(ast, session.symbol_table, vectorise=False) == b"".join(
+            word.to_bytes(WORD_BYTES, "big") for word in expected)
+
+def test_vectorised_encoder() -> None:
+    """Test the NumPy column encoder gives the same image as the integer encoder"""
+    pytest.importorskip("numpy")
+    source = _EVERY_MNEMONIC + read_file("../Examples/fibonacci.asm").replace("start", "fib")
+    for options in (AssemblerOptions(), AssemblerOptions(compact=True)):
+        session = Assembler(options)
+        ast = session.parse(session.tokenise(source))
+        assert (encode(ast, session.symbol_table, vectorise=True)
+                == encode(ast, session.symbol_table, vectorise=False))
+    assert encode_columns([], [], [], [], []) == bytearray()
+
+def test_import_has_no_logging_side_effects() -> None:
+    """Test importing the assembler installs no log handlers and defers heavy imports"""
+    code = ("import sys, logging, assembler, parser, writers; "
+            "print(logging.getLogger().handlers, "
+            "sorted({'logging.config', 'concurrent.futures.process', 'tempfile'} & set(sys.modules)))")
+    result = subprocess.run([sys.executable, "-c", code], cwd="src/POM8_Assembler",
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[] []"
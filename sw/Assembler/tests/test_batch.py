@@ -0,0 +1,41 @@
+from assembler import *
+from batch import *
+import pytest
+from pathlib import Path
+
+def test_batch_assembles_every_file(tmp_path: Path) -> None:
+    """Test a batch assembles every file across a process pool, reporting failures without stopping"""
+    bad_file = tmp_path / "bad.asm"
+    bad_file.write_text("LDI r0, r1\n")
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text(f"# firmware variants\n{bad_file.name}\n")
+
+    input_files = expand_inputs(["../Examples/*.asm"], str(manifest))
+    assert [Path(name).name for name in input_files] == ["add5.asm", "fibonacci.asm", "pwm_led_breathe.asm", "bad.asm"]
+
+    output_dir = tmp_path / "out"
+    results = assemble_batch(input_files, str(output_dir), workers=2)
+    assert [result.ok for result in results] == [True, True, True, False]
+    assert "Expected operand" in results[3].error
+
+    for result in results[:3]:
+        expected = Assembler().assemble_file(result.input_file)
+        assert Path(result.output_file).read_text().split() == expected
+    assert not Path(results[3].output_file).exists()
+
+    summary = format_summary(results)
+    assert summary.splitlines()[-1].startswith("4 files, 3 assembled, 1 failed")
+
+def test_batch_output_collisions(tmp_path: Path) -> None:
+    """Test inputs of the same name in different directories do not overwrite each other's output"""
+    for directory, source in (("a", "LDI r0, 1\n"), ("b", "LDI r0, 2\n")):
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / "add5.asm").write_text(source)
+    (tmp_path / "b" / "other.asm").write_text("HLT\n")
+    input_files = [str(tmp_path / "a" / "add5.asm"), str(tmp_path / "b" / "add5.asm"), str(tmp_path / "b" / "other.asm")]
+
+    results = assemble_batch(input_files, str(tmp_path / "out"), workers=1)
+    assert [result.ok for result in results] == [True, False, True]
+    assert results[1].input_file == input_files[1]
+    assert "also the output of" in results[1].error
+    assert Path(results[0].output_file).read_text().split() == Assembler().assemble_file(input_files[0])
@@ -0,0 +1,46 @@
+from assembler import *
+from cache import *
+import pytest
+import os
+from pathlib import Path
+
+def test_cache_hit_skips_assembly(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test a cache hit returns the stored machine code without tokenising, parsing or assembling"""
+    options = AssemblerOptions(cache_dir=str(tmp_path))
+    expected = Assembler().assemble_file("../Examples/fibonacci.asm")
+
+    session = Assembler(options)
+    assert session.assemble_file("../Examples/fibonacci.asm") == expected
+    assert (session.cache.stats.hits, session.cache.stats.misses, session.cache.stats.stores) == (0, 1, 1)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("assembled on a cache hit")
+    monkeypatch.setattr("assembler._tokenise_source", fail)
+    monkeypatch.setattr("assembler._tokenise_compact_source", fail)
+
+    session = Assembler(options)
+    assert session.assemble_file("../Examples/fibonacci.asm") == expected
+    assert session.cache.stats.hits == 1
+
+    #a different source or encoding is a different key
+    monkeypatch.setattr("assembler.__version__", "0.0.0")
+    with pytest.raises(AssertionError):
+        Assembler(options).assemble_file("../Examples/fibonacci.asm")
+
+def test_cache_lru_eviction(tmp_path: Path) -> None:
+    """Test the least recently used entries are evicted to stay within the size limit"""
+    cache = BuildCache(tmp_path, max_bytes=3 * 2 * 2)
+    machine_code = bytes.fromhex("40 00 f0 10 00 02")
+    keys = [BuildCache.key(f"source {x}".encode()) for x in range(3)]
+
+    cache.put(keys[0], machine_code)
+    cache.put(keys[1], machine_code)
+    os.utime(tmp_path / f"{keys[0]}.bin", (0, 0))
+    os.utime(tmp_path / f"{keys[1]}.bin", (1, 1))
+    assert cache.get(keys[0]) == machine_code #keys[0] is now the most recently used
+
+    cache.put(keys[2], machine_code)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == machine_code
+    assert cache.get(keys[2]) == machine_code
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.stores, cache.stats.evictions) == (3, 1, 3, 1)
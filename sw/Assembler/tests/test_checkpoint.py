@@ -0,0 +1,83 @@
+from assembler import *
+from simulator import *
+from translator import BlockSimulator
+from checkpoint import *
+import pytest
+
+#pwm_led_breathe spends its first cycles setting up, the fixtures start after them
+SETTLED_CYCLES = 200_000
+
+@pytest.fixture(scope="session")
+def checkpoints(tmp_path_factory: pytest.TempPathFactory) -> CheckpointCache:
+    """A checkpoint cache shared by the tests of a session"""
+    return CheckpointCache(tmp_path_factory.mktemp("checkpoints"))
+
+@pytest.fixture(scope="session")
+def pwm_image() -> tuple[bytearray, dict[str, int]]:
+    """The pwm_led_breathe example and its symbol table"""
+    session = Assembler()
+    return session.assemble_file_image("../Examples/pwm_led_breathe.asm"), session.symbol_table
+
+def test_snapshot_restore(pwm_image: tuple[bytearray, dict[str, int]]) -> None:
+    """Test a restored simulator carries on exactly as the one snapshotted"""
+    image, symbols = pwm_image
+    simulator = Simulator.from_image(image, symbols, pins=0b0101)
+    simulator.run(max_cycles=SETTLED_CYCLES)
+    snapshot = simulator.snapshot()
+    assert len(snapshot) < 600
+
+    restored = BlockSimulator.from_image(image, symbols)
+    restored.restore(snapshot)
+    assert (restored.pc, restored.cycles, restored.instructions, restored.pins) == \
+        (simulator.pc, simulator.cycles, simulator.instructions, 0b0101)
+    simulator.run(max_instructions=20000)
+    restored.run(max_instructions=20000)
+    assert restored.snapshot() == simulator.snapshot()
+
+def test_restore_rejects_other_snapshots(pwm_image: tuple[bytearray, dict[str, int]]) -> None:
+    """Test snapshots of another program, version or format are refused"""
+    image, symbols = pwm_image
+    snapshot = Simulator.from_image(image, symbols).snapshot()
+    other = Simulator([0x280000])
+    with pytest.raises(ValueError, match="different program"):
+        other.restore(snapshot)
+    other.restore(snapshot, check_program=False)
+
+    with pytest.raises(ValueError, match="version"):
+        other.restore(snapshot[:4] + bytes([SNAPSHOT_VERSION + 1]) + snapshot[5:], check_program=False)
+    with pytest.raises(ValueError, match="not a POM8"):
+        other.restore(b"XXXX" + snapshot[4:])
+    with pytest.raises(ValueError, match="bytes"):
+        other.restore(snapshot[:-1])
+
+def test_fast_forward(checkpoints: CheckpointCache, pwm_image: tuple[bytearray, dict[str, int]]) -> None:
+    """Test a fixture fast forwarded from the cache matches one simulated from reset"""
+    image, symbols = pwm_image
+    expected = Simulator.from_image(image, symbols)
+    expected.run(max_cycles=SETTLED_CYCLES)
+
+    first = Simulator.from_image(image, symbols)
+    second = BlockSimulator.from_image(image, symbols)
+    hits = checkpoints.hits
+    checkpoints.fast_forward(first, SETTLED_CYCLES)
+    assert checkpoints.fast_forward(second, SETTLED_CYCLES)
+    assert checkpoints.hits == hits + 1
+    assert first.snapshot() == second.snapshot() == expected.snapshot()
+
+    #other pins are another checkpoint
+    assert not checkpoints.fast_forward(Simulator.from_image(image, symbols, pins=1), SETTLED_CYCLES)
+
+def test_fast_forward_stopped_early(tmp_path, pwm_image: tuple[bytearray, dict[str, int]]) -> None:
+    """Test a run stopped by a watchpoint before the target cycle is not cached"""
+    from tracing import TracingSimulator, Watchpoint
+
+    image, symbols = pwm_image
+    checkpoints = CheckpointCache(tmp_path)
+    stopped = TracingSimulator.from_image(image, symbols, watchpoints=[Watchpoint(GPIO_BASE + 1, "w", stop=True)])
+    assert not checkpoints.fast_forward(stopped, SETTLED_CYCLES)
+    assert stopped.cycles < SETTLED_CYCLES
+    assert not list(tmp_path.iterdir())
+
+    simulator = Simulator.from_image(image, symbols)
+    assert not checkpoints.fast_forward(simulator, SETTLED_CYCLES)
+    assert simulator.cycles >= SETTLED_CYCLES
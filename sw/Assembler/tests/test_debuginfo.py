@@ -0,0 +1,55 @@
+from assembler import *
+from debuginfo import *
+from writers import unpack_words
+import pytest
+
+SOURCE = "; blink\nstart: LDI r0, 1\n       STA r0, 0x201\n\nloop:  SUBI r0, r0, 1\n       BRZ start\n       JMP loop\n"
+
+@pytest.mark.parametrize("options", [AssemblerOptions(), AssemblerOptions(scanner=True),
+                                     AssemblerOptions(compact=True), AssemblerOptions(one_pass=True),
+                                     AssemblerOptions(optimise=True)])
+def test_line_table(options: AssemblerOptions) -> None:
+    """Test each assembler records the source line of every instruction"""
+    session = Assembler(options)
+    session.assemble_image(SOURCE)
+    assert list(session.line_table) == [2, 3, 5, 6, 7]
+
+def test_debug_info_round_trip(tmp_path) -> None:
+    """Test the debug info read from a file answers the same as the line table and symbol table"""
+    session = Assembler()
+    image = session.assemble_file_image("../Examples/pwm_led_breathe.asm")
+    info = build_debug_info(session.line_table, session.symbol_table, "pwm_led_breathe.asm")
+    assert info.entries < len(session.line_table) #runs of consecutive lines share a row
+    info.write(tmp_path / "pwm.dbg")
+
+    with read_debug_info(tmp_path / "pwm.dbg") as info:
+        assert info.size == len(image) // 3
+        assert [info.line_of(address) for address in range(info.size)] == \
+            [("pwm_led_breathe.asm", line) for line in session.line_table]
+        assert info.line_of(info.size) is None
+        assert info.labels == session.symbol_table
+        assert info.address_of("delay") == session.symbol_table["delay"]
+        assert info.location(session.symbol_table["delay"] + 2) == "delay+2"
+
+def test_debug_info_rejects_other_files(tmp_path) -> None:
+    """Test files that are not debug info, or of another version, are refused"""
+    data = build_debug_info([1, 2], {"start": 0}, "a.asm").to_bytes()
+    with pytest.raises(ValueError, match="version"):
+        DebugInfo.from_buffer(data[:4] + bytes([DEBUG_INFO_VERSION + 1]) + data[5:])
+    with pytest.raises(ValueError, match="not a POM8"):
+        DebugInfo.from_buffer(b"XXXX" + data[4:])
+    with pytest.raises(ValueError, match="truncated"):
+        DebugInfo.from_buffer(data[:-1])
+    (tmp_path / "empty.dbg").write_bytes(b"")
+    with pytest.raises(ValueError, match="too short"):
+        read_debug_info(tmp_path / "empty.dbg")
+
+def test_listing() -> None:
+    """Test the listing gives each source line, with the address and word of its instruction"""
+    session = Assembler()
+    image = session.assemble_image(SOURCE)
+    listing = format_listing(image, session.line_table, SOURCE).splitlines()
+    assert len(listing) == 1 + SOURCE.count("\n")
+    assert listing[1].split() == ["1", ";", "blink"]
+    assert listing[2].split()[:4] == ["0x0000", f"{unpack_words(image)[0]:06X}", "2", "start:"]
+    assert listing[5].split()[:3] == ["0x0002", f"{unpack_words(image)[2]:06X}", "5"]
@@ -0,0 +1,67 @@
+from assembler import *
+from disassembler import *
+from disassembler import _BASE_TABLE, _OPERAND_TABLE
+from parser import MNEMONICS
+from rom_delta import read_image_words
+from writers import unpack_words
+import glob
+import random
+import pytest
+
+@pytest.mark.parametrize("file_name", sorted(glob.glob("../Examples/*.asm")) + ["samples/test_asm_no_errors.asm"])
+@pytest.mark.parametrize("vectorise", [False, True])
+def test_round_trip(file_name: str, vectorise: bool) -> None:
+    """Test asm -> bin -> asm gives the image back, and the same text when disassembled again"""
+    image = Assembler().assemble_file_image(file_name)
+    source = "\n".join(disassemble_image(image, vectorise=vectorise)) + "\n"
+    assert Assembler().assemble_image(source) == image
+    assert disassemble_image(Assembler().assemble_image(source), vectorise=vectorise) == source.splitlines()
+
+@pytest.mark.parametrize("file_name", sorted(glob.glob("samples/*_bin.txt")))
+def test_samples(file_name: str) -> None:
+    """Test the sample images disassemble into the programs they were assembled from"""
+    words = read_image_words(file_name)
+    source = "\n".join(disassemble(words)) + "\n"
+    assert unpack_words(Assembler().assemble_image(source)) == words
+
+def test_labels() -> None:
+    """Test branch targets are given labels, named by the symbol table when given"""
+    session = Assembler()
+    image = session.assemble_file_image("../Examples/pwm_led_breathe.asm")
+    lines = disassemble_image(image)
+    assert lines[4] == "            JMP loc0019"
+    assert lines[5] == "sub0005:    PUSH r0"
+    assert lines[25] == "loc0019:    LDI r0, 0"
+
+    named = disassemble_image(image, session.symbol_table)
+    assert named[5] == "delay:      PUSH r0"
+    assert named[27] == "incDuty:    CALL pwmGen"
+
+def test_every_encoding() -> None:
+    """Test random words of every mnemonic decode the same with and without NumPy, and reassemble"""
+    random.seed(8)
+    words = [_BASE_TABLE[index] | (random.getrandbits(24) & _OPERAND_TABLE[index] & 0x3FF)
+             for index in range(len(MNEMONICS)) for _ in range(20)]
+    assert decode_words(words, vectorise=False) == decode_words(words, vectorise=True)
+    assert unpack_words(Assembler().assemble_image("\n".join(disassemble(words)) + "\n")) == words
+
+def test_not_an_instruction() -> None:
+    """Test a word that is not an instruction is an error, or a comment when not strict"""
+    words = [0xFFFFFF, 0x000000, 0x105000]
+    with pytest.raises(ValueError, match="0xffffff cannot be disassembled"):
+        disassemble(words)
+    lines = disassemble(words, strict=False)
+    assert lines[0].split(None, 2)[:2] == ["NOP", ";"]
+    assert "FFFFFF cannot be disassembled" in lines[0]
+    assert lines[1].strip() == "ADD r0, r0, r0"
+    assert "outside the image" in lines[2]
+
+def test_not_an_instruction_reassembles() -> None:
+    """Test the disassembly of words that are not instructions, even branch targets, reassembles at the same addresses"""
+    words = [0x100002, 0xFC0000, 0xFC0000, 0x000000, 0x100001]
+    lines = disassemble(words, strict=False)
+    assert lines[2].startswith("loc0002:    NOP")
+    reassembled = unpack_words(Assembler().assemble_image("\n".join(lines) + "\n"))
+    assert len(reassembled) == len(words)
+    nop = unpack_words(Assembler().assemble_image("NOP\n"))[0]
+    assert reassembled == [words[0], nop, nop, *words[3:]]
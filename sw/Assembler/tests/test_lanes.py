@@ -0,0 +1,96 @@
+from assembler import *
+from simulator import *
+import pytest
+
+np = pytest.importorskip("numpy")
+from lanes import *
+
+#a program whose branches depend on the initial registers, so the lanes diverge
+DIVERGENT = """
+            LDI r0, 0b11110000
+            STA r0, 0x202
+            LDA r5, 0x200
+            ADDC r6, r5, r7
+loop:       SUBI r1, r1, 1
+            BRZ done
+            ADD r2, r2, r3
+            BRC carry
+            XOR r4, r4, r2
+            BRN neg
+            JMP loop
+carry:      PUSH r2
+            LSL r8, r2
+            LDO r9, r8, 3
+            POP r10
+            CALL sub
+            JMP loop
+neg:        SUBC r11, r4, r1
+            STA r11, 0x10
+            LSR r12, r11
+            BRV loop
+            NOT r13, r12, r0
+            JMP loop
+sub:        ORI r14, r14, 1
+            SETC
+            RET
+done:       STA r2, 0x201
+            HLT
+"""
+
+def assert_lanes_match(lane_simulator: LaneSimulator, simulators: list[Simulator]) -> None:
+    """Assert each lane has the same state as its scalar simulator"""
+    for lane, simulator in enumerate(simulators):
+        assert lane_simulator.registers[lane].tobytes() == bytes(simulator.registers)
+        assert lane_simulator.ram[lane].tobytes() == bytes(simulator.ram)
+        assert lane_simulator.gpio[lane].tobytes() == bytes(simulator.gpio)
+        assert (int(lane_simulator.flags[lane]), int(lane_simulator.pc[lane]), int(lane_simulator.sp[lane])) \
+            == (simulator.flags, simulator.pc, simulator.sp)
+        assert (int(lane_simulator.cycles[lane]), int(lane_simulator.instructions[lane]),
+                bool(lane_simulator.halted[lane])) == (simulator.cycles, simulator.instructions, simulator.halted)
+
+@pytest.mark.parametrize("limits", [{"max_instructions": 600}, {"max_cycles": 1500}])
+def test_lanes_match_simulator(limits: dict[str, int]) -> None:
+    """Test diverging lanes match a scalar simulator lane for lane"""
+    image = Assembler().assemble_image(DIVERGENT)
+    rng = np.random.default_rng(8)
+    lane_count = 48
+    registers = rng.integers(0, 256, (lane_count, 16), dtype=np.uint8)
+    registers[:, 1] = rng.integers(1, 200, lane_count) #loop counts, only some lanes halt
+    ram = rng.integers(0, 256, (lane_count, RAM_SIZE), dtype=np.uint8)
+    pins = rng.integers(0, 256, lane_count, dtype=np.uint8)
+
+    lane_simulator = LaneSimulator.from_image(image, lane_count)
+    lane_simulator.registers[:] = registers
+    lane_simulator.ram[:] = ram
+    lane_simulator.pins[:] = pins
+    lane_simulator.run(**limits)
+
+    simulators = []
+    for lane in range(lane_count):
+        simulator = Simulator.from_image(image, pins=int(pins[lane]))
+        simulator.registers[:] = registers[lane].tobytes()
+        simulator.ram[:] = ram[lane].tobytes()
+        simulator.run(**limits)
+        simulators.append(simulator)
+
+    assert lane_simulator.halted.any() and not lane_simulator.halted.all()
+    assert len(set(lane_simulator.pc.tolist())) > 1
+    assert_lanes_match(lane_simulator, simulators)
+
+def test_lanes_sweep_pins() -> None:
+    """Test a sweep of the GPIO inputs of the add5 example"""
+    session = Assembler()
+    image = session.assemble_file_image("../Examples/add5.asm")
+    lane_simulator = LaneSimulator.from_image(image, 16)
+    lane_simulator.pins[:] = np.arange(16)
+    lane_simulator.run(max_instructions=200)
+
+    assert lane_simulator.output_pins.tolist() == [((pins + 5) << 4) & 0xF0 for pins in range(16)]
+    assert (lane_simulator.cycles == lane_simulator.cycles[0]).all()
+
+def test_lanes_illegal_instruction() -> None:
+    """Test an illegal instruction is reported, with the PC of its lanes left at it"""
+    lane_simulator = LaneSimulator([0x000000, 0xFC0000], 4)
+    with pytest.raises(ValueError, match="illegal instruction"):
+        lane_simulator.run()
+    assert lane_simulator.pc.tolist() == [1, 1, 1, 1]
@@ -0,0 +1,83 @@
+from assembler import *
+from linker import *
+from simulator import *
+import os
+import pytest
+
+def split_example() -> list[str]:
+    """Split the PWM example into an entry, its subroutines and its main loop"""
+    with open("../Examples/pwm_led_breathe.asm", "r") as f:
+        lines = f.readlines()
+    return ["".join(lines[:6]), "".join(lines[6:28]), "".join(lines[28:])]
+
+def test_link_matches_whole_program() -> None:
+    """Test linking the modules of a program gives the image and labels of assembling it whole"""
+    parts = split_example()
+    modules = [assemble_object(Assembler(), part, f"part{index}") for index, part in enumerate(parts)]
+    assert modules[0].externals == ["start"]
+    assert modules[2].externals == ["pwmGen"]
+
+    image, symbols = link(modules)
+    session = Assembler()
+    assert image == session.assemble_image("".join(parts))
+    assert symbols == session.symbol_table
+
+def test_link_computed_jump() -> None:
+    """Test no module has instructions removed by -O when a module it is linked with has an IJMP"""
+    parts = ["LDI r0, 0\nLDI r1, 5\nIJMP r0, r1\n", "MOV r2, r2\nLDI r3, 1\ntarget: LDI r4, 7\nHLT\n"]
+    options = AssemblerOptions(optimise=True)
+    removals = not any(computes_jumps(part) for part in parts)
+    modules = [assemble_object(Assembler(options), part, f"part{index}", removals)
+               for index, part in enumerate(parts)]
+    assert not removals and modules[0].computed_jumps and not modules[1].removed
+
+    image, symbols = link(modules)
+    session = Assembler(options)
+    assert image == session.assemble_image("".join(parts))
+    assert symbols == session.symbol_table == {"target": 5}
+    simulator = Simulator.from_image(image, symbols)
+    simulator.run(max_instructions=100)
+    assert simulator.registers[4] == 7
+
+    copy = ObjectModule.from_bytes(modules[0].to_bytes(), "part0")
+    removed = assemble_object(Assembler(options), parts[1], "part1")
+    assert copy.computed_jumps and removed.removed
+    with pytest.raises(ValueError, match="part1: the optimiser removed instructions, but part0 has an IJMP"):
+        link([copy, removed])
+
+def test_object_round_trip() -> None:
+    """Test an object reads back as it was written"""
+    module = assemble_object(Assembler(), split_example()[2], "main")
+    copy = ObjectModule.from_bytes(module.to_bytes(), "main")
+    assert copy == module
+
+    with pytest.raises(ValueError, match="not a POM8 object file"):
+        ObjectModule.from_bytes(b"POM8", "main")
+    with pytest.raises(ValueError, match="truncated"):
+        ObjectModule.from_bytes(module.to_bytes()[:-3], "main")
+
+def test_link_errors() -> None:
+    """Test a label used but defined by no module, or defined by two, is reported"""
+    entry, subroutines, main = split_example()
+    session = Assembler()
+    with pytest.raises(SyntaxError, match="undefined label 'pwmGen'"):
+        link([assemble_object(Assembler(), entry, "entry"), assemble_object(session, main, "main")])
+    with pytest.raises(SyntaxError, match="'delay' label already exists"):
+        link([assemble_object(Assembler(), subroutines, "one"), assemble_object(Assembler(), subroutines, "two")])
+
+def test_build_object_only_when_changed(tmp_path) -> None:
+    """Test a module is assembled again only when its source, the options or the removals change"""
+    source = tmp_path / "main.asm"
+    source.write_text(split_example()[1])
+    module, rebuilt = build_object(str(source))
+    assert rebuilt and (tmp_path / "main.o").exists()
+
+    assert build_object(str(source)) == (module, False)
+    assert build_object(str(source), options=AssemblerOptions(optimise=True))[1]
+    assert build_object(str(source), options=AssemblerOptions(optimise=True), removals=False)[1]
+
+    stamp = os.stat(tmp_path / "main.o").st_mtime_ns
+    source.write_text(split_example()[1] + "            HLT\n")
+    os.utime(source, ns=(stamp + 1, stamp + 1))
+    module, rebuilt = build_object(str(source))
+    assert rebuilt and len(module) == 21
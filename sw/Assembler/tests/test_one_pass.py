@@ -0,0 +1,40 @@
+from assembler import *
+from one_pass import *
+import pytest
+
+@pytest.mark.parametrize("file_name", ["add5", "fibonacci", "pwm_led_breathe"])
+def test_one_pass_matches_assembler(file_name: str) -> None:
+    """Test a single pass gives the same image and symbol table as assembling the whole file"""
+    expected = Assembler()
+    image = expected.assemble_file_image(f"../Examples/{file_name}.asm")
+
+    session = Assembler(AssemblerOptions(one_pass=True))
+    assert session.assemble_file_image(f"../Examples/{file_name}.asm") == image
+    assert session.symbol_table == expected.symbol_table
+
+def test_one_pass_backpatches_forward_references() -> None:
+    """Test branches to a label defined later are patched when the label is reached"""
+    symbols: dict[str, int] = {}
+    words = assemble_words("JMP later\nCALL later\nlater: HLT\nJMP later\n", symbols)
+    assert list(words) == [0x100002, 0x080002, 0x280000, 0x100002]
+    assert symbols == {"later": 2}
+
+@pytest.mark.parametrize("source", [
+    "JMP nowhere\nCALL nowhere\n",
+    "start: NOP\nstart: NOP\n",
+    "ADD r0, r1\n",
+    "ADD r0, r1, r2, r3\n",
+    "ADD r0, r1, r2 r3 r4\n",
+    "foo r1\n",
+    "label:\nNOP\n",
+    "LDI r0, 300\n",
+    "PUSH r0, 1\n",
+    "JMP 12\n",
+])
+def test_one_pass_errors_match_assembler(source: str) -> None:
+    """Test a single pass raises the same errors as assembling the whole file"""
+    with pytest.raises(SyntaxError) as expected:
+        Assembler().assemble_image(source)
+    with pytest.raises(SyntaxError) as error:
+        Assembler(AssemblerOptions(one_pass=True)).assemble_image(source)
+    assert str(error.value) == str(expected.value)
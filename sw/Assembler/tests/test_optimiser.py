@@ -0,0 +1,67 @@
+from assembler import *
+from simulator import *
+import pytest
+
+PEEPHOLES = """start: LDI r1, 5
+ADDI r1, r1, 3
+ADD r2, r1, r1
+MOV r3, r3
+LDI r4, 1
+LDI r4, 2
+ADDI r5, r5, 4
+SUBI r5, r5, 4
+ADD r0, r0, r0
+CALL sub
+RET
+sub: JMP ja
+ja: JMP jb
+jb: JMP jc
+jc: HLT
+"""
+
+def run(source: str, optimise: bool) -> tuple[Assembler, Simulator]:
+    """Assemble a source, optimised or not, and run it until it halts"""
+    session = Assembler(AssemblerOptions(optimise=optimise))
+    simulator = Simulator.from_image(session.assemble_image(source), session.symbol_table)
+    simulator.run(max_instructions=10000)
+    return session, simulator
+
+def test_rules_keep_the_result() -> None:
+    """Test every rule rewrites the program, and it halts with the same registers and flags"""
+    _, plain = run(PEEPHOLES, False)
+    session, optimised = run(PEEPHOLES, True)
+    report = session.optimisation
+
+    assert all(rule.rewrites for rule in report.rules.values())
+    assert optimised.halted and plain.halted
+    assert bytes(optimised.registers) == bytes(plain.registers)
+    assert optimised.flags == plain.flags
+    assert report.words == 10
+    assert optimised.cycles < plain.cycles
+    #the labels of removed instructions mark the instruction after them
+    assert session.symbol_table == {"start": 0, "sub": 4, "ja": 4, "jb": 4, "jc": 4}
+    assert "fold_add" in str(report)
+
+def test_live_flags_and_branch_targets_are_kept() -> None:
+    """Test a fold is not made when the flags are read, or the second instruction is a target"""
+    session, _ = run("LDI r1, 0xFF\nADDI r1, r1, 1\nBRZ done\nLDI r2, 1\n"
+                     "ADDI r3, r3, 1\nmid: ADDI r3, r3, 1\nADD r0, r0, r0\nJMP mid\ndone: HLT\n", True)
+    assert session.optimisation.words == 0
+
+@pytest.mark.parametrize("example", ["fibonacci", "add5", "pwm_led_breathe"])
+def test_examples_simulate_the_same(example: str) -> None:
+    """Test optimising the examples does not change what they do"""
+    with open(f"../Examples/{example}.asm", "r") as f:
+        source = f.read()
+    _, plain = run(source, False)
+    session, optimised = run(source, True)
+
+    assert session.optimisation is not None
+    assert (bytes(optimised.registers), optimised.output_pins) == (bytes(plain.registers), plain.output_pins)
+
+def test_ijmp_disables_removal() -> None:
+    """Test no instructions are removed from a program with an IJMP, as its targets are computed"""
+    session = Assembler(AssemblerOptions(optimise=True))
+    image = session.assemble_image("MOV r1, r1\nIJMP r0, r2\n")
+    assert len(image) == 2 * WORD_BYTES
+    assert not session.optimisation.removals
@@ -0,0 +1,63 @@
+from assembler import *
+from pom8_token import *
+import parallel
+from parallel import *
+import pytest
+
+SOURCE = ("start: LDI r0, 1\n       JMP start\nmid:   NOP\n; a comment\n\n"
+          "loop:  ADD r1, r2, r3\n       BRZ loop\nend:   HLT")
+
+@pytest.fixture
+def small_chunks(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Split even the small sources of the tests across the pool"""
+    monkeypatch.setattr(parallel, "MIN_CHUNK_LINES", 1)
+
+def tokenise_both(source: str, scanner: bool, compact: bool) -> list[tuple]:
+    """Tokenise a source sequentially and in parallel, giving the tokens, symbols or error of each"""
+    outcomes = []
+    for jobs in (1, 3):
+        session = Assembler(AssemblerOptions(scanner=scanner, compact=compact, jobs=jobs))
+        try:
+            tokens = session.tokenise(source)
+        except (SyntaxError, ValueError) as ex:
+            outcomes.append((type(ex), str(ex), session.symbol_table))
+            continue
+        if compact:
+            outcomes.append((list(tokens.types), list(tokens.lines), list(tokens.starts), list(tokens.ends),
+                             session.symbol_table))
+        else:
+            outcomes.append(([(token.text, token.line_num, token.type) for token in tokens], session.symbol_table))
+    return outcomes
+
+def test_split_source() -> None:
+    """Test chunks end at line boundaries, cover the source and know their first line"""
+    source = "".join(f"line{x}\n" for x in range(1, 101)) + "last"
+    spans = split_source(source, 4)
+    assert len(spans) == 4
+    assert "".join(source[start:end] for start, end, _ in spans) == source
+    for start, end, first_line in spans:
+        assert source[start:end].startswith(f"line{first_line}\n") or first_line == 101
+        assert start == 0 or source[start - 1] == "\n"
+    assert split_source("NOP\n", 8) == [(0, 4, 1)]
+
+@pytest.mark.parametrize("scanner, compact", [(False, False), (True, False), (False, True)])
+@pytest.mark.parametrize("source", [
+    SOURCE + "\n",
+    SOURCE, #no newline after the last line
+    "\n\n" + SOURCE.replace("\n", "\r\n") + "\n",
+    SOURCE + "\nstart: NOP\n", #a label of another chunk
+    SOURCE.replace("loop:", "mid:"),
+    SOURCE + "\ntwice: twice: NOP\n", #a label twice on one line
+    SOURCE + "\nlate: LDI r0, $$\n", #an item that is not a token, after a label
+    SOURCE + "\nADD r1,,r2\n"])
+def test_parallel_matches_sequential(small_chunks: None, source: str, scanner: bool, compact: bool) -> None:
+    """Test tokenising in chunks gives the same tokens, symbol table and errors"""
+    sequential, chunked = tokenise_both(source, scanner, compact)
+    assert chunked == sequential
+
+def test_parallel_assembles_the_same(small_chunks: None) -> None:
+    """Test a program tokenised in chunks assembles to the same image"""
+    source = read_file("../Examples/pwm_led_breathe.asm")
+    expected = Assembler().assemble_image(source)
+    assert Assembler(AssemblerOptions(jobs=2)).assemble_image(source) == expected
+    assert Assembler(AssemblerOptions(compact=True, jobs=2)).assemble_image(source) == expected
@@ -29,4 +29,14 @@ def test_parser() -> None:
                 instruction.inst_format == expected_instructions[index].inst_format)
 
     #clear the symbol table
-    symbol_table.clear()
\ No newline at end of file
+    symbol_table.clear()
+
+@pytest.mark.parametrize("tokens", [
+    [Token("JMP", 1), Token("12", 1), Token("\n", 1)], #only a label or hexadecimal address
+    [Token("ADD", 1), Token("r0", 1), Token("r1", 1), Token("0x1", 1), Token("\n", 1)],
+    [Token("LDI", 1), Token("r0", 1)],
+])
+def test_parser_operand_types(tokens: list[Token]) -> None:
+    """Test an operand of a type the instruction does not take is a syntax error"""
+    with pytest.raises(SyntaxError, match="Expected operand of type"):
+        Parser(tokens, {}).parse_program()
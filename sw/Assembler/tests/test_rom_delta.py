@@ -0,0 +1,39 @@
+from assembler import *
+from writers import *
+from rom_delta import *
+import pytest
+
+RTL = "../../rtl/pom8_instruction_memory.vhd"
+
+def test_rtl_is_the_pwm_example() -> None:
+    """Test the ROM contents read from the RTL are the pwm example, so nothing changed"""
+    image = Assembler().assemble_file_image("../Examples/pwm_led_breathe.asm")
+    delta = compare_images(read_image_words(RTL), unpack_words(image))
+
+    assert delta.changes == []
+    assert delta.fits
+    assert "nothing to rebuild" in str(delta)
+
+@pytest.mark.parametrize("fmt", ["text", "bin", "coe", "mem", "vhdl"])
+def test_read_image_words(tmp_path, fmt: str) -> None:
+    """Test an image written in each format reads back as the same words"""
+    image = Assembler().assemble_file_image("../Examples/fibonacci.asm")
+    path = tmp_path / f"fibonacci{FORMAT_SUFFIXES[fmt]}"
+    with open(path, "wb") as f:
+        write_image(f, image, fmt)
+
+    assert read_image_words(str(path)) == unpack_words(image)
+
+def test_changed_words_and_depth() -> None:
+    """Test the changed words and primitives are listed, and a longer program needs a rebuild"""
+    previous = [0x400001, 0x438001, 0x43C000]
+    delta = compare_images(previous, [0x400001, 0x438003])
+
+    assert delta.changes == [WordChange(1, 0x438001, 0x438003), WordChange(2, 0x43C000, 0)]
+    assert delta.columns == [1, 14, 15, 16, 17, 22]
+    assert delta.depth == ROM_PRIMITIVE_DEPTH
+    assert delta.fits
+
+    delta = compare_images(previous, [0] * (ROM_PRIMITIVE_DEPTH + 1))
+    assert not delta.fits
+    assert "do not fit" in str(delta)
@@ -0,0 +1,68 @@
+from assembler import *
+from client import send_request
+from server import *
+import base64
+import io
+import json
+import os
+import tempfile
+import threading
+import pytest
+
+def test_assemble_request() -> None:
+    """Test a request is answered with the machine code of the source, and repeated from the cache"""
+    server = AssemblerServer()
+    with open("../Examples/fibonacci.asm", "r") as f:
+        source = f.read()
+    response = server.handle({"id": 7, "source": source})
+    session = Assembler()
+    assert response["id"] == 7 and response["ok"]
+    assert response["output"] == "".join(f"{line}\n" for line in session.assemble(source))
+    assert response["symbols"] == session.symbol_table
+
+    binary = server.handle({"file": "../Examples/fibonacci.asm", "format": "bin", "options": {"compact": True}})
+    assert base64.b64decode(binary["output"]) == session.assemble_image(source)
+    assert server.handle({"source": source})["output"] == response["output"]
+    assert (server.requests, server.hits) == (3, 1)
+
+def test_request_errors() -> None:
+    """Test errors are reported as diagnostics rather than raised"""
+    server = AssemblerServer()
+    response = server.handle({"source": "JMP nowhere\n"})
+    assert not response["ok"]
+    assert response["diagnostics"][0]["level"] == "ERROR"
+    assert "nowhere" in response["diagnostics"][0]["message"]
+    assert "unknown format" in server.handle({"source": "HLT\n", "format": "elf"})["diagnostics"][0]["message"]
+    assert "unknown options" in server.handle({"source": "HLT\n", "options": {"cache_dir": "/"}})["diagnostics"][0]["message"]
+    assert "must be a string" in server.handle({"source": 5})["diagnostics"][0]["message"]
+    assert "must be a string" in server.handle({"file": 0})["diagnostics"][0]["message"]
+    assert "must be true or false" in server.handle({"source": "HLT\n", "options": {"optimise": "false"}})["diagnostics"][0]["message"]
+    assert not json.loads(server.handle_line("not json"))["ok"]
+
+def test_serve_stdio() -> None:
+    """Test JSON line requests are answered a line each until shutdown"""
+    requests = io.StringIO('{"id": 1, "source": "HLT\\n"}\n\n{"id": 2, "command": "shutdown"}\n{"id": 3, "command": "ping"}\n')
+    output = io.StringIO()
+    serve_stdio(requests, output)
+    responses = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [response["id"] for response in responses] == [1, 2]
+    assert responses[0]["output"] == "001010000000000000000000\n"
+
+def test_serve_socket() -> None:
+    """Test a client is answered on the socket until it sends a shutdown request"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "pom8.sock")
+        ready = threading.Event()
+        thread = threading.Thread(target=serve_socket, args=(path, None, ready))
+        thread.start()
+        assert ready.wait(10)
+        try:
+            assert send_request({"id": 1, "source": "HLT\n"}, path)["output"] == "001010000000000000000000\n"
+            with pytest.raises(OSError, match="already listening"):
+                serve_socket(path)
+        finally:
+            send_request({"command": "shutdown"}, path)
+            thread.join(10)
+        assert not thread.is_alive() and not os.path.exists(path)
+        with pytest.raises(OSError):
+            send_request({"command": "ping"}, path)
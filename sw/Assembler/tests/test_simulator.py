@@ -0,0 +1,89 @@
+from assembler import *
+from simulator import *
+import pytest
+
+def simulate(source: str, **kwargs) -> Simulator:
+    """Assemble a source and create a simulator of it"""
+    session = Assembler()
+    image = session.assemble_image(source)
+    return Simulator.from_image(image, session.symbol_table, **kwargs)
+
+def test_fibonacci_cycles() -> None:
+    """Test the fibonacci example halts after the cycles the control unit takes"""
+    session = Assembler()
+    simulator = Simulator.from_image(session.assemble_file_image("../Examples/fibonacci.asm"),
+                                     session.symbol_table)
+    simulator.run()
+
+    assert simulator.halted
+    assert simulator.instructions == 162
+    #BOOT, 5 setup, 20 loop tests, 19 loop bodies with a POP writeback, HLT
+    assert simulator.cycles == 1 + 5*3 + 20*4*3 + 19*(3*3 + 4) + 3
+    assert simulator.gpio[2] == 0b11110000
+    assert simulator.run() == 0
+
+def test_call_ret_cycles() -> None:
+    """Test CALL and RET take the PCH_SAVE/PC_LOAD16 and PCH_LOAD8/PCL_FETCH8/PCL_LOAD8 states"""
+    simulator = simulate("CALL sub\nHLT\nsub: RET\n")
+    simulator.run()
+
+    assert simulator.halted
+    assert simulator.cycles == 1 + 5 + 6 + 3
+    assert simulator.sp == 0
+    assert simulator.ram[:2] == bytes([1, 0]) #the return address, low byte first
+    assert simulator.pc == 2
+
+def test_pch_inc_cycle() -> None:
+    """Test the fetch from the last address of a page takes an extra cycle"""
+    simulator = simulate("NOP\n" * 255 + "HLT\n")
+    simulator.run()
+
+    assert simulator.cycles == 1 + 255*3 + 4
+    assert simulator.pc == 0x100
+
+def test_alu_flags() -> None:
+    """Test the ALU flags, including the borrow of SUB and carry of LSL"""
+    simulator = simulate("LDI r0, 0\nSUBI r1, r0, 1\n")
+    simulator.run(max_instructions=2)
+    assert simulator.registers[1] == 0xFF
+    assert simulator.flags == FLAG_N | FLAG_C | FLAG_V
+
+    simulator = simulate("LDI r2, 0x81\nLSL r3, r2\nADDC r4, r0, r0\n")
+    simulator.run(max_instructions=2)
+    assert simulator.registers[3] == 0x02
+    assert simulator.flags == FLAG_P | FLAG_C
+    simulator.run(max_instructions=1)
+    assert simulator.registers[4] == 1
+    assert simulator.flags == FLAG_P
+
+def test_gpio() -> None:
+    """Test the add5 example reads the input pins and drives the output pins"""
+    session = Assembler()
+    simulator = Simulator.from_image(session.assemble_file_image("../Examples/add5.asm"),
+                                     session.symbol_table, pins=0b0110)
+    simulator.run(max_instructions=1000)
+
+    assert not simulator.halted
+    assert simulator.output_pins == ((0b0110 + 5) << 4) & 0xF0
+
+def test_illegal_instruction() -> None:
+    """Test an illegal opcode is reported when executed, with the PC left at it"""
+    simulator = Simulator([0x000000, 0xFC0000])
+    with pytest.raises(ValueError, match="illegal instruction"):
+        simulator.run()
+    assert simulator.pc == 1
+
+def test_profile_by_label() -> None:
+    """Test the profile is aggregated by label and accounts for every cycle"""
+    session = Assembler()
+    simulator = Simulator.from_image(session.assemble_file_image("../Examples/pwm_led_breathe.asm"),
+                                     session.symbol_table, profile=True)
+    simulator.run(max_cycles=100000)
+
+    profile = simulator.profile_by_label()
+    assert profile[0].label == "loopa"
+    assert sum(entry.cycles for entry in profile) + 1 == simulator.cycles
+    assert sum(entry.instructions for entry in profile) == simulator.instructions
+    assert sum(simulator.hits) == simulator.instructions
+    assert simulator.location(session.symbol_table["loopa"] + 1) == "loopa+1"
+    assert "loopa" in format_profile(simulator)
@@ -0,0 +1,45 @@
+from assembler import *
+from streaming import *
+from writers import *
+import io
+import pytest
+from typing import Iterator
+
+@pytest.mark.parametrize("file_name", ["add5", "fibonacci", "pwm_led_breathe"])
+def test_stream_matches_assembler(file_name: str) -> None:
+    """Test streaming gives the same output and symbol table as assembling the whole file"""
+    session = Assembler()
+    image = session.assemble_file_image(f"../Examples/{file_name}.asm")
+    for fmt in FORMATS:
+        expected = io.BytesIO()
+        write_image(expected, image, fmt)
+
+        output = io.BytesIO()
+        with open(f"../Examples/{file_name}.asm", "r") as f:
+            symbols = assemble_stream(f, output, fmt)
+        assert output.getvalue() == expected.getvalue()
+        assert symbols == session.symbol_table
+
+def test_stream_holds_back_only_forward_references() -> None:
+    """Test words are produced as lines are read, holding back only until a forward label is defined"""
+    lines_read: list[int] = []
+    def source() -> Iterator[str]:
+        for line_num, line in enumerate(["LDI r0, 1", "JMP later", "ADDI r0, r0, 1",
+                                         "later: HLT", "JMP later"], start=1):
+            lines_read.append(line_num)
+            yield line + "\n"
+
+    produced: list[tuple[int, int]] = []
+    for word in stream_words(source(), {}):
+        produced.append((word, lines_read[-1]))
+
+    assert produced == [(0x400001, 1), (0x100003, 4), (0x2C0001, 4), (0x280000, 4), (0x100003, 5)]
+
+def test_stream_undefined_label() -> None:
+    """Test a label that is never defined is reported at the end of the source"""
+    output = io.BytesIO()
+    with pytest.raises(SyntaxError, match="line 1: Invalid value nowhere for operand of type MNEMONIC"):
+        assemble_stream(["JMP nowhere\n", "NOP\n"], output)
+
+    with pytest.raises(SyntaxError, match="'start' label already exists"):
+        assemble_stream(["start: NOP\n", "start: NOP\n"], output)
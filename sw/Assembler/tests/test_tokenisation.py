@@ -2,6 +2,7 @@ from parser import *
 from assembler import *
 from pom8_token import *
 import pytest
+import re
 
 def test_token_classification() -> None:
     """Test the token classifier, ensuring each token type is correctly classified"""
@@ -58,4 +59,34 @@ def test_tokenisation() -> None:
     for index, token in enumerate(token_stream):
         assert (token.text == good_token_stream[index].text and
                 token.type == good_token_stream[index].type and
-                token.line_num == good_token_stream[index].line_num)
\ No newline at end of file
+                token.line_num == good_token_stream[index].line_num)
+
+def test_scanner_tokenisation() -> None:
+    """Test the scanner produces the same token stream and symbol table as the line by line tokeniser"""
+    file_names = ["./samples/test_asm_no_errors.asm", "../Examples/add5.asm",
+                  "../Examples/fibonacci.asm", "../Examples/pwm_led_breathe.asm"]
+    symbol_table.clear()
+    for file_name in file_names:
+        token_stream = tokenise(file_name)
+        expected_symbols = dict(symbol_table)
+        symbol_table.clear()
+
+        scanned_stream = tokenise(file_name, scanner=True)
+        assert symbol_table == expected_symbols
+        assert len(scanned_stream) == len(token_stream)
+        for scanned, token in zip(scanned_stream, token_stream):
+            assert (scanned.text == token.text and
+                    scanned.type == token.type and
+                    scanned.line_num == token.line_num)
+        symbol_table.clear()
+
+def test_scanner_errors() -> None:
+    """Test the scanner rejects the same items as the tokeniser, with the same error"""
+    bad_sources = ["LDI r0, 1m\n", "LDI r0 , 1\n", "LDI r0,\n", ",LDI r0, 1", "JMP start;comment\n"]
+    for source in bad_sources:
+        with pytest.raises(ValueError) as expected:
+            for item in re.split(r"[,][ ]*|[ \t]+", source.strip()):
+                Token(item, 1)
+        with pytest.raises(ValueError) as scanned:
+            list(scan(source))
+        assert str(scanned.value) == str(expected.value)
@@ -0,0 +1,88 @@
+from assembler import *
+from simulator import *
+from tracing import *
+import io
+import pytest
+
+def trace(source: str, **kwargs) -> TracingSimulator:
+    """Assemble a source and create a tracing simulator of it"""
+    session = Assembler()
+    image = session.assemble_image(source)
+    return TracingSimulator.from_image(image, session.symbol_table, **kwargs)
+
+@pytest.mark.parametrize("file_name", ["add5", "fibonacci", "pwm_led_breathe"])
+def test_tracing_matches_simulator(file_name: str) -> None:
+    """Test tracing does not change the simulation"""
+    session = Assembler()
+    image = session.assemble_file_image(f"../Examples/{file_name}.asm")
+    expected = Simulator.from_image(image, session.symbol_table, profile=True)
+    simulator = TracingSimulator.from_image(image, session.symbol_table, profile=True, capacity=16,
+                                            watchpoints=[Watchpoint(GPIO_BASE + 1)])
+    assert simulator.run(max_instructions=5000) == expected.run(max_instructions=5000)
+
+    assert (simulator.cycles, simulator.pc, simulator.sp, simulator.flags) == \
+        (expected.cycles, expected.pc, expected.sp, expected.flags)
+    assert (simulator.registers, simulator.ram, simulator.gpio) == (expected.registers, expected.ram, expected.gpio)
+    assert list(simulator.hits) == list(expected.hits)
+    assert len(simulator.trace) == min(16, simulator.instructions)
+    assert simulator.trace.total == simulator.instructions
+    assert simulator.trace.records()[-1].cycle == simulator.cycles
+
+def test_trace_records_ring() -> None:
+    """Test the trace keeps the most recent instructions, with the registers and memory they changed"""
+    simulator = trace("LDI r1, 5\nSTA r1, 0x10\nLDA r2, 0x10\nCALL sub\nHLT\nsub: PUSH r1\nPOP r3\nRET\n",
+                      capacity=4)
+    simulator.run()
+
+    records = simulator.trace.records()
+    assert simulator.trace.total == 8
+    assert [record.pc for record in records] == [5, 6, 7, 4]
+    assert (records[0].access, records[0].address, records[0].value) == (ACCESS_WRITE, 0x002, 5) #PUSH above the return address
+    assert (records[1].register, records[1].register_value, records[1].access, records[1].address) == (3, 5, ACCESS_READ, 0x002)
+    assert (records[2].access, records[2].address, records[2].value) == (ACCESS_READ, 0x000, 4) #RET to HLT
+    assert (records[3].register, records[3].address) == (None, None)
+    assert records[-1].cycle == simulator.cycles
+
+def test_watchpoint_snapshot() -> None:
+    """Test a watchpoint snapshots the processor and trace, and can stop the run"""
+    simulator = trace("LDI r0, 1\nSTA r0, 0x202\nLDI r1, 3\nloop: STA r1, 0x205\nSUBI r1, r1, 1\nBRZ end\nJMP loop\nend: HLT\n",
+                      watchpoints=[parse_watchpoint("gpio_output:w"), Watchpoint(0x202, "r")])
+    simulator.run()
+
+    assert simulator.halted
+    assert simulator.watch_hits == 3 #0x205 repeats the output register, 0x202 is only written
+    snapshot = simulator.snapshots[1]
+    assert (snapshot.address, snapshot.access, snapshot.value, snapshot.pc) == (0x205, ACCESS_WRITE, 2, 3)
+    assert snapshot.registers[1] == 2 and snapshot.gpio[1] == 2
+    assert snapshot.records[-1].pc == 3 and snapshot.records[-1].cycle == snapshot.cycle
+
+    stopping = trace("LDI r1, 7\nSTA r1, 0x201\nHLT\n", watchpoints=[parse_watchpoint("gpio_output:w", stop=True)])
+    assert stopping.run() == 2
+    assert not stopping.halted and stopping.pc == 2
+    assert stopping.run() == 1 and stopping.halted
+
+def test_trace_file_round_trip() -> None:
+    """Test a trace read back from its binary file matches, and other files are rejected"""
+    simulator = trace("loop: INC r0, r0, r0\nPUSH r0\nJMP loop\n", capacity=10)
+    simulator.run(max_instructions=25)
+
+    output = io.BytesIO()
+    simulator.trace.write(output)
+    decoded = read_trace(io.BytesIO(output.getvalue()))
+    assert decoded.records() == simulator.trace.records()
+    assert decoded.total == 25
+    assert "PUSH r0" in format_trace(decoded.records(), {"loop": 0})
+
+    with pytest.raises(ValueError, match="not a POM8 trace"):
+        read_trace(io.BytesIO(b"POM8" + bytes(20)))
+    with pytest.raises(ValueError, match="truncated"):
+        read_trace(io.BytesIO(output.getvalue()[:-1]))
+
+def test_parse_watchpoint() -> None:
+    """Test watchpoints are read from names and addresses"""
+    assert parse_watchpoint("gpio_ddr:r") == Watchpoint(GPIO_BASE + 2, "r")
+    assert parse_watchpoint("0x20") == Watchpoint(0x20, "rw")
+    with pytest.raises(ValueError):
+        parse_watchpoint("uart")
+    with pytest.raises(ValueError):
+        parse_watchpoint("0x20:x")
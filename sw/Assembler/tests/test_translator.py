@@ -0,0 +1,62 @@
+from assembler import *
+from simulator import *
+from translator import *
+from writers import unpack_words
+import pytest
+
+def state(simulator: Simulator) -> tuple:
+    """The architectural state, counters and profile of a simulator"""
+    return (simulator.instructions, simulator.cycles, simulator.halted, simulator.pc, simulator.sp,
+            simulator.flags, bytes(simulator.registers), bytes(simulator.ram), bytes(simulator.gpio),
+            simulator.output_pins, list(simulator.hits), list(simulator.address_cycles))
+
+@pytest.mark.parametrize("file_name", ["add5", "fibonacci", "pwm_led_breathe"])
+@pytest.mark.parametrize("limits", [{"max_instructions": 200003}, {"max_cycles": 77777},
+                                    {"max_instructions": 1234, "max_cycles": 3001}])
+def test_matches_simulator(file_name: str, limits: dict[str, int]) -> None:
+    """Test the block simulator gives the same state, cycles and profile as the simulator"""
+    session = Assembler()
+    image = session.assemble_file_image(f"../Examples/{file_name}.asm")
+    simulators = [simulator_class.from_image(image, session.symbol_table, profile=True, pins=0b0101)
+                  for simulator_class in (Simulator, BlockSimulator)]
+    for simulator in simulators:
+        simulator.run(**limits)
+        simulator.run(max_instructions=17)
+
+    assert state(simulators[1]) == state(simulators[0])
+    assert simulators[1].profile_by_label() == simulators[0].profile_by_label()
+
+def test_blocks_are_cached() -> None:
+    """Test each block is translated once"""
+    session = Assembler()
+    simulator = BlockSimulator.from_image(session.assemble_file_image("../Examples/pwm_led_breathe.asm"))
+    simulator.run(max_instructions=100000)
+    translations = simulator.translations
+    simulator.run(max_instructions=100000)
+
+    assert translations > 0
+    assert simulator.translations == translations
+    assert simulator.cached_blocks == translations
+
+def test_write_instruction_invalidates() -> None:
+    """Test writing the instruction memory drops the blocks holding the address"""
+    session = Assembler()
+    image = session.assemble_image("loop: ADDI r0, r0, 1\nADDI r1, r1, 3\nJMP loop\n")
+    patch = unpack_words(Assembler().assemble_image("ADDI r0, r0, 2\n"))[0]
+    simulators = [simulator_class.from_image(image) for simulator_class in (Simulator, BlockSimulator)]
+    for simulator in simulators:
+        simulator.run(max_instructions=30)
+        simulator.write_instruction(0, patch)
+        simulator.run(max_instructions=30)
+
+    assert bytes(simulators[1].registers) == bytes(simulators[0].registers)
+    assert simulators[1].cycles == simulators[0].cycles
+    assert simulators[1].registers[0] == (10 * 1 + 10 * 2) & 0xFF
+
+def test_illegal_instruction() -> None:
+    """Test an illegal opcode is reported when executed, with the PC left at it"""
+    simulator = BlockSimulator([0x400001, 0x000000, 0xFC0000])
+    with pytest.raises(ValueError, match="illegal instruction"):
+        simulator.run()
+    assert simulator.pc == 2
+    assert simulator.registers[0] == 2 #LDI r0, 1 then ADD r0, r0, r0
@@ -0,0 +1,72 @@
+from assembler import *
+from simulator import *
+from wcet import *
+import pytest
+
+def analyse(source: str) -> WcetReport:
+    """Parse a source and bound its WCET with its annotated loop bounds"""
+    session = Assembler()
+    ast = session.parse(session.tokenise(source))
+    return analyse_wcet(ast, session.symbol_table, read_loop_bounds(source))
+
+def test_cfg_blocks() -> None:
+    """Test the fibonacci example is split into blocks at its labels and branches"""
+    session = Assembler()
+    with open("../Examples/fibonacci.asm", "r") as f:
+        ast = session.parse(session.tokenise(f.read()))
+    cfg = build_cfg(ast, session.symbol_table)
+
+    assert sorted(cfg.blocks) == [0, 5, 9, 13]
+    assert cfg.blocks[5].successors == (13, 9)
+    assert cfg.blocks[9].successors == (5,)
+    assert cfg.blocks[13].exit == "HLT"
+    assert cfg.block_at(7).start == 5
+
+def test_fibonacci_bound_covers_simulation() -> None:
+    """Test the WCET of the fibonacci example bounds the simulated cycles"""
+    with open("../Examples/fibonacci.asm", "r") as f:
+        report = analyse(f.read())
+    session = Assembler()
+    simulator = Simulator.from_image(session.assemble_file_image("../Examples/fibonacci.asm"), session.symbol_table)
+    simulator.run()
+
+    loop = report.loops[0]
+    assert (loop.name, loop.bound) == ("loop", 20)
+    assert simulator.cycles - 1 <= report.subroutine("(start)").cycles <= simulator.cycles + loop.iteration
+
+def test_subroutine_bound_covers_worst_case() -> None:
+    """Test the WCET of the delay subroutine bounds a call with the longest annotated delay"""
+    with open("../Examples/pwm_led_breathe.asm", "r") as f:
+        source = f.read()
+    report = analyse(source)
+    assert report.subroutine("(start)").cycles is None
+    assert "no @bound" in report.subroutine("(start)").reason
+
+    session = Assembler()
+    simulator = Simulator.from_image(session.assemble_image("LDI r0, 127\nCALL delay\nHLT\n" + source),
+                                     session.symbol_table)
+    simulator.run(max_instructions=10**6)
+    delay = simulator.cycles - 1 - 3 - 5 - 3 #without BOOT, the LDI, CALL and HLT
+
+    assert simulator.halted
+    assert delay <= report.subroutine("delay").cycles < 1.01 * delay
+    assert report.subroutine("pwmGen").cycles >= 2 * report.subroutine("delay").cycles
+
+@pytest.mark.parametrize("source, reason", [
+    ("top: JMP top\n", "no @bound"),
+    ("LDI r0, 0\nIJMP r0, r0\n", "unknown address"),
+    ("CALL fn\nHLT\nfn: CALL fn\nRET\n", "called recursively"),
+    ("ADD r0, r0, r0\n", "leaves the program")
+])
+def test_unbounded(source: str, reason: str) -> None:
+    """Test the reason a WCET is unbounded is reported"""
+    wcet = analyse(source).subroutines[0]
+    assert wcet.cycles is None
+    assert reason in wcet.reason
+
+def test_bound_annotation_needs_label() -> None:
+    """Test a loop bound must be on the labelled line of a loop header"""
+    assert read_loop_bounds("top: NOP ; @bound 3\nJMP top\n") == {"top": 3}
+    with pytest.raises(SyntaxError, match="labelled line"):
+        read_loop_bounds("NOP ; @bound 3\n")
+    assert analyse("top: NOP ; @bound 3\nJMP top\n").subroutines[0].cycles == 3 * 6
@@ -0,0 +1,84 @@
+from assembler import *
+from writers import *
+import io
+import re
+import pytest
+
+def _write(image: bytearray, fmt: str) -> str:
+    f = io.BytesIO()
+    write_image(f, image, fmt)
+    return f.getvalue().decode("ascii")
+
+def test_text_matches_second_pass() -> None:
+    """Test the text format is the machine code of second_pass, and unpacks to the same words"""
+    session = Assembler()
+    image = session.assemble_file_image("../Examples/fibonacci.asm")
+    machine_code = Assembler().assemble_file("../Examples/fibonacci.asm")
+
+    assert len(image) == WORD_BYTES * len(machine_code)
+    assert _write(image, "text").splitlines() == machine_code
+    assert unpack_words(image) == [int(line, 2) for line in machine_code]
+
+    f = io.BytesIO()
+    write_image(f, image, "bin")
+    assert f.getvalue() == image
+
+def test_intel_hex() -> None:
+    """Test the Intel HEX records have valid checksums and hold the image"""
+    image = Assembler().assemble_file_image("../Examples/fibonacci.asm")
+    records = _write(image, "hex").splitlines()
+
+    assert records[-1] == ":00000001FF"
+    data = bytearray()
+    for record in records:
+        raw = bytes.fromhex(record[1:])
+        assert sum(raw) & 0xFF == 0
+        assert raw[0] == len(raw) - 5
+        if raw[3] == 0x00:
+            assert (raw[1] << 8) | raw[2] == len(data)
+            data += raw[4:-1]
+    assert data == image
+
+def test_memory_initialisation_files() -> None:
+    """Test the shape of the .coe and .mem formats"""
+    image = Assembler().assemble_file_image("../Examples/add5.asm")
+    words = [f"{word:06X}" for word in unpack_words(image)]
+
+    coe = _write(image, "coe").splitlines()
+    assert coe[:2] == ["memory_initialization_radix=16;", "memory_initialization_vector="]
+    assert [entry.rstrip(",;") for entry in coe[2:]] == words
+    assert coe[-1].endswith(";")
+
+    mem = _write(image, "mem").splitlines()
+    assert mem == ["@0000", *words]
+
+def test_vhdl_rom_matches_rtl() -> None:
+    """Test the VHDL aggregate matches the ROM contents in the RTL"""
+    with open("../../rtl/pom8_instruction_memory.vhd", "r") as f:
+        rtl = re.findall(r'^\s*(\d+ => "[01]{24}"),', f.read(), re.MULTILINE)
+
+    image = Assembler().assemble_file_image("../Examples/pwm_led_breathe.asm")
+    vhdl = _write(image, "vhdl").splitlines()
+
+    assert vhdl[0] == "constant rom_contents: rom_type := ("
+    assert [line.strip().rstrip(",") for line in vhdl[1:-2]] == rtl
+    assert vhdl[-2].strip() == 'others => "000000000000000000000000"'
+    assert vhdl[-1] == ");"
+
+def test_rom_tcl_matches_get_rom_col() -> None:
+    """Test the INIT value of each ROM256X1 primitive holds a bit of every word, as GetRomCol"""
+    image = Assembler().assemble_file_image("../Examples/pwm_led_breathe.asm")
+    words = unpack_words(image)
+    tcl = _write(image, "tcl")
+    inits = re.findall(r"INIT 256'h([0-9A-F]{64}) \[get_cells \{PM_inst/g256cpy_generate\[0\]"
+                       r"\.ibits_generate\[(\d+)\]\.ROM256X1_inst\}\]", tcl)
+
+    assert [int(column) for _, column in inits] == list(range(24))
+    for init, column in inits:
+        #GetRomCol puts address 0 in the rightmost, least significant, bit
+        bits = f"{int(init, 16):0256b}"
+        assert all(bits[255 - address] == str(word >> int(column) & 1) for address, word in enumerate(words))
+        assert bits[:256 - len(words)] == "0" * (256 - len(words))
+
+    with pytest.raises(ValueError, match="do not fit"):
+        rom_column_inits([0] * 257)
@@ -3,7 +3,7 @@
             LDI r0, 1       ; input 1
             LDI r1, 0       ; input 2
             LDI r2, 20      ; number of terms to calculate
-loop:       ADD r1, r0, r0  ; calculate next number in the sequence
+loop:       ADD r1, r0, r0  ; calculate next number in the sequence @bound 20
             STA r1, 0x201   ; output term
             SUBI r2, r2, 1
             BRZ done
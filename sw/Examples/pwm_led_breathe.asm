@@ -7,8 +7,8 @@
 delay:      PUSH r0         ; preserve the original input
             SUBI r0, r0, 0  ; check if the input delay is 0
             BRZ loopDone
-redo:       LDI r1, 255     ; 255 * r0 cycle delay
-loopa:      SUBI r1, r1, 1  ; burn a cycle
+redo:       LDI r1, 255     ; 255 * r0 cycle delay @bound 127
+loopa:      SUBI r1, r1, 1  ; burn a cycle @bound 255
             BRZ loopb
             JMP loopa
 loopb:      SUBI r0, r0, 1  ; burn a cycle